@@ -0,0 +1,87 @@
+"""bench_batch.py - benchmark batched metadata lookups
+
+This module looks up a batch of sequence ids against a local stub server in
+three ways: one get_response_dict call per sequence id (as batch mode does
+with a single worker), fetch_metadata_batch requesting each sequence id over
+a few pooled connections, and fetch_metadata_batch using the stub's batch
+endpoint. A fourth run repeats the batch lookup against a warm on-disk cache.
+The per-id time of each run is printed.
+
+Run from the repository root:
+    python -m benchmarks.bench_batch -n 10000 -l 5
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from enaclient.enaclient import ENAClient
+from tests.stub_server import StubRefgetServer
+
+BATCH_PATH = "sequence/metadata/batch"
+
+def make_client(server, cache_dir, batch_path=None):
+    """make a library client using the stub server
+
+    Args:
+        server (StubRefgetServer): the stub server
+        cache_dir (str): on-disk cache directory, None to disable the cache
+        batch_path (str): path of the batch endpoint, None if not used
+
+    Returns:
+        client (ENAClient): the client
+    """
+
+    client = ENAClient(args=None)
+    client.set_base_urls([server.url])
+    client.set_cache_dir(cache_dir)
+    client.set_batch_path(batch_path)
+    return client
+
+def main():
+    """run the benchmark"""
+
+    parser = argparse.ArgumentParser("python -m benchmarks.bench_batch")
+    parser.add_argument('-n', '--num_ids', type=int, default=10000,
+        help="number of sequence ids in the batch (default 10000)")
+    parser.add_argument('-l', '--latency_ms', type=float, default=0,
+        help="delay added to every stub response, to simulate the round "
+        + "trip to the API (default 0)")
+    args = parser.parse_args()
+
+    sequence_ids = ["%032x" % (i) for i in range(args.num_ids)]
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+         StubRefgetServer(batch_path=BATCH_PATH,
+                          latency_secs=args.latency_ms / 1000.0) as server:
+        client = make_client(server, None)
+        start = time.time()
+        for sequence_id in sequence_ids:
+            client.get_response_dict(sequence_id)
+        timings.append(("get_response_dict per id", time.time() - start))
+
+        client = make_client(server, None)
+        start = time.time()
+        client.fetch_metadata_batch(sequence_ids)
+        timings.append(("fetch_metadata_batch", time.time() - start))
+
+        cache_dir = os.path.join(tmp_dir, "cache")
+        client = make_client(server, cache_dir, BATCH_PATH)
+        start = time.time()
+        client.fetch_metadata_batch(sequence_ids)
+        timings.append(("fetch_metadata_batch, POST", time.time() - start))
+        client.close()
+
+        client = make_client(server, cache_dir, BATCH_PATH)
+        start = time.time()
+        client.fetch_metadata_batch(sequence_ids)
+        timings.append(("fetch_metadata_batch, cached", time.time() - start))
+        client.close()
+
+    print("ids: %s, latency: %s ms" % (args.num_ids, args.latency_ms))
+    for label, secs in timings:
+        print("%-30s %8.2f s total %8.1f us/id"
+              % (label, secs, 1000000 * secs / args.num_ids))
+
+if __name__ == "__main__":
+    main()
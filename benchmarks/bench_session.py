@@ -0,0 +1,80 @@
+"""bench_session.py - benchmark pooled keep-alive connections over TLS
+
+This module runs a batch of refget metadata requests against a local TLS stub
+server twice: once opening a new connection for every request (connection
+lifetime 0, the behaviour before the session pool was added), and once
+reusing pooled keep-alive connections. The per-request latency of each run is
+printed.
+
+Run from the repository root:
+    python -m benchmarks.bench_session -n 10000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from enaclient.enaclient import ENAClient
+from tests.stub_server import StubRefgetServer, make_self_signed_cert
+
+def run_batch(input_file_path, output_file_path, extra_args):
+    """run a batch through the ENAClient and time it
+
+    Args:
+        input_file_path (str): path to the input file of sequence ids
+        output_file_path (str): path to the output file
+        extra_args (list): additional command-line args
+
+    Returns:
+        elapsed_secs (float): wall-clock time of the batch
+    """
+
+    client = ENAClient(args=["-i", input_file_path, "-o", output_file_path]
+                       + extra_args)
+    start = time.time()
+    client.call_and_output_all()
+    elapsed_secs = time.time() - start
+    client.close()
+    return elapsed_secs
+
+def main():
+    """run the benchmark"""
+
+    parser = argparse.ArgumentParser("python -m benchmarks.bench_session")
+    parser.add_argument('-n', '--num_ids', type=int, default=10000,
+        help="number of sequence ids in the batch (default 10000)")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help="number of concurrent requests (default 1)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        certfile = make_self_signed_cert(tmp_dir)
+        os.environ["REQUESTS_CA_BUNDLE"] = certfile
+        input_file_path = os.path.join(tmp_dir, "input.txt")
+        output_file_path = os.path.join(tmp_dir, "output.json")
+        with open(input_file_path, "w") as input_file:
+            input_file.write("\n".join("%032x" % (i)
+                                       for i in range(args.num_ids)))
+
+        with StubRefgetServer(certfile=certfile) as server:
+            ENAClient.API_BASE_URL = server.url
+            workers_args = ["-w", str(args.workers)]
+            fresh_secs = run_batch(input_file_path, output_file_path,
+                                   workers_args
+                                   + ["--connection_lifetime", "0"])
+            fresh_connections = server.connection_count
+            pooled_secs = run_batch(input_file_path, output_file_path,
+                                    workers_args)
+            pooled_connections = server.connection_count - fresh_connections
+
+    print("ids: %s, workers: %s" % (args.num_ids, args.workers))
+    for label, secs, connections in [
+            ("new connection per request", fresh_secs, fresh_connections),
+            ("pooled keep-alive session", pooled_secs, pooled_connections)]:
+        print("%-28s %8.2f s total %8.3f ms/request %6s connections"
+              % (label, secs, 1000 * secs / args.num_ids, connections))
+    print("saved per request: %.3f ms"
+          % (1000 * (fresh_secs - pooled_secs) / args.num_ids))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""bench_startup.py - benchmark the cold start of single lookups
+
+This module measures what a workflow engine calling the command line once
+per sequence id pays on every call. It reports the import time of
+enaclient.enaclient with "python -X importtime" (median of several runs),
+with the modules that take longest to import, then the wall-clock time of
+complete single lookups (python scripts/run-enaclient.py -s) against a local
+stub server, run as new processes. Both are measured as the client now runs,
+importing requests and PyYAML only when needed and making single lookups over
+http.client, and with requests, PyYAML and the subcommand modules imported
+up front and the lookup made with requests (as before lazy imports).
+
+Run from the repository root:
+    python -m benchmarks.bench_startup -n 20
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from tests.stub_server import StubRefgetServer
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+
+# modules imported by enaclient before they were imported lazily
+EAGER_IMPORTS = "import requests, yaml, enaclient.session, " \
+    + "enaclient.mirror, enaclient.sequences; "
+
+SCRIPT = os.path.join("scripts", "run-enaclient.py")
+
+def get_import_times(code):
+    """import modules in a new interpreter, with import timing
+
+    Args:
+        code (str): python code importing the modules
+
+    Returns:
+        import_times (dict): cumulative microseconds keyed by (depth,
+            module), for the modules imported by the code (depth 0) and
+            the modules they import directly (depth 1)
+    """
+
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                                code], stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE, check=True)
+    import_times = {}
+    for line in completed.stderr.decode("utf-8").splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$",
+                         line)
+        if match and len(match.group(2)) <= 2:
+            import_times[(len(match.group(2)) // 2, match.group(3))] = \
+                int(match.group(1))
+    return import_times
+
+def get_import_total(import_times, startup_modules):
+    """get the total import time of the modules imported by the code
+
+    Args:
+        import_times (dict): import times returned by get_import_times
+        startup_modules (set): modules imported at interpreter startup,
+            before the code runs
+
+    Returns:
+        total_us (int): cumulative microseconds of the modules imported by
+            the code
+    """
+
+    return sum(us for (depth, module), us in import_times.items()
+               if depth == 0 and module not in startup_modules)
+
+def time_lookup(base_url, env, code=None):
+    """run a single lookup in a new process, and time it
+
+    Args:
+        base_url (str): base URL of the stub server
+        env (dict): environment of the process
+        code (str): python code run before the script, None to run the
+            script directly
+
+    Returns:
+        elapsed_secs (float): wall-clock time of the process
+    """
+
+    args = ["-s", sequence_id_0, "--no_cache", "--base_url", base_url]
+    if code is None:
+        command = [sys.executable, SCRIPT] + args
+    else:
+        command = [sys.executable, "-c", code + "import runpy, sys; "
+                   + "sys.argv = %r; " % ([SCRIPT] + args)
+                   + "runpy.run_path(%r, run_name='__main__')" % (SCRIPT)]
+    start = time.perf_counter()
+    subprocess.run(command, env=env, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+def main():
+    """run the benchmark"""
+
+    parser = argparse.ArgumentParser("python -m benchmarks.bench_startup")
+    parser.add_argument('-n', '--runs', type=int, default=20,
+        help="number of runs of each measurement (default 20)")
+    args = parser.parse_args()
+
+    # import time of the client module, lazy and with the eager imports,
+    # leaving out the modules the interpreter imports at startup
+    startup_modules = set(module for depth, module
+                          in get_import_times("pass"))
+    lazy_runs = [get_import_times("import enaclient.enaclient")
+                 for i in range(args.runs)]
+    eager_runs = [get_import_times(EAGER_IMPORTS
+                                   + "import enaclient.enaclient")
+                  for i in range(args.runs)]
+    lazy_us = statistics.median(get_import_total(run, startup_modules)
+                                for run in lazy_runs)
+    eager_us = statistics.median(get_import_total(run, startup_modules)
+                                 for run in eager_runs)
+    print("import time (median of %s runs, python -X importtime):"
+          % (args.runs))
+    print("  %-34s %8.1f ms" % ("lazy imports", lazy_us / 1000.0))
+    print("  %-34s %8.1f ms" % ("eager imports", eager_us / 1000.0))
+
+    # modules imported by enaclient.enaclient that take longest
+    print("slowest imports of enaclient.enaclient (lazy):")
+    modules = [key for key in lazy_runs[0]
+               if key[0] == 1 and key[1] not in startup_modules]
+    median_us = dict((key, statistics.median(run.get(key, 0)
+                                             for run in lazy_runs))
+                     for key in modules)
+    for key in sorted(modules, key=lambda key: -median_us[key])[:8]:
+        print("  %-34s %8.1f ms" % (key[1], median_us[key] / 1000.0))
+
+    # wall-clock time of complete single lookups. the eager runs set a proxy
+    # (bypassed for the stub with NO_PROXY), which makes the client fall
+    # back to requests
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    eager_env = dict(env, HTTP_PROXY="http://127.0.0.1:9",
+                     NO_PROXY="127.0.0.1")
+    with StubRefgetServer() as server:
+        lazy_secs = statistics.median(time_lookup(server.url, env)
+                                      for i in range(args.runs))
+        eager_secs = statistics.median(time_lookup(server.url, eager_env,
+                                                   EAGER_IMPORTS)
+                                       for i in range(args.runs))
+    print("single lookup, new process (median of %s runs):" % (args.runs))
+    print("  %-34s %8.1f ms" % ("lazy imports, http.client",
+                                1000 * lazy_secs))
+    print("  %-34s %8.1f ms" % ("eager imports, requests",
+                                1000 * eager_secs))
+    print("saved per call: %.1f ms" % (1000 * (eager_secs - lazy_secs)))
+
+if __name__ == "__main__":
+    main()
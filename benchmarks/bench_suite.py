@@ -0,0 +1,266 @@
+"""bench_suite.py - end-to-end benchmark suite against a local stub server
+
+This module runs call_and_output_all in batch mode against a local stub
+refget server, for every combination of output format, batch size and number
+of workers. The stub's latency, error rate and payload size (number of
+aliases per sequence) are configurable. Each combination runs in a separate
+process, so that its peak RSS can be measured, and reports ids/sec, p50/p99
+latency of each sequence id (including retries) and peak RSS. Results are
+printed, and saved as JSON so that they can be compared between releases.
+
+Run from the repository root:
+    python -m benchmarks.bench_suite -f json,ndjson -n 1000,10000 -w 1,16 \\
+        -l 2 --error_rate 0.01 --aliases 5 -o bench_suite.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from enaclient.enaclient import ENAClient
+from tests.stub_server import StubRefgetServer
+
+def percentile(values, fraction):
+    """get a percentile of a list of values
+
+    Args:
+        values (list): values, in any order
+        fraction (float): percentile as a fraction (eg. 0.99)
+
+    Returns:
+        value (float): the percentile, None if there are no values
+    """
+
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def get_peak_rss_mb():
+    """get the peak resident set size of this process
+
+    Returns:
+        peak_rss_mb (float): peak RSS in MiB, None where unavailable
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    if sys.platform == "darwin":
+        return peak_rss / (1024.0 * 1024.0)
+    return peak_rss / 1024.0
+
+class TimedENAClient(ENAClient):
+    """ENAClient recording the latency and status of each sequence id"""
+
+    def __init__(self, *args, **kwargs):
+        self.latencies = []
+        self.status_codes = Counter()
+        ENAClient.__init__(self, *args, **kwargs)
+
+    def get_response_dict(self, sequence_id):
+        start = time.perf_counter()
+        response_dict = ENAClient.get_response_dict(self, sequence_id)
+        self.latencies.append(time.perf_counter() - start)
+        self.status_codes[str(response_dict.get("status_code"))] += 1
+        return response_dict
+
+def run_child(config):
+    """run one benchmark configuration in this (child) process
+
+    Args:
+        config (dict): base_url, input_file, output_file, output_format,
+            workers and extra_args of the run
+
+    Returns:
+        result (dict): measurements of the run
+    """
+
+    ENAClient.API_BASE_URL = config["base_url"]
+    client = TimedENAClient(args=["-i", config["input_file"], "-o",
+        config["output_file"], "-f", config["output_format"], "-w",
+        str(config["workers"]), "--no_cache"] + config["extra_args"])
+    start = time.perf_counter()
+    client.call_and_output_all()
+    elapsed_secs = time.perf_counter() - start
+    client.close()
+
+    num_ids = len(client.latencies)
+    p50 = percentile(client.latencies, 0.50)
+    p99 = percentile(client.latencies, 0.99)
+    return {
+        "elapsed_secs": round(elapsed_secs, 4),
+        "ids_per_sec": round(num_ids / elapsed_secs, 1),
+        "p50_ms": round(1000 * p50, 3) if p50 is not None else None,
+        "p99_ms": round(1000 * p99, 3) if p99 is not None else None,
+        "peak_rss_mb": round(get_peak_rss_mb(), 1)
+            if get_peak_rss_mb() is not None else None,
+        "output_bytes": os.path.getsize(config["output_file"]),
+        "status_codes": dict(client.status_codes)
+    }
+
+def run_config(config):
+    """run one benchmark configuration in a child process
+
+    Args:
+        config (dict): configuration of the run, see run_child
+
+    Returns:
+        result (dict): measurements of the run
+
+    Raises:
+        RuntimeError: if the child process failed
+    """
+
+    completed = subprocess.run([sys.executable, "-m", "benchmarks.bench_suite",
+                                "--child", json.dumps(config)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if completed.returncode != 0:
+        raise RuntimeError("benchmark run failed: %s"
+                           % (completed.stderr.decode("utf-8")))
+    return json.loads(completed.stdout.decode("utf-8").splitlines()[-1])
+
+def get_environment():
+    """describe the environment the benchmark ran in
+
+    Returns:
+        environment (dict): python version, platform, git commit and time
+    """
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL) \
+            .stdout.decode("utf-8").strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+
+def parse_list(value, item_type):
+    """parse a comma-separated command-line list
+
+    Args:
+        value (str): comma-separated values
+        item_type (type): type of each value
+
+    Returns:
+        values (list): the parsed values
+    """
+
+    return [item_type(item) for item in value.split(",") if item]
+
+def run_suite(output_formats, batch_sizes, workers_list, latency_ms=0,
+              error_rate=0, aliases=0, extra_args=None, output_path=None):
+    """run every combination of output format, batch size and workers
+
+    Args:
+        output_formats (list): output format names
+        batch_sizes (list): numbers of sequence ids per batch
+        workers_list (list): numbers of workers
+        latency_ms (float): delay added to every stub response
+        error_rate (float): fraction of stub responses that are 503 errors
+        aliases (int): number of aliases per sequence in stub responses
+        extra_args (list): additional command-line args of every run
+        output_path (str): path of the JSON results file, None to only
+            print the results
+
+    Returns:
+        report (dict): environment, settings and results of the suite
+    """
+
+    report = {
+        "environment": get_environment(),
+        "settings": {"latency_ms": latency_ms, "error_rate": error_rate,
+                     "aliases": aliases, "extra_args": extra_args or []},
+        "results": []
+    }
+
+    print("%-8s %8s %7s %10s %9s %9s %9s %8s" % ("format", "ids",
+        "workers", "ids/sec", "p50 ms", "p99 ms", "rss MiB", "errors"))
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+         StubRefgetServer(latency_secs=latency_ms / 1000.0,
+                          error_rate=error_rate, aliases=aliases) as server:
+        for batch_size in batch_sizes:
+            input_file = os.path.join(tmp_dir, "input_%s.txt" % (batch_size))
+            with open(input_file, "w") as handle:
+                handle.write("\n".join("%032x" % (i)
+                                       for i in range(batch_size)))
+
+            for output_format in output_formats:
+                for workers in workers_list:
+                    config = {
+                        "base_url": server.url,
+                        "input_file": input_file,
+                        "output_file": os.path.join(tmp_dir, "output"),
+                        "output_format": output_format,
+                        "workers": workers,
+                        "extra_args": extra_args or []
+                    }
+                    result = {"output_format": output_format,
+                              "batch_size": batch_size, "workers": workers}
+                    result.update(run_config(config))
+                    report["results"].append(result)
+                    print("%-8s %8s %7s %10.1f %9.3f %9.3f %9s %8s"
+                          % (output_format, batch_size, workers,
+                             result["ids_per_sec"], result["p50_ms"],
+                             result["p99_ms"], result["peak_rss_mb"],
+                             batch_size - result["status_codes"]
+                             .get("200", 0)))
+
+    if output_path:
+        with open(output_path, "w") as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+        print("results saved to %s" % (output_path))
+    return report
+
+def main():
+    """run the benchmark suite"""
+
+    parser = argparse.ArgumentParser("python -m benchmarks.bench_suite")
+    parser.add_argument('-f', '--formats', type=str, default="json,ndjson",
+        help="comma-separated output formats (default json,ndjson)")
+    parser.add_argument('-n', '--batch_sizes', type=str, default="1000,10000",
+        help="comma-separated batch sizes (default 1000,10000)")
+    parser.add_argument('-w', '--workers', type=str, default="1,8",
+        help="comma-separated numbers of workers (default 1,8)")
+    parser.add_argument('-l', '--latency_ms', type=float, default=0,
+        help="delay added to every stub response (default 0)")
+    parser.add_argument('--error_rate', type=float, default=0,
+        help="fraction of stub responses that are 503 errors (default 0)")
+    parser.add_argument('--aliases', type=int, default=0,
+        help="aliases per sequence in stub responses, to vary the payload "
+        + "size (default 0)")
+    parser.add_argument('--backoff_base', type=str, default="0.01",
+        help="seconds of the first retry backoff of each run (default 0.01, "
+        + "so injected errors do not dominate the timings)")
+    parser.add_argument('-o', '--output', type=str,
+        help="path of the JSON results file (optional)")
+    parser.add_argument('--child', type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(json.loads(args.child))))
+        return
+
+    run_suite(parse_list(args.formats, str),
+              parse_list(args.batch_sizes, int),
+              parse_list(args.workers, int), args.latency_ms,
+              args.error_rate, args.aliases,
+              ["--backoff_base", args.backoff_base], args.output)
+
+if __name__ == "__main__":
+    main()
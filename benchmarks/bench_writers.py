@@ -0,0 +1,115 @@
+"""bench_writers.py - micro-benchmark of the output writers
+
+This module formats and writes a batch of refget API responses with each
+output writer, and with the per-record formatting the ENAClient used before
+the writers were added (json.dumps, dicttoxml + minidom, yaml.dump with regex
+re-indentation), and prints records/sec for each format. Formats added with
+the writers (ndjson, csv, parquet) have no legacy figure.
+
+Run from the repository root:
+    python -m benchmarks.bench_writers -n 20000
+"""
+
+import argparse
+import io
+import time
+from enaclient.enaclient import ENAClient
+from tests.legacy_format import legacy_format_record
+
+def make_records(num_records):
+    """make a batch of response dictionaries, 1 in 4 found
+
+    Args:
+        num_records (int): number of records
+
+    Returns:
+        records (list): response dictionaries
+    """
+
+    records = []
+    for i in range(num_records):
+        sequence_id = "%032x" % (i)
+        if i % 4 == 0:
+            metadata = {"id": sequence_id, "md5": sequence_id,
+                        "trunc512": "%048x" % (i), "length": 1000 + i,
+                        "aliases": [{"alias": "chr%s" % (i),
+                                     "naming_authority": "insdc"}]}
+            records.append({"req_seq_id": sequence_id, "status_code": 200,
+                            "metadata": metadata})
+        else:
+            metadata = {"id": None, "md5": None, "trunc512": None,
+                        "length": None, "aliases": []}
+            records.append({"req_seq_id": sequence_id, "status_code": 404,
+                            "metadata": metadata})
+    return records
+
+def time_writer(writer_class, records):
+    """write all records with a writer
+
+    Args:
+        writer_class (class): RecordWriter subclass
+        records (list): response dictionaries
+
+    Returns:
+        elapsed_secs (float): time to format and write the records
+    """
+
+    start = time.time()
+    writer = writer_class(io.BytesIO() if writer_class.BINARY
+                          else io.StringIO())
+    writer.write_prefix()
+    for inc, record in enumerate(records):
+        writer.write_record(record, inc)
+    writer.write_suffix()
+    return time.time() - start
+
+def time_legacy(writer_class, records):
+    """write all records with the legacy per-record formatting
+
+    Args:
+        writer_class (class): RecordWriter subclass, for the framing strings
+        records (list): response dictionaries
+
+    Returns:
+        elapsed_secs (float): time to format and write the records
+    """
+
+    start = time.time()
+    handle = io.StringIO()
+    handle.write(writer_class.PREFIX)
+    for inc, record in enumerate(records):
+        if inc:
+            handle.write(writer_class.SEPARATOR)
+        handle.write(legacy_format_record(record, inc, writer_class.NAME))
+    handle.write("\n" + writer_class.SUFFIX)
+    return time.time() - start
+
+def main():
+    """run the benchmark"""
+
+    parser = argparse.ArgumentParser("python -m benchmarks.bench_writers")
+    parser.add_argument('-n', '--num_records', type=int, default=20000,
+        help="number of records to write (default 20000)")
+    args = parser.parse_args()
+
+    records = make_records(args.num_records)
+    print("%-7s %16s %16s %8s" % ("format", "legacy rec/s", "writer rec/s",
+                                  "speedup"))
+    for writer_class in [ENAClient.WRITER_CLASSES[output_format]
+                         for output_format in sorted(ENAClient.WRITER_CLASSES)]:
+        try:
+            writer_secs = time_writer(writer_class, records)
+        except ImportError as e:
+            print("%-7s skipped: %s" % (writer_class.NAME, e))
+            continue
+        if writer_class.NAME in ("json", "xml", "yaml"):
+            legacy_secs = time_legacy(writer_class, records)
+            print("%-7s %16.0f %16.0f %7.1fx" % (writer_class.NAME,
+                len(records) / legacy_secs, len(records) / writer_secs,
+                legacy_secs / writer_secs))
+        else:
+            print("%-7s %16s %16.0f %8s" % (writer_class.NAME, "-",
+                len(records) / writer_secs, "-"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,597 @@
+"""aliases.py - local index of sequence identifiers across namespaces
+
+This module contains the class AliasIndex and the "resolve" subcommand. The
+AliasIndex maps every identifier seen for a sequence (its md5 and trunc512
+digests, and aliases such as INSDC accessions) to the digests of the
+sequence, in a SQLite database next to the metadata cache. It is filled from
+the found responses of earlier lookups, and from imported enaclient output,
+so that an identifier can be resolved to its canonical digest, or translated
+into another namespace, without calling the refget API.
+"""
+
+import argparse
+import csv
+import itertools
+import os
+import sys
+import threading
+from enaclient.cache import connect_database
+from enaclient.readers import read_sequence_ids, open_input, \
+                              guess_input_format, get_column_index, \
+                              skip_blank_and_comment_lines, \
+                              is_valid_sequence_id, INPUT_FORMAT_LINES, \
+                              MANIFEST_DELIMITERS, STDIN
+
+# namespaces of the digests of a sequence, aliases are in the namespace of
+# their naming authority (eg. "insdc")
+NAMESPACE_MD5 = "md5"
+NAMESPACE_TRUNC512 = "trunc512"
+DIGEST_NAMESPACES = (NAMESPACE_MD5, NAMESPACE_TRUNC512)
+
+class AliasIndex:
+    """SQLite-backed index of the identifiers of sequences
+
+    Each identifier is stored with its namespace and the md5 and trunc512
+    digests of its sequence (either may be unknown), keyed by all four for
+    resolution and indexed by digest for translation back into aliases. An
+    alias may name several sequences (eg. "chrM" in several assemblies), and
+    then resolves to none of them. Digests are stored in lower case, aliases
+    as they are.
+
+    Writes are committed in batches rather than one at a time; call flush()
+    or close() to commit outstanding writes. Processes sharing the index
+    should commit every write (commit_every=1), as for the MetadataCache.
+    """
+
+    FILE_NAME = "aliases.sqlite3"
+    COMMIT_EVERY = 100
+
+    # maximum identifiers looked up by one query, within SQLite's limit on
+    # query parameters
+    MAX_QUERY_IDS = 500
+
+    def __init__(self, cache_dir, commit_every=COMMIT_EVERY):
+        """instantiate the AliasIndex, creating the database if necessary
+
+        Args:
+            cache_dir (str): directory holding the index database
+            commit_every (int): number of writes committed together
+
+        Returns:
+            (class AliasIndex): the AliasIndex
+        """
+
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__uncommitted = 0
+
+        # worker processes of a sharded batch may create the directory at
+        # the same time
+        os.makedirs(cache_dir, exist_ok=True)
+        self.__connection = connect_database(
+            os.path.join(cache_dir, AliasIndex.FILE_NAME))
+
+        # rekey indexes created when rows were keyed by identifier alone,
+        # which re-pointed an alias shared by several sequences at the last
+        keys = [row[1] for row in sorted(self.__connection.execute(
+            "PRAGMA table_info(identifiers)").fetchall(),
+            key=lambda row: row[5]) if row[5]]
+        unkeyed = keys == ["identifier"]
+        if unkeyed:
+            self.__connection.execute("DROP INDEX IF EXISTS identifiers_md5")
+            self.__connection.execute(
+                "DROP INDEX IF EXISTS identifiers_trunc512")
+            self.__connection.execute(
+                "ALTER TABLE identifiers RENAME TO identifiers_unkeyed")
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS identifiers ("
+            + "identifier TEXT NOT NULL, "
+            + "namespace TEXT NOT NULL, "
+            + "md5 TEXT, "
+            + "trunc512 TEXT, "
+            + "PRIMARY KEY (identifier, namespace, md5, trunc512))")
+        if unkeyed:
+            self.__connection.execute(
+                "INSERT INTO identifiers "
+                + "SELECT identifier, namespace, md5, trunc512 "
+                + "FROM identifiers_unkeyed")
+            self.__connection.execute("DROP TABLE identifiers_unkeyed")
+        self.__connection.execute(
+            "CREATE INDEX IF NOT EXISTS identifiers_md5 "
+            + "ON identifiers (md5)")
+        self.__connection.execute(
+            "CREATE INDEX IF NOT EXISTS identifiers_trunc512 "
+            + "ON identifiers (trunc512)")
+        self.__connection.commit()
+
+    def add(self, metadata):
+        """index the identifiers of a sequence
+
+        Args:
+            metadata (dict): metadata of a found (200) response, holding the
+                "md5", "trunc512" and "aliases" of the sequence
+
+        Returns:
+            count (int): number of identifiers indexed
+        """
+
+        return self.add_many([metadata])
+
+    def add_many(self, metadatas):
+        """index the identifiers of many sequences in one transaction
+
+        Args:
+            metadatas (iterable): metadata of found (200) responses
+
+        Returns:
+            count (int): number of identifiers indexed
+        """
+
+        rows = []
+        for metadata in metadatas:
+            rows.extend(AliasIndex.get_rows(metadata))
+        if not rows:
+            return 0
+
+        with self.__lock:
+            # replace the rows of the same sequence, which may have been
+            # indexed before one of its digests was known, but keep those
+            # of other sequences sharing the identifier
+            self.__connection.executemany(
+                "DELETE FROM identifiers WHERE identifier = ? "
+                + "AND namespace = ? AND (md5 = ? OR trunc512 = ?)", rows)
+            self.__connection.executemany(
+                "INSERT OR REPLACE INTO identifiers VALUES (?, ?, ?, ?)",
+                rows)
+            self.__commit_if_due()
+        return len(rows)
+
+    def resolve(self, identifier):
+        """resolve an identifier to the digests of its sequence
+
+        Args:
+            identifier (str): md5, trunc512 or alias of a sequence
+
+        Returns:
+            digests (tuple): md5 and trunc512 of the sequence (either may be
+                None), or None if the identifier is not indexed or names
+                several sequences
+        """
+
+        with self.__lock:
+            rows = self.__connection.execute(
+                "SELECT DISTINCT md5, trunc512 FROM identifiers "
+                + "WHERE identifier = ?",
+                (AliasIndex.get_key(identifier),)).fetchall()
+            if len(rows) != 1:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return tuple(rows[0])
+
+    def resolve_many(self, identifiers):
+        """resolve many identifiers, with one query per MAX_QUERY_IDS
+
+        Args:
+            identifiers (iterable): md5s, trunc512s or aliases of sequences
+
+        Returns:
+            digests (dict): md5 and trunc512 of the sequence of each indexed
+                identifier naming one sequence, keyed by identifier
+        """
+
+        # identifiers keyed by index key, digests differing only in case
+        # share a key
+        keys = {}
+        for identifier in identifiers:
+            keys.setdefault(AliasIndex.get_key(identifier), []) \
+                .append(identifier)
+        sequences = {}
+        for chunk in iter_chunks(list(keys), AliasIndex.MAX_QUERY_IDS):
+            with self.__lock:
+                rows = self.__connection.execute(
+                    "SELECT DISTINCT identifier, md5, trunc512 "
+                    + "FROM identifiers WHERE identifier IN (%s)"
+                    % (", ".join("?" * len(chunk))), chunk).fetchall()
+            for key, md5, trunc512 in rows:
+                sequences.setdefault(key, []).append((md5, trunc512))
+
+        # identifiers naming several sequences are left unresolved
+        digests = {}
+        resolved = 0
+        for key, key_sequences in sequences.items():
+            if len(key_sequences) == 1:
+                resolved += 1
+                for identifier in keys[key]:
+                    digests[identifier] = key_sequences[0]
+        with self.__lock:
+            self.hits += resolved
+            self.misses += len(keys) - resolved
+        return digests
+
+    def get_aliases(self, identifier):
+        """get the aliases of the sequence of an identifier
+
+        Args:
+            identifier (str): md5, trunc512 or alias of a sequence
+
+        Returns:
+            aliases (list): (alias, namespace) tuples, sorted by namespace
+                then alias, empty if the identifier is not indexed
+        """
+
+        digests = self.resolve(identifier)
+        if digests is None:
+            return []
+        column, digest = ("md5", digests[0]) if digests[0] is not None \
+            else ("trunc512", digests[1])
+        with self.__lock:
+            return [tuple(row) for row in self.__connection.execute(
+                "SELECT identifier, namespace FROM identifiers "
+                + "WHERE %s = ? AND namespace NOT IN (?, ?) " % (column)
+                + "ORDER BY namespace, identifier",
+                (digest,) + DIGEST_NAMESPACES).fetchall()]
+
+    def translate_many(self, identifiers, namespace=NAMESPACE_MD5):
+        """translate many identifiers into one namespace
+
+        Identifiers are translated into a digest namespace through their
+        sequence's digests. Into an alias namespace, the first alias of the
+        sequence (in sort order) is taken. An md5 or trunc512 digest that is
+        not indexed is still translated into its own namespace.
+
+        Args:
+            identifiers (iterable): md5s, trunc512s or aliases of sequences
+            namespace (str): "md5", "trunc512", or the naming authority of
+                aliases (eg. "insdc")
+
+        Returns:
+            translated (dict): identifier in the namespace, keyed by the
+                translated identifier, for the identifiers that could be
+                translated
+        """
+
+        identifiers = list(identifiers)
+        digests = self.resolve_many(identifiers)
+        translated = {}
+        if namespace in DIGEST_NAMESPACES:
+            column = DIGEST_NAMESPACES.index(namespace)
+            for identifier in identifiers:
+                if identifier in digests:
+                    if digests[identifier][column] is not None:
+                        translated[identifier] = digests[identifier][column]
+                elif is_valid_sequence_id(identifier) \
+                     and AliasIndex.get_namespace(identifier) == namespace:
+                    translated[identifier] = identifier.lower()
+            return translated
+
+        # look up the aliases of the resolved sequences, by md5 and trunc512
+        aliases = {}
+        sequences = list(set(digests.values()))
+        for chunk in iter_chunks(sequences, AliasIndex.MAX_QUERY_IDS // 2):
+            md5s = [md5 for md5, trunc512 in chunk if md5 is not None]
+            trunc512s = [trunc512 for md5, trunc512 in chunk
+                         if trunc512 is not None]
+            with self.__lock:
+                rows = self.__connection.execute(
+                    "SELECT identifier, md5, trunc512 FROM identifiers "
+                    + "WHERE namespace = ? AND (md5 IN (%s) "
+                    % (", ".join("?" * len(md5s)))
+                    + "OR trunc512 IN (%s)) ORDER BY identifier DESC"
+                    % (", ".join("?" * len(trunc512s))),
+                    [namespace] + md5s + trunc512s).fetchall()
+            # rows are in descending order, so the alias kept for each
+            # sequence is the first in sort order
+            for alias, md5, trunc512 in rows:
+                aliases[(md5, trunc512)] = alias
+        for identifier in identifiers:
+            if digests.get(identifier) in aliases:
+                translated[identifier] = aliases[digests[identifier]]
+        return translated
+
+    def flush(self):
+        """commit outstanding writes"""
+
+        with self.__lock:
+            self.__connection.commit()
+            self.__uncommitted = 0
+
+    def close(self):
+        """commit outstanding writes and close the database"""
+
+        self.flush()
+        self.__connection.close()
+
+    def __len__(self):
+        with self.__lock:
+            return self.__connection.execute(
+                "SELECT COUNT(*) FROM identifiers").fetchone()[0]
+
+    def __commit_if_due(self):
+        """commit once enough writes have accumulated"""
+
+        self.__uncommitted += 1
+        if self.__uncommitted >= self.commit_every:
+            self.__connection.commit()
+            self.__uncommitted = 0
+
+    @staticmethod
+    def get_key(identifier):
+        """get the index key of an identifier
+
+        Args:
+            identifier (str): md5, trunc512 or alias of a sequence
+
+        Returns:
+            key (str): the identifier, in lower case if it is a digest
+        """
+
+        return identifier.lower() if is_valid_sequence_id(identifier) \
+            else identifier
+
+    @staticmethod
+    def get_namespace(digest):
+        """get the namespace of a digest
+
+        Args:
+            digest (str): md5 (32 hex digits) or trunc512 (48 hex digits)
+                digest
+
+        Returns:
+            namespace (str): "md5" or "trunc512"
+        """
+
+        return NAMESPACE_MD5 if len(digest) == 32 else NAMESPACE_TRUNC512
+
+    @staticmethod
+    def get_rows(metadata):
+        """get the index rows of the identifiers of a sequence
+
+        Args:
+            metadata (dict): metadata of a found (200) response
+
+        Returns:
+            rows (list): (identifier, namespace, md5, trunc512) tuples, empty
+                if the sequence has neither an md5 nor a trunc512 digest
+        """
+
+        if not isinstance(metadata, dict):
+            return []
+        md5 = metadata.get("md5")
+        trunc512 = metadata.get("trunc512")
+        md5 = md5.lower() if md5 else None
+        trunc512 = trunc512.lower() if trunc512 else None
+        if md5 is None and trunc512 is None:
+            return []
+
+        rows = [(digest, namespace, md5, trunc512) for digest, namespace
+                in [(md5, NAMESPACE_MD5), (trunc512, NAMESPACE_TRUNC512)]
+                if digest is not None]
+        for alias in metadata.get("aliases") or []:
+            if isinstance(alias, dict) and alias.get("alias"):
+                rows.append((alias["alias"],
+                             alias.get("naming_authority") or "",
+                             md5, trunc512))
+        return rows
+
+def iter_chunks(values, chunk_size):
+    """split values into chunks
+
+    Args:
+        values (iterable): values to split
+        chunk_size (int): maximum values per chunk
+
+    Yields:
+        chunk (list): next values, in order
+    """
+
+    values = iter(values)
+    while True:
+        chunk = list(itertools.islice(values, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def translate_manifest(index, input_file, output_handle, namespace,
+                       input_format=None, id_column=None, lookup=None):
+    """translate the identifiers of a manifest into a namespace
+
+    A file with one identifier per line is written back one translated
+    identifier per line. A TSV/CSV manifest is written back whole, with the
+    identifiers of its id column translated. Identifiers that cannot be
+    translated are written as they are.
+
+    Args:
+        index (AliasIndex): index the identifiers are translated with
+        input_file (str): path to the input file, or "-" for stdin
+        output_handle (file): text handle the output is written to
+        namespace (str): namespace identifiers are translated into
+        input_format (str): "lines", "tsv" or "csv", guessed from the file
+            extension if None
+        id_column (str): name or number of the id column of a manifest, the
+            first column if None
+        lookup (callable): called with the md5/trunc512 digests of each chunk
+            that could not be translated, to look them up and add them to
+            the index, None to only use the index
+
+    Returns:
+        counts (tuple): number of identifiers, and number translated
+    """
+
+    if input_format is None:
+        input_format = guess_input_format(input_file)
+    if input_format in MANIFEST_DELIMITERS:
+        handle = open_input(input_file)
+        delimiter = MANIFEST_DELIMITERS[input_format]
+        rows = csv.reader(skip_blank_and_comment_lines(handle),
+                          delimiter=delimiter)
+        writer = csv.writer(output_handle, delimiter=delimiter,
+                            lineterminator="\n")
+        header = next(rows, None)
+        if header is None:
+            rows = iter([])
+        else:
+            column = get_column_index(header, id_column or "1")
+            writer.writerow(header)
+    else:
+        handle = None
+        rows = ([sequence_id] for sequence_id
+                in read_sequence_ids(input_file, INPUT_FORMAT_LINES))
+        writer = None
+        column = 0
+
+    count = 0
+    translated_count = 0
+    try:
+        for chunk in iter_chunks(rows, AliasIndex.MAX_QUERY_IDS):
+            identifiers = [row[column].strip() if column < len(row) else ""
+                           for row in chunk]
+            translated = index.translate_many(identifiers, namespace)
+
+            # look up the digests that are missing, so that the index learns
+            # their other identifiers
+            missing = [identifier for identifier in identifiers
+                       if identifier not in translated
+                       and is_valid_sequence_id(identifier)]
+            if missing and lookup is not None:
+                lookup(list(dict.fromkeys(missing)))
+                translated.update(index.translate_many(missing, namespace))
+
+            for row, identifier in zip(chunk, identifiers):
+                count += 1
+                if identifier in translated:
+                    translated_count += 1
+                    identifier = translated[identifier]
+                if writer is None:
+                    output_handle.write(identifier + "\n")
+                else:
+                    writer.writerow(row[:column] + [identifier]
+                                    + row[column + 1:])
+    finally:
+        if handle is not None and handle is not sys.stdin:
+            handle.close()
+    return count, translated_count
+
+def main(args=sys.argv[2:]):
+    """run the "resolve" subcommand
+
+    Translates the identifiers of an input file (one per line, or the id
+    column of a TSV/CSV manifest) into a namespace with the alias index of
+    the cache directory, after importing previous enaclient JSON/NDJSON/enab
+    output into the index if given.
+
+    Args:
+        args (list): subcommand arguments taken from command-line
+
+    Returns:
+        exit_code (int): 0 on success, 1 on error
+    """
+
+    # imported here, as the ENAClient imports the AliasIndex
+    from enaclient.enaclient import ENAClient
+    from enaclient.mirror import read_output_bodies
+
+    parser = argparse.ArgumentParser("python run-enaclient.py resolve")
+    parser.add_argument('-i', '--input_file', type=str,
+        help="input file containing identifiers, or a TSV/CSV manifest, - "
+        + "to read from stdin")
+    parser.add_argument('-o', '--output_file', type=str,
+        help="path to the translated output file (optional, will print to "
+        + "stdout by default)")
+    parser.add_argument('--input_format', type=str,
+        choices=[INPUT_FORMAT_LINES] + sorted(MANIFEST_DELIMITERS),
+        help="input file format, one identifier per line or a TSV/CSV "
+        + "manifest with a header row (optional, guessed from the file "
+        + "extension by default)")
+    parser.add_argument('--id_column', type=str,
+        help="name or number (from 1) of the identifier column of a "
+        + "TSV/CSV manifest (optional, default is the first column)")
+    parser.add_argument('--to', type=str, default=NAMESPACE_MD5,
+        dest="namespace",
+        help="namespace identifiers are translated into: md5, trunc512, or "
+        + "the naming authority of aliases, eg. insdc (optional, default "
+        + "md5)")
+    parser.add_argument('--import', type=str, nargs="+", default=[],
+        dest="import_files", metavar="OUTPUT_FILE",
+        help="enaclient JSON/NDJSON/enab output files whose found responses "
+        + "are added to the index first, may be compressed")
+    parser.add_argument('--lookup', action="store_true",
+        help="look up md5/trunc512 digests missing from the index with the "
+        + "refget API, adding them to the index")
+    parser.add_argument('--cache_dir', '--cache-dir', type=str,
+        default=ENAClient.default_cache_dir(),
+        help="directory of the on-disk metadata cache holding the index "
+        + "(optional, default %s)" % (ENAClient.default_cache_dir()))
+    parser.add_argument('--base_url', '--base-url', type=str,
+        action="append",
+        help="base URL of a refget API used by --lookup, repeat to fail "
+        + "over to further endpoints (optional, default %s)"
+        % (ENAClient.API_BASE_URL))
+    args_dict = vars(parser.parse_args(args))
+
+    output_path = args_dict["output_file"]
+    temp_path = output_path + ".part" if output_path else None
+    try:
+        if not args_dict["input_file"] and not args_dict["import_files"]:
+            raise ValueError("ERROR: an input file (-i) or output files to "
+                             + "import (--import) are required\n")
+        for path in [args_dict["input_file"]] + args_dict["import_files"]:
+            if path and path != STDIN and not os.path.exists(path):
+                raise FileNotFoundError("ERROR: input file not found: %s\n"
+                                        % (path))
+
+        client = ENAClient(args=None)
+        client.set_cache_dir(args_dict["cache_dir"])
+        client.set_base_urls(args_dict["base_url"])
+        index = client.get_alias_index()
+        try:
+            # add the identifiers of previous output to the index
+            for path in args_dict["import_files"]:
+                count = 0
+                for bodies in iter_chunks(read_output_bodies(path),
+                                          AliasIndex.MAX_QUERY_IDS):
+                    count += index.add_many(body.get("metadata")
+                                            for body in bodies)
+                sys.stderr.write("%s identifiers imported from %s\n"
+                                 % (count, path))
+            if not args_dict["input_file"]:
+                return 0
+
+            # learn the identifiers of digests looked up with the API,
+            # including those answered from the metadata cache
+            def lookup(sequence_ids):
+                index.add_many(response_dict["metadata"] for response_dict
+                               in client.iter_metadata_batch(sequence_ids)
+                               if response_dict["status_code"] == 200)
+
+            # write to a temporary file, moved into place once every
+            # identifier was translated
+            handle = open(temp_path, "w") if temp_path else sys.stdout
+            try:
+                count, translated_count = translate_manifest(
+                    index, args_dict["input_file"], handle,
+                    args_dict["namespace"], args_dict["input_format"],
+                    args_dict["id_column"],
+                    lookup if args_dict["lookup"] else None)
+            finally:
+                if temp_path:
+                    handle.close()
+                else:
+                    handle.flush()
+            if temp_path:
+                os.replace(temp_path, output_path)
+            sys.stderr.write("%s of %s identifiers translated to %s\n"
+                             % (translated_count, count,
+                                args_dict["namespace"]))
+        finally:
+            client.close()
+
+    except (ValueError, FileNotFoundError) as e:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+        print(e)
+        return 1
+
+    return 0
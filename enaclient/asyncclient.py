@@ -0,0 +1,143 @@
+"""asyncclient.py - retrieve ENA sequence metadata from asyncio code
+
+This module contains the class AsyncENAClient. The AsyncENAClient wraps an
+ENAClient so that refget API requests can be awaited from a running event
+loop without blocking it. Responses have the same dictionary shape as those of
+the ENAClient, and can be formatted with the same formatters.
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from enaclient.enaclient import ENAClient
+
+class AsyncENAClient:
+    """Retrieve ENA sequence metadata through refget API from asyncio code
+
+    Each blocking refget API request is run on a worker thread, so the event
+    loop stays free while the request is in flight. fetch_many requests
+    metadata for many sequence ids concurrently, pulling ids from its input
+    only as fast as responses are consumed, so that a very large (or
+    endless) id iterator is never loaded into memory.
+    """
+
+    DEFAULT_CONCURRENCY = 10
+
+    def __init__(self, client=None):
+        """instantiate the AsyncENAClient
+
+        Args:
+            client (ENAClient): client used to make and format the requests.
+                A client with default settings is created if None
+
+        Returns:
+            (class AsyncENAClient): the AsyncENAClient
+        """
+
+        if client is None:
+            client = ENAClient(args=None)
+        self.__set_client(client)
+
+    async def fetch(self, sequence_id, executor=None):
+        """Execute refget API request without blocking the event loop
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+            executor (Executor): executor to run the request on, the event
+                loop's default executor is used if None
+
+        Returns:
+            response_dict (dict): API response for the sequence id
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, self.get_client().get_response_dict, sequence_id)
+
+    async def fetch_many(self, sequence_ids,
+                         concurrency=DEFAULT_CONCURRENCY):
+        """Execute refget API requests for many sequence ids, in input order
+
+        At most "concurrency" requests are in flight at once. The next
+        sequence id is only taken from the input once the oldest pending
+        response has been consumed, which applies backpressure to the input.
+
+        Args:
+            sequence_ids (iterable or async iterable): md5sums/ids for the
+                sequences of interest
+            concurrency (int): maximum number of requests in flight
+
+        Yields:
+            response_dict (dict): API response for each sequence id
+        """
+
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            async for sequence_id in self.__aiter(sequence_ids):
+                pending.append(asyncio.ensure_future(
+                    self.fetch(sequence_id, executor=executor)))
+                # window is full, wait for the oldest response before
+                # taking another sequence id from the input
+                if len(pending) >= concurrency:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            # consumer stopped early or the input raised, do not leave
+            # requests running in the background
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def format_response(self, response_dict, inc):
+        """Format a response dictionary according to the output format
+
+        Args:
+            response_dict (dict): API response for a sequence id
+            inc (int): auto-increment input sequence
+
+        Returns:
+            response_string (str): json/xml/yaml formatted API response
+        """
+        return self.get_client().format_response(response_dict, inc)
+
+    async def __aiter(self, sequence_ids):
+        """iterate over sync or async iterables of sequence ids
+
+        Args:
+            sequence_ids (iterable or async iterable): sequence ids
+
+        Yields:
+            sequence_id (str): md5sum/id for the sequence of interest
+        """
+
+        if hasattr(sequence_ids, "__aiter__"):
+            async for sequence_id in sequence_ids:
+                yield sequence_id
+        else:
+            for sequence_id in sequence_ids:
+                yield sequence_id
+
+    "Setter Methods"
+
+    def __set_client(self, client):
+        """set client
+
+        Args:
+            client (ENAClient): client used to make and format the requests
+        """
+        self._client = client
+
+    "Getter Methods"
+
+    def get_client(self):
+        """get client
+
+        Returns:
+            _client (ENAClient): client used to make and format the requests
+        """
+        return self._client
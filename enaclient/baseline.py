@@ -0,0 +1,132 @@
+"""baseline.py - compare the responses of a run with a previous run
+
+This module contains the class BaselineIndex, used by diff mode
+(--baseline). The records of a previous run's JSON/NDJSON/enab output are
+loaded into a compact index, holding a fingerprint of each record rather than
+the record itself, and each response of the current run is compared with it,
+so that only the records that were added or changed since are written.
+"""
+
+import hashlib
+import json
+import threading
+from enaclient.readers import read_output_records
+
+class BaselineIndex:
+    """Fingerprints of the records of a previous run, keyed by req_seq_id
+
+    Each record is reduced to 9 bytes: a flag set if its status code was 404,
+    and an 8-byte BLAKE2 digest of the rest of the record (status code,
+    metadata and error), serialized with sorted keys.
+    """
+
+    ADDED = "added"
+    CHANGED = "changed"
+    NOT_FOUND = "not found"
+    FAILED = "failed"
+    UNCHANGED = "unchanged"
+    CATEGORIES = (ADDED, CHANGED, NOT_FOUND, FAILED, UNCHANGED)
+
+    # status codes compared with the baseline, other responses (eg.
+    # timeouts) could not be compared and are always written
+    COMPARED_STATUS_CODES = (200, 404, "400")
+
+    DIGEST_SIZE = 8
+
+    def __init__(self, path):
+        """instantiate the BaselineIndex, loading a previous run's output
+
+        Args:
+            path (str): path to the previous JSON/NDJSON/enab output, may be
+                compressed
+
+        Returns:
+            (class BaselineIndex): the BaselineIndex
+
+        Raises:
+            ValueError: if the output is not enaclient JSON/NDJSON/enab output
+        """
+
+        self.path = path
+        self.counts = dict((category, 0)
+                           for category in BaselineIndex.CATEGORIES)
+        self.__lock = threading.Lock()
+        self.__fingerprints = {}
+        try:
+            for response_dict in read_output_records(path):
+                self.__fingerprints[response_dict["req_seq_id"]] = \
+                    BaselineIndex.get_fingerprint(response_dict)
+        except (ValueError, KeyError, TypeError):
+            raise ValueError("ERROR: baseline is not enaclient "
+                             + "JSON/NDJSON/enab output: %s\n" % (path))
+
+    def compare(self, response_dict):
+        """compare a response with the baseline, counting its category
+
+        Args:
+            response_dict (dict): API response for a sequence id
+
+        Returns:
+            category (str): "added" if the sequence id is not in the
+                baseline, "unchanged" if the record is the same, "not found"
+                if the sequence is newly not found (404), "failed" if the
+                request failed so the response could not be compared,
+                otherwise "changed"
+        """
+
+        previous = self.__fingerprints.get(response_dict["req_seq_id"])
+        fingerprint = BaselineIndex.get_fingerprint(response_dict)
+        if previous is None:
+            category = BaselineIndex.ADDED
+        elif response_dict.get("status_code") \
+                not in BaselineIndex.COMPARED_STATUS_CODES:
+            # a request that failed the same way in the baseline tells
+            # nothing of the sequence either
+            category = BaselineIndex.FAILED
+        elif previous == fingerprint:
+            category = BaselineIndex.UNCHANGED
+        elif response_dict.get("status_code") == 404 \
+                and previous[:1] != b"\x01":
+            category = BaselineIndex.NOT_FOUND
+        else:
+            category = BaselineIndex.CHANGED
+        with self.__lock:
+            self.counts[category] += 1
+        return category
+
+    def format_summary(self):
+        """format the counts of each category, for stderr
+
+        Returns:
+            summary (str): one line of counts
+        """
+
+        return ("baseline: %s added, %s changed, %s newly not found, %s "
+                + "failed, %s unchanged (%s records in %s)\n") \
+            % (tuple(self.counts[category]
+                     for category in BaselineIndex.CATEGORIES)
+               + (len(self), self.path))
+
+    def __len__(self):
+        return len(self.__fingerprints)
+
+    @staticmethod
+    def get_fingerprint(response_dict):
+        """get the fingerprint of a record
+
+        Args:
+            response_dict (dict): API response for a sequence id
+
+        Returns:
+            fingerprint (bytes): flag byte (1 for a 404 response), then the
+                digest of the record without its req_seq_id
+        """
+
+        body = dict((key, value) for key, value in response_dict.items()
+                    if key != "req_seq_id")
+        digest = hashlib.blake2b(
+            json.dumps(body, sort_keys=True, separators=(",", ":"))
+            .encode("utf-8"), digest_size=BaselineIndex.DIGEST_SIZE).digest()
+        flag = b"\x01" if response_dict.get("status_code") == 404 \
+            else b"\x00"
+        return flag + digest
@@ -0,0 +1,475 @@
+"""cache.py - caches of refget API responses
+
+This module contains the classes MetadataCache, LRUCache, and SingleFlight.
+The MetadataCache stores refget API responses in a SQLite database keyed by
+sequence id, so that metadata for sequences requested in a previous run can be
+returned without calling the API again. The LRUCache and SingleFlight keep
+responses in memory within a run, so that a sequence id repeated in the input
+is only requested once. The function connect_database opens the SQLite
+databases kept in the cache directory.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# attempts at switching a new database to write-ahead logging, and the
+# seconds between them
+WAL_ATTEMPTS = 50
+WAL_RETRY_SECS = 0.02
+
+def connect_database(path):
+    """open a SQLite database shared by threads and processes
+
+    The database is switched to write-ahead logging, so that readers do not
+    block the writer. Switching takes an exclusive lock without waiting for
+    it, which fails while another process is creating the same database
+    (eg. the worker processes of a sharded batch), so it is retried.
+
+    Args:
+        path (str): path to the database file, created if it does not exist
+
+    Returns:
+        connection (sqlite3.Connection): connection usable from any thread
+
+    Raises:
+        sqlite3.OperationalError: if the database stays locked
+    """
+
+    connection = sqlite3.connect(path, check_same_thread=False)
+    for attempt in range(WAL_ATTEMPTS):
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            break
+        except sqlite3.OperationalError:
+            if attempt == WAL_ATTEMPTS - 1:
+                raise
+            time.sleep(WAL_RETRY_SECS)
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+class MetadataCache:
+    """SQLite-backed cache of refget API responses
+
+    Found (200) and not found (404) responses are cached with separate
+    time-to-live values, so that sequences missing from the API are retried
+    sooner than metadata is refreshed; a time-to-live of 0 leaves them
+    uncached. Other responses (eg. timeouts) are never cached. Once the cache holds more than "max_entries" responses, the
+    least recently used are evicted. The ETag of each response, if the API
+    sent one, is kept as a validator, so that an expired response can be
+    revalidated with a conditional request rather than requested again.
+
+    Writes are committed in batches rather than one at a time; call flush()
+    or close() to commit outstanding writes. A batch holds the database's
+    write lock until it is committed, so processes sharing the cache should
+    commit every write (commit_every=1).
+    """
+
+    FILE_NAME = "metadata.sqlite3"
+    COMMIT_EVERY = 100
+
+    # maximum sequence ids looked up by one get_many query, within SQLite's
+    # limit on query parameters
+    MAX_QUERY_IDS = 500
+
+    # status codes that are cached, and whether they are negative (not found)
+    # responses
+    CACHEABLE_STATUS_CODES = {200: False, 404: True}
+
+    def __init__(self, cache_dir, ttl, negative_ttl, max_entries,
+                 commit_every=COMMIT_EVERY):
+        """instantiate the MetadataCache, creating the database if necessary
+
+        Args:
+            cache_dir (str): directory holding the cache database
+            ttl (float): seconds that found (200) responses stay valid
+            negative_ttl (float): seconds that not found (404) responses
+                stay valid
+            max_entries (int): maximum number of cached responses
+            commit_every (int): number of writes committed together
+
+        Returns:
+            (class MetadataCache): the MetadataCache
+        """
+
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__uncommitted = 0
+
+        # worker processes of a sharded batch may create the directory at
+        # the same time
+        os.makedirs(cache_dir, exist_ok=True)
+        self.__connection = connect_database(
+            os.path.join(cache_dir, MetadataCache.FILE_NAME))
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            + "sequence_id TEXT PRIMARY KEY, "
+            + "status_code INTEGER NOT NULL, "
+            + "body TEXT NOT NULL, "
+            + "expires_at REAL NOT NULL, "
+            + "accessed_at REAL NOT NULL, "
+            + "etag TEXT)")
+        self.__connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+            + "ON responses (accessed_at)")
+
+        # add the validator column to caches created before it
+        columns = [row[1] for row in self.__connection.execute(
+            "PRAGMA table_info(responses)")]
+        if "etag" not in columns:
+            self.__connection.execute(
+                "ALTER TABLE responses ADD COLUMN etag TEXT")
+        self.__connection.commit()
+        self.__count = self.__connection.execute(
+            "SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, sequence_id):
+        """get the cached response for a sequence id
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+
+        Returns:
+            response_dict (dict): cached API response, or None if the
+                sequence id is not cached or its response has expired
+        """
+
+        now = time.time()
+        with self.__lock:
+            row = self.__connection.execute(
+                "SELECT status_code, body, expires_at FROM responses "
+                + "WHERE sequence_id = ?", (sequence_id,)).fetchone()
+            if row is None or row[2] <= now:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.__connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE sequence_id = ?",
+                (now, sequence_id))
+            self.__commit_if_due()
+
+        # rebuild the response dictionary with the same key order as a
+        # response from the API
+        response_dict = {"req_seq_id": sequence_id, "status_code": row[0]}
+        response_dict.update(json.loads(row[1]))
+        return response_dict
+
+    def get_many(self, sequence_ids):
+        """get the cached responses for many sequence ids in one query
+
+        Args:
+            sequence_ids (list): distinct md5sums/ids for the sequences of
+                interest, at most MAX_QUERY_IDS
+
+        Returns:
+            response_dicts (dict): cached API responses keyed by sequence
+                id, for the sequence ids that are cached and not expired
+        """
+
+        now = time.time()
+        with self.__lock:
+            rows = self.__connection.execute(
+                "SELECT sequence_id, status_code, body, expires_at "
+                + "FROM responses WHERE sequence_id IN (%s)"
+                % (", ".join("?" * len(sequence_ids))),
+                list(sequence_ids)).fetchall() if sequence_ids else []
+            rows = [row for row in rows if row[3] > now]
+            self.hits += len(rows)
+            self.misses += len(sequence_ids) - len(rows)
+            if rows:
+                self.__connection.executemany(
+                    "UPDATE responses SET accessed_at = ? "
+                    + "WHERE sequence_id = ?", [(now, row[0]) for row in rows])
+                self.__commit_if_due()
+
+        response_dicts = {}
+        for sequence_id, status_code, body, expires_at in rows:
+            response_dict = {"req_seq_id": sequence_id,
+                             "status_code": status_code}
+            response_dict.update(json.loads(body))
+            response_dicts[sequence_id] = response_dict
+        return response_dicts
+
+    def get_validators(self, sequence_ids):
+        """get the cached responses with an ETag for many sequence ids,
+        whether or not they have expired
+
+        Args:
+            sequence_ids (list): distinct md5sums/ids for the sequences of
+                interest, at most MAX_QUERY_IDS
+
+        Returns:
+            validators (dict): (response_dict, etag) tuples keyed by
+                sequence id, for the sequence ids with a cached ETag
+        """
+
+        with self.__lock:
+            rows = self.__connection.execute(
+                "SELECT sequence_id, status_code, body, etag "
+                + "FROM responses WHERE sequence_id IN (%s) "
+                % (", ".join("?" * len(sequence_ids)))
+                + "AND etag IS NOT NULL",
+                list(sequence_ids)).fetchall() if sequence_ids else []
+
+        validators = {}
+        for sequence_id, status_code, body, etag in rows:
+            response_dict = {"req_seq_id": sequence_id,
+                             "status_code": status_code}
+            response_dict.update(json.loads(body))
+            validators[sequence_id] = (response_dict, etag)
+        return validators
+
+    def put(self, sequence_id, response_dict, etag=None):
+        """cache the response for a sequence id, if its status is cacheable
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+            response_dict (dict): API response for the sequence id
+            etag (str): ETag of the response, None if the API sent none
+        """
+
+        status_code = response_dict.get("status_code")
+        if status_code not in MetadataCache.CACHEABLE_STATUS_CODES:
+            return
+
+        now = time.time()
+        ttl = self.negative_ttl \
+            if MetadataCache.CACHEABLE_STATUS_CODES[status_code] else self.ttl
+        if ttl <= 0:
+            return
+        body = dict((key, value) for key, value in response_dict.items()
+                    if key not in ("req_seq_id", "status_code"))
+
+        with self.__lock:
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (sequence_id, status_code, json.dumps(body), now + ttl, now,
+                 etag))
+            self.__count += 1
+            if self.__count > self.max_entries:
+                self.__evict()
+            self.__commit_if_due()
+
+    def put_many(self, response_dicts, etags=None):
+        """cache many responses in one transaction, if their status is
+        cacheable
+
+        Args:
+            response_dicts (iterable): API responses, keyed in the cache by
+                their req_seq_id
+            etags (dict): ETags of the responses keyed by req_seq_id, for
+                the responses the API sent one with
+        """
+
+        etags = etags or {}
+        now = time.time()
+        rows = []
+        for response_dict in response_dicts:
+            status_code = response_dict.get("status_code")
+            if status_code not in MetadataCache.CACHEABLE_STATUS_CODES:
+                continue
+            ttl = self.negative_ttl \
+                if MetadataCache.CACHEABLE_STATUS_CODES[status_code] \
+                else self.ttl
+            if ttl <= 0:
+                continue
+            body = dict((key, value) for key, value in response_dict.items()
+                        if key not in ("req_seq_id", "status_code"))
+            rows.append((response_dict["req_seq_id"], status_code,
+                         json.dumps(body), now + ttl, now,
+                         etags.get(response_dict["req_seq_id"])))
+        if not rows:
+            return
+
+        with self.__lock:
+            self.__connection.executemany(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                rows)
+            self.__count += len(rows)
+            if self.__count > self.max_entries:
+                self.__evict()
+            self.__connection.commit()
+            self.__uncommitted = 0
+
+    def get_hit_ratio(self):
+        """get the fraction of lookups answered from the cache
+
+        Returns:
+            hit_ratio (float): hits / lookups, 0 if there were no lookups
+        """
+
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def flush(self):
+        """commit outstanding writes"""
+
+        with self.__lock:
+            self.__connection.commit()
+            self.__uncommitted = 0
+
+    def close(self):
+        """commit outstanding writes and close the database"""
+
+        self.flush()
+        self.__connection.close()
+
+    def __evict(self):
+        """evict the least recently used responses
+
+        The count of cached responses is approximate (replaced entries are
+        counted again), so it is refreshed before evicting. Evicts down to
+        90% of the maximum, so that eviction does not run on every put.
+        """
+
+        self.__count = self.__connection.execute(
+            "SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = self.__count - int(self.max_entries * 0.9)
+        if self.__count > self.max_entries and excess > 0:
+            self.__connection.execute(
+                "DELETE FROM responses WHERE sequence_id IN ("
+                + "SELECT sequence_id FROM responses "
+                + "ORDER BY accessed_at LIMIT ?)", (excess,))
+            self.__count -= excess
+
+    def __commit_if_due(self):
+        """commit once enough writes have accumulated"""
+
+        self.__uncommitted += 1
+        if self.__uncommitted >= self.commit_every:
+            self.__connection.commit()
+            self.__uncommitted = 0
+
+class LRUCache:
+    """Bounded, thread-safe in-memory cache with least recently used eviction
+    """
+
+    def __init__(self, max_size):
+        """instantiate the LRUCache
+
+        Args:
+            max_size (int): maximum number of cached values
+
+        Returns:
+            (class LRUCache): the LRUCache
+        """
+
+        self.max_size = max_size
+        self.hits = 0
+        self.__lock = threading.Lock()
+        self.__values = OrderedDict()
+
+    def get(self, key):
+        """get a cached value, marking it as most recently used
+
+        Args:
+            key (str): cache key
+
+        Returns:
+            value (obj): cached value, or None if not cached
+        """
+
+        with self.__lock:
+            if key not in self.__values:
+                return None
+            self.__values.move_to_end(key)
+            self.hits += 1
+            return self.__values[key]
+
+    def put(self, key, value):
+        """cache a value, evicting the least recently used if full
+
+        Args:
+            key (str): cache key
+            value (obj): value to cache
+        """
+
+        with self.__lock:
+            self.__values[key] = value
+            self.__values.move_to_end(key)
+            if len(self.__values) > self.max_size:
+                self.__values.popitem(last=False)
+
+    def __len__(self):
+        return len(self.__values)
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into a single call
+
+    The first caller for a key runs the function; callers arriving for the
+    same key while it is running wait for, and share, its result.
+    """
+
+    def __init__(self):
+        """instantiate the SingleFlight
+
+        Returns:
+            (class SingleFlight): the SingleFlight
+        """
+
+        self.collapsed = 0
+        self.__lock = threading.Lock()
+        self.__calls = {}
+
+    def do(self, key, function, *args):
+        """call function(*args) once for all concurrent callers of a key
+
+        Args:
+            key (str): key identifying the call
+            function (callable): function to call
+            *args: arguments passed to the function
+
+        Returns:
+            result (obj): return value of the function
+
+        Raises:
+            BaseException: any exception raised by the function (including
+                interrupts, eg. KeyboardInterrupt), in the caller that ran it
+                and in all waiting callers
+        """
+
+        with self.__lock:
+            call = self.__calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.__calls[key] = call
+            else:
+                self.collapsed += 1
+
+        # another caller is running the function for this key, wait for it
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args)
+        except BaseException as e:
+            # waiting callers must not take the unset result for the
+            # function's return value, whatever interrupted it
+            call.error = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.done.set()
+        return call.result
+
+class _Call:
+    """result of an in-flight SingleFlight call"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
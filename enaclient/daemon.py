@@ -0,0 +1,390 @@
+"""daemon.py - serve metadata lookups from a long-running process
+
+This module contains the class MetadataDaemon, run by the "serve"
+subcommand. The daemon holds one ENAClient for its whole life, so its
+connection pool stays warm and its in-memory cache is shared by every job
+on the node, and answers lookups over a Unix socket (or localhost http):
+
+    GET /health              process id, address and requests served
+    GET /metadata/<id>       response dictionary of a sequence id
+    POST /metadata           {"ids": [...]}, answered with {"responses":
+                             [...]} in input order
+
+Concurrent lookups of the same sequence id, from one job or many, are
+collapsed into one API request by the ENAClient. Command line runs use the
+daemon on the default socket if one is running (see ENAClient.get_daemon),
+through the DaemonClient of lighthttp.py.
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import urlsplit, unquote
+from enaclient.lighthttp import DaemonClient
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """Answer the http requests of a connection to the daemon"""
+
+    # keep connections alive between the lookups of a job
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        """answer a health check or the lookup of one sequence id"""
+
+        metadata_daemon = self.server.metadata_daemon
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if parts == ["health"]:
+            self.__respond(200, metadata_daemon.get_health())
+        elif len(parts) == 2 and parts[0] == "metadata" and parts[1]:
+            self.__respond_lookup(metadata_daemon.lookup, unquote(parts[1]))
+        else:
+            self.__respond(404, {"error": "not found: %s" % (self.path)})
+
+    def do_POST(self):
+        """answer the lookup of many sequence ids"""
+
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if urlsplit(self.path).path.strip("/") != "metadata":
+            self.__respond(404, {"error": "not found: %s" % (self.path)})
+            return
+        try:
+            sequence_ids = json.loads(body.decode("utf-8"))["ids"]
+            if not isinstance(sequence_ids, list) or not all(
+                    isinstance(sequence_id, str)
+                    for sequence_id in sequence_ids):
+                raise TypeError("ids is not a list of strings")
+        except (ValueError, KeyError, TypeError) as e:
+            self.__respond(400, {"error": "invalid request: %s" % (e)})
+            return
+        self.__respond_lookup(
+            lambda sequence_ids: {"responses": self.server.metadata_daemon
+                                  .lookup_many(sequence_ids)},
+            sequence_ids)
+
+    def log_message(self, format, *args):
+        """do not log requests, a daemon may serve millions"""
+        pass
+
+    def __respond_lookup(self, lookup, *args):
+        """send the answer of a lookup, or a 500 response if it failed
+
+        A failed lookup is answered rather than dropping the connection, so
+        that the client can tell the daemon is still running.
+
+        Args:
+            lookup (callable): lookup method of the MetadataDaemon
+            *args: arguments of the lookup
+        """
+
+        try:
+            answer = lookup(*args)
+        except Exception as e:
+            self.__respond(500, {"error": "lookup failed: %s" % (e)})
+            return
+        self.__respond(200, answer)
+
+    def __respond(self, status_code, body):
+        """send a JSON response
+
+        Args:
+            status_code (int): http status code
+            body (obj): response body, encoded as JSON
+        """
+
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    """http server on a Unix socket, one thread per connection"""
+
+    daemon_threads = True
+    block_on_close = False
+
+class ThreadingLocalHTTPServer(ThreadingMixIn, HTTPServer):
+    """http server on a localhost port, one thread per connection"""
+
+    daemon_threads = True
+    block_on_close = False
+
+class MetadataDaemon:
+    """Serve the lookups of one ENAClient to other processes
+
+    Outstanding writes to the on-disk cache and alias index are committed
+    every few seconds, so that they do not hold the database's write lock
+    while other processes (eg. runs that do not use the daemon) share it.
+    """
+
+    DEFAULT_WORKERS = 8
+    FLUSH_INTERVAL_SECS = 2
+
+    def __init__(self, client, address, workers=DEFAULT_WORKERS,
+                 flush_secs=FLUSH_INTERVAL_SECS):
+        """instantiate the MetadataDaemon, listening on its address
+
+        A socket left behind by a daemon that is no longer running is
+        replaced.
+
+        Args:
+            client (ENAClient): client looking up the metadata
+            address (str): path to the Unix socket, or an http://host:port
+                URL (port 0 picks a free port)
+            workers (int): concurrent lookups of the sequence ids of a POST
+                request
+            flush_secs (float): seconds between commits of the on-disk
+                cache and alias index
+
+        Returns:
+            (class MetadataDaemon): the MetadataDaemon
+
+        Raises:
+            ValueError: if a daemon is already running on the address
+        """
+
+        self.client = client
+        self.requests = 0
+        self.lookups = 0
+        self.started_at = time.time()
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=workers)
+
+        if DaemonClient.is_http_address(address):
+            parts = urlsplit(address)
+            self.__server = ThreadingLocalHTTPServer(
+                (parts.hostname, parts.port or 0), DaemonRequestHandler)
+            self.socket_path = None
+            self.address = "http://%s:%s" % self.__server.server_address[:2]
+        else:
+            if os.path.exists(address):
+                if DaemonClient(address, timeout=1).is_running():
+                    raise ValueError("ERROR: a daemon is already running on "
+                                     + "%s\n" % (address))
+                os.remove(address)
+            dirname = os.path.dirname(address)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            self.__server = ThreadingUnixHTTPServer(address,
+                                                    DaemonRequestHandler)
+            # only processes of the same user can use the daemon
+            os.chmod(address, 0o600)
+            self.socket_path = address
+            self.address = address
+        self.__server.metadata_daemon = self
+
+        # commit cached responses periodically
+        self.__stopped = threading.Event()
+        self.__flusher = threading.Thread(target=self.__flush_periodically,
+                                          args=(flush_secs,), daemon=True)
+        self.__flusher.start()
+
+    def lookup(self, sequence_id):
+        """look up the response dictionary of one sequence id
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+
+        Returns:
+            response_dict (dict): API response for the sequence id
+        """
+
+        with self.__lock:
+            self.requests += 1
+            self.lookups += 1
+        return self.client.get_response_dict(sequence_id)
+
+    def lookup_many(self, sequence_ids):
+        """look up the response dictionaries of many sequence ids
+
+        Each sequence id is looked up on its own (by a pool of workers), so
+        that lookups of the same sequence id by other requests in flight
+        are collapsed with it.
+
+        Args:
+            sequence_ids (list): md5sums/ids for the sequences of interest
+
+        Returns:
+            response_dicts (list): API response for each sequence id, in
+                input order
+        """
+
+        with self.__lock:
+            self.requests += 1
+            self.lookups += len(sequence_ids)
+        return list(self.__executor.map(self.client.get_response_dict,
+                                        sequence_ids))
+
+    def get_health(self):
+        """get the health of the daemon
+
+        Returns:
+            health (dict): process id, address, requests and lookups served,
+                and seconds since the daemon started
+        """
+
+        with self.__lock:
+            return {"pid": os.getpid(), "address": self.address,
+                    "requests": self.requests, "lookups": self.lookups,
+                    "uptime_secs": round(time.time() - self.started_at, 3)}
+
+    def flush(self):
+        """commit cached responses and indexed aliases"""
+
+        cache = self.client.get_cache(create=False)
+        if cache is not None:
+            cache.flush()
+        alias_index = self.client.get_alias_index(create=False)
+        if alias_index is not None:
+            alias_index.flush()
+
+    def serve_forever(self):
+        """answer requests until shutdown() is called"""
+
+        self.__server.serve_forever()
+
+    def shutdown(self):
+        """stop serve_forever(), from another thread"""
+
+        self.__server.shutdown()
+
+    def close(self):
+        """stop listening, removing the socket, and close the client,
+        committing cached responses"""
+
+        self.__stopped.set()
+        self.__flusher.join()
+        self.__server.server_close()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.__executor.shutdown(wait=True)
+        self.client.close()
+
+    def __flush_periodically(self, flush_secs):
+        """commit cached responses every few seconds until closed
+
+        Args:
+            flush_secs (float): seconds between commits
+        """
+
+        while not self.__stopped.wait(flush_secs):
+            self.flush()
+
+def stop_serving(signum, frame):
+    """signal handler stopping the daemon, as Ctrl-C does"""
+    raise KeyboardInterrupt()
+
+def main(args=sys.argv[2:]):
+    """run the "serve" subcommand
+
+    Runs a MetadataDaemon on a Unix socket (by default the socket that
+    command line runs look for) or a localhost port, until it is
+    interrupted or terminated.
+
+    Args:
+        args (list): subcommand arguments taken from command-line
+
+    Returns:
+        exit_code (int): 0 once stopped, 1 on error
+    """
+
+    # imported here, as the ENAClient imports the DaemonClient
+    from enaclient.enaclient import ENAClient
+
+    parser = argparse.ArgumentParser("python run-enaclient.py serve")
+    group_address = parser.add_mutually_exclusive_group()
+    group_address.add_argument('--socket', type=str,
+        default=ENAClient.default_daemon_address(),
+        help="path to the Unix socket to listen on (optional, default %s)"
+        % (ENAClient.default_daemon_address()))
+    group_address.add_argument('--port', type=int,
+        help="listen on this localhost port instead of a Unix socket, 0 "
+        + "picks a free port (runs use it with --daemon "
+        + "http://127.0.0.1:PORT)")
+    parser.add_argument('-w', '--workers', type=int,
+        default=MetadataDaemon.DEFAULT_WORKERS,
+        help="concurrent refget API requests for the sequence ids of a "
+        + "batch (optional, default %s)" % (MetadataDaemon.DEFAULT_WORKERS))
+    group_cache = parser.add_mutually_exclusive_group()
+    group_cache.add_argument('--cache_dir', '--cache-dir', type=str,
+        nargs="?", const=ENAClient.default_cache_dir(),
+        help="cache metadata on disk, in this directory (optional, %s if "
+        % (ENAClient.default_cache_dir())
+        + "no directory is given, by default no cache is used)")
+    group_cache.add_argument('--no_cache', '--no-cache', action="store_true",
+        help="do not read or write the on-disk metadata cache (the default)")
+    parser.add_argument('--memo_size', type=int,
+        help="maximum number of responses kept in memory (optional, "
+        + "default %s)" % (ENAClient.DEFAULT_MEMO_SIZE))
+    parser.add_argument('--mirror', type=str,
+        help="local snapshot of metadata, built with the mirror subcommand, "
+        + "that answers lookups before the cache and the API (optional)")
+    parser.add_argument('--base_url', '--base-url', type=str,
+        action="append",
+        help="base URL of a refget API serving sequence metadata, repeat to "
+        + "fail over to further endpoints (optional, default %s)"
+        % (ENAClient.API_BASE_URL))
+    parser.add_argument('--rate_limit', type=float,
+        help="maximum requests per second to the API, shared by every job "
+        + "using the daemon (optional, unlimited by default)")
+    args_dict = vars(parser.parse_args(args))
+
+    try:
+        if args_dict["workers"] < 1:
+            raise ValueError("ERROR: number of workers must be at least 1\n")
+        for setting in ["memo_size", "rate_limit"]:
+            if args_dict[setting] is not None and args_dict[setting] < 0:
+                raise ValueError("ERROR: %s must not be negative\n"
+                                 % (setting))
+        if args_dict["mirror"] and not os.path.exists(args_dict["mirror"]):
+            raise FileNotFoundError("ERROR: mirror snapshot not found: %s\n"
+                                    % (args_dict["mirror"]))
+        for base_url in args_dict["base_url"] or []:
+            if not base_url.startswith(("http://", "https://")):
+                raise ValueError("ERROR: base URL must start with http:// "
+                                 + "or https://: %s\n" % (base_url))
+
+        client = ENAClient(args=None)
+        client.set_workers(args_dict["workers"])
+        if args_dict["no_cache"]:
+            client.set_cache_dir(None)
+        elif args_dict["cache_dir"]:
+            client.set_cache_dir(args_dict["cache_dir"])
+        if args_dict["memo_size"] is not None:
+            client.set_memo_size(args_dict["memo_size"])
+        client.set_mirror_path(args_dict["mirror"])
+        client.set_base_urls(args_dict["base_url"])
+        if args_dict["rate_limit"]:
+            client.set_rate_limit(args_dict["rate_limit"])
+
+        address = args_dict["socket"] if args_dict["port"] is None \
+            else "http://127.0.0.1:%s" % (args_dict["port"])
+        metadata_daemon = MetadataDaemon(client, address,
+                                         args_dict["workers"])
+    except (ValueError, FileNotFoundError, OSError) as e:
+        print(e)
+        return 1
+
+    # stop on SIGTERM as on Ctrl-C, removing the socket and committing the
+    # cache on the way out
+    signal.signal(signal.SIGTERM, stop_serving)
+    sys.stderr.write("enaclient daemon serving on %s (pid %s)\n"
+                     % (metadata_daemon.address, os.getpid()))
+    try:
+        metadata_daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        metadata_daemon.close()
+    sys.stderr.write("enaclient daemon stopped after %s lookups\n"
+                     % (metadata_daemon.lookups))
+    return 0
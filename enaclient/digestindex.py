@@ -0,0 +1,373 @@
+"""digestindex.py - files of records indexed by sequence digest
+
+This module contains the classes DigestIndexWriter and DigestIndexReader. A
+digest-indexed file holds opaque records, followed by an index of sequence
+digests (md5 or trunc512) sorted by key, so that a record can be found with a
+binary search over the memory-mapped file, without loading the file or the
+index into memory. Records can also be indexed by other identifiers (eg. the
+req_seq_id of enaclient output), through a hash of the identifier.
+
+File layout:
+    magic (8 bytes)
+    records (opaque bytes, in the order they were written)
+    index entries (sorted by key), each: key (25 bytes), record offset
+        (8 bytes), record length (4 bytes)
+    footer: index offset (8 bytes), entry count (8 bytes), magic (8 bytes)
+"""
+
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+# index keys are a digest type byte followed by the digest, right-padded to
+# the size of a trunc512 digest
+KEY_SIZE = 25
+KEY_TYPE_MD5 = b"m"
+KEY_TYPE_TRUNC512 = b"t"
+KEY_TYPE_HASH = b"h"
+MAGIC_SIZE = 8
+
+# index entries a DigestIndexWriter holds in memory before spilling them to
+# a temporary file as a sorted run
+SPILL_ENTRIES = 100000
+
+ENTRY = struct.Struct(">%dsQI" % (KEY_SIZE))
+FOOTER = struct.Struct(">QQ%ds" % (MAGIC_SIZE))
+
+def digest_key(sequence_id):
+    """get the index key of a sequence id
+
+    Args:
+        sequence_id (str): md5 (32 hex digits) or trunc512 (48 hex digits)
+            sequence id
+
+    Returns:
+        key (bytes): index key, or None if the sequence id is not an md5 or
+            trunc512 digest
+    """
+
+    try:
+        digest = bytes.fromhex(sequence_id)
+    except (TypeError, ValueError):
+        return None
+    if len(digest) == 16:
+        return KEY_TYPE_MD5 + digest + b"\0" * (KEY_SIZE - 17)
+    if len(digest) == 24:
+        return KEY_TYPE_TRUNC512 + digest
+    return None
+
+def identifier_key(identifier):
+    """get the index key of any identifier
+
+    md5 and trunc512 digests are keyed as by digest_key. Other identifiers
+    are keyed by a BLAKE2 hash of their UTF-8 encoding, so a record found by
+    such a key should be checked against the identifier.
+
+    Args:
+        identifier (str): digest, or any other identifier
+
+    Returns:
+        key (bytes): index key
+    """
+
+    key = digest_key(identifier)
+    if key is None:
+        key = KEY_TYPE_HASH + hashlib.blake2b(
+            identifier.encode("utf-8"), digest_size=KEY_SIZE - 1).digest()
+    return key
+
+class DigestIndexWriter:
+    """Write records to a binary handle, and index them by digest
+
+    Records are streamed to the handle as they are written. Index entries
+    are held in memory until there are spill_entries of them, then written
+    to a temporary file as a sorted run, so that memory use does not grow
+    with the number of records; finish() merges the runs into the sorted
+    index. A key added more than once points to the record it was last
+    added for.
+    """
+
+    def __init__(self, handle, magic, spill_entries=SPILL_ENTRIES):
+        """instantiate the DigestIndexWriter, writing the file magic
+
+        Args:
+            handle (file): binary handle, open for writing at its start
+            magic (bytes): 8-byte magic identifying the kind of file
+            spill_entries (int): index entries held in memory before they
+                are spilled to a sorted run
+
+        Returns:
+            (class DigestIndexWriter): the DigestIndexWriter
+        """
+
+        self.handle = handle
+        self.magic = magic
+        self.spill_entries = spill_entries
+        self.__offset = 0
+        self.__entries = {}
+        self.__runs = []
+        self.__spill_file = None
+        self.__write(magic)
+
+    def write_record(self, record):
+        """write a record
+
+        Args:
+            record (bytes): record to write
+
+        Returns:
+            location (tuple): offset and length of the record, to be passed
+                to add_key
+        """
+
+        location = (self.__offset, len(record))
+        self.__write(record)
+        return location
+
+    def add_key(self, key, location):
+        """index a record by a key
+
+        Args:
+            key (bytes): index key from digest_key
+            location (tuple): offset and length returned by write_record
+        """
+
+        self.__entries[key] = location
+        if len(self.__entries) >= self.spill_entries:
+            self.__spill()
+
+    def finish(self):
+        """write the sorted index and the footer
+
+        Returns:
+            count (int): number of index entries
+        """
+
+        index_offset = self.__offset
+        count = 0
+        if self.__runs:
+            self.__spill()
+            try:
+                for entry in self.__iter_merged_runs():
+                    self.__write(entry)
+                    count += 1
+            finally:
+                self.__spill_file.close()
+                self.__spill_file = None
+                self.__runs = []
+        else:
+            for key in sorted(self.__entries):
+                offset, length = self.__entries[key]
+                self.__write(ENTRY.pack(key, offset, length))
+            count = len(self.__entries)
+        self.__write(FOOTER.pack(index_offset, count, self.magic))
+        self.__entries = {}
+        return count
+
+    def __spill(self):
+        """write the index entries held in memory to the temporary file, as
+        a sorted run"""
+
+        if not self.__entries:
+            return
+        if self.__spill_file is None:
+            self.__spill_file = tempfile.TemporaryFile()
+        self.__spill_file.seek(0, os.SEEK_END)
+        self.__runs.append((self.__spill_file.tell(), len(self.__entries)))
+        self.__spill_file.write(b"".join(
+            ENTRY.pack(key, *self.__entries[key])
+            for key in sorted(self.__entries)))
+        self.__entries = {}
+
+    def __iter_merged_runs(self):
+        """merge the sorted runs of the temporary file
+
+        Yields:
+            entry (bytes): each packed index entry, sorted by key. a key in
+                several runs keeps its entry of the latest run
+        """
+
+        self.__spill_file.flush()
+        mm = mmap.mmap(self.__spill_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            runs = [DigestIndexWriter.__iter_run(mm, run_index, offset, count)
+                    for run_index, (offset, count)
+                    in enumerate(self.__runs)]
+            previous = None
+            for key, run_index, position in heapq.merge(*runs):
+                if previous is not None and key != previous[0]:
+                    yield mm[previous[1]:previous[1] + ENTRY.size]
+                previous = (key, position)
+            if previous is not None:
+                yield mm[previous[1]:previous[1] + ENTRY.size]
+        finally:
+            mm.close()
+
+    @staticmethod
+    def __iter_run(mm, run_index, offset, count):
+        """iterate over the entries of a sorted run
+
+        Args:
+            mm (mmap): the mapped temporary file
+            run_index (int): index of the run, ordering equal keys
+            offset (int): offset of the run in the file
+            count (int): number of entries in the run
+
+        Yields:
+            entry (tuple): key, run index and offset of each entry
+        """
+
+        for position in range(offset, offset + count * ENTRY.size,
+                              ENTRY.size):
+            yield (mm[position:position + KEY_SIZE], run_index, position)
+
+    def __write(self, data):
+        """write bytes to the handle, tracking the offset
+
+        Args:
+            data (bytes): bytes to write
+        """
+
+        self.handle.write(data)
+        self.__offset += len(data)
+
+class DigestIndexReader:
+    """Look up records of a digest-indexed file by binary search
+
+    The file is memory-mapped read-only, so lookups only touch the pages of
+    the index entries and the record they need, and the reader can be shared
+    by concurrent threads.
+    """
+
+    def __init__(self, path, magic):
+        """instantiate the DigestIndexReader, memory-mapping the file
+
+        Args:
+            path (str): path to the digest-indexed file
+            magic (bytes): 8-byte magic the file must have
+
+        Returns:
+            (class DigestIndexReader): the DigestIndexReader
+
+        Raises:
+            ValueError: if the file is not a digest-indexed file of the
+                given kind
+        """
+
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__file = open(path, "rb")
+        size = os.fstat(self.__file.fileno()).st_size
+        if size < MAGIC_SIZE + FOOTER.size:
+            self.__file.close()
+            raise ValueError("ERROR: not a digest-indexed file: %s\n"
+                             % (path))
+        self.__mmap = mmap.mmap(self.__file.fileno(), 0,
+                                access=mmap.ACCESS_READ)
+        index_offset, self.count, footer_magic = FOOTER.unpack_from(
+            self.__mmap, size - FOOTER.size)
+        if self.__mmap[:MAGIC_SIZE] != magic or footer_magic != magic:
+            self.close()
+            raise ValueError("ERROR: not a digest-indexed file: %s\n"
+                             % (path))
+        self.__index_offset = index_offset
+
+    def get(self, key):
+        """get the record indexed by a key
+
+        Args:
+            key (bytes): index key from digest_key
+
+        Returns:
+            record (bytes): the record, or None if the key is not indexed
+        """
+
+        location = self.get_location(key)
+        if location is None:
+            return None
+        offset, length = location
+        return self.__mmap[offset:offset + length]
+
+    def get_location(self, key):
+        """get the location of the record indexed by a key
+
+        Args:
+            key (bytes): index key from digest_key
+
+        Returns:
+            location (tuple): offset and length of the record, or None if
+                the key is not indexed
+        """
+
+        mm = self.__mmap
+        index_offset = self.__index_offset
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            position = index_offset + middle * ENTRY.size
+            middle_key = mm[position:position + KEY_SIZE]
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return struct.unpack_from(">QI", mm, position + KEY_SIZE)
+        return None
+
+    def iter_records(self, terminator=b"\n"):
+        """iterate over all records, in the order they were written
+
+        Only for files whose records each end with a terminator (eg. one
+        line per record). Records are read from the mapped file one at a
+        time.
+
+        Args:
+            terminator (bytes): byte sequence ending each record
+
+        Yields:
+            record (bytes): each record, including its terminator
+        """
+
+        for offset, record in self.iter_located_records(terminator):
+            yield record
+
+    def iter_located_records(self, terminator=b"\n"):
+        """iterate over all records with their offset, in the order they
+        were written
+
+        As iter_records, the offset of each record telling whether it is
+        the record its keys are indexed to (see get_location).
+
+        Args:
+            terminator (bytes): byte sequence ending each record
+
+        Yields:
+            located_record (tuple): offset of each record, and the record
+                including its terminator
+        """
+
+        mm = self.__mmap
+        position = MAGIC_SIZE
+        while position < self.__index_offset:
+            end = mm.find(terminator, position, self.__index_offset)
+            end = self.__index_offset if end < 0 else end + len(terminator)
+            yield (position, mm[position:end])
+            position = end
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """unmap and close the file"""
+
+        with self.__lock:
+            if self.__mmap is not None:
+                self.__mmap.close()
+                self.__mmap = None
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
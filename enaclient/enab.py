@@ -0,0 +1,136 @@
+"""enab.py - random access to enab output
+
+This module contains the class EnabReader. An enab file ("-f enab") is the
+output of a batch in a compact, indexed form: each record is the response
+dictionary as one line of compact JSON, and the records are followed by an
+index of their req_seq_id sorted by key (see digestindex.py). A reader
+memory-maps the file and finds the record of any req_seq_id with a binary
+search over the index, in O(log n), without loading or parsing the rest of
+the file, however large it is.
+
+    from enaclient.enab import EnabReader
+
+    with EnabReader("metadata.enab") as reader:
+        response_dict = reader.get("3050107579885e1608e6fe50fae3f8d0")
+"""
+
+import json
+from enaclient.digestindex import DigestIndexReader, identifier_key, \
+                                  digest_key, MAGIC_SIZE
+from enaclient.results import MetadataResult
+
+# magic at the start and end of an enab file
+ENAB_MAGIC = b"ENAB0001"
+
+def is_enab_file(path):
+    """check whether a file is enab output
+
+    Args:
+        path (str): path to the file
+
+    Returns:
+        enab (bool): true if the file starts with the enab magic
+    """
+
+    try:
+        with open(path, "rb") as handle:
+            return handle.read(MAGIC_SIZE) == ENAB_MAGIC
+    except OSError:
+        return False
+
+class EnabReader:
+    """Look up the records of enab output by req_seq_id
+
+    The file is memory-mapped read-only, so a lookup only touches the pages
+    of the index entries and the record it needs, and the reader can be
+    shared by concurrent threads. If a req_seq_id was written more than
+    once, the last record written for it is found.
+    """
+
+    def __init__(self, path):
+        """instantiate the EnabReader, memory-mapping the file
+
+        Args:
+            path (str): path to the enab file
+
+        Returns:
+            (class EnabReader): the EnabReader
+
+        Raises:
+            ValueError: if the file is not enab output
+        """
+
+        self.path = path
+        try:
+            self.__reader = DigestIndexReader(path, ENAB_MAGIC)
+        except ValueError:
+            raise ValueError("ERROR: not an enab file: %s\n" % (path))
+
+    def get(self, req_seq_id):
+        """get the record of a req_seq_id
+
+        md5 and trunc512 digests are found whatever their case, other
+        identifiers (eg. aliases) only as written.
+
+        Args:
+            req_seq_id (str): sequence id the record was requested with
+
+        Returns:
+            response_dict (dict): the record, or None if the file holds no
+                record for the sequence id
+        """
+
+        record = self.__reader.get(identifier_key(req_seq_id))
+        if record is None:
+            return None
+        response_dict = json.loads(record.decode("utf-8"))
+
+        # other identifiers are indexed by hash, check the record is theirs
+        if digest_key(req_seq_id) is None \
+           and response_dict.get("req_seq_id") != req_seq_id:
+            return None
+        return response_dict
+
+    def get_result(self, req_seq_id):
+        """get the record of a req_seq_id as a structured result
+
+        Args:
+            req_seq_id (str): sequence id the record was requested with
+
+        Returns:
+            result (MetadataResult): the record, or None if the file holds
+                no record for the sequence id
+        """
+
+        response_dict = self.get(req_seq_id)
+        if response_dict is None:
+            return None
+        return MetadataResult.from_response_dict(response_dict)
+
+    def __contains__(self, req_seq_id):
+        return self.get(req_seq_id) is not None
+
+    def __iter__(self):
+        """iterate over every record, in the order they were written
+
+        Yields:
+            response_dict (dict): each record
+        """
+
+        for record in self.__reader.iter_records():
+            yield json.loads(record.decode("utf-8"))
+
+    def __len__(self):
+        """number of distinct req_seq_ids indexed"""
+        return len(self.__reader)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """unmap and close the file"""
+
+        self.__reader.close()
@@ -7,13 +7,32 @@ mode, and returned metadata can be formated as JSON, XML, or YAML.
 
 import os
 import sys
-import re
 import argparse
-import requests
-import json
-import yaml
-from dicttoxml import dicttoxml
-from xml.dom.minidom import parseString
+import itertools
+import threading
+import time
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from enaclient.lighthttp import LightSessionPool, DaemonClient, DaemonError
+from enaclient.aliases import AliasIndex
+from enaclient.endpoints import EndpointPool
+from enaclient.cache import MetadataCache, LRUCache, SingleFlight
+from enaclient.journal import Journal
+from enaclient.pipeline import Stage
+from enaclient.metrics import RequestTrace, RunStats, OpenTelemetryObserver, \
+                              STAGE_RATE_LIMIT, STAGE_DECODE, STAGE_FAILED, \
+                              STAGE_BACKOFF, STAGE_SERVER, \
+                              reset_connect_secs, get_connect_secs
+from enaclient.results import MetadataResult
+from enaclient.readers import read_sequence_ids, is_valid_sequence_id, \
+                              guess_input_format, read_manifest_header, \
+                              get_column_index, MANIFEST_DELIMITERS, \
+                              INPUT_FORMAT_LINES, STDIN
+from enaclient.throttle import AdaptiveRateLimiter, RetryPolicy, \
+                              parse_retry_after
+from enaclient.writers import JSONWriter, XMLWriter, YAMLWriter, \
+                              NDJSONWriter, CSVWriter, ParquetWriter, \
+                              EnabWriter
 
 class ENAClient:
     """Retrieve ENA sequence metadata through refget API and format responses
@@ -33,34 +52,146 @@ class ENAClient:
     OUTPUT_FORMAT_JSON = 0
     OUTPUT_FORMAT_XML = 1
     OUTPUT_FORMAT_YAML = 2
+    OUTPUT_FORMAT_NDJSON = 3
+    OUTPUT_FORMAT_CSV = 4
+    OUTPUT_FORMAT_PARQUET = 5
+    OUTPUT_FORMAT_ENAB = 6
+
+    # writer class for each output format, and the output format for each
+    # name accepted on the command line
+    WRITER_CLASSES = {
+        OUTPUT_FORMAT_JSON: JSONWriter,
+        OUTPUT_FORMAT_XML: XMLWriter,
+        OUTPUT_FORMAT_YAML: YAMLWriter,
+        OUTPUT_FORMAT_NDJSON: NDJSONWriter,
+        OUTPUT_FORMAT_CSV: CSVWriter,
+        OUTPUT_FORMAT_PARQUET: ParquetWriter,
+        OUTPUT_FORMAT_ENAB: EnabWriter
+    }
+    OUTPUT_FORMAT_NAMES = dict((writer_class.NAME, output_format)
+        for output_format, writer_class in WRITER_CLASSES.items())
 
     OUTPUT_MODE_STDOUT = 0
     OUTPUT_MODE_FILE = 1
 
-    DEFAULT_TIMEOUT_SECS = 10
+    OUTPUT_BUFFER_SIZE = 1024 * 1024
 
-    def __init__(self, args=sys.argv[1:]):
+    DEFAULT_TIMEOUT_SECS = 10
+    DEFAULT_WORKERS = 1
+    DEFAULT_POOL_SIZE = 10
+
+    DEFAULT_CACHE_TTL_SECS = 30 * 24 * 60 * 60
+    DEFAULT_CACHE_NEGATIVE_TTL_SECS = 0
+    DEFAULT_CACHE_MAX_ENTRIES = 1000000
+    DEFAULT_MEMO_SIZE = 100000
+
+    DEFAULT_BATCH_CHUNK_SIZE = 100
+    DEFAULT_BATCH_WORKERS = 4
+
+    DEFAULT_MAX_RETRIES = 3
+    DEFAULT_BACKOFF_BASE_SECS = 0.5
+    DEFAULT_BACKOFF_MAX_SECS = 30
+
+    DAEMON_SOCKET_NAME = "daemon.sock"
+
+    # args changing how lookups are made, which a daemon would not apply to
+    # the lookups sent to it
+    DAEMON_EXCLUDED_ARGS = ["cache_dir", "no_cache", "refresh", "revalidate",
+                            "cache_ttl", "cache_negative_ttl",
+                            "cache_max_entries", "mirror", "base_url",
+                            "hedge", "baseline"]
+
+    # args tuning lookups (retries, rate, connections, memo), applied by the
+    # daemon rather than by the run: they are ignored, with a warning, when
+    # lookups are sent to a daemon
+    DAEMON_IGNORED_ARGS = ["pool_size", "connection_lifetime", "max_retries",
+                           "backoff_base", "backoff_max", "rate_limit",
+                           "memo_size"]
+
+    def __init__(self, args=sys.argv[1:], pool_size=None,
+                 connection_lifetime=None):
         """instantiate the ENAClient
 
         Args:
-            args (list): parameter specifications taken from command-line
+            args (list): parameter specifications taken from command-line,
+                or None to keep the default settings when the client is used
+                as a library (change them with the set_* methods)
+            pool_size (int): maximum number of keep-alive connections to the
+                API, by default the larger of 10 and the number of workers
+            connection_lifetime (float): seconds before pooled connections
+                are closed and reopened, by default they are kept open
 
         Returns:
             (class ENAClient): the ENAClient
         """
 
+        # lock guarding the lazy creation of shared resources (session pool,
+        # cache) by concurrent workers, which read them without it once
+        # created, and lock guarding the counters they update
+        self.__resource_lock = threading.Lock()
+        self.__counter_lock = threading.Lock()
+
         # set default settings in case these properties are not overriden
         # via command-line args
         self.__set_input_mode(ENAClient.INPUT_MODE_SINGLE)
         self.__set_output_mode(ENAClient.OUTPUT_MODE_STDOUT)
-        self.__set_output_format(ENAClient.OUTPUT_FORMAT_JSON)
+        self.set_output_format(ENAClient.OUTPUT_FORMAT_JSON)
         self.__set_output_file(None)
         self.__set_valid_args(False)
         self.set_timeout_secs(ENAClient.DEFAULT_TIMEOUT_SECS)
+        self.set_workers(ENAClient.DEFAULT_WORKERS)
+        self.set_pool_size(pool_size)
+        self.set_connection_lifetime(connection_lifetime)
+        self.__set_session_pool(None)
+        self.set_cache_dir(None)
+        self.set_cache_ttl(ENAClient.DEFAULT_CACHE_TTL_SECS)
+        self.set_cache_negative_ttl(ENAClient.DEFAULT_CACHE_NEGATIVE_TTL_SECS)
+        self.set_cache_max_entries(ENAClient.DEFAULT_CACHE_MAX_ENTRIES)
+        self.set_refresh(False)
+        self.set_revalidate(False)
+        self.__set_not_modified(0)
+        self.__set_cache(None)
+        self.__set_alias_index(None)
+        self.set_memo_size(ENAClient.DEFAULT_MEMO_SIZE)
+        self.__set_memo(None)
+        self.__single_flight = SingleFlight()
+        self.set_resume(False)
+        self.set_max_retries(ENAClient.DEFAULT_MAX_RETRIES)
+        self.set_backoff_base(ENAClient.DEFAULT_BACKOFF_BASE_SECS)
+        self.set_backoff_max(ENAClient.DEFAULT_BACKOFF_MAX_SECS)
+        self.set_rate_limit(None)
+        self.__set_rate_limiter(None)
+        self.__set_retry_policy(None)
+        self.set_input_format(None)
+        self.set_id_column(None)
+        self.set_mirror_path(None)
+        self.__set_mirror(None)
+        self.set_base_urls(None)
+        self.__set_endpoint_pool(None)
+        self.set_hedge(False)
+        self.__set_hedge_executor(None)
+        self.set_batch_path(None)
+        self.set_observers([])
+        self.set_stats(False)
+        self.set_metrics_file(None)
+        self.__set_run_stats(None)
+        self.set_processes(1)
+        self.set_keep_shards(False)
+        self.__set_shard(0, 1)
+        self.set_baseline_path(None)
+        self.__set_baseline(None)
+        self.set_daemon_address(None)
+        self.__set_daemon(None)
+        self.set_in_flight(None)
+        self.set_flush_every(0)
+        self.__set_args(args)
 
         # parse command-line args, changing properties as necessary
         # verify that a valid set of args was passed (ie passes error checks)
-        self.__parse_args(args)
+        if args is not None:
+            self.__parse_args(args)
+        else:
+            self.__set_args_dict(None)
 
     def __parse_args(self, args):
         """parse command-line args, changing properties as necessary
@@ -75,8 +206,25 @@ class ENAClient:
 
         Raises:
             ArgumentError: if invalid output format specified
-            ValueError: if neither sequence id nor input file were provided
-            FileNotFoundError: if input file or output directory not found
+            ValueError: if neither sequence id nor input file were provided,
+                if an id column is given for input that is not a manifest,
+                if a binary output format is written to stdout, if resume
+                is requested outside of batch mode with an output file,
+                if the number of workers, pool size, maximum cache entries
+                or in-flight window is less than 1, or if the connection
+                lifetime, a cache ttl, the memo size, a retry setting, the
+                rate limit or the flush interval is negative,
+                if a base URL is not an http(s) URL, or if hedging is
+                requested with a single endpoint, or if OpenTelemetry spans
+                are requested without opentelemetry-api installed, if the
+                number of processes is less than 1, or if sharded mode is
+                requested without an input file, with resume, a metrics file
+                or a baseline, or shards are kept without an output file, or
+                if a baseline is combined with resume, or if a daemon is
+                combined with an option changing how lookups are made
+            FileNotFoundError: if input file, output directory, mirror
+                snapshot, metrics file directory, baseline or daemon socket
+                not found
         """
 
         # add arguments to the parser, makes provisions for sequence id,
@@ -87,14 +235,140 @@ class ENAClient:
         sequence_id_arg = group_input_mode.add_argument('-s', '--sequence_id',
             type=str, help="sequence id (not compatible with -i option)")
         group_input_mode.add_argument('-i', '--input_file', type=str,
-            help="input file containing sequence ids (not compatible with "
+            help="input file containing sequence ids, - to read from stdin, "
+            + "may be gzip/bzip2/zstandard compressed (not compatible with "
             + "-s option)")
+        parser.add_argument('--input_format', type=str,
+            choices=[INPUT_FORMAT_LINES] + sorted(MANIFEST_DELIMITERS),
+            help="input file format, one sequence id per line or a TSV/CSV "
+            + "manifest with a header row (optional, guessed from the file "
+            + "extension by default)")
+        parser.add_argument('--id_column', type=str,
+            help="name or number (from 1) of the sequence id column of a "
+            + "TSV/CSV manifest (optional, default is the first column)")
         output_format_arg = parser.add_argument('-f', '--output_format',
-            type=str, help="output format, specify [text|json|xml]. (optional, "
-            + "will output text by default)")
+            type=str, help="output format, specify "
+            + "[json|xml|yaml|ndjson|csv|parquet|enab]. (optional, will "
+            + "output json by default, parquet and enab require an output "
+            + "file)")
         parser.add_argument('-o', '--output_file', type=str,
             help="path to output file (optional, will print to stdout by "
             + "default)")
+        parser.add_argument('-w', '--workers', type=int,
+            help="number of concurrent refget API requests in batch mode "
+            + "(optional, default %s)" % (ENAClient.DEFAULT_WORKERS))
+        parser.add_argument('--pool_size', type=int,
+            help="maximum number of keep-alive connections to the API "
+            + "(optional, default is the larger of %s and the number of "
+            % (ENAClient.DEFAULT_POOL_SIZE) + "workers)")
+        parser.add_argument('--connection_lifetime', type=float,
+            help="seconds before keep-alive connections are closed and "
+            + "reopened, 0 opens a new connection for every request "
+            + "(optional, connections are kept open by default)")
+        group_cache = parser.add_mutually_exclusive_group()
+        group_cache.add_argument('--cache_dir', '--cache-dir', type=str,
+            nargs="?", const=ENAClient.default_cache_dir(),
+            help="cache metadata on disk, in this directory (optional, "
+            + "%s if no directory is given, " % (ENAClient.default_cache_dir())
+            + "by default no cache is used)")
+        group_cache.add_argument('--no_cache', '--no-cache',
+            action="store_true",
+            help="do not read or write the on-disk metadata cache (the "
+            + "default)")
+        parser.add_argument('--refresh', action="store_true",
+            help="ignore cached metadata, requesting every sequence id from "
+            + "the API and updating the cache")
+        parser.add_argument('--revalidate', action="store_true",
+            help="check cached metadata with the API whether or not it has "
+            + "expired, with conditional requests (If-None-Match) where the "
+            + "API sent an ETag")
+        parser.add_argument('--cache_ttl', type=float,
+            help="seconds that cached metadata stays valid (optional, "
+            + "default %s)" % (ENAClient.DEFAULT_CACHE_TTL_SECS))
+        parser.add_argument('--cache_negative_ttl', type=float,
+            help="seconds that cached not found (404) responses stay valid "
+            + "(optional, by default they are not cached)")
+        parser.add_argument('--cache_max_entries', type=int,
+            help="maximum number of cached responses, least recently used "
+            + "are evicted first (optional, default %s)"
+            % (ENAClient.DEFAULT_CACHE_MAX_ENTRIES))
+        parser.add_argument('--resume', action="store_true",
+            help="journal completed responses next to the output file, and "
+            + "if a journal from an interrupted run exists, continue from "
+            + "where it stopped (batch mode with an output file only)")
+        parser.add_argument('--max_retries', type=int,
+            help="maximum retries of a request that timed out, lost its "
+            + "connection, or got a 429/5xx response (optional, default %s)"
+            % (ENAClient.DEFAULT_MAX_RETRIES))
+        parser.add_argument('--backoff_base', type=float,
+            help="seconds of the first retry backoff, doubling with each "
+            + "retry (optional, default %s)"
+            % (ENAClient.DEFAULT_BACKOFF_BASE_SECS))
+        parser.add_argument('--backoff_max', type=float,
+            help="maximum seconds of a retry backoff (optional, default %s)"
+            % (ENAClient.DEFAULT_BACKOFF_MAX_SECS))
+        parser.add_argument('--rate_limit', type=float,
+            help="maximum requests per second, lowered automatically when "
+            + "the API answers 429 (optional, unlimited by default)")
+        parser.add_argument('--mirror', type=str,
+            help="local snapshot of metadata, built with the mirror "
+            + "subcommand, that answers lookups before the cache and the "
+            + "API (optional)")
+        parser.add_argument('--base_url', '--base-url', type=str,
+            action="append",
+            help="base URL of a refget API serving sequence metadata, repeat "
+            + "to fail over to further endpoints in the order given "
+            + "(optional, default %s)" % (ENAClient.API_BASE_URL))
+        parser.add_argument('--hedge', action="store_true",
+            help="if a request is slower than the 95th percentile latency "
+            + "of its endpoint, send it to a second endpoint as well and use "
+            + "the first response (requires two or more --base_url)")
+        parser.add_argument('--stats', action="store_true",
+            help="write a summary of the run to stderr: throughput, latency "
+            + "of each request stage, status codes and bytes received")
+        parser.add_argument('--metrics_file', type=str,
+            help="write the statistics of the run to this file in the "
+            + "Prometheus text format (optional)")
+        parser.add_argument('--otel', action="store_true",
+            help="emit an OpenTelemetry span for each request, with a child "
+            + "span for each stage (requires opentelemetry-api)")
+        parser.add_argument('--processes', type=int,
+            help="number of worker processes in batch mode, each running "
+            + "its own client over a shard of the input (optional, default "
+            + "1)")
+        parser.add_argument('--keep_shards', action="store_true",
+            help="with --processes, leave the output of each worker in its "
+            + "own file (eg. output.shard-1-of-4.json) rather than merging "
+            + "them into the output file")
+        parser.add_argument('--baseline', type=str,
+            help="previous JSON/NDJSON/enab output to compare with, only "
+            + "records that were added, changed, newly not found (404) or "
+            + "that failed are written (implies --revalidate)")
+        parser.add_argument('--memo_size', type=int,
+            help="maximum number of responses kept in memory, so that "
+            + "repeated sequence ids are only requested once per run, 0 to "
+            + "disable (optional, default %s)" % (ENAClient.DEFAULT_MEMO_SIZE))
+        parser.add_argument('--in_flight', type=int,
+            help="maximum requests pending at once in batch mode, bounding "
+            + "how far the input is read ahead of the output (optional, "
+            + "default twice the number of workers)")
+        parser.add_argument('--flush_every', '--flush-every', type=int,
+            help="flush the output every N records rather than when its "
+            + "%s MB buffer is full, eg. for a reader following the output "
+            % (ENAClient.OUTPUT_BUFFER_SIZE // (1024 * 1024))
+            + "(optional)")
+        group_daemon = parser.add_mutually_exclusive_group()
+        group_daemon.add_argument('--daemon', type=str, nargs="?",
+            const=ENAClient.default_daemon_address(),
+            help="send lookups to the enaclient daemon (see the serve "
+            + "subcommand) on this Unix socket or http://host:port URL, "
+            + "or on %s if no address is given "
+            % (ENAClient.default_daemon_address())
+            + "(optional, defaults to the ENACLIENT_DAEMON environment "
+            + "variable, lookups are made directly if it is not set)")
+        group_daemon.add_argument('--no_daemon', action="store_true",
+            help="look up sequence ids directly, even if ENACLIENT_DAEMON "
+            + "is set")
 
         args_dict = None
 
@@ -108,26 +382,47 @@ class ENAClient:
                      + "Specify sequence id with -s or input file with -i\n")
 
             # set input mode to "batch" instead of "single" if input file
-            # specified. check input file exists, raise FileNotFoundError
-            # otherwise
+            # specified. check input file exists (unless reading stdin),
+            # raise FileNotFoundError otherwise
             if args_dict["input_file"]:
                 self.__set_input_mode(ENAClient.INPUT_MODE_BATCH)
-                if not os.path.exists(args_dict["input_file"]):
+                if args_dict["input_file"] != STDIN \
+                   and not os.path.exists(args_dict["input_file"]):
                     raise FileNotFoundError("ERROR: input file not found: "
                         + "%s\n" % (args_dict["input_file"]))
 
-            # set output format. default is json, can be changed to xml or
-            # yaml if correct arg provided. if format arg is anything else
-            # other than json, xml, or yaml, raise ArgumentError
-            if args_dict["output_format"] in set(["json", None]):
+            # set the input format and id column, raise ValueError if an id
+            # column is given for input with one sequence id per line, or is
+            # not in the manifest header (unless reading stdin)
+            if args_dict["input_format"]:
+                self.set_input_format(args_dict["input_format"])
+            if args_dict["id_column"]:
+                input_format = self.get_input_format() \
+                    or guess_input_format(args_dict["input_file"] or "")
+                if input_format not in MANIFEST_DELIMITERS:
+                    raise ValueError("ERROR: --id_column requires a TSV/CSV "
+                        + "manifest, specify one with --input_format\n")
+                if args_dict["input_file"] \
+                   and args_dict["input_file"] != STDIN:
+                    header = read_manifest_header(args_dict["input_file"],
+                                                  input_format)
+                    if header is not None:
+                        get_column_index(header, args_dict["id_column"])
+                self.set_id_column(args_dict["id_column"])
+
+            # set output format. default is json, can be changed to any
+            # format with a writer if correct arg provided. if format arg is
+            # anything else, raise ArgumentError
+            output_format_names = ENAClient.OUTPUT_FORMAT_NAMES
+            if args_dict["output_format"] is None:
                 pass
-            elif args_dict["output_format"] == "xml":
-                self.__set_output_format(ENAClient.OUTPUT_FORMAT_XML)
-            elif args_dict["output_format"] == "yaml":
-                self.__set_output_format(ENAClient.OUTPUT_FORMAT_YAML)
+            elif args_dict["output_format"] in output_format_names:
+                self.set_output_format(
+                    output_format_names[args_dict["output_format"]])
             else:
                 raise argparse.ArgumentError(output_format_arg,
-                    "invalid output format, specify json, xml, or yaml\n")
+                    "invalid output format, specify %s\n"
+                    % (", ".join(sorted(output_format_names))))
 
             # set output mode to file instead of stdout if output file provided
             # check that output directory exists, raise FileNotFoundError if not
@@ -138,6 +433,212 @@ class ENAClient:
                     raise FileNotFoundError("ERROR: output directory does not "
                         + "exist: %s\n" % (dirname))
 
+            # binary output formats (eg. parquet) are only written to an
+            # output file, raise ValueError otherwise, or if the optional
+            # dependencies of the output format are missing (checked before
+            # the output file is opened)
+            if self.get_writer_class().BINARY \
+               and not args_dict["output_file"]:
+                raise ValueError("ERROR: %s output requires an output file, "
+                    % (self.get_writer_class().NAME) + "specify one with -o\n")
+            try:
+                self.get_writer_class().check_available()
+            except ImportError as e:
+                raise ValueError("ERROR: %s\n" % (e))
+
+            # set the number of concurrent workers, raise ValueError if the
+            # pool would be empty
+            if args_dict["workers"] is not None:
+                if args_dict["workers"] < 1:
+                    raise ValueError("ERROR: number of workers must be at "
+                        + "least 1\n")
+                self.set_workers(args_dict["workers"])
+
+            # set the connection pool size and lifetime, raise ValueError if
+            # the pool would be empty or the lifetime is negative
+            if args_dict["pool_size"] is not None:
+                if args_dict["pool_size"] < 1:
+                    raise ValueError("ERROR: pool size must be at least 1\n")
+                self.set_pool_size(args_dict["pool_size"])
+            if args_dict["connection_lifetime"] is not None:
+                if args_dict["connection_lifetime"] < 0:
+                    raise ValueError("ERROR: connection lifetime must not be "
+                        + "negative\n")
+                self.set_connection_lifetime(args_dict["connection_lifetime"])
+
+            # set the on-disk cache location and settings, raise ValueError
+            # if the settings would make the cache unusable
+            if args_dict["no_cache"]:
+                self.set_cache_dir(None)
+            elif args_dict["cache_dir"]:
+                self.set_cache_dir(args_dict["cache_dir"])
+            self.set_refresh(args_dict["refresh"])
+            self.set_revalidate(args_dict["revalidate"])
+            for ttl_arg in ["cache_ttl", "cache_negative_ttl"]:
+                if args_dict[ttl_arg] is not None and args_dict[ttl_arg] < 0:
+                    raise ValueError("ERROR: %s must not be negative\n"
+                        % (ttl_arg))
+            if args_dict["cache_ttl"] is not None:
+                self.set_cache_ttl(args_dict["cache_ttl"])
+            if args_dict["cache_negative_ttl"] is not None:
+                self.set_cache_negative_ttl(args_dict["cache_negative_ttl"])
+            if args_dict["cache_max_entries"] is not None:
+                if args_dict["cache_max_entries"] < 1:
+                    raise ValueError("ERROR: cache_max_entries must be at "
+                        + "least 1\n")
+                self.set_cache_max_entries(args_dict["cache_max_entries"])
+
+            # set resume mode, which journals responses next to the output
+            # file. raise ValueError if there is no input or output file
+            if args_dict["resume"]:
+                if not args_dict["input_file"] \
+                   or not args_dict["output_file"]:
+                    raise ValueError("ERROR: --resume requires an input file "
+                        + "(-i) and an output file (-o)\n")
+                self.set_resume(True)
+
+            # set the retry and rate limit settings, raise ValueError if any
+            # is negative (a rate limit of 0 means unlimited)
+            for retry_arg in ["max_retries", "backoff_base", "backoff_max",
+                              "rate_limit"]:
+                if args_dict[retry_arg] is not None \
+                   and args_dict[retry_arg] < 0:
+                    raise ValueError("ERROR: %s must not be negative\n"
+                        % (retry_arg))
+            if args_dict["max_retries"] is not None:
+                self.set_max_retries(args_dict["max_retries"])
+            if args_dict["backoff_base"] is not None:
+                self.set_backoff_base(args_dict["backoff_base"])
+            if args_dict["backoff_max"] is not None:
+                self.set_backoff_max(args_dict["backoff_max"])
+            if args_dict["rate_limit"]:
+                self.set_rate_limit(args_dict["rate_limit"])
+
+            # set the local mirror snapshot, raise FileNotFoundError if it
+            # does not exist
+            if args_dict["mirror"]:
+                if not os.path.exists(args_dict["mirror"]):
+                    raise FileNotFoundError("ERROR: mirror snapshot not "
+                        + "found: %s\n" % (args_dict["mirror"]))
+                self.set_mirror_path(args_dict["mirror"])
+
+            # set the API endpoints, raise ValueError if a base URL is not
+            # an http(s) URL, or hedging has no second endpoint
+            if args_dict["base_url"]:
+                for base_url in args_dict["base_url"]:
+                    if not base_url.startswith(("http://", "https://")):
+                        raise ValueError("ERROR: base URL must start with "
+                            + "http:// or https://: %s\n" % (base_url))
+                self.set_base_urls(args_dict["base_url"])
+            if args_dict["hedge"]:
+                if len(self.get_base_urls()) < 2:
+                    raise ValueError("ERROR: --hedge requires two or more "
+                        + "endpoints, specify them with --base_url\n")
+                self.set_hedge(True)
+
+            # set the run statistics and metrics export, raise
+            # FileNotFoundError if the metrics file directory does not exist,
+            # or ValueError if OpenTelemetry is not installed
+            self.set_stats(args_dict["stats"])
+            if args_dict["metrics_file"]:
+                dirname = os.path.dirname(args_dict["metrics_file"])
+                if not os.path.exists(dirname) and dirname != "":
+                    raise FileNotFoundError("ERROR: metrics file directory "
+                        + "does not exist: %s\n" % (dirname))
+                self.set_metrics_file(args_dict["metrics_file"])
+            if args_dict["otel"]:
+                try:
+                    observer = OpenTelemetryObserver()
+                except ImportError as e:
+                    raise ValueError("ERROR: %s\n" % (e))
+                self.set_observers(self.get_observers() + [observer])
+
+            # set the number of worker processes, raise ValueError if less
+            # than 1, or if sharded mode lacks an input or output file or
+            # is combined with an option writing one file per run
+            if args_dict["processes"] is not None:
+                if args_dict["processes"] < 1:
+                    raise ValueError("ERROR: number of processes must be at "
+                        + "least 1\n")
+                self.set_processes(args_dict["processes"])
+            if self.get_processes() > 1:
+                if not args_dict["input_file"]:
+                    raise ValueError("ERROR: --processes requires an input "
+                        + "file (-i)\n")
+                for shard_arg in ["resume", "metrics_file", "baseline"]:
+                    if args_dict[shard_arg]:
+                        raise ValueError("ERROR: --%s can not be combined "
+                            % (shard_arg) + "with --processes\n")
+            if args_dict["keep_shards"]:
+                if self.get_processes() < 2 or not args_dict["output_file"]:
+                    raise ValueError("ERROR: --keep_shards requires "
+                        + "--processes and an output file (-o)\n")
+                self.set_keep_shards(True)
+
+            # set the baseline of diff mode, raise FileNotFoundError if it
+            # does not exist, or ValueError if combined with --resume (which
+            # replays every record)
+            if args_dict["baseline"]:
+                if args_dict["baseline"] != STDIN \
+                   and not os.path.exists(args_dict["baseline"]):
+                    raise FileNotFoundError("ERROR: baseline not found: "
+                        + "%s\n" % (args_dict["baseline"]))
+                if args_dict["resume"]:
+                    raise ValueError("ERROR: --baseline can not be combined "
+                        + "with --resume\n")
+                self.set_baseline_path(args_dict["baseline"])
+                self.set_revalidate(True)
+
+            # set the in-memory cache size, raise ValueError if negative
+            if args_dict["memo_size"] is not None:
+                if args_dict["memo_size"] < 0:
+                    raise ValueError("ERROR: memo size must not be "
+                        + "negative\n")
+                self.set_memo_size(args_dict["memo_size"])
+
+            # set the in-flight window and output flushing of batch mode,
+            # raise ValueError if the window would be empty or records are
+            # flushed every negative number
+            if args_dict["in_flight"] is not None:
+                if args_dict["in_flight"] < 1:
+                    raise ValueError("ERROR: in_flight must be at least 1\n")
+                self.set_in_flight(args_dict["in_flight"])
+            if args_dict["flush_every"] is not None:
+                if args_dict["flush_every"] < 0:
+                    raise ValueError("ERROR: flush_every must not be "
+                        + "negative\n")
+                self.set_flush_every(args_dict["flush_every"])
+
+            # set the daemon lookups are sent to, given with --daemon or the
+            # ENACLIENT_DAEMON environment variable (a daemon is never used
+            # unless asked for). raise FileNotFoundError if its socket does
+            # not exist, or ValueError if combined with an option changing
+            # how lookups are made. options tuning lookups are ignored, with
+            # a warning
+            daemon_address = args_dict["daemon"]
+            daemon_option = "--daemon"
+            if daemon_address is None and not args_dict["no_daemon"]:
+                daemon_address = os.environ.get("ENACLIENT_DAEMON") or None
+                daemon_option = "ENACLIENT_DAEMON"
+            if daemon_address is not None:
+                if not DaemonClient.is_http_address(daemon_address) \
+                   and not os.path.exists(daemon_address):
+                    raise FileNotFoundError("ERROR: daemon socket not found: "
+                        + "%s\n" % (daemon_address))
+                excluded_args = [excluded_arg for excluded_arg
+                                 in ENAClient.DAEMON_EXCLUDED_ARGS
+                                 if args_dict[excluded_arg] is not None
+                                 and args_dict[excluded_arg] is not False]
+                if excluded_args:
+                    raise ValueError("ERROR: --%s can not be combined with "
+                        % (excluded_args[0]) + "%s\n" % (daemon_option))
+                for ignored_arg in ENAClient.DAEMON_IGNORED_ARGS:
+                    if args_dict[ignored_arg] is not None:
+                        sys.stderr.write("daemon: --%s ignored, lookups are "
+                                         % (ignored_arg)
+                                         + "made by the daemon\n")
+                self.set_daemon_address(daemon_address)
+
             # if no errors are raised, set "_valid_args" to true, meaning that
             # the rest of the program can proceed
             self.__set_valid_args(True)
@@ -169,63 +670,368 @@ class ENAClient:
         """
 
         args_dict = self.get_args_dict()
-        inc = 0
 
         # only makes API call if there is a valid set of args
         if self.get_valid_args():
 
-            # open the output file handle if applicable
-            # first overwrite all the contents of the file, then close and
-            # open the file again in append mode
+            # in sharded mode, worker processes run the batch
+            if self.get_input_mode() == ENAClient.INPUT_MODE_BATCH \
+               and self.get_processes() > 1:
+                from enaclient.shards import run_sharded
+                run_sharded(self)
+                return
+
+            # load the previous output in diff mode, before any request
+            baseline = self.get_baseline()
+
+            # collect the statistics of the run if they are reported
+            if self.get_stats() or self.get_metrics_file():
+                self.__set_run_stats(RunStats())
+                self.set_observers(self.get_observers()
+                                   + [self.get_run_stats()])
+
+            # open the output file handle if applicable, with a large write
+            # buffer. the writer streams formatted records into the handle
             if self.get_output_mode() == ENAClient.OUTPUT_MODE_FILE:
-                output_file_path = args_dict["output_file"]
-                output_file_write = open(output_file_path, "w")
-                output_file_write.write("")
-                output_file_write.close()
-                self.__set_output_file(open(output_file_path, "a"))
+                file_mode = "wb" if self.get_writer_class().BINARY else "w"
+                self.__set_output_file(open(args_dict["output_file"],
+                    file_mode, buffering=ENAClient.OUTPUT_BUFFER_SIZE))
+            else:
+                self.__set_output_file(ENAClient.open_stdout())
+            writer = self.get_writer_class()(self.get_output_file())
 
             # write/print prefix for array of metadata objects
-            self.__output_batch_prefix()
+            writer.write_prefix()
 
             # if input file was provided, then the program will iterate over
             # each sequence id in the file, making the API request for each
-            # id. Formatted responses are printed/written as they are processed.
+            # id. Sequence ids are read lazily, so the input is never held
+            # in memory. Formatted responses are printed/written in input
+            # order as they are processed.
             if self.get_input_mode() == ENAClient.INPUT_MODE_BATCH:
-                input_file = open(args_dict["input_file"], "r")
-                input_line = input_file.readline()
-                # while next input file line is not empty
-                while (input_line):
-                    # get the sequence id and get the formatted response
-                    sequence_id = input_line.rstrip()
-                    response_string = self.call_refget_api(sequence_id, inc)
-
-                    input_line = input_file.readline()
-                    # if there is another sequence id on the next line,
-                    # output the formatted response and the separator char
-                    # between returned objects
-                    if input_line:
-                        self.__output(response_string)
-                        self.__output_batch_separator()
-                    # if there are no more sequence ids (at end of file), then
-                    # do not output the separator char
-                    else:
-                        self.__output(response_string + "\n")
-                    inc += 1
+                sequence_ids = read_sequence_ids(args_dict["input_file"],
+                    self.get_input_format(), self.get_id_column())
+                self.__output_batch(writer, sequence_ids)
 
             # sequence id was provided, program executed in single mode
             else:
                 # get sequence id and send it to api call method, writing/
-                # printing output
+                # printing output. a single lookup needs no connection pool,
+                # so it is sent over a light http.client session rather than
+                # paying for the import of requests
                 sequence_id = args_dict["sequence_id"]
-                response_string = self.call_refget_api(sequence_id, inc)
-                self.__output(response_string + "\n")
+                if self.get_session_pool(create=False) is None \
+                   and not self.get_hedge() \
+                   and LightSessionPool.is_supported():
+                    self.__set_session_pool(LightSessionPool())
+                response_dict = self.get_response_dict(sequence_id)
+                if self.__is_changed(response_dict):
+                    self.__write_record(writer, response_dict, 0)
 
             # write/print suffix for array of metadata objects
-            self.__output_batch_suffix()
+            writer.write_suffix()
+            writer.flush()
+
+            # commit cached responses and indexed aliases, reporting how
+            # many requests the cache answered, and how many were retried or
+            # throttled in batch mode
+            cache = self.get_cache(create=False)
+            if cache is not None:
+                cache.flush()
+            alias_index = self.get_alias_index(create=False)
+            if alias_index is not None:
+                alias_index.flush()
+            if self.get_input_mode() == ENAClient.INPUT_MODE_BATCH:
+                self.__report_batch_counters()
+            if baseline is not None:
+                sys.stderr.write(baseline.format_summary())
+            self.__report_run_stats()
 
-            if self.get_output_mode() == ENAClient.OUTPUT_MODE_FILE:
+            if self.get_output_file() is not sys.stdout:
                 self.get_output_file().close()
 
+    def call_and_output_shard(self, shard_index, shard_count, input_path,
+                              output_path, framed):
+        """Output formatted responses for one shard of a sharded batch
+
+        Run by each worker process in sharded mode (see shards.py). The
+        shard input holds every shard_count-th sequence id of the batch,
+        starting from shard_index (see split_input). Records are numbered by
+        their position in the whole batch.
+
+        Args:
+            shard_index (int): index of the shard, from 0
+            shard_count (int): number of shards
+            input_path (str): path of the shard input file
+            output_path (str): path the shard is written to
+            framed (bool): if true, write formatted records for the parent
+                to merge, otherwise a complete output file
+
+        Returns:
+            count (int): number of records written
+        """
+
+        from enaclient.shards import ShardRecordWriter, read_shard_input
+        self.__set_shard(shard_index, shard_count)
+        if self.get_stats():
+            self.__set_run_stats(RunStats())
+            self.set_observers(self.get_observers()
+                               + [self.get_run_stats()])
+
+        writer_class = ShardRecordWriter if framed \
+            else self.get_writer_class()
+        with open(output_path, "wb" if writer_class.BINARY else "w",
+                  buffering=ENAClient.OUTPUT_BUFFER_SIZE) as handle:
+            writer = writer_class(handle)
+            writer.write_prefix()
+            self.__output_batch(writer, read_shard_input(input_path))
+            writer.write_suffix()
+            writer.flush()
+
+        # commit cached responses and indexed aliases, and report the
+        # counters of the shard
+        cache = self.get_cache(create=False)
+        if cache is not None:
+            cache.flush()
+        alias_index = self.get_alias_index(create=False)
+        if alias_index is not None:
+            alias_index.flush()
+        sys.stderr.write("shard %s of %s: %s records\n"
+                         % (shard_index + 1, shard_count, writer.count))
+        self.__report_batch_counters()
+        self.__report_run_stats()
+        return writer.count
+
+    def __output_batch(self, writer, sequence_ids):
+        """Request and write the responses for a batch of sequence ids
+
+        In resume mode, responses completed by a previous run are replayed
+        from the journal (for as long as the journal matches the input), and
+        every new response is journaled, so the batch can be restarted
+        again. The journal is deleted once the batch completes.
+
+        Args:
+            writer (RecordWriter): writer of the output format
+            sequence_ids (iterable): md5sums/ids for the sequences of interest
+        """
+
+        inc = 0
+        journal = None
+        shard_index, shard_count = self.get_shard()
+
+        # replay the journal of a previous run, then continue the batch
+        # from the first sequence id without a journaled response
+        if self.get_resume():
+            journal = Journal(self.get_journal_path())
+            sequence_ids = iter(sequence_ids)
+            for sequence_id in sequence_ids:
+                response_dict = journal.replay(sequence_id)
+                if response_dict is None:
+                    sequence_ids = itertools.chain([sequence_id],
+                                                   sequence_ids)
+                    break
+                self.__write_record(writer, response_dict, inc)
+                inc += 1
+            journal.start_appending()
+
+        # read the input, fetch responses and format them in stages of
+        # their own, each handing its results to the next through a bounded
+        # queue, and write the formatted records here. the output buffer is
+        # flushed every flush_every records, if set
+        records = iter(Stage(self.__format_records(Stage(
+            self.__get_response_dicts(Stage(sequence_ids, "read")), "fetch"),
+            inc), "format"))
+        observers = self.get_observers()
+        flush_every = self.get_flush_every()
+        try:
+            for response_dict, record, format_secs in records:
+                if observers:
+                    start = time.perf_counter()
+                    writer.write_formatted(record)
+                    write_secs = time.perf_counter() - start
+                    for observer in observers:
+                        observer.on_record(response_dict, format_secs,
+                                           write_secs)
+                else:
+                    writer.write_formatted(record)
+                if journal is not None:
+                    journal.append(response_dict)
+                if flush_every and writer.count % flush_every == 0:
+                    writer.flush()
+        finally:
+            # stop the stages, and keep the journal if the batch was
+            # interrupted
+            records.close()
+            if journal is not None:
+                journal.close()
+
+        if journal is not None:
+            journal.remove()
+            if journal.replayed:
+                sys.stderr.write("resumed: %s responses replayed from "
+                                 % (journal.replayed) + "journal\n")
+
+    def __format_records(self, response_dicts, inc):
+        """Format the responses of a batch that are to be written
+
+        Args:
+            response_dicts (iterable): API response for each sequence id, in
+                input order
+            inc (int): number of records written before the first
+
+        Yields:
+            record (tuple): response dictionary, formatted record, and the
+                seconds spent formatting it (0 if no observer times it)
+        """
+
+        shard_index, shard_count = self.get_shard()
+        timed = bool(self.get_observers())
+        for response_dict in response_dicts:
+            if not self.__is_changed(response_dict):
+                continue
+            start = time.perf_counter() if timed else 0
+            record = self.format_response(response_dict,
+                                          inc * shard_count + shard_index)
+            yield (response_dict, record,
+                   time.perf_counter() - start if timed else 0)
+            inc += 1
+
+    def __is_changed(self, response_dict):
+        """Compare a response with the previous output in diff mode
+
+        Args:
+            response_dict (dict): API response for a sequence id
+
+        Returns:
+            changed (bool): false if the record is unchanged since the
+                previous output, true if it is to be written (always true
+                outside of diff mode)
+        """
+
+        baseline = self.get_baseline()
+        return baseline is None \
+            or baseline.compare(response_dict) != baseline.UNCHANGED
+
+    def __write_record(self, writer, response_dict, inc):
+        """Format and write the output record of a response
+
+        Args:
+            writer (RecordWriter): writer of the output format
+            response_dict (dict): API response for a sequence id
+            inc (int): auto-increment input sequence
+        """
+
+        observers = self.get_observers()
+        if not observers:
+            writer.write_formatted(self.format_response(response_dict, inc))
+            return
+
+        # time formatting and writing separately for the observers
+        start = time.perf_counter()
+        record = self.format_response(response_dict, inc)
+        formatted = time.perf_counter()
+        writer.write_formatted(record)
+        written = time.perf_counter()
+        for observer in observers:
+            observer.on_record(response_dict, formatted - start,
+                               written - formatted)
+
+    def __report_run_stats(self):
+        """Write the summary of the run to stderr, and the Prometheus
+        metrics to the metrics file, if requested
+        """
+
+        run_stats = self.get_run_stats()
+        if run_stats is None:
+            return
+        if self.get_stats():
+            sys.stderr.write(run_stats.format_summary())
+
+        # replace the metrics file atomically, so that a collector never
+        # reads it half written
+        metrics_file = self.get_metrics_file()
+        if metrics_file:
+            tmp_path = metrics_file + ".tmp"
+            with open(tmp_path, "w") as handle:
+                handle.write(run_stats.to_prometheus())
+            os.replace(tmp_path, metrics_file)
+
+    def __report_batch_counters(self):
+        """Write the daemon, cache, retry, throttling and endpoint counters of
+        a run to stderr
+        """
+
+        daemon = self.get_daemon(create=False)
+        if daemon is not None:
+            sys.stderr.write("daemon: lookups sent to %s\n" % (daemon.address))
+        mirror = self.get_mirror(create=False)
+        if mirror is not None:
+            sys.stderr.write("mirror hit ratio: %.1f%% (%s hits, %s misses)\n"
+                % (100 * mirror.get_hit_ratio(), mirror.hits, mirror.misses))
+        cache = self.get_cache(create=False)
+        if cache is not None:
+            sys.stderr.write("cache hit ratio: %.1f%% (%s hits, %s misses)\n"
+                % (100 * cache.get_hit_ratio(), cache.hits, cache.misses))
+        if cache is not None and self.get_revalidate():
+            sys.stderr.write("revalidated: %s not modified (304 responses)\n"
+                % (self.get_not_modified()))
+        retry_policy = self.get_retry_policy()
+        rate_limiter = self.get_rate_limiter()
+        sys.stderr.write("retries: %s (%s requests failed after all "
+            % (retry_policy.retries, retry_policy.gave_up)
+            + "retries), throttled: %s (429 responses), rate limit wait: "
+            % (rate_limiter.throttled) + "%.1fs\n" % (rate_limiter.wait_secs))
+        endpoint_pool = self.get_endpoint_pool(create=False)
+        if endpoint_pool is not None and len(endpoint_pool.endpoints) > 1:
+            sys.stderr.write("failovers: %s (requests sent to fallback "
+                % (endpoint_pool.failovers) + "endpoints), hedged: %s "
+                % (endpoint_pool.hedged) + "(%s answered first by the "
+                % (endpoint_pool.hedges_won) + "hedge)\n")
+
+    def __get_response_dicts(self, sequence_ids):
+        """Execute refget API requests for many sequence ids, in input order
+
+        With a single worker, requests are made one at a time. Otherwise
+        requests are submitted to a thread pool of the configured size, with
+        at most the in-flight window of requests pending (see get_in_flight)
+        so that the input is never read far ahead of the output. Responses
+        are yielded in the same order as the sequence ids.
+
+        Args:
+            sequence_ids (iterable): md5sums/ids for the sequences of interest
+
+        Yields:
+            response_dict (dict): API response for each sequence id
+        """
+
+        workers = self.get_workers()
+
+        # with a daemon, send the sequence ids in chunks, one request each
+        if self.get_daemon() is not None:
+            for response_dict in self.iter_metadata_batch(sequence_ids,
+                                                          workers=workers):
+                yield response_dict
+            return
+
+        # serial mode, no thread pool required
+        if workers == 1:
+            for sequence_id in sequence_ids:
+                yield self.get_response_dict(sequence_id)
+            return
+
+        # concurrent mode, keep a bounded window of pending requests and
+        # yield the oldest once the window is full
+        max_pending = self.get_in_flight()
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for sequence_id in sequence_ids:
+                pending.append(executor.submit(self.get_response_dict,
+                                               sequence_id))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
     def call_refget_api(self, sequence_id, inc):
         """Execute refget API request and return formatted response
 
@@ -239,119 +1045,894 @@ class ENAClient:
 
         Returns:
             response_string (str): json/xml/yaml formatted API response
+        """
 
-        Raises:
-            requests.exceptions.ConnectTimeout: if API does not respond within
-                the specified time limit
+        response_dict = self.get_response_dict(sequence_id)
+        return self.format_response(response_dict, inc)
+
+    def lookup(self, sequence_id):
+        """Get the metadata of a sequence id as a structured result
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+
+        Returns:
+            result (MetadataResult): metadata of the sequence id
+        """
+
+        return MetadataResult.from_response_dict(
+            self.get_response_dict(sequence_id))
+
+    def lookup_many(self, sequence_ids, chunk_size=None, workers=None):
+        """Get the metadata of many sequence ids as structured results
+
+        Sequence ids are looked up in chunks, as by iter_metadata_batch.
+
+        Args:
+            sequence_ids (iterable): md5sums/ids for the sequences of interest
+            chunk_size (int): sequence ids looked up together
+            workers (int): concurrent requests for sequence ids missing from
+                the caches
+
+        Yields:
+            result (MetadataResult): metadata of each sequence id, in input
+                order
+        """
+
+        for response_dict in self.iter_metadata_batch(sequence_ids,
+                                                      chunk_size, workers):
+            yield MetadataResult.from_response_dict(response_dict)
+
+    def get_response_dict(self, sequence_id):
+        """Execute refget API request and return the response dictionary
+
+        The response dictionary contains the user-specified sequence id
+        ("req_seq_id"), the http status code ("status_code"), and the metadata
+        returned by the API ("metadata"). On connection timeout, the status
+        code is set to "408" and an "error" message is added instead.
+        Sequence ids are first resolved with the alias index (see
+        resolve_sequence_id): an alias or trunc512 checksum of a sequence
+        seen before is looked up by its md5 checksum, the response keeping
+        the user-specified sequence id. Other sequence ids that are not md5
+        or trunc512 checksums are not requested, their status code is set to
+        "400" with an "error" message. If a local mirror snapshot is used,
+        sequences found in it are not requested either.
+
+        Each distinct sequence id is only requested once per run: responses
+        are kept in an in-memory LRU cache, and concurrent requests for the
+        same sequence id are collapsed into one. Every call returns its own
+        copy of the response dictionary. If a daemon is used (see
+        get_daemon), the lookup is sent to it instead.
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+
+        Returns:
+            response_dict (dict): API response for the sequence id
+        """
+
+        # send the lookup to the daemon if one is used
+        response_dict = self.__ask_daemon("get_response_dict", sequence_id)
+        if response_dict is not None:
+            return response_dict
+
+        # resolve aliases, and reject malformed sequence ids without calling
+        # the API
+        lookup_id = self.resolve_sequence_id(sequence_id)
+        if lookup_id is None:
+            return self.__invalid_response_dict(sequence_id)
+
+        # answer from the local mirror snapshot, falling back to the caches
+        # and the API for sequences missing from it
+        mirror = self.get_mirror()
+        if mirror is not None:
+            response_dict = mirror.get(lookup_id)
+            if response_dict is not None:
+                return self.__as_requested(response_dict, sequence_id)
+
+        memo = self.get_memo()
+        if memo is not None:
+            response_dict = memo.get(lookup_id)
+            if response_dict is not None:
+                return self.__as_requested(response_dict, sequence_id)
+
+        response_dict = self.__single_flight.do(
+            lookup_id, self.__request_response_dict, lookup_id)
+        return self.__as_requested(response_dict, sequence_id)
+
+    def resolve_sequence_id(self, sequence_id):
+        """Resolve a sequence id to the sequence id it is looked up by
+
+        md5 checksums are looked up as they are. Aliases (eg. INSDC
+        accessions) and trunc512 checksums found in the alias index are
+        looked up by the md5 checksum of their sequence (or its trunc512
+        checksum, if the md5 is unknown), so that a sequence is requested,
+        cached and mirrored under one sequence id whatever it was called.
+
+        Args:
+            sequence_id (str): md5sum/id, trunc512 or alias of the sequence
+                of interest
+
+        Returns:
+            lookup_id (str): sequence id to look up, or None if the sequence
+                id is neither a checksum nor an indexed alias
+        """
+
+        return self.__resolve_sequence_ids([sequence_id])[sequence_id]
+
+    def __resolve_sequence_ids(self, sequence_ids):
+        """Resolve many sequence ids, with one query of the alias index
+
+        Args:
+            sequence_ids (list): md5sums/ids, trunc512s or aliases of the
+                sequences of interest
+
+        Returns:
+            lookup_ids (dict): sequence id to look up (see
+                resolve_sequence_id) keyed by sequence id, None for sequence
+                ids that are neither checksums nor indexed aliases
+        """
+
+        # md5 checksums are looked up as they are
+        lookup_ids = {}
+        unresolved = []
+        for sequence_id in sequence_ids:
+            if is_valid_sequence_id(sequence_id) and len(sequence_id) == 32:
+                lookup_ids[sequence_id] = sequence_id
+            else:
+                unresolved.append(sequence_id)
+        if not unresolved:
+            return lookup_ids
+
+        alias_index = self.get_alias_index()
+        digests = alias_index.resolve_many(unresolved) \
+            if alias_index is not None else {}
+        for sequence_id in unresolved:
+            if sequence_id in digests:
+                lookup_ids[sequence_id] = digests[sequence_id][0] \
+                    or digests[sequence_id][1]
+            else:
+                lookup_ids[sequence_id] = sequence_id \
+                    if is_valid_sequence_id(sequence_id) else None
+        return lookup_ids
+
+    def fetch_metadata_batch(self, sequence_ids, chunk_size=None,
+                             workers=None):
+        """Get the response dictionaries for many sequence ids
+
+        See iter_metadata_batch, which this method collects.
+
+        Args:
+            sequence_ids (iterable): md5sums/ids for the sequences of interest
+            chunk_size (int): sequence ids looked up together
+            workers (int): concurrent requests for sequence ids missing from
+                the caches
+
+        Returns:
+            response_dicts (OrderedDict): API response for each distinct
+                sequence id, keyed by sequence id, in input order
+        """
+
+        return OrderedDict((response_dict["req_seq_id"], response_dict)
+                           for response_dict in self.iter_metadata_batch(
+                               sequence_ids, chunk_size, workers))
+
+    def iter_metadata_batch(self, sequence_ids, chunk_size=None,
+                            workers=None):
+        """Get the response dictionaries for many sequence ids, in chunks
+
+        Library counterpart of batch mode, without argument parsing or
+        output formatting. Sequence ids are taken from the input in chunks
+        (so the input can be any iterable, of any length). Each chunk is
+        looked up in the mirror and in-memory cache, then in the on-disk
+        cache with a single query. The sequence ids still missing are sent
+        to the batch endpoint in one POST request if one is configured (see
+        set_batch_path), and any left are requested concurrently over a few
+        pooled connections. New responses are written to the on-disk cache
+        in a single transaction.
+
+        Args:
+            sequence_ids (iterable): md5sums/ids for the sequences of interest
+            chunk_size (int): sequence ids looked up together (optional,
+                default DEFAULT_BATCH_CHUNK_SIZE)
+            workers (int): concurrent requests for sequence ids missing from
+                the caches (optional, default DEFAULT_BATCH_WORKERS)
+
+        Yields:
+            response_dict (dict): API response for each sequence id, in input
+                order
+        """
+
+        chunk_size = min(chunk_size or ENAClient.DEFAULT_BATCH_CHUNK_SIZE,
+                         MetadataCache.MAX_QUERY_IDS)
+        sequence_ids = iter(sequence_ids)
+        with ThreadPoolExecutor(max_workers=workers
+                                or ENAClient.DEFAULT_BATCH_WORKERS) \
+                as executor:
+            while True:
+                chunk = list(itertools.islice(sequence_ids, chunk_size))
+                if not chunk:
+                    return
+                response_dicts = self.__get_response_dict_chunk(chunk,
+                                                                executor)
+                for sequence_id in chunk:
+                    yield dict(response_dicts[sequence_id])
+
+    def __get_response_dict_chunk(self, sequence_ids, executor):
+        """Get the response dictionaries for a chunk of sequence ids
+
+        Args:
+            sequence_ids (list): md5sums/ids for the sequences of interest
+            executor (ThreadPoolExecutor): thread pool requesting sequence
+                ids missing from the caches
+
+        Returns:
+            response_dicts (dict): API response for each distinct sequence
+                id, keyed by sequence id
+        """
+
+        # send the chunk to the daemon if one is used, with one request
+        sequence_ids = list(OrderedDict.fromkeys(sequence_ids))
+        answered = self.__ask_daemon("get_response_dicts", sequence_ids)
+        if answered is not None:
+            return dict(zip(sequence_ids, answered))
+
+        response_dicts = {}
+        missing = []
+        mirror = self.get_mirror()
+        memo = self.get_memo()
+
+        # resolve aliases to the sequence ids they are looked up by, with one
+        # query of the alias index
+        resolved = self.__resolve_sequence_ids(sequence_ids)
+        lookup_ids = OrderedDict()
+        for sequence_id in sequence_ids:
+            lookup_id = resolved[sequence_id]
+            if lookup_id is None:
+                response_dicts[sequence_id] = \
+                    self.__invalid_response_dict(sequence_id)
+            else:
+                lookup_ids.setdefault(lookup_id, []).append(sequence_id)
+
+        # answer sequence ids in the mirror or in memory
+        for sequence_id in lookup_ids:
+            response_dict = None
+            if mirror is not None:
+                response_dict = mirror.get(sequence_id)
+            if response_dict is None and memo is not None:
+                response_dict = memo.get(sequence_id)
+            if response_dict is None:
+                missing.append(sequence_id)
+            else:
+                response_dicts[sequence_id] = response_dict
+
+        # look up the rest in the on-disk cache with one query, unless the
+        # cache is being refreshed. when revalidating, cached responses are
+        # checked with conditional requests instead
+        cache = self.get_cache()
+        validators = {}
+        if cache is not None and missing and not self.get_refresh() \
+           and self.get_revalidate():
+            validators = cache.get_validators(missing)
+        elif cache is not None and missing and not self.get_refresh():
+            cached = cache.get_many(missing)
+            for sequence_id, response_dict in cached.items():
+                self.__memoize(sequence_id, response_dict)
+            response_dicts.update(cached)
+            missing = [sequence_id for sequence_id in missing
+                       if sequence_id not in cached]
+
+        # request the rest from the batch endpoint, and anything it did not
+        # answer one sequence id at a time. the batch endpoint has no
+        # conditional requests, so cached responses are revalidated one at a
+        # time
+        fetched = []
+        etags = {}
+        unvalidated = [sequence_id for sequence_id in missing
+                       if sequence_id not in validators]
+        if unvalidated and self.get_batch_path():
+            fetched = list(self.__request_metadata_batch(unvalidated)
+                           .values())
+            answered = set(response_dict["req_seq_id"]
+                           for response_dict in fetched)
+            missing = [sequence_id for sequence_id in missing
+                       if sequence_id not in answered]
+        for response_dict, etag in executor.map(
+                self.__request_metadata, missing,
+                [validators.get(sequence_id) for sequence_id in missing]):
+            fetched.append(response_dict)
+            if etag:
+                etags[response_dict["req_seq_id"]] = etag
+
+        if cache is not None:
+            cache.put_many(fetched, etags)
+        self.__learn_aliases(fetched)
+        for response_dict in fetched:
+            self.__memoize(response_dict["req_seq_id"], response_dict)
+            response_dicts[response_dict["req_seq_id"]] = response_dict
+
+        # answer aliases with the response of the sequence id they resolved
+        # to
+        for lookup_id, requested_ids in lookup_ids.items():
+            for sequence_id in requested_ids:
+                if sequence_id != lookup_id:
+                    response_dicts[sequence_id] = self.__as_requested(
+                        response_dicts[lookup_id], sequence_id)
+        return response_dicts
+
+    def __ask_daemon(self, method_name, *args):
+        """Send a lookup to the daemon, if one is used
+
+        If the daemon can not be reached (eg. it was stopped), it is no
+        longer used by this client, and lookups are made directly.
+
+        Args:
+            method_name (str): name of the DaemonClient method making the
+                lookup
+            *args: arguments of the method
+
+        Returns:
+            answer (obj): answer of the daemon, None if no daemon is used or
+                the daemon failed
+        """
+
+        daemon = self.get_daemon()
+        if daemon is None:
+            return None
+        try:
+            return getattr(daemon, method_name)(*args)
+        except DaemonError as e:
+            with self.__resource_lock:
+                if self._daemon is daemon:
+                    sys.stderr.write("%s, looking up directly\n" % (e))
+                    daemon.close()
+                    self.set_daemon_address(None)
+                    self.__set_daemon(None)
+            return None
+
+    def __request_metadata_batch(self, sequence_ids):
+        """Request metadata for many sequence ids with one POST request
+
+        The batch endpoint (batch path under the base URL of the first
+        endpoint that is up) is sent {"ids": [...]} as JSON, and answers
+        with a JSON object keyed by sequence id, each value holding the
+        "status_code" and body of the metadata endpoint for that sequence
+        id. Endpoints answering 404, 405 or 501 are marked as having no
+        batch endpoint. Sequence ids missing from the answer, and all
+        sequence ids if the request failed, are left out of the result, to
+        be requested one at a time.
+
+        Args:
+            sequence_ids (list): md5sums/ids for the sequences of interest
+
+        Returns:
+            response_dicts (dict): API response for each sequence id the
+                batch endpoint answered, keyed by sequence id
+        """
+
+        endpoint_pool = self.get_endpoint_pool()
+        endpoint = endpoint_pool.choose()
+        if not endpoint.batch_supported:
+            return {}
+
+        trace = RequestTrace(None, len(sequence_ids))
+        trace.attempts = 1
+        rate_limiter = self.get_rate_limiter()
+        start = time.perf_counter()
+        rate_limiter.acquire()
+        trace.add_stage(STAGE_RATE_LIMIT, start)
+        session_pool = self.get_session_pool()
+        start = time.perf_counter()
+        reset_connect_secs()
+        session = session_pool.get_session()
+        try:
+            response_obj = session.post(
+                endpoint.base_url + self.get_batch_path(),
+                json={"ids": sequence_ids}, timeout=self.get_timeout_secs())
+        except session_pool.exceptions.RequestException as e:
+            self.__set_connect_error(e)
+            endpoint_pool.record_failure(endpoint)
+            trace.add_stage(STAGE_FAILED, start)
+            self.__finish_trace(trace, "503")
+            return {}
+        finally:
+            session_pool.release(session)
+        trace.add_response(start, get_connect_secs(), response_obj)
+
+        status_code = response_obj.status_code
+        if status_code != 200:
+            self.__finish_trace(trace, status_code)
+        if status_code in (404, 405, 501):
+            endpoint.batch_supported = False
+            return {}
+        if status_code == 429:
+            rate_limiter.on_throttled(parse_retry_after(
+                response_obj.headers.get("Retry-After")))
+            return {}
+        if status_code != 200:
+            endpoint_pool.record_failure(endpoint)
+            return {}
+        rate_limiter.on_success()
+        endpoint_pool.record_success(endpoint)
+        start = time.perf_counter()
+        try:
+            bodies = response_obj.json()
+        except ValueError:
+            bodies = None
+        trace.add_stage(STAGE_DECODE, start)
+        self.__finish_trace(trace, status_code)
+        if bodies is None:
+            return {}
+
+        response_dicts = {}
+        for sequence_id in sequence_ids:
+            body = bodies.get(sequence_id) if isinstance(bodies, dict) \
+                else None
+            if not isinstance(body, dict) or "status_code" not in body:
+                continue
+            response_dict = {"req_seq_id": sequence_id,
+                             "status_code": body["status_code"]}
+            response_dict.update((key, value) for key, value in body.items()
+                                 if key != "status_code")
+            response_dicts[sequence_id] = response_dict
+        return response_dicts
+
+    def __as_requested(self, response_dict, sequence_id):
+        """Copy a response dictionary for the user-specified sequence id
+
+        Args:
+            response_dict (dict): API response for the sequence id looked up
+            sequence_id (str): user-specified sequence id
+
+        Returns:
+            response_dict (dict): copy of the response, with the
+                user-specified sequence id as "req_seq_id"
+        """
+
+        response_dict = dict(response_dict)
+        response_dict["req_seq_id"] = sequence_id
+        return response_dict
+
+    def __learn_aliases(self, response_dicts):
+        """Add the identifiers of found responses to the alias index
+
+        Args:
+            response_dicts (list): API responses requested from the API
+        """
+
+        alias_index = self.get_alias_index()
+        if alias_index is not None:
+            alias_index.add_many(response_dict["metadata"]
+                                 for response_dict in response_dicts
+                                 if response_dict.get("status_code") == 200)
+
+    def __invalid_response_dict(self, sequence_id):
+        """Get the response dictionary of a malformed sequence id
+
+        Args:
+            sequence_id (str): sequence id that is not an md5 or trunc512
+                checksum
+
+        Returns:
+            response_dict (dict): "400" response with an "error" message
+        """
+
+        return {"req_seq_id": sequence_id, "status_code": "400",
+                "error": "invalid sequence id"}
+
+    def __request_response_dict(self, sequence_id):
+        """Get the response dictionary from the on-disk cache or the API
+
+        Found/not found responses are added to the in-memory cache before
+        returning, so that later callers find them there.
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+
+        Returns:
+            response_dict (dict): API response for the sequence id
         """
 
-        # construct the endpoint for the API request
-        endpoint = ENAClient.API_BASE_URL + "sequence/" + sequence_id \
-                   + "/metadata"
+        # return the cached response if there is one, unless the cache is
+        # being refreshed. when revalidating, the cached response is checked
+        # with a conditional request instead
+        cache = self.get_cache()
+        validator = None
+        if cache is not None and not self.get_refresh():
+            if self.get_revalidate():
+                validator = cache.get_validators([sequence_id]) \
+                    .get(sequence_id)
+            else:
+                response_dict = cache.get(sequence_id)
+                if response_dict is not None:
+                    self.__memoize(sequence_id, response_dict)
+                    return response_dict
+
+        response_dict, etag = self.__request_metadata(sequence_id, validator)
+
+        # cache the response, only found/not found responses are kept, and
+        # index the identifiers of a found sequence
+        if cache is not None:
+            cache.put(sequence_id, response_dict, etag)
+        self.__memoize(sequence_id, response_dict)
+        self.__learn_aliases([response_dict])
+
+        return response_dict
+
+    def __request_metadata(self, sequence_id, validator=None):
+        """Request metadata from the API, retrying transient failures
+
+        Requests are spaced out by the rate limiter, and sent to the first
+        API endpoint that is up. Timeouts, connection errors (eg. resets),
+        429 and 5xx responses are retried with exponential backoff and
+        jitter, waiting at least as long as any Retry-After header asks, on
+        another endpoint if there is one. Once retries are exhausted, the
+        status code of the last failure is returned with an "error" message;
+        timeouts and connection errors, which have no http status, are
+        reported as "408" and "503" respectively. The time spent in each
+        stage of the request is traced, and the trace passed to the
+        observers once the request completes.
+
+        A cached response with an ETag is revalidated with a conditional
+        request: if the API answers 304 (not modified), the cached response
+        is returned.
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+            validator (tuple): cached response dictionary and its ETag, None
+                to request the metadata unconditionally
+
+        Returns:
+            response_dict (dict): API response for the sequence id
+            etag (str): ETag of the response, None if the API sent none
+        """
 
         # initialize the response object with the user-specified sequence id
         response_dict = {"req_seq_id": sequence_id}
-        response_string = ""
+        etag = validator[1] if validator is not None else None
+        rate_limiter = self.get_rate_limiter()
+        retry_policy = self.get_retry_policy()
+        endpoint_pool = self.get_endpoint_pool()
+        exceptions = self.get_session_pool().exceptions
+        trace = RequestTrace(sequence_id)
+        failed_endpoint = None
+        attempt = 0
+
+        while True:
+            retry_after = None
+            trace.attempts += 1
+            start = time.perf_counter()
+            rate_limiter.acquire()
+            trace.add_stage(STAGE_RATE_LIMIT, start)
+            endpoint = endpoint_pool.choose(exclude=failed_endpoint)
+            try:
+
+                # make http request over the pooled session, adding http
+                # response code to what will be output (200 if sequence
+                # metadata found and returned, 404 if the sequence id could
+                # not be found.
+                endpoint, response_obj = self.__get_metadata(endpoint,
+                                                             sequence_id,
+                                                             trace, etag)
+                status_code = response_obj.status_code
+
+                # throttled or failed on the server side, note how long the
+                # API asked the client to wait
+                if status_code == 429 \
+                   or status_code in RetryPolicy.RETRY_STATUS_CODES:
+                    retry_after = parse_retry_after(
+                        response_obj.headers.get("Retry-After"))
+                    if status_code == 429:
+                        rate_limiter.on_throttled(retry_after)
+                        failure = (status_code, "rate limited")
+                    else:
+                        endpoint_pool.record_failure(endpoint)
+                        failure = (status_code, "server error")
+
+                # the cached response is still current
+                elif status_code == 304 and validator is not None:
+                    rate_limiter.on_success()
+                    endpoint_pool.record_success(endpoint)
+                    with self.__counter_lock:
+                        self.__set_not_modified(self.get_not_modified() + 1)
+                    self.__finish_trace(trace, status_code)
+                    return dict(validator[0]), \
+                        response_obj.headers.get("ETag") or etag
+
+                # update the response dictionary with the returned metadata
+                else:
+                    rate_limiter.on_success()
+                    endpoint_pool.record_success(endpoint)
+                    response_dict["status_code"] = status_code
+                    start = time.perf_counter()
+                    try:
+                        response_dict.update(response_obj.json())
+                    except ValueError:
+                        response_dict["error"] = "invalid response body"
+                    trace.add_stage(STAGE_DECODE, start)
+                    self.__finish_trace(trace, status_code)
+                    return response_dict, response_obj.headers.get("ETag")
+
+            # if connection or read timed out, set status code to "408" so
+            # user knows there was a timeout
+            except exceptions.ConnectTimeout as e:
+                self.__set_connect_error(e)
+                endpoint_pool.record_failure(endpoint)
+                failure = ("408", "connection timeout")
+            except exceptions.ReadTimeout as e:
+                self.__set_connect_error(e)
+                endpoint_pool.record_failure(endpoint)
+                failure = ("408", "read timeout")
+            # connection refused/reset, or response cut short
+            except (exceptions.ConnectionError,
+                    exceptions.ChunkedEncodingError) as e:
+                self.__set_connect_error(e)
+                endpoint_pool.record_failure(endpoint)
+                failure = ("503", "connection error")
+            # any other request failure (eg. too many redirects, an invalid
+            # url, or an undecodable body) would fail again, so it is
+            # reported without retrying
+            except exceptions.RequestException as e:
+                self.__set_connect_error(e)
+                failure = ("503", "request error")
+                attempt = retry_policy.max_retries
+
+            # retry after a backoff, or give up and report the failure
+            if attempt < retry_policy.max_retries:
+                retry_policy.record_retry()
+                start = time.perf_counter()
+                time.sleep(retry_policy.get_delay(attempt, retry_after))
+                trace.add_stage(STAGE_BACKOFF, start)
+                failed_endpoint = endpoint
+                attempt += 1
+            else:
+                retry_policy.record_gave_up()
+                response_dict["status_code"], response_dict["error"] = failure
+                self.__finish_trace(trace, response_dict["status_code"])
+                return response_dict, None
+
+    def __finish_trace(self, trace, status_code):
+        """Stop the clock of a request trace and pass it to the observers
+
+        Args:
+            trace (RequestTrace): timings of the request
+            status_code (int/str): status code the request ended with
+        """
+
+        trace.finish(status_code)
+        for observer in self.get_observers():
+            observer.on_request(trace)
+
+    def __get_metadata(self, endpoint, sequence_id, trace, etag=None):
+        """Send a metadata request to an endpoint, hedging it if enabled
+
+        A hedged request waits up to the p95 latency of the endpoint for a
+        response. If none has arrived, the request is also sent to another
+        endpoint that is up, and the first successful response is used (the
+        slower request is left to complete in the background). Requests are
+        only hedged once the endpoint's p95 latency is known. The wait for a
+        hedged request is traced as a single server stage.
+
+        Args:
+            endpoint (Endpoint): endpoint to send the request to
+            sequence_id (str): md5sum/id for the sequence of interest
+            trace (RequestTrace): timings of the request
+            etag (str): ETag of a cached response, None to request the
+                metadata unconditionally
+
+        Returns:
+            endpoint (Endpoint): endpoint the response came from
+            response_obj (Response): the http response
+
+        Raises:
+            RequestException: if the request failed (on every endpoint it
+                was sent to when hedged)
+        """
+
+        endpoint_pool = self.get_endpoint_pool()
+        hedge_delay = endpoint_pool.get_hedge_delay(endpoint) \
+            if self.get_hedge() else None
+        if hedge_delay is None:
+            return endpoint, self.__send(endpoint, sequence_id, trace, etag)
+
+        start = time.perf_counter()
+        executor = self.get_hedge_executor()
+        future = executor.submit(self.__send, endpoint, sequence_id, None,
+                                 etag)
+        done, pending = wait([future], timeout=hedge_delay)
+        hedge_endpoint = endpoint_pool.choose_hedge(endpoint)
+        if done or hedge_endpoint is None:
+            return endpoint, self.__traced_result(future, start, trace)
+
+        # the request is slower than usual, hedge it on another endpoint
+        endpoint_pool.record_hedge()
+        endpoints = {future: endpoint,
+                     executor.submit(self.__send, hedge_endpoint,
+                                     sequence_id, None, etag): hedge_endpoint}
+        pending = set(endpoints)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for done_future in done:
+                if done_future.exception() is None:
+                    if endpoints[done_future] is hedge_endpoint:
+                        endpoint_pool.record_hedge_won()
+                    return endpoints[done_future], self.__traced_result(
+                        done_future, start, trace)
+
+        # both requests failed, report the failure of the original request
+        endpoint_pool.record_failure(hedge_endpoint)
+        return endpoint, self.__traced_result(future, start, trace)
+
+    def __traced_result(self, future, start, trace):
+        """Get the response of a hedged request, tracing the wait for it
+
+        Args:
+            future (Future): the request sent by __send
+            start (float): time.perf_counter() when the request was sent
+            trace (RequestTrace): timings of the request
+
+        Returns:
+            response_obj (Response): the http response
+
+        Raises:
+            RequestException: if the request failed
+        """
 
         try:
+            response_obj = future.result()
+        except self.get_session_pool().exceptions.RequestException:
+            trace.add_stage(STAGE_FAILED, start)
+            raise
+        trace.add_stage(STAGE_SERVER, start)
+        trace.bytes_received += len(response_obj.content)
+        return response_obj
 
-            # make http request, adding http response code to what will be
-            # output (200 if sequence metadata found and returned, 404 if
-            # the sequence id could not be found.
-            response_obj = requests.get(endpoint,
-                                        timeout=self.get_timeout_secs())
-            response_dict["status_code"] = response_obj.status_code
-            # update the response dictionary with the returned metadata
-            response_dict.update(response_obj.json())
-
-        # if connection timed out, set status code to "408" so user knows
-        # there was a timeout
-        except requests.exceptions.ConnectTimeout as e:
-            self.__set_connect_error(e)
-            response_dict["status_code"] = "408"
-            response_dict["error"] = "connection timeout"
+    def __send(self, endpoint, sequence_id, trace=None, etag=None):
+        """Send a metadata request to an endpoint, recording its latency
+
+        Args:
+            endpoint (Endpoint): endpoint to send the request to
+            sequence_id (str): md5sum/id for the sequence of interest
+            trace (RequestTrace): timings of the request, None to not trace
+                its stages
+            etag (str): ETag of a cached response, sent as If-None-Match so
+                that the API answers 304 if it is still current
+
+        Returns:
+            response_obj (Response): the http response
+
+        Raises:
+            RequestException: if the request failed
+        """
 
-        # format the response dictionary according to output format
+        session_pool = self.get_session_pool()
+        start = time.perf_counter()
+        reset_connect_secs()
+        session = session_pool.get_session()
+        try:
+            response_obj = session.get(
+                endpoint.get_metadata_url(sequence_id),
+                timeout=self.get_timeout_secs(),
+                headers={"If-None-Match": etag} if etag else None)
+        except session_pool.exceptions.RequestException:
+            if trace is not None:
+                trace.add_stage(STAGE_FAILED, start)
+            raise
         finally:
-            # format response as json
-            output_format = self.get_output_format()
-            if output_format == ENAClient.OUTPUT_FORMAT_JSON:
-                response_string = json.dumps(response_dict, indent=4,
-                                             sort_keys=True)
-            # format response as xml
-            elif output_format == ENAClient.OUTPUT_FORMAT_XML:
-                xml = dicttoxml(response_dict, custom_root="sequence",
-                                attr_type=False)
-                dom = parseString(xml)
-                response_string = dom.toprettyxml(indent="    ")[:-1]
-                response_string = re.sub("<\\?xml.+?>\n", "", response_string)
-            # format response as yaml
-            elif output_format == ENAClient.OUTPUT_FORMAT_YAML:
-                response_string = yaml.dump(response_dict)[:-1]
-                response_string = re.sub("(.+?\n)", r'    \1', response_string)
-                response_string =  re.sub("\n(.+?$)", r'\n    \1',
-                                   response_string)
-                response_string = "sequence_%s:\n" % (inc) + response_string
-
-            # indent all lines in response string, to account for the fact that
-            # each object is one element in an overall array
-            response_string = re.sub("(.+?\n)", r'    \1', response_string)
-            response_string = re.sub("\n(.+?$)", r'\n    \1', response_string)
-
-        return response_string
-
-    def __output_batch_prefix(self):
-        """Write/print prefix for array of metadata objects based on format"""
-
-        # write prefix that opens the array of metadata objects
-        prefixes_dict = {
-            ENAClient.OUTPUT_FORMAT_JSON: "[\n",
-            ENAClient.OUTPUT_FORMAT_XML: '<?xml version="1.0" ?>\n'
-                                         + '<sequence_group>\n',
-            ENAClient.OUTPUT_FORMAT_YAML: "sequence_group:\n"
-        }
-        self.__output(prefixes_dict[self.get_output_format()])
-
-    def __output_batch_separator(self):
-        """Write/print char(s) that separate elements in array of objs"""
-
-        # write character(s) the separate metadata responses, as each response
-        # is an element in an overall array
-        separators_dict = {
-            ENAClient.OUTPUT_FORMAT_JSON: ",\n",
-            ENAClient.OUTPUT_FORMAT_XML: "\n",
-            ENAClient.OUTPUT_FORMAT_YAML: "\n\n"
-        }
-        self.__output(separators_dict[self.get_output_format()])
-
-    def __output_batch_suffix(self):
-        """Write/print suffix for array of metadata objects based on format"""
-
-        # write suffix that closes the array of metadata objects
-
-        suffixes_dict = {
-            ENAClient.OUTPUT_FORMAT_JSON: "]",
-            ENAClient.OUTPUT_FORMAT_XML: "</sequence_group>",
-            ENAClient.OUTPUT_FORMAT_YAML: ""
-        }
-        self.__output(suffixes_dict[self.get_output_format()])
-
-    def __output(self, to_write):
-        """Write/print output based on user specification
-
-        Args:
-            to_write (str): string to be printed/written to file
-        """
-
-        # if output mode is set to stdout, print the provided string,
-        # otherwise write it to the output file
-        output_mode = self.get_output_mode()
-
-        if output_mode == ENAClient.OUTPUT_MODE_STDOUT:
-            print(to_write, end="")
-        elif output_mode == ENAClient.OUTPUT_MODE_FILE:
-            output_file = self.get_output_file()
-            output_file.write(to_write)
+            session_pool.release(session)
+        self.get_endpoint_pool().record_latency(endpoint,
+                                                time.perf_counter() - start)
+        if trace is not None:
+            trace.add_response(start, get_connect_secs(), response_obj)
+        return response_obj
+
+    def __memoize(self, sequence_id, response_dict):
+        """Add a found/not found response to the in-memory cache
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+            response_dict (dict): API response for the sequence id
+        """
+
+        memo = self.get_memo()
+        status_code = response_dict.get("status_code")
+        if memo is not None \
+           and status_code in MetadataCache.CACHEABLE_STATUS_CODES:
+            memo.put(sequence_id, response_dict)
+
+    def format_response(self, response_dict, inc):
+        """Format a response dictionary according to the output format
+
+        Args:
+            response_dict (dict): API response for a sequence id
+            inc (int): auto-increment input sequence
+
+        Returns:
+            response_string (str): formatted API response, indented as one
+                element in an overall array (a row tuple for binary formats)
+        """
+
+        return self.get_writer_class().format_record(response_dict, inc)
+
+    def close(self):
+        """Close pooled connections to the API, the on-disk cache, alias
+        index and mirror
+
+        The client can still be used afterwards, new connections are opened
+        and the cache, alias index and mirror reopened as needed.
+        """
+
+        if self.get_mirror(create=False) is not None:
+            self.get_mirror(create=False).close()
+            self.__set_mirror(None)
+        if self.get_hedge_executor(create=False) is not None:
+            self.get_hedge_executor(create=False).shutdown(wait=False)
+            self.__set_hedge_executor(None)
+
+        if self.get_session_pool(create=False) is not None:
+            self.get_session_pool(create=False).close()
+            self.__set_session_pool(None)
+        if self.get_cache(create=False) is not None:
+            self.get_cache(create=False).close()
+            self.__set_cache(None)
+        if self.get_alias_index(create=False) is not None:
+            self.get_alias_index(create=False).close()
+            self.__set_alias_index(None)
+        if self.get_daemon(create=False) is not None:
+            self.get_daemon(create=False).close()
+            self.__set_daemon(None)
+
+    @staticmethod
+    def default_cache_dir():
+        """get the default directory of the on-disk metadata cache
+
+        The ENACLIENT_CACHE_DIR environment variable takes precedence, then
+        "enaclient" under XDG_CACHE_HOME, or under ~/.cache.
+
+        Returns:
+            cache_dir (str): default cache directory
+        """
+
+        if os.environ.get("ENACLIENT_CACHE_DIR"):
+            return os.environ["ENACLIENT_CACHE_DIR"]
+        cache_home = os.environ.get("XDG_CACHE_HOME") \
+            or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(cache_home, "enaclient")
+
+    @staticmethod
+    def open_stdout():
+        """open stdout for writing through a large buffer
+
+        Returns:
+            handle (file): text handle on the stdout file descriptor with a
+                buffer of OUTPUT_BUFFER_SIZE, closing it leaves stdout open.
+                stdout itself if it has no file descriptor (eg. captured)
+        """
+
+        try:
+            fileno = sys.stdout.fileno()
+        except (AttributeError, OSError, ValueError):
+            return sys.stdout
+        sys.stdout.flush()
+        return open(fileno, "w", buffering=ENAClient.OUTPUT_BUFFER_SIZE,
+                    encoding=sys.stdout.encoding, errors=sys.stdout.errors,
+                    closefd=False)
+
+    @staticmethod
+    def default_daemon_address():
+        """get the default address of the enaclient daemon
+
+        The ENACLIENT_DAEMON environment variable takes precedence, then a
+        socket in the default cache directory.
+
+        Returns:
+            address (str): path to the daemon's Unix socket, or its
+                http://host:port URL
+        """
+
+        return os.environ.get("ENACLIENT_DAEMON") \
+            or os.path.join(ENAClient.default_cache_dir(),
+                            ENAClient.DAEMON_SOCKET_NAME)
 
     "Setter Methods"
 
@@ -363,7 +1944,7 @@ class ENAClient:
         """
         self._input_mode = input_mode
 
-    def __set_output_format(self, output_format):
+    def set_output_format(self, output_format):
         """set output format
 
         Args:
@@ -427,31 +2008,425 @@ class ENAClient:
         """
         self.timeout_secs = timeout_secs
 
-    "Getter Methods"
-
-    def get_input_mode(self):
-        """get input mode
+    def set_pool_size(self, pool_size):
+        """set pool size
 
-        Returns:
-            _input_mode (int): input mode
+        Args:
+            pool_size (int): maximum number of keep-alive connections, None
+                for the default
         """
-        return self._input_mode
+        self.pool_size = pool_size
 
-    def get_output_format(self):
-        """get output format
+    def set_connection_lifetime(self, connection_lifetime):
+        """set connection lifetime
 
-        Returns:
-            _output_format (int): output format
+        Args:
+            connection_lifetime (float): seconds before connections are
+                reopened, None to keep them open
         """
-        return self._output_format
+        self.connection_lifetime = connection_lifetime
 
-    def get_output_mode(self):
-        """get output mode
+    def __set_session_pool(self, session_pool):
+        """set session pool
 
-        Returns:
-            _output_mode (int): output mode
+        Args:
+            session_pool (SessionPool): pooled http session
         """
-        return self._output_mode
+        self._session_pool = session_pool
+
+    def set_cache_dir(self, cache_dir):
+        """set cache dir
+
+        Args:
+            cache_dir (str): directory of the on-disk metadata cache, None to
+                disable the cache
+        """
+        self.cache_dir = cache_dir
+
+    def set_cache_ttl(self, cache_ttl):
+        """set cache ttl
+
+        Args:
+            cache_ttl (float): seconds that cached metadata stays valid
+        """
+        self.cache_ttl = cache_ttl
+
+    def set_cache_negative_ttl(self, cache_negative_ttl):
+        """set cache negative ttl
+
+        Args:
+            cache_negative_ttl (float): seconds that cached not found (404)
+                responses stay valid
+        """
+        self.cache_negative_ttl = cache_negative_ttl
+
+    def set_cache_max_entries(self, cache_max_entries):
+        """set cache max entries
+
+        Args:
+            cache_max_entries (int): maximum number of cached responses
+        """
+        self.cache_max_entries = cache_max_entries
+
+    def set_refresh(self, refresh):
+        """set refresh
+
+        Args:
+            refresh (bool): ignore cached responses, but update the cache
+        """
+        self.refresh = refresh
+
+    def set_revalidate(self, revalidate):
+        """set revalidate
+
+        Args:
+            revalidate (bool): check cached responses with the API whether
+                or not they have expired, with a conditional request if the
+                cached response has an ETag
+        """
+        self.revalidate = revalidate
+
+    def __set_not_modified(self, not_modified):
+        """set not modified
+
+        Args:
+            not_modified (int): number of cached responses revalidated with
+                a 304 (not modified) response
+        """
+        self._not_modified = not_modified
+
+    def __set_cache(self, cache):
+        """set cache
+
+        Args:
+            cache (MetadataCache): on-disk metadata cache
+        """
+        self._cache = cache
+
+    def __set_alias_index(self, alias_index):
+        """set alias index
+
+        Args:
+            alias_index (AliasIndex): index of sequence identifiers
+        """
+        self._alias_index = alias_index
+
+    def set_resume(self, resume):
+        """set resume
+
+        Args:
+            resume (bool): journal responses and resume interrupted batches
+        """
+        self.resume = resume
+
+    def set_max_retries(self, max_retries):
+        """set max retries
+
+        Args:
+            max_retries (int): maximum retries of a failed request
+        """
+        self.max_retries = max_retries
+
+    def set_backoff_base(self, backoff_base):
+        """set backoff base
+
+        Args:
+            backoff_base (float): seconds of the first retry backoff
+        """
+        self.backoff_base = backoff_base
+
+    def set_backoff_max(self, backoff_max):
+        """set backoff max
+
+        Args:
+            backoff_max (float): maximum seconds of a retry backoff
+        """
+        self.backoff_max = backoff_max
+
+    def set_rate_limit(self, rate_limit):
+        """set rate limit
+
+        Args:
+            rate_limit (float): maximum requests per second, None for no
+                limit until the API starts throttling
+        """
+        self.rate_limit = rate_limit
+
+    def __set_rate_limiter(self, rate_limiter):
+        """set rate limiter
+
+        Args:
+            rate_limiter (AdaptiveRateLimiter): client-side rate limiter
+        """
+        self._rate_limiter = rate_limiter
+
+    def __set_retry_policy(self, retry_policy):
+        """set retry policy
+
+        Args:
+            retry_policy (RetryPolicy): retry/backoff policy
+        """
+        self._retry_policy = retry_policy
+
+    def set_memo_size(self, memo_size):
+        """set memo size
+
+        Args:
+            memo_size (int): maximum number of responses kept in memory, 0 to
+                disable the in-memory cache
+        """
+        self.memo_size = memo_size
+
+    def __set_memo(self, memo):
+        """set memo
+
+        Args:
+            memo (LRUCache): in-memory cache of responses
+        """
+        self._memo = memo
+
+    def set_input_format(self, input_format):
+        """set input format
+
+        Args:
+            input_format (str): "lines", "tsv" or "csv", None to guess the
+                format from the input file extension
+        """
+        self.input_format = input_format
+
+    def set_id_column(self, id_column):
+        """set id column
+
+        Args:
+            id_column (str): name or number of the sequence id column of a
+                TSV/CSV manifest, None for the first column
+        """
+        self.id_column = id_column
+
+    def set_mirror_path(self, mirror_path):
+        """set mirror path
+
+        Args:
+            mirror_path (str): path to the local mirror snapshot, None to
+                request all metadata from the cache or the API
+        """
+        self.mirror_path = mirror_path
+
+    def __set_mirror(self, mirror):
+        """set mirror
+
+        Args:
+            mirror (MirrorSnapshot): local mirror snapshot
+        """
+        self._mirror = mirror
+
+    def set_base_urls(self, base_urls):
+        """set base urls
+
+        Args:
+            base_urls (list): base URLs of refget APIs, in order of
+                preference, None for API_BASE_URL
+        """
+        self.base_urls = base_urls
+
+    def __set_endpoint_pool(self, endpoint_pool):
+        """set endpoint pool
+
+        Args:
+            endpoint_pool (EndpointPool): API endpoints and their health
+        """
+        self._endpoint_pool = endpoint_pool
+
+    def set_hedge(self, hedge):
+        """set hedge
+
+        Args:
+            hedge (bool): true if slow requests are also sent to a second
+                endpoint
+        """
+        self.hedge = hedge
+
+    def __set_hedge_executor(self, hedge_executor):
+        """set hedge executor
+
+        Args:
+            hedge_executor (ThreadPoolExecutor): thread pool sending hedged
+                requests
+        """
+        self._hedge_executor = hedge_executor
+
+    def set_batch_path(self, batch_path):
+        """set batch path
+
+        Args:
+            batch_path (str): path of the batch metadata endpoint under each
+                base URL (eg. "sequence/metadata/batch"), None if the
+                endpoints have none
+        """
+        self.batch_path = batch_path
+
+    def set_observers(self, observers):
+        """set observers
+
+        Args:
+            observers (list): MetricsObserver instances notified of the
+                timings of each request and output record
+        """
+        self.observers = list(observers)
+
+    def set_stats(self, stats):
+        """set stats
+
+        Args:
+            stats (bool): if true, write a summary of the run to stderr
+        """
+        self.stats = stats
+
+    def set_metrics_file(self, metrics_file):
+        """set metrics file
+
+        Args:
+            metrics_file (str): path the Prometheus metrics of the run are
+                written to, None to not export them
+        """
+        self.metrics_file = metrics_file
+
+    def __set_run_stats(self, run_stats):
+        """set run stats
+
+        Args:
+            run_stats (RunStats): statistics collected during the run
+        """
+        self._run_stats = run_stats
+
+    def set_processes(self, processes):
+        """set processes
+
+        Args:
+            processes (int): number of worker processes in batch mode
+        """
+        self.processes = processes
+
+    def set_keep_shards(self, keep_shards):
+        """set keep shards
+
+        Args:
+            keep_shards (bool): if true, sharded mode leaves the output of
+                each worker in its own file
+        """
+        self.keep_shards = keep_shards
+
+    def set_baseline_path(self, baseline_path):
+        """set baseline path
+
+        Args:
+            baseline_path (str): path to the previous JSON/NDJSON/enab output
+                compared with in diff mode, None to write every record
+        """
+        self.baseline_path = baseline_path
+
+    def __set_baseline(self, baseline):
+        """set baseline
+
+        Args:
+            baseline (BaselineIndex): index of the previous output
+        """
+        self._baseline = baseline
+
+    def set_in_flight(self, in_flight):
+        """set in flight
+
+        Args:
+            in_flight (int): maximum requests pending at once in batch mode,
+                None for twice the number of workers
+        """
+        self.in_flight = in_flight
+
+    def set_flush_every(self, flush_every):
+        """set flush every
+
+        Args:
+            flush_every (int): records written between flushes of the output
+                in batch mode, 0 to flush only when the buffer is full
+        """
+        self.flush_every = flush_every
+
+    def set_daemon_address(self, daemon_address):
+        """set daemon address
+
+        Args:
+            daemon_address (str): path to the Unix socket or http://host:port
+                URL of the daemon lookups are sent to, None to look up
+                sequence ids directly
+        """
+        self.daemon_address = daemon_address
+
+    def __set_daemon(self, daemon):
+        """set daemon
+
+        Args:
+            daemon (DaemonClient): client of the daemon
+        """
+        self._daemon = daemon
+
+    def __set_shard(self, shard_index, shard_count):
+        """set shard
+
+        Args:
+            shard_index (int): index of the shard this client outputs, from 0
+            shard_count (int): number of shards of the batch
+        """
+        self._shard = (shard_index, shard_count)
+
+    def __set_args(self, args):
+        """set args
+
+        Args:
+            args (list): command-line args, None if not given
+        """
+        self._args = args
+
+    def set_workers(self, workers):
+        """set workers
+
+        Args:
+            workers (int): number of concurrent refget API requests
+        """
+        self.workers = workers
+
+    "Getter Methods"
+
+    def get_input_mode(self):
+        """get input mode
+
+        Returns:
+            _input_mode (int): input mode
+        """
+        return self._input_mode
+
+    def get_output_format(self):
+        """get output format
+
+        Returns:
+            _output_format (int): output format
+        """
+        return self._output_format
+
+    def get_writer_class(self):
+        """get the writer class of the output format
+
+        Returns:
+            writer_class (class): RecordWriter subclass for the output format
+        """
+        return ENAClient.WRITER_CLASSES[self.get_output_format()]
+
+    def get_output_mode(self):
+        """get output mode
+
+        Returns:
+            _output_mode (int): output mode
+        """
+        return self._output_mode
 
     def get_output_file(self):
         """get output file
@@ -500,3 +2475,510 @@ class ENAClient:
             timeout_secs (float): timeout secs
         """
         return self.timeout_secs
+
+    def get_workers(self):
+        """get workers
+
+        Returns:
+            workers (int): number of concurrent refget API requests
+        """
+        return self.workers
+
+    def get_pool_size(self):
+        """get pool size
+
+        Returns:
+            pool_size (int): maximum number of keep-alive connections, the
+                larger of the default and the number of workers if not set
+        """
+        if self.pool_size is None:
+            return max(ENAClient.DEFAULT_POOL_SIZE, self.get_workers())
+        return self.pool_size
+
+    def get_connection_lifetime(self):
+        """get connection lifetime
+
+        Returns:
+            connection_lifetime (float): seconds before connections are
+                reopened, None if they are kept open
+        """
+        return self.connection_lifetime
+
+    def get_session_pool(self, create=True):
+        """get session pool, creating it on first use
+
+        requests (and the session module built on it) is imported here
+        rather than with the module, so that runs that never use it do not
+        pay for the import.
+
+        Args:
+            create (bool): create the session pool if it does not exist yet
+
+        Returns:
+            _session_pool (SessionPool): pooled http session
+        """
+        # created under the lock on first use, then read without it
+        if self._session_pool is None and create:
+            with self.__resource_lock:
+                if self._session_pool is None:
+                    from enaclient.session import SessionPool
+                    self.__set_session_pool(SessionPool(
+                        self.get_pool_size(), self.get_connection_lifetime()))
+        return self._session_pool
+
+    def get_cache_dir(self):
+        """get cache dir
+
+        Returns:
+            cache_dir (str): directory of the on-disk metadata cache, None if
+                the cache is disabled
+        """
+        return self.cache_dir
+
+    def get_cache_ttl(self):
+        """get cache ttl
+
+        Returns:
+            cache_ttl (float): seconds that cached metadata stays valid
+        """
+        return self.cache_ttl
+
+    def get_cache_negative_ttl(self):
+        """get cache negative ttl
+
+        Returns:
+            cache_negative_ttl (float): seconds that cached not found (404)
+                responses stay valid
+        """
+        return self.cache_negative_ttl
+
+    def get_cache_max_entries(self):
+        """get cache max entries
+
+        Returns:
+            cache_max_entries (int): maximum number of cached responses
+        """
+        return self.cache_max_entries
+
+    def get_refresh(self):
+        """get refresh
+
+        Returns:
+            refresh (bool): true if cached responses are ignored
+        """
+        return self.refresh
+
+    def get_revalidate(self):
+        """get revalidate
+
+        Returns:
+            revalidate (bool): true if cached responses are checked with the
+                API whether or not they have expired
+        """
+        return self.revalidate
+
+    def get_not_modified(self):
+        """get not modified
+
+        Returns:
+            _not_modified (int): number of cached responses revalidated with
+                a 304 (not modified) response
+        """
+        return self._not_modified
+
+    def get_cache(self, create=True):
+        """get the on-disk metadata cache, opening it on first use
+
+        Args:
+            create (bool): open the cache if it is not open yet
+
+        Returns:
+            _cache (MetadataCache): on-disk metadata cache, None if disabled
+        """
+        # created under the lock on first use, then read without it
+        if self._cache is None and create and self.get_cache_dir():
+            with self.__resource_lock:
+                if self._cache is None:
+                    # worker processes of a sharded batch share the cache, so
+                    # they commit every write rather than holding its lock
+                    commit_every = 1 if self.get_shard()[1] > 1 \
+                        else MetadataCache.COMMIT_EVERY
+                    self.__set_cache(MetadataCache(
+                        self.get_cache_dir(), self.get_cache_ttl(),
+                        self.get_cache_negative_ttl(),
+                        self.get_cache_max_entries(), commit_every))
+        return self._cache
+
+    def get_alias_index(self, create=True):
+        """get the index of sequence identifiers, opening it on first use
+
+        The index is kept in the directory of the on-disk metadata cache.
+
+        Args:
+            create (bool): open the index if it is not open yet
+
+        Returns:
+            _alias_index (AliasIndex): index of sequence identifiers, None
+                if the on-disk cache is disabled
+        """
+        # created under the lock on first use, then read without it
+        if self._alias_index is None and create and self.get_cache_dir():
+            with self.__resource_lock:
+                if self._alias_index is None:
+                    commit_every = 1 if self.get_shard()[1] > 1 \
+                        else AliasIndex.COMMIT_EVERY
+                    self.__set_alias_index(AliasIndex(self.get_cache_dir(),
+                                                      commit_every))
+        return self._alias_index
+
+    def get_memo_size(self):
+        """get memo size
+
+        Returns:
+            memo_size (int): maximum number of responses kept in memory
+        """
+        return self.memo_size
+
+    def get_memo(self):
+        """get the in-memory cache of responses, creating it on first use
+
+        Returns:
+            _memo (LRUCache): in-memory cache of responses, None if disabled
+        """
+        # created under the lock on first use, then read without it
+        if self._memo is None and self.get_memo_size() > 0:
+            with self.__resource_lock:
+                if self._memo is None:
+                    self.__set_memo(LRUCache(self.get_memo_size()))
+        return self._memo
+
+    def get_resume(self):
+        """get resume
+
+        Returns:
+            resume (bool): true if responses are journaled and interrupted
+                batches resumed
+        """
+        return self.resume
+
+    def get_journal_path(self):
+        """get the path of the resume journal, next to the output file
+
+        Returns:
+            journal_path (str): path of the journal file
+        """
+        return self.get_args_dict()["output_file"] + Journal.SUFFIX
+
+    def get_input_format(self):
+        """get input format
+
+        Returns:
+            input_format (str): "lines", "tsv" or "csv", None if guessed
+                from the input file extension
+        """
+        return self.input_format
+
+    def get_id_column(self):
+        """get id column
+
+        Returns:
+            id_column (str): name or number of the sequence id column of a
+                TSV/CSV manifest, None for the first column
+        """
+        return self.id_column
+
+    def get_mirror_path(self):
+        """get mirror path
+
+        Returns:
+            mirror_path (str): path to the local mirror snapshot, None if
+                not used
+        """
+        return self.mirror_path
+
+    def get_mirror(self, create=True):
+        """get the local mirror snapshot, opening it on first use
+
+        Args:
+            create (bool): open the snapshot if it is not open yet
+
+        Returns:
+            _mirror (MirrorSnapshot): local mirror snapshot, None if not used
+        """
+        # created under the lock on first use, then read without it
+        if self._mirror is None and create and self.get_mirror_path():
+            with self.__resource_lock:
+                if self._mirror is None:
+                    from enaclient.mirror import MirrorSnapshot
+                    self.__set_mirror(MirrorSnapshot(self.get_mirror_path()))
+        return self._mirror
+
+    def get_base_urls(self):
+        """get base urls
+
+        Returns:
+            base_urls (list): base URLs of refget APIs, in order of
+                preference
+        """
+        return self.base_urls or [ENAClient.API_BASE_URL]
+
+    def get_endpoint_pool(self, create=True):
+        """get the API endpoints, creating them on first use
+
+        Args:
+            create (bool): create the endpoint pool if it does not exist yet
+
+        Returns:
+            _endpoint_pool (EndpointPool): API endpoints and their health
+        """
+        # created under the lock on first use, then read without it
+        if self._endpoint_pool is None and create:
+            with self.__resource_lock:
+                if self._endpoint_pool is None:
+                    self.__set_endpoint_pool(
+                        EndpointPool(self.get_base_urls()))
+        return self._endpoint_pool
+
+    def get_hedge(self):
+        """get hedge
+
+        Returns:
+            hedge (bool): true if slow requests are also sent to a second
+                endpoint
+        """
+        return self.hedge
+
+    def get_hedge_executor(self, create=True):
+        """get the thread pool sending hedged requests, creating it on first
+        use
+
+        Each worker may have a request and its hedge in flight, and a slow
+        request is left to complete after its hedge wins, so the pool has
+        four threads per worker.
+
+        Args:
+            create (bool): create the thread pool if it does not exist yet
+
+        Returns:
+            _hedge_executor (ThreadPoolExecutor): thread pool sending hedged
+                requests
+        """
+        # created under the lock on first use, then read without it
+        if self._hedge_executor is None and create:
+            with self.__resource_lock:
+                if self._hedge_executor is None:
+                    self.__set_hedge_executor(ThreadPoolExecutor(
+                        max_workers=self.get_workers() * 4))
+        return self._hedge_executor
+
+    def get_batch_path(self):
+        """get batch path
+
+        Returns:
+            batch_path (str): path of the batch metadata endpoint under each
+                base URL, None if the endpoints have none
+        """
+        return self.batch_path
+
+    def get_max_retries(self):
+        """get max retries
+
+        Returns:
+            max_retries (int): maximum retries of a failed request
+        """
+        return self.max_retries
+
+    def get_backoff_base(self):
+        """get backoff base
+
+        Returns:
+            backoff_base (float): seconds of the first retry backoff
+        """
+        return self.backoff_base
+
+    def get_backoff_max(self):
+        """get backoff max
+
+        Returns:
+            backoff_max (float): maximum seconds of a retry backoff
+        """
+        return self.backoff_max
+
+    def get_rate_limit(self):
+        """get rate limit
+
+        Returns:
+            rate_limit (float): maximum requests per second, None if unlimited
+        """
+        return self.rate_limit
+
+    def get_rate_limiter(self):
+        """get the rate limiter, creating it on first use
+
+        Returns:
+            _rate_limiter (AdaptiveRateLimiter): client-side rate limiter
+        """
+        # created under the lock on first use, then read without it
+        if self._rate_limiter is None:
+            with self.__resource_lock:
+                if self._rate_limiter is None:
+                    self.__set_rate_limiter(
+                        AdaptiveRateLimiter(self.get_rate_limit()))
+        return self._rate_limiter
+
+    def get_retry_policy(self):
+        """get the retry policy, creating it on first use
+
+        Returns:
+            _retry_policy (RetryPolicy): retry/backoff policy
+        """
+        # created under the lock on first use, then read without it
+        if self._retry_policy is None:
+            with self.__resource_lock:
+                if self._retry_policy is None:
+                    self.__set_retry_policy(RetryPolicy(
+                        self.get_max_retries(), self.get_backoff_base(),
+                        self.get_backoff_max()))
+        return self._retry_policy
+
+    def get_observers(self):
+        """get observers
+
+        Returns:
+            observers (list): MetricsObserver instances notified of the
+                timings of each request and output record
+        """
+        return self.observers
+
+    def get_stats(self):
+        """get stats
+
+        Returns:
+            stats (bool): if true, a summary of the run is written to stderr
+        """
+        return self.stats
+
+    def get_metrics_file(self):
+        """get metrics file
+
+        Returns:
+            metrics_file (str): path the Prometheus metrics of the run are
+                written to, None if they are not exported
+        """
+        return self.metrics_file
+
+    def get_run_stats(self):
+        """get run stats
+
+        Returns:
+            _run_stats (RunStats): statistics collected during the run, None
+                if neither the summary nor the metrics file were requested
+        """
+        return self._run_stats
+
+    def get_processes(self):
+        """get processes
+
+        Returns:
+            processes (int): number of worker processes in batch mode
+        """
+        return self.processes
+
+    def get_keep_shards(self):
+        """get keep shards
+
+        Returns:
+            keep_shards (bool): if true, sharded mode leaves the output of
+                each worker in its own file
+        """
+        return self.keep_shards
+
+    def get_baseline_path(self):
+        """get baseline path
+
+        Returns:
+            baseline_path (str): path to the previous output compared with
+                in diff mode, None if every record is written
+        """
+        return self.baseline_path
+
+    def get_baseline(self, create=True):
+        """get the index of the previous output, loading it on first use
+
+        Args:
+            create (bool): load the index if it is not loaded yet
+
+        Returns:
+            _baseline (BaselineIndex): index of the previous output, None if
+                not in diff mode
+        """
+        # created under the lock on first use, then read without it
+        if self._baseline is None and create and self.get_baseline_path():
+            with self.__resource_lock:
+                if self._baseline is None:
+                    from enaclient.baseline import BaselineIndex
+                    self.__set_baseline(
+                        BaselineIndex(self.get_baseline_path()))
+        return self._baseline
+
+    def get_in_flight(self):
+        """get in flight
+
+        Returns:
+            in_flight (int): maximum requests pending at once in batch mode
+        """
+        return self.in_flight or self.get_workers() * 2
+
+    def get_flush_every(self):
+        """get flush every
+
+        Returns:
+            flush_every (int): records written between flushes of the output
+                in batch mode, 0 if only flushed when the buffer is full
+        """
+        return self.flush_every
+
+    def get_daemon_address(self):
+        """get daemon address
+
+        Returns:
+            daemon_address (str): address of the daemon lookups are sent to,
+                None if sequence ids are looked up directly
+        """
+        return self.daemon_address
+
+    def get_daemon(self, create=True):
+        """get the client of the daemon, creating it on first use
+
+        Args:
+            create (bool): create the client if it does not exist yet
+
+        Returns:
+            _daemon (DaemonClient): client of the daemon lookups are sent
+                to, None if sequence ids are looked up directly
+        """
+        # created under the lock on first use, then read without it. the
+        # address is checked again, as a failed daemon clears it under the
+        # lock
+        if self._daemon is None and create and self.get_daemon_address():
+            with self.__resource_lock:
+                if self._daemon is None and self.get_daemon_address():
+                    self.__set_daemon(DaemonClient(self.get_daemon_address()))
+        return self._daemon
+
+    def get_shard(self):
+        """get shard
+
+        Returns:
+            _shard (tuple): index of the shard this client outputs, and the
+                number of shards of the batch ((0, 1) unless sharded)
+        """
+        return self._shard
+
+    def get_args(self):
+        """get args
+
+        Returns:
+            _args (list): command-line args, None if not given
+        """
+        return self._args
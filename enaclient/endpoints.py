@@ -0,0 +1,211 @@
+"""endpoints.py - refget API endpoints with health tracking
+
+This module contains the classes EndpointPool and Endpoint. The EndpointPool
+holds the refget API base URLs a client can send requests to, in order of
+preference. It tracks the health of each endpoint so that requests fail over
+to the next endpoint while one is failing, and tracks response latencies so
+that slow requests can be hedged with a second request to another endpoint.
+"""
+
+import threading
+import time
+from collections import deque
+
+class Endpoint:
+    """A refget API base URL, with its health and recent latencies"""
+
+    def __init__(self, base_url):
+        """instantiate the Endpoint
+
+        Args:
+            base_url (str): base URL of the refget API
+
+        Returns:
+            (class Endpoint): the Endpoint
+        """
+
+        self.base_url = base_url if base_url.endswith("/") \
+            else base_url + "/"
+        self.failures = 0
+        # false once the endpoint answered that it has no batch endpoint
+        self.batch_supported = True
+        self.down_until = 0.0
+        self.cooldown_secs = 0.0
+        self.latencies = deque(maxlen=EndpointPool.LATENCY_WINDOW)
+        self.p95 = None
+        self.__new_latencies = 0
+
+    def get_metadata_url(self, sequence_id):
+        """get the metadata URL of a sequence id on this endpoint
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+
+        Returns:
+            url (str): metadata URL
+        """
+
+        return self.base_url + "sequence/" + sequence_id + "/metadata"
+
+    def add_latency(self, latency_secs):
+        """record the latency of a response, updating the p95 periodically
+
+        Args:
+            latency_secs (float): seconds from request to response
+        """
+
+        self.latencies.append(latency_secs)
+        self.__new_latencies += 1
+        if len(self.latencies) >= EndpointPool.MIN_LATENCIES \
+           and (self.p95 is None or self.__new_latencies
+                >= EndpointPool.P95_UPDATE_EVERY):
+            ordered = sorted(self.latencies)
+            self.p95 = ordered[int(0.95 * (len(ordered) - 1))]
+            self.__new_latencies = 0
+
+class EndpointPool:
+    """Endpoints in order of preference, failing over while one is down
+
+    Requests go to the first endpoint that is up. After FAILURE_THRESHOLD
+    consecutive failures (timeouts, connection errors, 5xx responses) an
+    endpoint is marked down for a cooldown, starting at COOLDOWN_SECS and
+    doubling each time it fails again, up to MAX_COOLDOWN_SECS. Once the
+    cooldown ends the endpoint is tried again, and a success brings it back
+    up, while a failure marks it down again. If every endpoint is down, the
+    one that comes back first is used.
+    """
+
+    FAILURE_THRESHOLD = 3
+    COOLDOWN_SECS = 5.0
+    MAX_COOLDOWN_SECS = 300.0
+
+    # latencies kept per endpoint, minimum before a p95 is known, and new
+    # latencies between p95 updates
+    LATENCY_WINDOW = 1000
+    MIN_LATENCIES = 20
+    P95_UPDATE_EVERY = 50
+
+    def __init__(self, base_urls):
+        """instantiate the EndpointPool
+
+        Args:
+            base_urls (list): base URLs of the refget API, in order of
+                preference
+
+        Returns:
+            (class EndpointPool): the EndpointPool
+        """
+
+        self.endpoints = [Endpoint(base_url) for base_url in base_urls]
+        # requests sent to an endpoint other than the preferred one, and
+        # hedged requests (and those answered first by the hedge)
+        self.failovers = 0
+        self.hedged = 0
+        self.hedges_won = 0
+        self.__lock = threading.Lock()
+
+    def choose(self, exclude=None):
+        """choose the endpoint for a request
+
+        Args:
+            exclude (Endpoint): endpoint to avoid if another is up (eg. the
+                endpoint the previous attempt failed on)
+
+        Returns:
+            endpoint (Endpoint): first endpoint that is up, or the endpoint
+                that comes back up first if all are down
+        """
+
+        now = time.monotonic()
+        with self.__lock:
+            for endpoint in self.endpoints:
+                if endpoint is not exclude and endpoint.down_until <= now:
+                    if endpoint is not self.endpoints[0]:
+                        self.failovers += 1
+                    return endpoint
+            return min(self.endpoints,
+                       key=lambda endpoint: endpoint.down_until)
+
+    def choose_hedge(self, endpoint):
+        """choose the endpoint for a hedged request
+
+        Args:
+            endpoint (Endpoint): endpoint of the original request
+
+        Returns:
+            hedge_endpoint (Endpoint): another endpoint that is up, or None
+        """
+
+        now = time.monotonic()
+        with self.__lock:
+            for hedge_endpoint in self.endpoints:
+                if hedge_endpoint is not endpoint \
+                   and hedge_endpoint.down_until <= now:
+                    return hedge_endpoint
+            return None
+
+    def record_latency(self, endpoint, latency_secs):
+        """record the latency of a response from an endpoint
+
+        Args:
+            endpoint (Endpoint): endpoint that responded
+            latency_secs (float): seconds from request to response
+        """
+
+        with self.__lock:
+            endpoint.add_latency(latency_secs)
+
+    def get_hedge_delay(self, endpoint):
+        """get how long to wait for a response before hedging a request
+
+        Args:
+            endpoint (Endpoint): endpoint of the original request
+
+        Returns:
+            delay (float): p95 latency of the endpoint, None until enough
+                latencies have been recorded
+        """
+
+        with self.__lock:
+            return endpoint.p95
+
+    def record_hedge(self):
+        """count a hedged request"""
+        with self.__lock:
+            self.hedged += 1
+
+    def record_hedge_won(self):
+        """count a hedged request answered first by the hedge"""
+        with self.__lock:
+            self.hedges_won += 1
+
+    def record_success(self, endpoint):
+        """mark an endpoint up after a successful request
+
+        Args:
+            endpoint (Endpoint): endpoint that responded
+        """
+
+        with self.__lock:
+            endpoint.failures = 0
+            endpoint.down_until = 0.0
+            endpoint.cooldown_secs = 0.0
+
+    def record_failure(self, endpoint):
+        """count a failed request, marking the endpoint down if it keeps
+        failing
+
+        Args:
+            endpoint (Endpoint): endpoint that failed
+        """
+
+        with self.__lock:
+            endpoint.failures += 1
+            if endpoint.failures >= EndpointPool.FAILURE_THRESHOLD:
+                endpoint.cooldown_secs = min(EndpointPool.MAX_COOLDOWN_SECS,
+                    endpoint.cooldown_secs * 2 or EndpointPool.COOLDOWN_SECS)
+                endpoint.down_until = time.monotonic() \
+                    + endpoint.cooldown_secs
+                # once the cooldown ends, a single failure marks the
+                # endpoint down again
+                endpoint.failures = EndpointPool.FAILURE_THRESHOLD - 1
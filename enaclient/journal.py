@@ -0,0 +1,132 @@
+"""journal.py - checkpoint journal for resumable batches
+
+This module contains the class Journal. The Journal is an append-only file
+of the responses a batch has completed, written in input order, so that a
+batch that was interrupted can be restarted without requesting the completed
+sequence ids again.
+"""
+
+import json
+import os
+
+class Journal:
+    """Append-only journal of completed batch responses, in input order
+
+    Each line of the journal is one response dictionary as compact JSON.
+    Because responses are journaled in input order, the journal always holds
+    the responses of a leading run of the input, and resuming is a matter of
+    reading the journal and the input in lockstep.
+
+    Lines are buffered and handed to the operating system every FLUSH_EVERY
+    responses rather than synced one at a time, so journaling does not slow
+    the batch down. A batch killed mid-write leaves at most a partial last
+    line, which is discarded on resume.
+    """
+
+    SUFFIX = ".journal"
+    FLUSH_EVERY = 1000
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, path, flush_every=FLUSH_EVERY):
+        """instantiate the Journal, opening an existing journal for replay
+
+        Args:
+            path (str): path to the journal file
+            flush_every (int): number of appended responses between flushes
+
+        Returns:
+            (class Journal): the Journal
+        """
+
+        self.path = path
+        self.flush_every = flush_every
+        self.replayed = 0
+        self.__offset = 0
+        self.__unflushed = 0
+        self.__writer = None
+        self.__reader = open(path, "rb") if os.path.exists(path) else None
+
+    def replay(self, sequence_id):
+        """get the next journaled response, if it is for the sequence id
+
+        Args:
+            sequence_id (str): next sequence id of the input
+
+        Returns:
+            response_dict (dict): journaled response, or None if the journal
+                is exhausted, its next line is partial, or it is for another
+                sequence id (ie. the input changed)
+        """
+
+        if self.__reader is None:
+            return None
+
+        line = self.__reader.readline()
+        if not line.endswith(b"\n"):
+            return self.__stop_replay()
+        try:
+            response_dict = json.loads(line.decode("utf-8"))
+        except ValueError:
+            return self.__stop_replay()
+        if response_dict.get("req_seq_id") != sequence_id:
+            return self.__stop_replay()
+
+        self.__offset += len(line)
+        self.replayed += 1
+        return response_dict
+
+    def start_appending(self):
+        """stop replaying, and open the journal for appending responses
+
+        Anything after the last replayed response (a partial line, or
+        responses for a different input) is truncated.
+        """
+
+        self.__stop_replay()
+        mode = "r+b" if os.path.exists(self.path) else "wb"
+        self.__writer = open(self.path, mode, buffering=Journal.BUFFER_SIZE)
+        self.__writer.truncate(self.__offset)
+        self.__writer.seek(self.__offset)
+
+    def append(self, response_dict):
+        """append a completed response
+
+        Args:
+            response_dict (dict): API response for the next sequence id
+        """
+
+        self.__writer.write(json.dumps(response_dict, separators=(",", ":"))
+                            .encode("utf-8") + b"\n")
+        self.__unflushed += 1
+        if self.__unflushed >= self.flush_every:
+            self.__writer.flush()
+            self.__unflushed = 0
+
+    def close(self):
+        """flush and sync the journal, and close it"""
+
+        self.__stop_replay()
+        if self.__writer is not None:
+            self.__writer.flush()
+            os.fsync(self.__writer.fileno())
+            self.__writer.close()
+            self.__writer = None
+
+    def remove(self):
+        """close and delete the journal, once the batch has completed"""
+
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __stop_replay(self):
+        """close the journal reader
+
+        Returns:
+            None
+        """
+
+        if self.__reader is not None:
+            self.__reader.close()
+            self.__reader = None
+        return None
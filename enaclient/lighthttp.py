@@ -0,0 +1,556 @@
+"""lighthttp.py - lightweight http session for single refget API lookups
+
+This module contains the classes LightSessionPool, LightSession and
+LightResponse, and the DaemonClient. The sessions cover the small part of the
+requests API the ENAClient uses for metadata requests (GET with a timeout,
+the status code, headers, body and elapsed time of the response), over
+http.client from the standard library. Importing requests takes longer than
+a single lookup against a nearby server, so a command line run that looks up
+one sequence id uses a LightSession instead. For the same reason, command
+line runs reach a running enaclient daemon through the DaemonClient here
+rather than through daemon.py.
+
+The exceptions raised mirror the names and hierarchy of requests.exceptions,
+so callers can catch either through the "exceptions" attribute of the pool.
+"""
+
+import datetime
+import http.client
+import json
+import os
+import socket
+import ssl
+import sys
+import threading
+import time
+from urllib.parse import urlsplit, urljoin, quote
+from enaclient.metrics import add_connect_secs
+
+# environment variables configuring a proxy, which LightSession does not
+# support
+PROXY_VARIABLES = ["http_proxy", "https_proxy", "all_proxy", "HTTP_PROXY",
+                   "HTTPS_PROXY", "ALL_PROXY"]
+
+# environment variables pointing requests at a CA bundle, honoured by
+# LightSession too
+CA_BUNDLE_VARIABLES = ["REQUESTS_CA_BUNDLE", "CURL_CA_BUNDLE"]
+
+class RequestException(IOError):
+    """the request failed"""
+
+class ConnectionError(RequestException):
+    """the connection could not be opened, or was lost"""
+
+class Timeout(RequestException):
+    """the request timed out"""
+
+class ConnectTimeout(ConnectionError, Timeout):
+    """the connection timed out while being opened"""
+
+class ReadTimeout(Timeout):
+    """the server did not respond in time"""
+
+class ChunkedEncodingError(RequestException):
+    """the response body was cut short"""
+
+class TooManyRedirects(RequestException):
+    """the request was redirected more than MAX_REDIRECTS times"""
+
+class LightResponse:
+    """Response to a LightSession request, with its body read"""
+
+    def __init__(self, status_code, headers, content, elapsed):
+        """instantiate the LightResponse
+
+        Args:
+            status_code (int): http status code
+            headers (HTTPMessage): response headers, case insensitive
+            content (bytes): response body
+            elapsed (timedelta): time from sending the request until the
+                response headers arrived
+        """
+
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.elapsed = elapsed
+
+    def json(self):
+        """decode the response body as JSON
+
+        Returns:
+            body (obj): decoded body
+
+        Raises:
+            ValueError: if the body is not valid JSON
+        """
+
+        return json.loads(self.content.decode("utf-8"))
+
+class LightSession:
+    """Keep-alive http.client connections, one per host
+
+    Not thread safe: a LightSession is meant for the requests of a single
+    lookup, made one after the other.
+    """
+
+    # redirects followed before giving up, as requests
+    MAX_REDIRECTS = 30
+    REDIRECT_STATUS_CODES = (301, 302, 303, 307, 308)
+
+    def __init__(self):
+        """instantiate the LightSession"""
+
+        self.__connections = {}
+        self.__ssl_context = None
+
+    def get(self, url, timeout=None, headers=None):
+        """send a GET request, following redirects
+
+        A request on a kept-alive connection that the server has since
+        closed is sent again once, on a new connection. Redirects (301, 302,
+        303, 307, 308) are followed as requests does, up to MAX_REDIRECTS.
+
+        Args:
+            url (str): http(s) URL
+            timeout (float): seconds to wait for the connection to open, and
+                for each read from it
+            headers (dict): additional request headers (eg. If-None-Match)
+
+        Returns:
+            response_obj (LightResponse): the response
+
+        Raises:
+            ConnectTimeout: if the connection timed out while being opened
+            ReadTimeout: if the server did not respond in time
+            ConnectionError: if the connection failed or was lost
+            ChunkedEncodingError: if the response body was cut short
+            TooManyRedirects: if there were more than MAX_REDIRECTS
+                redirects
+        """
+
+        request_headers = {"Accept": "application/json",
+                           "User-Agent": "enaclient"}
+        request_headers.update(headers or {})
+        for redirect in range(LightSession.MAX_REDIRECTS + 1):
+            response_obj = self.__get_once(url, timeout, request_headers)
+            location = response_obj.headers.get("Location")
+            if response_obj.status_code \
+               not in LightSession.REDIRECT_STATUS_CODES or not location:
+                return response_obj
+            url = urljoin(url, location)
+        raise TooManyRedirects("exceeded %s redirects: %s"
+                               % (LightSession.MAX_REDIRECTS, url))
+
+    def __get_once(self, url, timeout, request_headers):
+        """send a GET request, without following redirects
+
+        Args:
+            url (str): http(s) URL
+            timeout (float): seconds to wait for the connection to open, and
+                for each read from it
+            request_headers (dict): request headers
+
+        Returns:
+            response_obj (LightResponse): the response
+
+        Raises:
+            ConnectTimeout: if the connection timed out while being opened
+            ReadTimeout: if the server did not respond in time
+            ConnectionError: if the connection failed or was lost
+            ChunkedEncodingError: if the response body was cut short
+        """
+
+        parts = urlsplit(url)
+        path = parts.path + ("?" + parts.query if parts.query else "")
+        key = (parts.scheme, parts.hostname, parts.port)
+        for attempt in range(2):
+            reused = key in self.__connections
+            connection = self.__get_connection(key, timeout)
+            start = time.perf_counter()
+            try:
+                connection.request("GET", path, headers=request_headers)
+                response = connection.getresponse()
+                elapsed = datetime.timedelta(
+                    seconds=time.perf_counter() - start)
+                content = response.read()
+            except socket.timeout:
+                self.__discard(key)
+                raise ReadTimeout("read timed out: %s" % (url))
+            except http.client.IncompleteRead:
+                self.__discard(key)
+                raise ChunkedEncodingError("response cut short: %s" % (url))
+            except (OSError, http.client.HTTPException) as e:
+                self.__discard(key)
+                if reused and attempt == 0:
+                    continue
+                raise ConnectionError("connection error: %s: %s" % (url, e))
+            if response.will_close:
+                self.__discard(key)
+            return LightResponse(response.status, response.headers, content,
+                                 elapsed)
+
+    def close(self):
+        """close the kept-alive connections"""
+
+        for key in list(self.__connections):
+            self.__discard(key)
+
+    def __get_connection(self, key, timeout):
+        """get the kept-alive connection to a host, opening one if needed
+
+        Args:
+            key (tuple): scheme, host and port
+            timeout (float): seconds to wait for the connection to open
+
+        Returns:
+            connection (HTTPConnection): open connection
+
+        Raises:
+            ConnectTimeout: if the connection timed out while being opened
+            ConnectionError: if the connection could not be opened
+        """
+
+        connection = self.__connections.get(key)
+        if connection is not None:
+            return connection
+
+        scheme, host, port = key
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(host, port,
+                timeout=timeout, context=self.__get_ssl_context())
+        else:
+            connection = http.client.HTTPConnection(host, port,
+                                                    timeout=timeout)
+        start = time.perf_counter()
+        try:
+            connection.connect()
+        except socket.timeout:
+            raise ConnectTimeout("connection timed out: %s" % (host))
+        except OSError as e:
+            raise ConnectionError("connection error: %s: %s" % (host, e))
+        finally:
+            add_connect_secs(time.perf_counter() - start)
+        self.__connections[key] = connection
+        return connection
+
+    def __discard(self, key):
+        """close and forget the connection to a host
+
+        Args:
+            key (tuple): scheme, host and port
+        """
+
+        connection = self.__connections.pop(key, None)
+        if connection is not None:
+            connection.close()
+
+    def __get_ssl_context(self):
+        """get the TLS context, verifying certificates against the CA
+        bundle requests would use
+
+        Returns:
+            context (SSLContext): TLS context
+        """
+
+        if self.__ssl_context is None:
+            cafile = None
+            for variable in CA_BUNDLE_VARIABLES:
+                cafile = cafile or os.environ.get(variable)
+            context = ssl.create_default_context(cafile=cafile)
+            # fall back to the certifi bundle requests ships with if the
+            # system has no CA certificates (eg. some macOS installs)
+            if cafile is None and not context.cert_store_stats()["x509_ca"]:
+                import certifi
+                context.load_verify_locations(certifi.where())
+            self.__ssl_context = context
+        return self.__ssl_context
+
+class LightSessionPool:
+    """Drop-in replacement of SessionPool for single lookups
+
+    Holds one LightSession, for use by one thread at a time.
+    """
+
+    def __init__(self):
+        """instantiate the LightSessionPool"""
+
+        self.__lock = threading.Lock()
+        self.__session = None
+
+    @staticmethod
+    def is_supported():
+        """check that a LightSession can make the requests of this process
+
+        Returns:
+            supported (bool): false if a proxy is configured, which only
+                requests supports
+        """
+
+        return not any(os.environ.get(variable)
+                       for variable in PROXY_VARIABLES)
+
+    @property
+    def exceptions(self):
+        """module holding the exception classes raised by the sessions"""
+        return sys.modules[__name__]
+
+    def get_session(self):
+        """get the session, creating it on first use
+
+        Returns:
+            session (LightSession): session to make the request with
+        """
+
+        with self.__lock:
+            if self.__session is None:
+                self.__session = LightSession()
+            return self.__session
+
+    def release(self, session):
+        """hand back the session once a request made with it is done
+
+        Args:
+            session (LightSession): session taken with get_session
+        """
+
+        pass
+
+    def close(self):
+        """close the session and its connections"""
+
+        with self.__lock:
+            if self.__session is not None:
+                self.__session.close()
+                self.__session = None
+
+class DaemonError(RequestException):
+    """the daemon could not be reached, or failed to answer"""
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix domain socket"""
+
+    def __init__(self, socket_path, timeout=None):
+        """instantiate the UnixHTTPConnection
+
+        Args:
+            socket_path (str): path to the Unix socket
+            timeout (float): seconds to wait for each read from the socket
+        """
+
+        http.client.HTTPConnection.__init__(self, "localhost",
+                                            timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        """connect to the Unix socket"""
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class DaemonClient:
+    """Look up metadata through a running enaclient daemon (see daemon.py)
+
+    The daemon is reached over a Unix socket, or localhost http if its
+    address is an http:// URL. Each thread keeps its own kept-alive
+    connection, so a DaemonClient can be shared by the workers of a batch.
+    """
+
+    # seconds to wait for the daemon to answer, which for a batch may mean
+    # waiting for every sequence id to be requested from the API
+    DEFAULT_TIMEOUT_SECS = 300
+
+    def __init__(self, address, timeout=DEFAULT_TIMEOUT_SECS):
+        """instantiate the DaemonClient
+
+        Args:
+            address (str): path to the daemon's Unix socket, or its
+                http://host:port URL
+            timeout (float): seconds to wait for each read from the daemon
+        """
+
+        self.address = address
+        self.timeout = timeout
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__connections = []
+
+    @staticmethod
+    def is_http_address(address):
+        """check whether a daemon address is a localhost http URL
+
+        Args:
+            address (str): daemon address
+
+        Returns:
+            http (bool): true for an http:// URL, false for a socket path
+        """
+
+        return address.startswith("http://")
+
+    def is_running(self):
+        """check that the daemon answers
+
+        Returns:
+            running (bool): true if the daemon answered its health check
+        """
+
+        try:
+            self.get_health()
+        except DaemonError:
+            return False
+        return True
+
+    def get_health(self):
+        """get the health of the daemon
+
+        Returns:
+            health (dict): process id, address, requests served and uptime
+
+        Raises:
+            DaemonError: if the daemon could not be reached
+        """
+
+        return self.__request("GET", "/health")
+
+    def get_response_dict(self, sequence_id):
+        """get the response dictionary for a sequence id from the daemon
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+
+        Returns:
+            response_dict (dict): API response for the sequence id
+
+        Raises:
+            DaemonError: if the daemon could not be reached
+        """
+
+        return self.__request("GET", "/metadata/"
+                              + quote(sequence_id, safe=""))
+
+    def get_response_dicts(self, sequence_ids):
+        """get the response dictionaries for many sequence ids, with one
+        request to the daemon
+
+        Args:
+            sequence_ids (list): md5sums/ids for the sequences of interest
+
+        Returns:
+            response_dicts (list): API response for each sequence id, in
+                input order
+
+        Raises:
+            DaemonError: if the daemon could not be reached
+        """
+
+        return self.__request("POST", "/metadata",
+                              {"ids": list(sequence_ids)})["responses"]
+
+    def close(self):
+        """close the kept-alive connections of every thread"""
+
+        with self.__lock:
+            for connection in self.__connections:
+                connection.close()
+            self.__connections = []
+        self.__local = threading.local()
+
+    def __request(self, method, path, body=None):
+        """send a request to the daemon and decode its JSON answer
+
+        A request on a kept-alive connection that the daemon has since
+        closed is sent again once, on a new connection.
+
+        Args:
+            method (str): GET or POST
+            path (str): request path
+            body (obj): JSON body of a POST request
+
+        Returns:
+            answer (obj): decoded body of the answer
+
+        Raises:
+            DaemonError: if the daemon could not be reached, or did not
+                answer with 200
+        """
+
+        headers = {"Accept": "application/json", "User-Agent": "enaclient"}
+        content = None
+        if body is not None:
+            content = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        for attempt in range(2):
+            reused = getattr(self.__local, "connection", None) is not None
+            connection = self.__get_connection()
+            try:
+                connection.request(method, path, body=content,
+                                   headers=headers)
+                response = connection.getresponse()
+                answer = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                self.__discard()
+                if reused and attempt == 0:
+                    continue
+                raise DaemonError("daemon error: %s: %s" % (self.address, e))
+            if response.will_close:
+                self.__discard()
+            if response.status != 200:
+                raise DaemonError("daemon error: %s: %s %s%s"
+                    % (self.address, response.status, response.reason,
+                       DaemonClient.get_error(answer)))
+            try:
+                return json.loads(answer.decode("utf-8"))
+            except ValueError as e:
+                raise DaemonError("daemon error: %s: %s" % (self.address, e))
+
+    @staticmethod
+    def get_error(answer):
+        """get the error message of an answer of the daemon
+
+        Args:
+            answer (bytes): body of the answer
+
+        Returns:
+            error (str): ": " and the error message of a JSON answer, empty
+                if it holds none
+        """
+
+        try:
+            error = json.loads(answer.decode("utf-8")).get("error")
+        except (ValueError, AttributeError):
+            return ""
+        return ": %s" % (error) if error else ""
+
+    def __get_connection(self):
+        """get the calling thread's connection, creating it if needed
+
+        Returns:
+            connection (HTTPConnection): connection to the daemon, opened on
+                the first request
+        """
+
+        connection = getattr(self.__local, "connection", None)
+        if connection is None:
+            if DaemonClient.is_http_address(self.address):
+                parts = urlsplit(self.address)
+                connection = http.client.HTTPConnection(parts.hostname,
+                    parts.port, timeout=self.timeout)
+            else:
+                connection = UnixHTTPConnection(self.address, self.timeout)
+            self.__local.connection = connection
+            with self.__lock:
+                self.__connections.append(connection)
+        return connection
+
+    def __discard(self):
+        """close and forget the calling thread's connection"""
+
+        connection = getattr(self.__local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.__local.connection = None
+            with self.__lock:
+                if connection in self.__connections:
+                    self.__connections.remove(connection)
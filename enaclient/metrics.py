@@ -0,0 +1,472 @@
+"""metrics.py - per-stage timings of refget API requests
+
+This module contains the classes RequestTrace, MetricsObserver, Histogram,
+RunStats and OpenTelemetryObserver. A RequestTrace records how long each
+stage of a refget API request took (waiting on the rate limiter, opening the
+connection, waiting on the server, transferring and decoding the response,
+backing off before retries). Once a request completes, its trace is passed to
+each MetricsObserver registered with the client, along with the time spent
+formatting and writing each output record. RunStats aggregates these into
+histograms for a summary at the end of a run, or a Prometheus text export,
+and OpenTelemetryObserver turns each trace into spans. The http sessions
+record the time each thread spends opening connections with
+add_connect_secs, for the traces to tell connection setup apart from
+waiting on the server.
+"""
+
+import bisect
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# stages of a request, in the order they happen within an attempt
+STAGE_RATE_LIMIT = "rate_limit"
+STAGE_CONNECT = "connect"
+STAGE_SERVER = "server"
+STAGE_TRANSFER = "transfer"
+STAGE_DECODE = "decode"
+STAGE_FAILED = "failed"
+STAGE_BACKOFF = "backoff"
+REQUEST_STAGES = (STAGE_RATE_LIMIT, STAGE_CONNECT, STAGE_SERVER,
+                  STAGE_TRANSFER, STAGE_DECODE, STAGE_FAILED, STAGE_BACKOFF)
+
+# stages of an output record
+STAGE_FORMAT = "format"
+STAGE_WRITE = "write"
+OUTPUT_STAGES = (STAGE_FORMAT, STAGE_WRITE)
+
+# seconds each thread spent opening connections (DNS lookup, TCP connect and
+# TLS handshake) since it last reset the counter
+_connect_times = threading.local()
+
+def reset_connect_secs():
+    """reset the connection setup time of the current thread"""
+    _connect_times.secs = 0.0
+
+def get_connect_secs():
+    """get the connection setup time of the current thread
+
+    Returns:
+        connect_secs (float): seconds spent opening connections since the
+            last call to reset_connect_secs
+    """
+    return getattr(_connect_times, "secs", 0.0)
+
+def add_connect_secs(secs):
+    """add to the connection setup time of the current thread
+
+    Args:
+        secs (float): seconds spent opening a connection
+    """
+    _connect_times.secs = get_connect_secs() + secs
+
+def format_secs(secs):
+    """format a duration for display
+
+    Args:
+        secs (float): duration in seconds
+
+    Returns:
+        text (str): duration in ms below a second, in s otherwise
+    """
+
+    if secs == float("inf"):
+        return "inf"
+    if secs < 1:
+        return "%.2fms" % (1000 * secs)
+    return "%.2fs" % (secs)
+
+class RequestTrace:
+    """Timings of the stages of one request to the refget API
+
+    Attributes:
+        sequence_id (str): requested sequence id, None for a batch request
+        batch_size (int): number of sequence ids requested
+        start_time (float): time the request started, in seconds since the
+            epoch
+        status_code (int/str): http status code of the response, or the
+            "408"/"503" reported for timeouts and connection errors
+        attempts (int): number of attempts, including retries
+        bytes_received (int): size of the response bodies received
+        stages (list): (stage, offset secs, duration secs) tuples in the
+            order the stages happened, offsets from the start of the request
+        total_secs (float): duration of the whole request, once finished
+    """
+
+    def __init__(self, sequence_id, batch_size=1):
+        """instantiate the RequestTrace, starting its clock
+
+        Args:
+            sequence_id (str): requested sequence id
+            batch_size (int): number of sequence ids requested
+        """
+
+        self.sequence_id = sequence_id
+        self.batch_size = batch_size
+        self.start_time = time.time()
+        self.status_code = None
+        self.attempts = 0
+        self.bytes_received = 0
+        self.stages = []
+        self.total_secs = None
+        self.__start = time.perf_counter()
+
+    def add_stage(self, stage, start, duration=None):
+        """record a stage of the request
+
+        Args:
+            stage (str): name of the stage
+            start (float): time.perf_counter() when the stage started
+            duration (float): seconds the stage took, by default until now
+        """
+
+        if duration is None:
+            duration = time.perf_counter() - start
+        self.stages.append((stage, start - self.__start, duration))
+
+    def add_response(self, start, connect_secs, response_obj):
+        """record the stages of an http request that got a response
+
+        The time until the response headers arrived (the "elapsed" time of
+        the response) is split into opening the connection, if a new one was
+        needed, and waiting on the server. The rest is spent transferring
+        the response body.
+
+        Args:
+            start (float): time.perf_counter() when the request was sent
+            connect_secs (float): seconds spent opening connections (DNS
+                lookup, TCP connect and TLS handshake)
+            response_obj (Response): the http response, its body read
+        """
+
+        total_secs = time.perf_counter() - start
+        elapsed_secs = min(max(response_obj.elapsed.total_seconds(),
+                               connect_secs), total_secs)
+        self.add_stage(STAGE_CONNECT, start, connect_secs)
+        self.add_stage(STAGE_SERVER, start + connect_secs,
+                       elapsed_secs - connect_secs)
+        self.add_stage(STAGE_TRANSFER, start + elapsed_secs,
+                       total_secs - elapsed_secs)
+        self.bytes_received += len(response_obj.content)
+
+    def finish(self, status_code):
+        """stop the clock of the request
+
+        Args:
+            status_code (int/str): status code the request ended with
+        """
+
+        self.status_code = status_code
+        self.total_secs = time.perf_counter() - self.__start
+
+    def get_stage_secs(self):
+        """get the total time spent in each stage, over all attempts
+
+        Returns:
+            stage_secs (OrderedDict): seconds keyed by stage, in the order
+                the stages first happened
+        """
+
+        stage_secs = OrderedDict()
+        for stage, offset, duration in self.stages:
+            stage_secs[stage] = stage_secs.get(stage, 0.0) + duration
+        return stage_secs
+
+class MetricsObserver:
+    """Interface notified of the timings of requests and output records
+
+    Subclass and override the methods of interest, then register instances
+    with ENAClient.set_observers. Methods are called from the worker threads
+    making requests, so implementations must be thread safe.
+    """
+
+    def on_request(self, trace):
+        """called once a request to the refget API has completed
+
+        Args:
+            trace (RequestTrace): timings of the request
+        """
+        pass
+
+    def on_record(self, response_dict, format_secs, write_secs):
+        """called once an output record has been written
+
+        Args:
+            response_dict (dict): API response for the sequence id
+            format_secs (float): seconds spent formatting the record
+            write_secs (float): seconds spent writing the record
+        """
+        pass
+
+class Histogram:
+    """Counts of observed durations in fixed buckets, with their sum
+
+    Memory use does not depend on the number of observations, so histograms
+    can be kept for batches of any size. Quantiles are estimated as the
+    upper bound of the bucket they fall in.
+    """
+
+    # upper bounds of the buckets, in seconds, an overflow bucket follows
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+               0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        """instantiate an empty Histogram"""
+
+        self.counts = [0] * (len(Histogram.BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, secs):
+        """count an observed duration
+
+        Args:
+            secs (float): observed duration in seconds
+        """
+
+        self.counts[bisect.bisect_left(Histogram.BUCKETS, secs)] += 1
+        self.count += 1
+        self.sum += secs
+
+    def get_mean(self):
+        """get the mean of the observations
+
+        Returns:
+            mean (float): mean duration, 0 if there are no observations
+        """
+
+        return self.sum / self.count if self.count else 0.0
+
+    def get_quantile(self, fraction):
+        """estimate a quantile of the observations
+
+        Args:
+            fraction (float): quantile as a fraction (eg. 0.99)
+
+        Returns:
+            secs (float): upper bound of the bucket the quantile falls in,
+                inf if in the overflow bucket, 0 if there are no observations
+        """
+
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                break
+        return Histogram.BUCKETS[index] if index < len(Histogram.BUCKETS) \
+            else float("inf")
+
+class RunStats(MetricsObserver):
+    """Aggregate statistics of a run: throughput, latency histograms per
+    stage, status code counts and bytes received
+    """
+
+    # width of the bars of the latency histogram in the summary
+    BAR_WIDTH = 40
+
+    def __init__(self):
+        """instantiate the RunStats, starting the clock of the run"""
+
+        self.records = 0
+        self.record_status_codes = Counter()
+        self.requests = 0
+        self.request_status_codes = Counter()
+        self.bytes_received = 0
+        self.request_histogram = Histogram()
+        self.stage_histograms = OrderedDict((stage, Histogram())
+            for stage in REQUEST_STAGES + OUTPUT_STAGES)
+        self.__start = time.perf_counter()
+        self.__lock = threading.Lock()
+
+    def on_request(self, trace):
+        stage_secs = trace.get_stage_secs()
+        with self.__lock:
+            self.requests += 1
+            self.request_status_codes[str(trace.status_code)] += 1
+            self.bytes_received += trace.bytes_received
+            self.request_histogram.observe(trace.total_secs)
+            for stage, secs in stage_secs.items():
+                self.stage_histograms[stage].observe(secs)
+
+    def on_record(self, response_dict, format_secs, write_secs):
+        with self.__lock:
+            self.records += 1
+            self.record_status_codes[str(response_dict.get("status_code"))] \
+                += 1
+            self.stage_histograms[STAGE_FORMAT].observe(format_secs)
+            self.stage_histograms[STAGE_WRITE].observe(write_secs)
+
+    def get_elapsed_secs(self):
+        """get the duration of the run so far
+
+        Returns:
+            elapsed_secs (float): seconds since the RunStats was created
+        """
+
+        return time.perf_counter() - self.__start
+
+    def format_summary(self):
+        """format the statistics of the run for display
+
+        Returns:
+            summary (str): throughput, status codes, bytes received, latency
+                of each stage and a histogram of request latencies
+        """
+
+        elapsed_secs = self.get_elapsed_secs()
+        with self.__lock:
+            lines = ["stats: %s records in %.2fs (%.1f records/sec), %s API "
+                % (self.records, elapsed_secs,
+                   self.records / elapsed_secs if elapsed_secs else 0.0,
+                   self.requests)
+                + "requests, %.1f KiB received"
+                % (self.bytes_received / 1024.0)]
+            for label, status_codes in [("record", self.record_status_codes),
+                    ("request", self.request_status_codes)]:
+                if status_codes:
+                    lines.append("%s status codes: %s" % (label, ", ".join(
+                        "%s: %s" % (status_code, status_codes[status_code])
+                        for status_code in sorted(status_codes))))
+
+            # mean and estimated quantiles of each stage that happened
+            lines.append("%-10s %8s %10s %10s %10s %10s" % ("stage",
+                "count", "mean", "p50", "p90", "p99"))
+            histograms = [("request", self.request_histogram)] \
+                + list(self.stage_histograms.items())
+            for stage, histogram in histograms:
+                if histogram.count:
+                    lines.append("%-10s %8s %10s %10s %10s %10s" % (stage,
+                        histogram.count, format_secs(histogram.get_mean()),
+                        "<=" + format_secs(histogram.get_quantile(0.5)),
+                        "<=" + format_secs(histogram.get_quantile(0.9)),
+                        "<=" + format_secs(histogram.get_quantile(0.99))))
+
+            # bar chart of request latencies, one row per bucket from the
+            # first to the last bucket with requests
+            if self.request_histogram.count:
+                lines.append("request latency histogram:")
+                counts = self.request_histogram.counts
+                bounds = ["<=" + format_secs(bound)
+                          for bound in Histogram.BUCKETS] \
+                    + [">" + format_secs(Histogram.BUCKETS[-1])]
+                used = [index for index, count in enumerate(counts) if count]
+                for index in range(used[0], used[-1] + 1):
+                    bar = "#" * int(round(RunStats.BAR_WIDTH * counts[index]
+                                          / float(max(counts))))
+                    lines.append("  %-10s |%-*s| %s" % (bounds[index],
+                        RunStats.BAR_WIDTH, bar, counts[index]))
+        return "\n".join(lines) + "\n"
+
+    def to_prometheus(self, prefix="enaclient"):
+        """export the statistics in the Prometheus text format
+
+        Args:
+            prefix (str): prefix of the metric names
+
+        Returns:
+            text (str): counters of records, requests and bytes received,
+                and histograms of request and stage latencies
+        """
+
+        lines = []
+
+        def add_metric(name, metric_type, help_text, samples):
+            lines.append("# HELP %s_%s %s" % (prefix, name, help_text))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, metric_type))
+            for suffix, labels, value in samples:
+                label_text = ",".join('%s="%s"' % (key, label_value)
+                                      for key, label_value in labels)
+                lines.append("%s_%s%s%s %s" % (prefix, name, suffix,
+                    "{%s}" % (label_text) if label_text else "", value))
+
+        def histogram_samples(histogram, labels):
+            samples = []
+            cumulative = 0
+            for bound, count in zip(Histogram.BUCKETS, histogram.counts):
+                cumulative += count
+                samples.append(("_bucket", labels + [("le", repr(bound))],
+                                cumulative))
+            samples.append(("_bucket", labels + [("le", "+Inf")],
+                            histogram.count))
+            samples.append(("_sum", labels, repr(histogram.sum)))
+            samples.append(("_count", labels, histogram.count))
+            return samples
+
+        elapsed_secs = self.get_elapsed_secs()
+        with self.__lock:
+            add_metric("run_seconds", "gauge", "Duration of the run.",
+                [("", [], repr(elapsed_secs))])
+            add_metric("records_total", "counter", "Output records, by "
+                + "status code.", [("", [("status_code", status_code)],
+                    count) for status_code, count
+                    in sorted(self.record_status_codes.items())])
+            add_metric("requests_total", "counter", "Requests to the refget "
+                + "API, by status code.", [("", [("status_code",
+                    status_code)], count) for status_code, count
+                    in sorted(self.request_status_codes.items())])
+            add_metric("response_bytes_total", "counter", "Size of the "
+                + "response bodies received.",
+                [("", [], self.bytes_received)])
+            add_metric("request_seconds", "histogram", "Duration of "
+                + "requests to the refget API, including retries.",
+                histogram_samples(self.request_histogram, []))
+            stage_samples = []
+            for stage, histogram in self.stage_histograms.items():
+                stage_samples.extend(histogram_samples(histogram,
+                                                       [("stage", stage)]))
+            add_metric("stage_seconds", "histogram", "Duration of each "
+                + "stage of requests and output records.", stage_samples)
+        return "\n".join(lines) + "\n"
+
+class OpenTelemetryObserver(MetricsObserver):
+    """Emit an OpenTelemetry span for each request, with a child span for
+    each of its stages
+
+    Spans go to the tracer provider configured for the process (eg. by
+    opentelemetry-instrument, or the opentelemetry-sdk). Requires the
+    optional opentelemetry-api package.
+    """
+
+    def __init__(self, tracer=None):
+        """instantiate the observer
+
+        Args:
+            tracer (Tracer): tracer creating the spans, by default the
+                "enaclient" tracer of the global tracer provider
+
+        Raises:
+            ImportError: if opentelemetry-api is not installed
+        """
+
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            raise ImportError("OpenTelemetry spans require opentelemetry-api, "
+                              + "install it with: pip install "
+                              + "opentelemetry-api opentelemetry-sdk")
+
+        self.__trace = trace
+        self.__tracer = tracer or trace.get_tracer("enaclient")
+
+    def on_request(self, trace):
+        # spans are created once the request is complete, with the start
+        # and end times recorded in the trace
+        start_ns = int(trace.start_time * 1e9)
+        attributes = {"refget.status_code": str(trace.status_code),
+                      "refget.attempts": trace.attempts,
+                      "refget.batch_size": trace.batch_size,
+                      "http.response.body.size": trace.bytes_received}
+        if trace.sequence_id is not None:
+            attributes["refget.sequence_id"] = trace.sequence_id
+        span = self.__tracer.start_span("refget.request",
+                                        start_time=start_ns,
+                                        attributes=attributes)
+        context = self.__trace.set_span_in_context(span)
+        for stage, offset, duration in trace.stages:
+            stage_span = self.__tracer.start_span(stage, context=context,
+                start_time=start_ns + int(offset * 1e9))
+            stage_span.end(end_time=start_ns + int((offset + duration) * 1e9))
+        span.end(end_time=start_ns + int(trace.total_secs * 1e9))
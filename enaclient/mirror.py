@@ -0,0 +1,265 @@
+"""mirror.py - local snapshot of refget API metadata
+
+This module contains the class MirrorSnapshot and the "mirror" subcommand. A
+MirrorSnapshot is a digest-indexed file of sequence metadata, looked up by
+md5 or trunc512 with a binary search over the memory-mapped file, so that
+metadata can be served without calling the refget API (eg. on compute nodes
+without network access). Snapshots are built by importing previous enaclient
+JSON or NDJSON output.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+from enaclient.digestindex import DigestIndexWriter, DigestIndexReader, \
+                                  digest_key
+from enaclient.readers import read_output_records
+
+class MirrorSnapshot:
+    """Read-only local snapshot of sequence metadata
+
+    Each record of the snapshot is the metadata of one sequence, as a line of
+    compact JSON, indexed by both its md5 and its trunc512 digest. Only found
+    (200) responses are kept: a sequence missing from the snapshot may still
+    exist in the API.
+    """
+
+    MAGIC = b"ENAMIR01"
+
+    def __init__(self, path):
+        """instantiate the MirrorSnapshot, memory-mapping the snapshot file
+
+        Args:
+            path (str): path to the snapshot file
+
+        Returns:
+            (class MirrorSnapshot): the MirrorSnapshot
+
+        Raises:
+            ValueError: if the file is not a mirror snapshot
+        """
+
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__reader = DigestIndexReader(path, MirrorSnapshot.MAGIC)
+
+    def get(self, sequence_id):
+        """get the response for a sequence id from the snapshot
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+
+        Returns:
+            response_dict (dict): response as if returned by the API, or None
+                if the sequence id is not in the snapshot
+        """
+
+        key = digest_key(sequence_id)
+        record = self.__reader.get(key) if key is not None else None
+        with self.__lock:
+            if record is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        response_dict = {"req_seq_id": sequence_id, "status_code": 200}
+        response_dict.update(json.loads(record.decode("utf-8")))
+        return response_dict
+
+    def iter_bodies(self):
+        """iterate over the response bodies in the snapshot
+
+        Yields:
+            body (dict): response without req_seq_id and status_code
+        """
+
+        for record in self.__reader.iter_records():
+            yield json.loads(record.decode("utf-8"))
+
+    def get_hit_ratio(self):
+        """get the fraction of lookups answered from the snapshot
+
+        Returns:
+            hit_ratio (float): hits / lookups, 0 if there were no lookups
+        """
+
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.__reader)
+
+    def close(self):
+        """close the snapshot file"""
+
+        self.__reader.close()
+
+    @staticmethod
+    def build(path, bodies):
+        """build a snapshot file from response bodies
+
+        The bodies are first written to a temporary file with every record,
+        then compacted into a second temporary file holding only the records
+        that are still indexed (ie. not replaced by a later body for the
+        same sequence), moved into place once complete, so an existing
+        snapshot can be read while its replacement is built. Neither pass
+        holds the bodies, or the set of sequences, in memory.
+
+        Args:
+            path (str): path to the snapshot file
+            bodies (iterable): responses without req_seq_id and status_code
+                (ie. {"metadata": {...}}), a later body for the same
+                sequence replacing an earlier one
+
+        Returns:
+            count (int): number of distinct sequences in the snapshot
+        """
+
+        build_path = path + ".build"
+        temp_path = path + ".tmp"
+        try:
+            # write every body
+            with open(build_path, "wb") as handle:
+                writer = DigestIndexWriter(handle, MirrorSnapshot.MAGIC)
+                for body in bodies:
+                    keys = MirrorSnapshot.__get_keys(body)
+                    if not keys:
+                        continue
+                    location = writer.write_record(json.dumps(
+                        body, separators=(",", ":")).encode("utf-8") + b"\n")
+                    for key in keys:
+                        writer.add_key(key, location)
+                writer.finish()
+
+            # keep the records their keys are still indexed to
+            count = 0
+            reader = DigestIndexReader(build_path, MirrorSnapshot.MAGIC)
+            try:
+                with open(temp_path, "wb") as handle:
+                    writer = DigestIndexWriter(handle, MirrorSnapshot.MAGIC)
+                    for offset, record in reader.iter_located_records():
+                        keys = [key for key in MirrorSnapshot.__get_keys(
+                                    json.loads(record.decode("utf-8")))
+                                if reader.get_location(key)[0] == offset]
+                        if not keys:
+                            continue
+                        location = writer.write_record(record)
+                        for key in keys:
+                            writer.add_key(key, location)
+                        count += 1
+                    writer.finish()
+            finally:
+                reader.close()
+            os.replace(temp_path, path)
+        finally:
+            for temp in (build_path, temp_path):
+                if os.path.exists(temp):
+                    os.remove(temp)
+        return count
+
+    @staticmethod
+    def __get_keys(body):
+        """get the index keys of a response body
+
+        Args:
+            body (dict): response without req_seq_id and status_code
+
+        Returns:
+            keys (list): keys of its md5 and trunc512 digests, empty if it
+                has neither
+        """
+
+        metadata = body.get("metadata") or {}
+        keys = [digest_key(metadata.get(digest) or "")
+                for digest in ("md5", "trunc512")]
+        return [key for key in keys if key is not None]
+
+def read_output_bodies(path):
+    """read the found responses of previous enaclient JSON/NDJSON/enab output
+
+    Args:
+        path (str): path to the output file, or "-" for stdin
+
+    Yields:
+        body (dict): each found (200) response, without req_seq_id and
+            status_code
+    """
+
+    for response_dict in read_output_records(path):
+        if response_dict.get("status_code") == 200:
+            yield dict((key, value) for key, value in response_dict.items()
+                       if key not in ("req_seq_id", "status_code"))
+
+def main(args=sys.argv[2:]):
+    """run the "mirror" subcommand
+
+    "mirror import" builds a snapshot from previous enaclient JSON/NDJSON/enab
+    output files, adding to the existing snapshot if there is one. "mirror
+    info" prints the number of index entries (md5 and trunc512 digests) in a
+    snapshot.
+
+    Args:
+        args (list): subcommand arguments taken from command-line
+
+    Returns:
+        exit_code (int): 0 on success, 1 on error
+    """
+
+    parser = argparse.ArgumentParser("python run-enaclient.py mirror")
+    subparsers = parser.add_subparsers(dest="action")
+    import_parser = subparsers.add_parser("import",
+        help="import previous enaclient JSON/NDJSON/enab output into a "
+        + "snapshot")
+    import_parser.add_argument('snapshot', type=str,
+        help="path to the snapshot file, created if it does not exist")
+    import_parser.add_argument('output_files', type=str, nargs="+",
+        help="enaclient JSON/NDJSON/enab output files, may be compressed, - "
+        + "to read from stdin")
+    info_parser = subparsers.add_parser("info",
+        help="print the number of index entries in a snapshot")
+    info_parser.add_argument('snapshot', type=str,
+        help="path to the snapshot file")
+    args_dict = vars(parser.parse_args(args))
+
+    try:
+        if args_dict["action"] == "import":
+            for path in args_dict["output_files"]:
+                if path != "-" and not os.path.exists(path):
+                    raise FileNotFoundError("ERROR: output file not found: "
+                        + "%s\n" % (path))
+
+            # keep the sequences of the existing snapshot, responses from
+            # the imported files replace them
+            snapshot = None
+            bodies = itertools.chain.from_iterable(
+                read_output_bodies(path)
+                for path in args_dict["output_files"])
+            if os.path.exists(args_dict["snapshot"]):
+                snapshot = MirrorSnapshot(args_dict["snapshot"])
+                bodies = itertools.chain(snapshot.iter_bodies(), bodies)
+            try:
+                count = MirrorSnapshot.build(args_dict["snapshot"], bodies)
+            finally:
+                if snapshot is not None:
+                    snapshot.close()
+            print("%s sequences in %s" % (count, args_dict["snapshot"]))
+
+        elif args_dict["action"] == "info":
+            snapshot = MirrorSnapshot(args_dict["snapshot"])
+            print("%s index entries in %s"
+                  % (len(snapshot), args_dict["snapshot"]))
+            snapshot.close()
+
+        else:
+            parser.print_help()
+            return 1
+
+    except (ValueError, FileNotFoundError) as e:
+        print(e)
+        return 1
+    return 0
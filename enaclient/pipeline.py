@@ -0,0 +1,182 @@
+"""pipeline.py - bounded stages of a batch
+
+This module contains the class Stage. A batch runs as a pipeline of stages:
+reading sequence ids from the input, fetching their responses, and
+formatting them, each in a thread of its own, with the output written by the
+calling thread. Each stage hands its results to the next through a bounded
+queue, and blocks once the queue is full, so that a slow stage holds back
+the stages before it (backpressure) rather than letting results pile up in
+memory. However large the input, a batch holds at most a few queues of
+records at once.
+
+Results are handed over in small batches, to spread the cost of the queue
+(and of switching threads) over many results. So that slow results (eg.
+requests to a distant API) are not held back waiting for a batch to fill, a
+stage that has waited BATCH_DELAY seconds on an empty queue takes the partial
+batch of the stage before it, whether or not that stage has produced
+anything since.
+"""
+
+import queue
+import threading
+
+class Stage:
+    """Iterate over an iterable in a background thread, handing its items
+    to the consumer through a bounded queue
+
+    Items are yielded in the order of the iterable. An exception raised by
+    the iterable is raised by the consumer's iteration, once the items
+    before it were yielded. If the consumer stops iterating (or the stage is
+    closed), the thread stops at its next item and closes the iterable.
+
+    The batch being filled is shared with the consumer under a lock: a
+    consumer that finds the queue empty for BATCH_DELAY_SECS takes it, unless
+    a batch before it is on its way to the queue (which must be yielded
+    first).
+    """
+
+    QUEUE_SIZE = 16
+    BATCH_SIZE = 32
+    BATCH_DELAY_SECS = 0.05
+
+    # seconds between checks that the consumer stopped, while the queue is
+    # full
+    PUT_TIMEOUT_SECS = 0.1
+
+    def __init__(self, iterable, name, queue_size=QUEUE_SIZE,
+                 batch_size=BATCH_SIZE):
+        """instantiate the Stage, starting its thread
+
+        Args:
+            iterable (iterable): items of the stage, iterated in the thread
+            name (str): name of the stage, for its thread
+            queue_size (int): maximum batches waiting for the consumer
+            batch_size (int): maximum items in one batch
+
+        Returns:
+            (class Stage): the Stage
+        """
+
+        self.name = name
+        self.batch_size = batch_size
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__stopped = threading.Event()
+        self.__error = None
+        self.__lock = threading.Lock()
+        self.__batch = []
+        self.__putting = False
+        self.__thread = threading.Thread(target=self.__run, args=(iterable,),
+                                         name="enaclient-" + name,
+                                         daemon=True)
+        self.__thread.start()
+
+    def __iter__(self):
+        """iterate over the items of the stage
+
+        Yields:
+            item (obj): each item of the iterable
+
+        Raises:
+            BaseException: the exception raised by the iterable, if any
+        """
+
+        try:
+            while True:
+                try:
+                    batch = self.__queue.get(timeout=Stage.BATCH_DELAY_SECS)
+                except queue.Empty:
+                    batch = self.__take_batch()
+                    if not batch:
+                        continue
+                if batch is None:
+                    break
+                for item in batch:
+                    yield item
+        finally:
+            self.close()
+        if self.__error is not None:
+            raise self.__error
+
+    def close(self):
+        """stop the stage's thread, at its next item"""
+
+        self.__stopped.set()
+
+    def __run(self, iterable):
+        """iterate over the iterable, putting its items on the queue in
+        batches, then None to mark the end
+
+        Args:
+            iterable (iterable): items of the stage
+        """
+
+        iterator = iter(iterable)
+        batch_size = self.batch_size
+        acquire = self.__lock.acquire
+        release = self.__lock.release
+        try:
+            for item in iterator:
+                # nothing in between can raise, so the lock is taken and
+                # released without a with block, once per item
+                acquire()
+                batch = self.__batch
+                batch.append(item)
+                full = len(batch) >= batch_size
+                if full:
+                    self.__batch = []
+                    self.__putting = True
+                release()
+                if full and not self.__put(batch):
+                    return
+        except BaseException as e:
+            # raised again by the consumer, including interrupts (eg. a
+            # KeyboardInterrupt raised while fetching)
+            self.__error = e
+        finally:
+            # close a generator in the thread iterating over it, so that
+            # the stages before it are stopped in turn
+            if hasattr(iterator, "close"):
+                iterator.close()
+        with self.__lock:
+            batch = self.__batch
+            self.__batch = []
+            self.__putting = True
+        if batch and not self.__put(batch):
+            return
+        self.__put(None)
+
+    def __take_batch(self):
+        """take the batch being filled, unless batches before it are on (or
+        being put on) the queue
+
+        Returns:
+            batch (list): items of the partial batch, empty if there are
+                none to take
+        """
+
+        with self.__lock:
+            if self.__putting or not self.__queue.empty():
+                return []
+            batch = self.__batch
+            self.__batch = []
+            return batch
+
+    def __put(self, batch):
+        """put a batch on the queue, waiting while it is full
+
+        Args:
+            batch (list): items, or None to mark the end
+
+        Returns:
+            put (bool): false if the stage was closed before there was room
+        """
+
+        while not self.__stopped.is_set():
+            try:
+                self.__queue.put(batch, timeout=Stage.PUT_TIMEOUT_SECS)
+                with self.__lock:
+                    self.__putting = False
+                return True
+            except queue.Full:
+                pass
+        return False
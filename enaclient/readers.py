@@ -0,0 +1,261 @@
+"""readers.py - streaming readers of batch input
+
+This module contains the function read_sequence_ids and the helpers it is
+built from. Batch input is read lazily, as a pipeline of generators: the
+input (a file or stdin, optionally gzip, bzip2 or zstandard compressed) is
+read line by line, blank and comment lines are dropped, and the sequence id
+is taken from each remaining line, either the whole line or one column of a
+TSV/CSV manifest. Sequence ids can be checked with is_valid_sequence_id
+before any request is made. The records of previous enaclient JSON/NDJSON/enab
+output are read back with read_output_records.
+"""
+
+import bz2
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import re
+import sys
+
+# input path read from stdin
+STDIN = "-"
+
+INPUT_FORMAT_LINES = "lines"
+INPUT_FORMAT_TSV = "tsv"
+INPUT_FORMAT_CSV = "csv"
+
+# column delimiter of each manifest input format
+MANIFEST_DELIMITERS = {INPUT_FORMAT_TSV: "\t", INPUT_FORMAT_CSV: ","}
+
+COMMENT_PREFIX = "#"
+
+# refget sequence ids are md5 (32 hex digits) or trunc512 (48 hex digits)
+# checksums
+SEQUENCE_ID_PATTERN = re.compile(r"^(?:[0-9a-fA-F]{32}|[0-9a-fA-F]{48})$")
+
+def is_valid_sequence_id(sequence_id):
+    """check a sequence id is a well-formed md5 or trunc512 checksum
+
+    Args:
+        sequence_id (str): md5sum/id for the sequence of interest
+
+    Returns:
+        valid (bool): True if the sequence id can be requested from the API
+    """
+
+    return SEQUENCE_ID_PATTERN.match(sequence_id) is not None
+
+def guess_input_format(path):
+    """guess the input format from the file extension
+
+    Compression extensions are ignored, so "ids.tsv.gz" is a TSV manifest.
+
+    Args:
+        path (str): path to the input file, or "-" for stdin
+
+    Returns:
+        input_format (str): "tsv", "csv", or "lines" (one id per line)
+    """
+
+    root, extension = os.path.splitext(path.lower())
+    if extension in (".gz", ".bz2", ".zst"):
+        extension = os.path.splitext(root)[1]
+    input_format = extension[1:]
+    return input_format if input_format in MANIFEST_DELIMITERS \
+        else INPUT_FORMAT_LINES
+
+def open_input(path):
+    """open an input file as text, decompressing by file extension
+
+    Args:
+        path (str): path to the input file, or "-" for stdin
+
+    Returns:
+        input_file (file): text handle of the input
+
+    Raises:
+        ImportError: if the input is zstandard compressed and the zstandard
+            package is not installed
+    """
+
+    if path == STDIN:
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstandard compressed input requires "
+                              + "zstandard, install it with: pip install "
+                              + "zstandard")
+        return io.TextIOWrapper(zstandard.open(path, "rb"))
+    return open(path, "r")
+
+def skip_blank_and_comment_lines(lines):
+    """drop blank lines and comment lines (starting with "#")
+
+    Remaining lines are left as they are, so that the leading delimiter of
+    a manifest row with an empty first field is kept.
+
+    Args:
+        lines (iterable): lines of the input
+
+    Yields:
+        line (str): each remaining line
+    """
+
+    for line in lines:
+        stripped = line.strip()
+        if stripped and not stripped.startswith(COMMENT_PREFIX):
+            yield line
+
+def get_column_index(header, id_column):
+    """get the index of the sequence id column of a manifest
+
+    Args:
+        header (list): column names of the manifest header
+        id_column (str): name or number (counting from 1) of the sequence id
+            column
+
+    Returns:
+        index (int): index of the column, counting from 0
+
+    Raises:
+        ValueError: if the id column is not in the header
+    """
+
+    header = [name.strip() for name in header]
+    if id_column in header:
+        return header.index(id_column)
+    if id_column.isdigit() and 0 < int(id_column) <= len(header):
+        return int(id_column) - 1
+    raise ValueError("ERROR: id column not found in manifest header: "
+                     + "%s\n" % (id_column))
+
+def read_manifest_header(path, input_format):
+    """read the header row of a manifest
+
+    Args:
+        path (str): path to the manifest
+        input_format (str): "tsv" or "csv"
+
+    Returns:
+        header (list): column names of the manifest header, or None if the
+            manifest is empty
+    """
+
+    input_file = open_input(path)
+    try:
+        rows = csv.reader(skip_blank_and_comment_lines(input_file),
+                          delimiter=MANIFEST_DELIMITERS[input_format])
+        return next(rows, None)
+    finally:
+        input_file.close()
+
+def select_column(lines, delimiter, id_column):
+    """take the sequence id column from the rows of a manifest
+
+    The first row is the manifest header. The id column is given by name,
+    or by number counting from 1.
+
+    Args:
+        lines (iterable): lines of the manifest, header first
+        delimiter (str): column delimiter
+        id_column (str): name or number of the sequence id column
+
+    Yields:
+        sequence_id (str): sequence id of each row
+
+    Raises:
+        ValueError: if the id column is not in the header
+    """
+
+    rows = csv.reader(lines, delimiter=delimiter)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    index = get_column_index(header, id_column)
+    for row in rows:
+        yield row[index].strip() if index < len(row) else ""
+
+def read_sequence_ids(path, input_format=None, id_column=None):
+    """lazily read the sequence ids of a batch input
+
+    The input is opened when iteration starts, and closed once it is
+    exhausted (stdin is left open).
+
+    Args:
+        path (str): path to the input file, or "-" for stdin
+        input_format (str): "lines", "tsv" or "csv", guessed from the file
+            extension if None
+        id_column (str): name or number of the sequence id column of a
+            manifest, the first column if None
+
+    Yields:
+        sequence_id (str): each sequence id, in input order
+    """
+
+    if input_format is None:
+        input_format = guess_input_format(path)
+    input_file = open_input(path)
+    try:
+        lines = skip_blank_and_comment_lines(input_file)
+        if input_format in MANIFEST_DELIMITERS:
+            sequence_ids = select_column(lines,
+                                         MANIFEST_DELIMITERS[input_format],
+                                         id_column or "1")
+        else:
+            sequence_ids = (line.strip() for line in lines)
+        for sequence_id in sequence_ids:
+            yield sequence_id
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+
+def read_output_records(path):
+    """read the records of previous enaclient JSON/NDJSON/enab output
+
+    JSON output (an array) is loaded whole, NDJSON output is read line by
+    line. Both may be compressed, as for batch input. enab output is read
+    record by record from the memory-mapped file.
+
+    Args:
+        path (str): path to the output file, or "-" for stdin
+
+    Yields:
+        response_dict (dict): each record, as written
+    """
+
+    # imported here, as enab output is rarely read back
+    from enaclient.enab import EnabReader, is_enab_file
+    if path != STDIN and is_enab_file(path):
+        reader = EnabReader(path)
+        try:
+            for response_dict in reader:
+                yield response_dict
+        finally:
+            reader.close()
+        return
+
+    input_file = open_input(path)
+    try:
+        # JSON output starts with the opening bracket of an array
+        first_line = input_file.readline()
+        if first_line.lstrip().startswith("["):
+            response_dicts = json.loads(first_line + input_file.read())
+        else:
+            response_dicts = (json.loads(line) for line
+                              in itertools.chain([first_line], input_file)
+                              if line.strip())
+        for response_dict in response_dicts:
+            yield response_dict
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
@@ -0,0 +1,146 @@
+"""results.py - structured results of refget API requests
+
+This module contains the class MetadataResult. A MetadataResult holds the
+metadata returned for one sequence id as attributes, for use from Python code
+without going through the response dictionaries or formatted output of the
+command line.
+"""
+
+class MetadataResult:
+    """Metadata of one sequence id, as returned by the refget API
+
+    A lightweight record (with __slots__, so that many results take little
+    memory). Attributes:
+        sequence_id (str): the requested sequence id
+        status_code (int/str): http status code, or "400"/"408"/"503" if
+            the sequence id was invalid, or the request timed out or lost
+            its connection
+        error (str): error message, None if the request succeeded
+        id, md5, trunc512 (str): sequence identifiers, None if not found
+        length (int): sequence length, None if not found
+        aliases (list): alias dictionaries (alias, naming_authority)
+        extra (dict): any other metadata returned by the API (eg.
+            "circular"), keyed by name
+        response_extra (dict): any other keys of the response dictionary
+    """
+
+    __slots__ = ("sequence_id", "status_code", "error", "id", "md5",
+                 "trunc512", "length", "aliases", "extra", "response_extra",
+                 "_has_metadata", "_metadata_keys")
+
+    # metadata keys, in the order the API returns them
+    METADATA_KEYS = ("id", "md5", "trunc512", "length", "aliases")
+
+    # response dictionary keys held as attributes
+    RESPONSE_KEYS = ("req_seq_id", "status_code", "error", "metadata")
+
+    def __init__(self, sequence_id, status_code, error=None, id=None,
+                 md5=None, trunc512=None, length=None, aliases=None,
+                 extra=None, response_extra=None):
+        """instantiate the MetadataResult
+
+        Args:
+            sequence_id (str): the requested sequence id
+            status_code (int/str): http status code
+            error (str): error message
+            id (str): sequence id reported by the API
+            md5 (str): md5 checksum of the sequence
+            trunc512 (str): trunc512 checksum of the sequence
+            length (int): sequence length
+            aliases (list): alias dictionaries
+            extra (dict): any other metadata
+            response_extra (dict): any other response dictionary keys
+
+        Returns:
+            (class MetadataResult): the MetadataResult
+        """
+
+        self.sequence_id = sequence_id
+        self.status_code = status_code
+        self.error = error
+        self.id = id
+        self.md5 = md5
+        self.trunc512 = trunc512
+        self.length = length
+        self.aliases = aliases if aliases is not None else []
+        self.extra = extra if extra is not None else {}
+        self.response_extra = response_extra \
+            if response_extra is not None else {}
+        self._has_metadata = error is None
+
+        # metadata keys in the order they were returned, None for the order
+        # of METADATA_KEYS
+        self._metadata_keys = None
+
+    @classmethod
+    def from_response_dict(cls, response_dict):
+        """build a result from a response dictionary
+
+        Args:
+            response_dict (dict): API response for a sequence id
+
+        Returns:
+            result (MetadataResult): the result
+        """
+
+        result = cls(response_dict.get("req_seq_id"),
+                     response_dict.get("status_code"),
+                     response_dict.get("error"))
+        result.response_extra = dict(
+            (key, value) for key, value in response_dict.items()
+            if key not in MetadataResult.RESPONSE_KEYS)
+        metadata = response_dict.get("metadata")
+        result._has_metadata = metadata is not None
+        if metadata is not None:
+            result.id = metadata.get("id")
+            result.md5 = metadata.get("md5")
+            result.trunc512 = metadata.get("trunc512")
+            result.length = metadata.get("length")
+            if "aliases" in metadata:
+                result.aliases = metadata["aliases"]
+            result.extra = dict(
+                (key, value) for key, value in metadata.items()
+                if key not in MetadataResult.METADATA_KEYS)
+            result._metadata_keys = tuple(metadata)
+        return result
+
+    def to_response_dict(self):
+        """get the response dictionary of the result
+
+        Returns:
+            response_dict (dict): API response, as returned by
+                ENAClient.get_response_dict, for formatting or output
+        """
+
+        response_dict = {"req_seq_id": self.sequence_id,
+                         "status_code": self.status_code}
+        if self.error is not None:
+            response_dict["error"] = self.error
+        if self._has_metadata:
+            # only the keys the metadata was built with, so that partial
+            # metadata comes back as it was
+            keys = self._metadata_keys if self._metadata_keys is not None \
+                else MetadataResult.METADATA_KEYS
+            metadata = {}
+            for key in keys + tuple(self.extra):
+                if key in MetadataResult.METADATA_KEYS:
+                    metadata[key] = getattr(self, key)
+                elif key in self.extra:
+                    metadata[key] = self.extra[key]
+            response_dict["metadata"] = metadata
+        response_dict.update(self.response_extra)
+        return response_dict
+
+    @property
+    def found(self):
+        """bool: true if the API returned metadata for the sequence id"""
+        return self.status_code == 200
+
+    def __eq__(self, other):
+        if not isinstance(other, MetadataResult):
+            return NotImplemented
+        return self.to_response_dict() == other.to_response_dict()
+
+    def __repr__(self):
+        return "MetadataResult(sequence_id=%r, status_code=%r, length=%r)" \
+            % (self.sequence_id, self.status_code, self.length)
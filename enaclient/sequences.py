@@ -0,0 +1,533 @@
+"""sequences.py - retrieve sequence bases through refget API
+
+This module contains the classes SequenceFetcher and FastaWriter, and the
+"sequence" subcommand. The SequenceFetcher streams the bases of a sequence
+(or a sub-range of it) from the refget API in chunks, so that a large contig
+is never held in memory, and can fetch parts of one or many ranges in
+parallel. The FastaWriter wraps streamed bases into FASTA records.
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from enaclient.enaclient import ENAClient
+from enaclient.readers import read_sequence_ids, is_valid_sequence_id
+from enaclient.throttle import RetryPolicy, parse_retry_after
+
+class ChecksumError(ValueError):
+    """Streamed bases do not match the checksum of the sequence id"""
+
+class FastaWriter:
+    """Write FASTA records to a binary handle, as bases are streamed in"""
+
+    DEFAULT_LINE_WIDTH = 60
+
+    def __init__(self, handle, line_width=DEFAULT_LINE_WIDTH):
+        """instantiate the FastaWriter
+
+        Args:
+            handle (file): binary handle that records are written to
+            line_width (int): number of bases per line
+
+        Returns:
+            (class FastaWriter): the FastaWriter
+        """
+
+        self.handle = handle
+        self.line_width = line_width
+        self.__column = 0
+
+    def write_header(self, name):
+        """start a record, ending the previous one
+
+        Args:
+            name (str): record name, written after ">"
+        """
+
+        self.end_record()
+        self.handle.write((">%s\n" % (name)).encode("utf-8"))
+
+    def write_bases(self, bases):
+        """write a chunk of bases, wrapping lines at the line width
+
+        Args:
+            bases (bytes): chunk of bases, of any length
+        """
+
+        position = 0
+        while position < len(bases):
+            take = min(self.line_width - self.__column,
+                       len(bases) - position)
+            self.handle.write(bases[position:position + take])
+            position += take
+            self.__column += take
+            if self.__column == self.line_width:
+                self.handle.write(b"\n")
+                self.__column = 0
+
+    def end_record(self):
+        """end the current line of bases, if it is incomplete"""
+
+        if self.__column:
+            self.handle.write(b"\n")
+            self.__column = 0
+
+class SequenceFetcher:
+    """Stream sequence bases from the refget API
+
+    Bases are requested from the endpoints of an ENAClient, over its pooled
+    session, and streamed in chunks of "chunk_size" bytes. If a stream is
+    interrupted (or a 429/5xx response received) it is resumed from the
+    last byte received, following the client's retry policy. With more than
+    one worker, ranges are split into parts of "part_size" bases that are
+    requested in parallel (with HTTP Range requests) and written in order;
+    at most two parts per worker are held in memory.
+    """
+
+    DEFAULT_CHUNK_SIZE = 64 * 1024
+    DEFAULT_PART_SIZE = 4 * 1024 * 1024
+
+    # refget media type of sequence bases, with plain text as a fallback
+    ACCEPT = "text/vnd.ga4gh.refget.v1.0.0+plain, text/plain"
+
+    def __init__(self, client=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                 part_size=DEFAULT_PART_SIZE):
+        """instantiate the SequenceFetcher
+
+        Args:
+            client (ENAClient): client whose endpoints, session pool and retry
+                policy are used, a library ENAClient by default
+            workers (int): number of parts requested in parallel
+            chunk_size (int): bytes read from the stream at a time
+            part_size (int): bases per part requested in parallel
+
+        Returns:
+            (class SequenceFetcher): the SequenceFetcher
+        """
+
+        self.client = client if client is not None else ENAClient(args=None)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.part_size = part_size
+
+    def iter_bases(self, sequence_id, start=None, end=None):
+        """stream the bases of a sequence, or a range of it
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+            start (int): 0-based start of the range, None for the start of
+                the sequence
+            end (int): exclusive end of the range, None for the end of the
+                sequence
+
+        Yields:
+            bases (bytes): chunks of bases, in order
+
+        Raises:
+            HTTPError: if the API answered with an error status (eg. 404),
+                or a 429/5xx status after all retries
+            RequestException: if the request failed after all retries
+        """
+
+        rate_limiter = self.client.get_rate_limiter()
+        retry_policy = self.client.get_retry_policy()
+        session_pool = self.client.get_session_pool()
+        received = 0
+        attempt = 0
+
+        while True:
+            rate_limiter.acquire()
+            try:
+                # the session is held until the response is streamed
+                session = session_pool.get_session()
+                try:
+                    offset = (start or 0) + received
+                    response_obj = self.__request(session, sequence_id,
+                                                  offset, end,
+                                                  ranged=received > 0)
+                    try:
+                        for bases in self.__iter_range(response_obj, offset,
+                                                       end):
+                            received += len(bases)
+                            yield bases
+                    finally:
+                        response_obj.close()
+                finally:
+                    session_pool.release(session)
+                return
+
+            # retry (resuming from the last byte received) after a backoff,
+            # or give up
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout,
+                    _RetryableStatus) as e:
+                retry_after = None
+                if isinstance(e, _RetryableStatus):
+                    retry_after = e.retry_after
+                    if e.response_obj.status_code == 429:
+                        rate_limiter.on_throttled(retry_after)
+                if attempt >= retry_policy.max_retries:
+                    retry_policy.record_gave_up()
+                    if isinstance(e, _RetryableStatus):
+                        e.response_obj.raise_for_status()
+                    raise
+                retry_policy.record_retry()
+                time.sleep(retry_policy.get_delay(attempt, retry_after))
+                attempt += 1
+
+    def write_fasta(self, writer, sequence_id, ranges=None, verify=False):
+        """write a sequence, or ranges of it, as FASTA records
+
+        Each range is written as its own record, named "id:start-end" (in
+        refget coordinates, 0-based with an exclusive end); the whole
+        sequence is named after its id.
+
+        Args:
+            writer (FastaWriter): writer of the FASTA output
+            sequence_id (str): md5sum/id for the sequence of interest
+            ranges (list): (start, end) tuples, None for the whole sequence
+            verify (bool): check the checksum of the whole sequence (md5 or
+                trunc512, as given by the sequence id) as it is streamed
+
+        Returns:
+            length (int): number of bases written
+
+        Raises:
+            ValueError: if a range is invalid or empty, or verify is
+                requested for ranges
+            ChecksumError: if the streamed bases do not match the sequence id
+        """
+
+        if ranges is not None and verify:
+            raise ValueError("ERROR: only whole sequences can be verified\n")
+        # reject negative and empty ranges, which have no valid Range header
+        for start, end in ranges or []:
+            if start < 0 or start >= end:
+                raise ValueError("ERROR: invalid range: %s-%s\n"
+                                 % (start, end))
+
+        checksum = _Checksum(sequence_id) if verify else None
+        length = 0
+        record_index = None
+        for index, bases in self.__iter_parts(sequence_id, ranges):
+            if index != record_index:
+                record_index = index
+                writer.write_header(sequence_id if ranges is None
+                                    else "%s:%s-%s" % ((sequence_id,)
+                                                       + ranges[index]))
+            writer.write_bases(bases)
+            if checksum is not None:
+                checksum.update(bases)
+            length += len(bases)
+        writer.end_record()
+
+        if checksum is not None and not checksum.matches():
+            raise ChecksumError("ERROR: checksum mismatch for %s, got %s\n"
+                                % (sequence_id, checksum.hexdigest()))
+        return length
+
+    def __iter_parts(self, sequence_id, ranges):
+        """get the bases of each range, in order
+
+        With one worker (or an unknown sequence length), each range is
+        streamed in chunks. Otherwise ranges are split into parts that are
+        requested in parallel, keeping at most two parts per worker in
+        flight.
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+            ranges (list): (start, end) tuples, None for the whole sequence
+
+        Yields:
+            index (int): index of the range the bases belong to
+            bases (bytes): chunk or part of the range's bases, in order
+        """
+
+        # the whole sequence is one range, from 0 to its length (if known)
+        if ranges is None:
+            length = self.__get_length(sequence_id) if self.workers > 1 \
+                else None
+            if length is None:
+                for bases in self.iter_bases(sequence_id):
+                    yield 0, bases
+                return
+            ranges = [(0, length)]
+
+        if self.workers == 1:
+            for index, (start, end) in enumerate(ranges):
+                for bases in self.iter_bases(sequence_id, start, end):
+                    yield index, bases
+            return
+
+        parts = ((index, part_start, min(end, part_start + self.part_size))
+                 for index, (start, end) in enumerate(ranges)
+                 for part_start in range(start, end, self.part_size))
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for index, part_start, part_end in parts:
+                pending.append((index, executor.submit(self.__fetch_part,
+                    sequence_id, part_start, part_end)))
+                if len(pending) >= self.workers * 2:
+                    index, future = pending.popleft()
+                    yield index, future.result()
+            while pending:
+                index, future = pending.popleft()
+                yield index, future.result()
+
+    def __fetch_part(self, sequence_id, start, end):
+        """get the bases of a part of a sequence
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+            start (int): 0-based start of the part
+            end (int): exclusive end of the part
+
+        Returns:
+            bases (bytes): bases of the part
+        """
+
+        return b"".join(self.iter_bases(sequence_id, start, end))
+
+    def __get_length(self, sequence_id):
+        """get the length of a sequence from its metadata
+
+        Args:
+            sequence_id (str): md5sum/id for the sequence of interest
+
+        Returns:
+            length (int): sequence length, None if the metadata is not found
+        """
+
+        response_dict = self.client.get_response_dict(sequence_id)
+        return (response_dict.get("metadata") or {}).get("length") \
+            if response_dict.get("status_code") == 200 else None
+
+    def __iter_range(self, response_obj, start, end):
+        """stream the bases of a range from a response
+
+        A 206 response holds the range requested. A server that ignores the
+        Range header answers with a 200 and the whole sequence instead, so
+        the bases before the range are skipped and the stream is cut at
+        its end, rather than written out again.
+
+        Args:
+            response_obj (Response): the streaming http response
+            start (int): 0-based start of the range requested
+            end (int): exclusive end of the range, None for the end of the
+                sequence
+
+        Yields:
+            bases (bytes): chunks of the range's bases, in order
+        """
+
+        skip = start if response_obj.status_code == 200 else 0
+        remaining = None if end is None else end - start
+        for bases in response_obj.iter_content(self.chunk_size):
+            if skip:
+                bases, skip = bases[skip:], max(0, skip - len(bases))
+            if remaining is not None:
+                bases = bases[:remaining]
+                remaining -= len(bases)
+            if bases:
+                yield bases
+            if remaining == 0:
+                return
+
+    def __request(self, session, sequence_id, start, end, ranged=False):
+        """request bases from the first endpoint that is up, streaming the
+        response
+
+        A range starting at 0 and open at the end is requested without a
+        Range header (unless resuming), so the server returns the whole
+        sequence with a 200.
+
+        Args:
+            session (requests.Session): session to make the request with
+            sequence_id (str): md5sum/id for the sequence of interest
+            start (int): 0-based start of the range
+            end (int): exclusive end of the range, None for the end of the
+                sequence
+            ranged (bool): request a range even from 0 to the end
+
+        Returns:
+            response_obj (Response): the streaming http response
+
+        Raises:
+            HTTPError: if the API answered with an error status
+            _RetryableStatus: if the API answered 429 or a 5xx status
+        """
+
+        headers = {"Accept": SequenceFetcher.ACCEPT}
+        if start or end is not None or ranged:
+            headers["Range"] = "bytes=%s-%s" \
+                % (start, "" if end is None else end - 1)
+
+        endpoint_pool = self.client.get_endpoint_pool()
+        endpoint = endpoint_pool.choose()
+        try:
+            response_obj = session.get(endpoint.base_url + "sequence/"
+                + sequence_id, headers=headers, stream=True,
+                timeout=self.client.get_timeout_secs())
+        except requests.exceptions.RequestException:
+            endpoint_pool.record_failure(endpoint)
+            raise
+
+        status_code = response_obj.status_code
+        if status_code == 429 \
+           or status_code in RetryPolicy.RETRY_STATUS_CODES:
+            endpoint_pool.record_failure(endpoint)
+            response_obj.close()
+            raise _RetryableStatus(response_obj, parse_retry_after(
+                response_obj.headers.get("Retry-After")))
+        self.client.get_rate_limiter().on_success()
+        endpoint_pool.record_success(endpoint)
+        if status_code not in (200, 206):
+            response_obj.close()
+            response_obj.raise_for_status()
+        return response_obj
+
+class _RetryableStatus(Exception):
+    """429/5xx response to a bases request, worth retrying"""
+
+    def __init__(self, response_obj, retry_after=None):
+        Exception.__init__(self, "http status %s"
+                           % (response_obj.status_code))
+        self.response_obj = response_obj
+        self.retry_after = retry_after
+
+class _Checksum:
+    """md5 or trunc512 checksum of streamed bases, matching a sequence id"""
+
+    def __init__(self, sequence_id):
+        self.sequence_id = sequence_id.lower()
+        self.__hash = hashlib.md5() if len(sequence_id) == 32 \
+            else hashlib.sha512()
+
+    def update(self, bases):
+        self.__hash.update(bases)
+
+    def hexdigest(self):
+        # trunc512 is the first 24 bytes of the sha512 digest
+        return self.__hash.hexdigest()[:len(self.sequence_id)]
+
+    def matches(self):
+        return self.hexdigest() == self.sequence_id
+
+def parse_range(value):
+    """parse a range given on the command line as START-END
+
+    Args:
+        value (str): range in refget coordinates (0-based, exclusive end)
+
+    Returns:
+        range (tuple): (start, end)
+
+    Raises:
+        ArgumentTypeError: if the range is not two integers
+    """
+
+    try:
+        start, end = value.split("-")
+        return int(start), int(end)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid range, specify START-END: "
+                                         + "%s" % (value))
+
+def main(args=sys.argv[2:]):
+    """run the "sequence" subcommand
+
+    Writes the bases of a sequence (-s), ranges of it (-r), or of each
+    sequence in an input file (-i), as FASTA.
+
+    Args:
+        args (list): subcommand arguments taken from command-line
+
+    Returns:
+        exit_code (int): 0 on success, 1 on error
+    """
+
+    parser = argparse.ArgumentParser("python run-enaclient.py sequence")
+    group_input_mode = parser.add_mutually_exclusive_group(required=True)
+    group_input_mode.add_argument('-s', '--sequence_id', type=str,
+        help="sequence id (not compatible with -i option)")
+    group_input_mode.add_argument('-i', '--input_file', type=str,
+        help="input file containing sequence ids, - to read from stdin "
+        + "(not compatible with -s option)")
+    parser.add_argument('-o', '--output_file', type=str,
+        help="path to output FASTA file (optional, will print to stdout by "
+        + "default)")
+    parser.add_argument('-r', '--range', type=parse_range, action="append",
+        dest="ranges",
+        help="range START-END of the sequence to write (0-based, exclusive "
+        + "end), repeat for several ranges (optional, -s only, the whole "
+        + "sequence by default)")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+        help="number of parts of a sequence requested in parallel "
+        + "(optional, default 1)")
+    parser.add_argument('--verify', action="store_true",
+        help="verify the md5/trunc512 checksum of each whole sequence as "
+        + "it is streamed")
+    parser.add_argument('--line_width', type=int,
+        default=FastaWriter.DEFAULT_LINE_WIDTH,
+        help="bases per FASTA line (optional, default %s)"
+        % (FastaWriter.DEFAULT_LINE_WIDTH))
+    parser.add_argument('--base_url', '--base-url', type=str,
+        action="append",
+        help="base URL of a refget API, repeat to fail over to further "
+        + "endpoints (optional, default %s)" % (ENAClient.API_BASE_URL))
+    args_dict = vars(parser.parse_args(args))
+
+    output_path = args_dict["output_file"]
+    temp_path = output_path + ".part" if output_path else None
+    try:
+        if args_dict["ranges"] and args_dict["input_file"]:
+            raise ValueError("ERROR: ranges can only be given with -s\n")
+        if args_dict["workers"] < 1 or args_dict["line_width"] < 1:
+            raise ValueError("ERROR: workers and line width must be at "
+                             + "least 1\n")
+        if args_dict["input_file"] and args_dict["input_file"] != "-" \
+           and not os.path.exists(args_dict["input_file"]):
+            raise FileNotFoundError("ERROR: input file not found: %s\n"
+                                    % (args_dict["input_file"]))
+
+        client = ENAClient(args=None)
+        client.set_base_urls(args_dict["base_url"])
+        client.set_cache_dir(None)
+        fetcher = SequenceFetcher(client, workers=args_dict["workers"])
+        sequence_ids = [args_dict["sequence_id"]] \
+            if args_dict["sequence_id"] \
+            else read_sequence_ids(args_dict["input_file"])
+
+        # write to a temporary file, moved into place once every sequence
+        # was written (and verified)
+        handle = open(temp_path, "wb") if temp_path else sys.stdout.buffer
+        try:
+            writer = FastaWriter(handle, args_dict["line_width"])
+            for sequence_id in sequence_ids:
+                if not is_valid_sequence_id(sequence_id):
+                    raise ValueError("ERROR: invalid sequence id: %s\n"
+                                     % (sequence_id))
+                fetcher.write_fasta(writer, sequence_id, args_dict["ranges"],
+                                    args_dict["verify"])
+        finally:
+            if temp_path:
+                handle.close()
+            else:
+                handle.flush()
+            client.close()
+        if temp_path:
+            os.replace(temp_path, output_path)
+
+    except (ValueError, FileNotFoundError,
+            requests.exceptions.RequestException) as e:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+        print(e)
+        return 1
+    return 0
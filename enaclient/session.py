@@ -0,0 +1,156 @@
+"""session.py - reusable http session for refget API requests
+
+This module contains the class SessionPool. The SessionPool owns a requests
+session whose connections are kept alive and reused across refget API
+requests, so that each request does not pay for a new TCP connection and TLS
+handshake. Connections are opened by TimedHTTPAdapter, which records the
+time each thread spends opening connections, so that request timings can
+tell connection setup apart from waiting on the server.
+"""
+
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from enaclient.metrics import add_connect_secs
+
+class TimedHTTPConnection(HTTPConnection):
+    """HTTP connection recording how long it took to open"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            HTTPConnection.connect(self)
+        finally:
+            add_connect_secs(time.perf_counter() - start)
+
+class TimedHTTPSConnection(HTTPSConnection):
+    """HTTPS connection recording how long it took to open, including the
+    TLS handshake"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            HTTPSConnection.connect(self)
+        finally:
+            add_connect_secs(time.perf_counter() - start)
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections record how long they took to open"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool
+        }
+
+class SessionPool:
+    """Keep-alive requests session with a bounded connection pool
+
+    The session is shared by all threads making requests. Connections are
+    kept open between requests, up to "pool_size" per host. If a connection
+    lifetime is set, the session is replaced once it is older than the
+    lifetime, so that long batches periodically reconnect (eg. to pick up
+    DNS changes). A lifetime of 0 opens a new connection for every request.
+    Each session taken with get_session is handed back with release once
+    the request is done, so that a replaced session is closed once the
+    requests other threads are making with it have finished.
+    """
+
+    def __init__(self, pool_size, connection_lifetime=None):
+        """instantiate the SessionPool
+
+        Args:
+            pool_size (int): maximum number of connections kept per host
+            connection_lifetime (float): seconds before the session and its
+                connections are replaced, None to keep them indefinitely
+
+        Returns:
+            (class SessionPool): the SessionPool
+        """
+
+        self.pool_size = pool_size
+        self.connection_lifetime = connection_lifetime
+        self.__lock = threading.Lock()
+        self.__session = None
+        self.__created = None
+        # number of requests in flight on each session
+        self.__in_use = {}
+
+    @property
+    def exceptions(self):
+        """module holding the exception classes raised by the sessions"""
+        return requests.exceptions
+
+    def get_session(self):
+        """get the current session, replacing it if its lifetime has passed
+
+        Returns:
+            session (requests.Session): session to make the request with,
+                to hand back with release
+        """
+
+        with self.__lock:
+            expired = self.__session is not None \
+                and self.connection_lifetime is not None \
+                and time.time() - self.__created >= self.connection_lifetime
+            if expired and self.__session not in self.__in_use:
+                self.__session.close()
+            if self.__session is None or expired:
+                self.__session = self.__new_session()
+                self.__created = time.time()
+            self.__in_use[self.__session] = \
+                self.__in_use.get(self.__session, 0) + 1
+            return self.__session
+
+    def release(self, session):
+        """hand back a session once a request made with it is done,
+        closing it if it was replaced in the meantime
+
+        Args:
+            session (requests.Session): session taken with get_session
+        """
+
+        with self.__lock:
+            count = self.__in_use.get(session, 0) - 1
+            if count > 0:
+                self.__in_use[session] = count
+                return
+            self.__in_use.pop(session, None)
+            if session is not self.__session:
+                session.close()
+
+    def close(self):
+        """close every session and its pooled connections"""
+
+        with self.__lock:
+            for session in list(self.__in_use):
+                if session is not self.__session:
+                    session.close()
+            self.__in_use = {}
+            if self.__session is not None:
+                self.__session.close()
+                self.__session = None
+
+    def __new_session(self):
+        """create a session with pooled keep-alive connections
+
+        Returns:
+            session (requests.Session): new session
+        """
+
+        session = requests.Session()
+        adapter = TimedHTTPAdapter(pool_connections=self.pool_size,
+                              pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
@@ -0,0 +1,223 @@
+"""shards.py - run a batch across several worker processes
+
+This module runs a batch in sharded mode (--processes). The parent process
+deals the sequence ids of the input round-robin into one shard per worker
+process, and each worker runs its own ENAClient (with its own session and
+connection pool), requesting and formatting the responses of its shard. The
+formatted records are framed into a shard file, and once every worker has
+finished the parent merges the shards into one output in input order, taking
+a record from each shard in turn. Formatting, the most CPU-bound part of a
+batch, is spread across the workers; the parent only copies the formatted
+records. With --keep_shards, each worker instead writes a complete output
+file of its own, and no merge takes place.
+"""
+
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from enaclient.readers import read_sequence_ids
+from enaclient.writers import RecordWriter
+
+class ShardRecordWriter(RecordWriter):
+    """Write formatted records into a shard file, one pickle per record
+
+    Records are written already formatted for the output format (strings,
+    or row tuples for binary formats), without framing strings, so that the
+    parent can copy them into the merged output as they are.
+    """
+
+    NAME = "shard"
+    BINARY = True
+
+    def write_prefix(self):
+        pass
+
+    def write_formatted(self, record_string):
+        pickle.dump(record_string, self.handle, pickle.HIGHEST_PROTOCOL)
+        self.count += 1
+
+    def write_suffix(self):
+        pass
+
+def get_shard_path(output_file, shard_index, shard_count):
+    """get the path of a kept shard of the output file
+
+    Args:
+        output_file (str): path to the output file
+        shard_index (int): index of the shard, from 0
+        shard_count (int): number of shards
+
+    Returns:
+        shard_path (str): path of the shard, with the shard number before
+            the file extension (eg. metadata.shard-1-of-4.json)
+    """
+
+    root, extension = os.path.splitext(output_file)
+    return "%s.shard-%s-of-%s%s" % (root, shard_index + 1, shard_count,
+                                    extension)
+
+def split_input(sequence_ids, input_paths):
+    """deal sequence ids round-robin into shard input files
+
+    Sequence ids are written one pickle per id, rather than one per line,
+    so that each shard reads back exactly the ids it was dealt, including
+    empty ids and ids that would read as blank or comment lines.
+
+    Args:
+        sequence_ids (iterable): md5sums/ids for the sequences of interest
+        input_paths (list): paths of the shard input files, one per shard
+
+    Returns:
+        count (int): number of sequence ids
+    """
+
+    handles = [open(input_path, "wb") for input_path in input_paths]
+    count = 0
+    try:
+        for sequence_id in sequence_ids:
+            pickle.dump(sequence_id, handles[count % len(handles)],
+                        pickle.HIGHEST_PROTOCOL)
+            count += 1
+    finally:
+        for handle in handles:
+            handle.close()
+    return count
+
+def read_shard_input(input_path):
+    """read the sequence ids of a shard input file
+
+    Args:
+        input_path (str): path of the shard input file
+
+    Yields:
+        sequence_id (str): each sequence id dealt to the shard, in order
+    """
+
+    with open(input_path, "rb") as handle:
+        while True:
+            try:
+                yield pickle.load(handle)
+            except EOFError:
+                return
+
+def iter_merged(shard_paths):
+    """read the records of the shard files in input order
+
+    Sequence ids were dealt round-robin, so records are taken from each
+    shard in turn. Earlier shards hold as many or one more record than
+    later shards, so the first shard to run out ends the merge.
+
+    Args:
+        shard_paths (list): paths of the shard files, in shard order
+
+    Yields:
+        record (obj): formatted record
+    """
+
+    handles = [open(shard_path, "rb") for shard_path in shard_paths]
+    try:
+        while True:
+            for handle in handles:
+                try:
+                    yield pickle.load(handle)
+                except EOFError:
+                    return
+    finally:
+        for handle in handles:
+            handle.close()
+
+def run_shard(args, shard_index, shard_count, input_path, output_path,
+              framed):
+    """run one shard of a batch, in a worker process
+
+    Args:
+        args (list): command-line args of the batch
+        shard_index (int): index of the shard, from 0
+        shard_count (int): number of shards
+        input_path (str): path of the shard input file
+        output_path (str): path the shard is written to
+        framed (bool): if true, write framed records for the parent to
+            merge, otherwise a complete output file
+
+    Returns:
+        count (int): number of records written
+    """
+
+    from enaclient.enaclient import ENAClient
+    client = ENAClient(args=args)
+    try:
+        return client.call_and_output_shard(shard_index, shard_count,
+                                            input_path, output_path, framed)
+    finally:
+        client.close()
+
+def run_sharded(client):
+    """run a batch across worker processes, merging their output
+
+    The shard inputs (and shard files, unless they are kept) are written to
+    a temporary directory next to the output file, removed once the batch
+    completes.
+
+    Args:
+        client (ENAClient): client holding the parsed command-line args
+
+    Returns:
+        count (int): number of records written
+    """
+
+    args_dict = client.get_args_dict()
+    shard_count = client.get_processes()
+    output_file = args_dict["output_file"]
+    keep_shards = client.get_keep_shards()
+    shard_dir = tempfile.mkdtemp(prefix=".enaclient-shards-",
+        dir=os.path.dirname(os.path.abspath(output_file))
+        if output_file else None)
+
+    try:
+        # deal the sequence ids into the shard inputs
+        input_paths = [os.path.join(shard_dir, "input-%s.bin" % (index))
+                       for index in range(shard_count)]
+        split_input(read_sequence_ids(args_dict["input_file"],
+                                      client.get_input_format(),
+                                      client.get_id_column()), input_paths)
+
+        # run the shards, each worker writing framed records or a complete
+        # output file
+        if keep_shards:
+            output_paths = [get_shard_path(output_file, index, shard_count)
+                            for index in range(shard_count)]
+        else:
+            output_paths = [os.path.join(shard_dir, "output-%s.bin" % (index))
+                            for index in range(shard_count)]
+        with ProcessPoolExecutor(max_workers=shard_count) as executor:
+            futures = [executor.submit(run_shard, client.get_args(), index,
+                                       shard_count, input_paths[index],
+                                       output_paths[index], not keep_shards)
+                       for index in range(shard_count)]
+            counts = [future.result() for future in futures]
+        if keep_shards:
+            return sum(counts)
+
+        # merge the shards in input order into the output file or stdout
+        writer_class = client.get_writer_class()
+        if output_file:
+            handle = open(output_file, "wb" if writer_class.BINARY else "w",
+                          buffering=client.OUTPUT_BUFFER_SIZE)
+        else:
+            handle = sys.stdout
+        try:
+            writer = writer_class(handle)
+            writer.write_prefix()
+            for record in iter_merged(output_paths):
+                writer.write_formatted(record)
+            writer.write_suffix()
+            writer.flush()
+        finally:
+            if output_file:
+                handle.close()
+        return writer.count
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
@@ -0,0 +1,208 @@
+"""throttle.py - client-side rate limiting and retries
+
+This module contains the classes AdaptiveRateLimiter and RetryPolicy. The
+AdaptiveRateLimiter is a token bucket that spaces out refget API requests,
+slowing down when the API answers 429 (Too Many Requests) and honouring its
+Retry-After header. The RetryPolicy decides how long to wait before retrying
+a failed request, using exponential backoff with jitter.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+def parse_retry_after(value):
+    """parse a Retry-After header, given in seconds or as an http date
+
+    Args:
+        value (str): Retry-After header value, or None
+
+    Returns:
+        retry_after (float): seconds to wait, or None if absent/invalid
+    """
+
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class AdaptiveRateLimiter:
+    """Token bucket limiting the rate of requests, adapting to throttling
+
+    The bucket refills at "rate" tokens per second and holds up to one
+    second's worth of tokens, so short bursts are allowed. Without a
+    configured maximum rate the limiter starts unlimited. Each 429 response
+    halves the rate (starting from the measured request rate when
+    unlimited), at most once per DECREASE_INTERVAL, and a Retry-After
+    header pauses all requests for its duration. Each successful response
+    then raises the rate by 1/rate requests per second, ie. by about one
+    request per second for each second of unthrottled traffic, up to the
+    configured maximum.
+    """
+
+    MIN_RATE = 0.5
+    DECREASE_FACTOR = 0.5
+    DECREASE_INTERVAL = 1.0
+    RATE_WINDOW = 100
+
+    def __init__(self, max_rate=None):
+        """instantiate the AdaptiveRateLimiter
+
+        Args:
+            max_rate (float): maximum requests per second, None for no limit
+                until the API starts throttling
+
+        Returns:
+            (class AdaptiveRateLimiter): the AdaptiveRateLimiter
+        """
+
+        self.max_rate = max_rate
+        self.rate = max_rate
+        self.throttled = 0
+        self.wait_secs = 0.0
+        self.__lock = threading.Lock()
+        self.__tokens = 1.0
+        self.__refilled_at = time.monotonic()
+        self.__paused_until = 0.0
+        self.__decreased_at = None
+        self.__acquired_at = deque(maxlen=AdaptiveRateLimiter.RATE_WINDOW)
+
+    def acquire(self):
+        """wait until a request may be made"""
+
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                if self.__paused_until > now:
+                    wait = self.__paused_until - now
+                elif self.rate is None:
+                    self.__acquired_at.append(now)
+                    return
+                else:
+                    self.__tokens = min(max(1.0, self.rate), self.__tokens
+                        + (now - self.__refilled_at) * self.rate)
+                    self.__refilled_at = now
+                    if self.__tokens >= 1.0:
+                        self.__tokens -= 1.0
+                        self.__acquired_at.append(now)
+                        return
+                    wait = (1.0 - self.__tokens) / self.rate
+                self.wait_secs += wait
+            time.sleep(wait)
+
+    def on_success(self):
+        """raise the rate after a request that was not throttled"""
+
+        with self.__lock:
+            if self.rate is not None:
+                self.rate += 1.0 / self.rate
+                if self.max_rate is not None:
+                    self.rate = min(self.rate, self.max_rate)
+
+    def on_throttled(self, retry_after=None):
+        """lower the rate after a 429 response, pausing for Retry-After
+
+        Args:
+            retry_after (float): seconds the API asked the client to wait
+        """
+
+        with self.__lock:
+            now = time.monotonic()
+            self.throttled += 1
+            if retry_after:
+                self.__paused_until = max(self.__paused_until,
+                                          now + retry_after)
+
+            # several in-flight requests are usually throttled together,
+            # only lower the rate once for them
+            if self.__decreased_at is not None \
+               and now - self.__decreased_at < \
+               AdaptiveRateLimiter.DECREASE_INTERVAL:
+                return
+            self.__decreased_at = now
+
+            rate = self.rate
+            if rate is None:
+                rate = self.__measured_rate(now)
+                self.__tokens = 0.0
+                self.__refilled_at = now
+            self.rate = max(AdaptiveRateLimiter.MIN_RATE,
+                            rate * AdaptiveRateLimiter.DECREASE_FACTOR)
+
+    def __measured_rate(self, now):
+        """measure the recent request rate
+
+        Args:
+            now (float): current monotonic time
+
+        Returns:
+            rate (float): requests per second over the recent window
+        """
+
+        if len(self.__acquired_at) < 2:
+            return AdaptiveRateLimiter.MIN_RATE
+        span = now - self.__acquired_at[0]
+        return len(self.__acquired_at) / span if span > 0 \
+            else AdaptiveRateLimiter.MIN_RATE
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for retrying failed requests
+
+    The delay before retry n (starting at 0) is drawn uniformly between 0
+    and min(backoff_max, backoff_base * 2 ** n), so that clients throttled
+    at the same moment do not retry in lockstep.
+    """
+
+    # http status codes worth retrying (429 is also retried)
+    RETRY_STATUS_CODES = set([500, 502, 503, 504])
+
+    def __init__(self, max_retries, backoff_base, backoff_max):
+        """instantiate the RetryPolicy
+
+        Args:
+            max_retries (int): maximum number of retries per request
+            backoff_base (float): seconds of the first backoff ceiling
+            backoff_max (float): maximum backoff ceiling in seconds
+
+        Returns:
+            (class RetryPolicy): the RetryPolicy
+        """
+
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
+        self.gave_up = 0
+        self.__lock = threading.Lock()
+
+    def get_delay(self, attempt, retry_after=None):
+        """get the seconds to wait before a retry
+
+        Args:
+            attempt (int): number of retries already made for the request
+            retry_after (float): seconds the API asked the client to wait
+
+        Returns:
+            delay (float): seconds to wait, never less than retry_after
+        """
+
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return max(random.uniform(0, ceiling), retry_after or 0.0)
+
+    def record_retry(self):
+        """count a retried request"""
+        with self.__lock:
+            self.retries += 1
+
+    def record_gave_up(self):
+        """count a request that failed after all retries"""
+        with self.__lock:
+            self.gave_up += 1
@@ -0,0 +1,591 @@
+"""writers.py - streaming output writers for refget API responses
+
+This module contains one writer class per output format. A writer formats
+response dictionaries and writes them, framed as an array of metadata
+objects (or one object per line for NDJSON), straight into a buffered file
+handle as they are produced, so a batch never has to be held in memory. The
+columnar writers (CSV, Parquet) flatten the refget metadata into one typed
+column per field. The enab writer indexes its records by req_seq_id, for
+random access with the EnabReader of enab.py.
+
+The JSON, XML, and YAML writers produce the same bytes as formatting each
+response with json.dumps, dicttoxml + minidom, and yaml.dump followed by
+regex re-indentation, without the per-record DOM parse and regex passes.
+"""
+
+import csv
+import io
+import json
+import re
+from json.encoder import encode_basestring_ascii
+
+# PyYAML and its dumper class (the faster libyaml emitter, if PyYAML was
+# built with it), imported when the first YAML record is formatted, so that
+# other output formats do not pay for the import
+_yaml = None
+_yaml_dumper = None
+
+# indentation of one nesting level, and of each record within the array
+INDENT = "    "
+
+# columns of the columnar output formats, top-level response fields then
+# refget metadata fields
+COLUMNS = ["req_seq_id", "status_code", "error", "id", "md5", "trunc512",
+           "length", "aliases"]
+METADATA_COLUMNS = COLUMNS[3:]
+
+def indent_lines(text, prefix=INDENT):
+    """prefix every non-empty line of a multi-line string
+
+    Matches the re-indentation previously done with the regex substitutions
+    "(.+?\\n)" and "\\n(.+?$)": empty lines are left as they are, as is a
+    string with no line break at all.
+
+    Args:
+        text (str): string to indent
+        prefix (str): prefix added to each non-empty line
+
+    Returns:
+        indented (str): indented string
+    """
+
+    if "\n" not in text:
+        return text
+    return "\n".join(prefix + line if line else line
+                     for line in text.split("\n"))
+
+class RecordWriter:
+    """Base class of the streaming output writers
+
+    A writer writes the prefix that opens the array of metadata objects,
+    then each record with the separator between records, then the suffix
+    that closes the array. Subclasses set the framing strings and implement
+    format_record. Writers with BINARY set are given a binary file handle.
+    """
+
+    NAME = None
+    BINARY = False
+    PREFIX = ""
+    SEPARATOR = ""
+    SUFFIX = ""
+
+    def __init__(self, handle):
+        """instantiate the writer
+
+        Args:
+            handle (file): text file handle records are written to
+
+        Returns:
+            (class RecordWriter): the writer
+        """
+
+        self.handle = handle
+        self.count = 0
+
+    @classmethod
+    def check_available(cls):
+        """check the optional dependencies of the writer are installed
+
+        Raises:
+            ImportError: if a dependency of the writer is missing
+        """
+        pass
+
+    @classmethod
+    def format_record(cls, response_dict, inc):
+        """format a response dictionary as one element of the array
+
+        Args:
+            response_dict (dict): API response for a sequence id
+            inc (int): auto-increment input sequence
+
+        Returns:
+            record_string (str): formatted, indented record
+        """
+        raise NotImplementedError
+
+    def write_prefix(self):
+        """write the prefix that opens the array of metadata objects"""
+        self.handle.write(self.PREFIX)
+
+    def write_record(self, response_dict, inc):
+        """format and write a response dictionary
+
+        Args:
+            response_dict (dict): API response for a sequence id
+            inc (int): auto-increment input sequence
+        """
+        self.write_formatted(self.format_record(response_dict, inc))
+
+    def write_formatted(self, record_string):
+        """write a record already formatted with format_record
+
+        Args:
+            record_string (str): formatted record
+        """
+
+        if self.count:
+            self.handle.write(self.SEPARATOR)
+        self.handle.write(record_string)
+        self.count += 1
+
+    def write_suffix(self):
+        """write the suffix that closes the array of metadata objects"""
+
+        if self.count:
+            self.handle.write("\n")
+        self.handle.write(self.SUFFIX)
+
+    def flush(self):
+        """flush the file handle"""
+        self.handle.flush()
+
+class JSONWriter(RecordWriter):
+    """Write records as a pretty-printed JSON array, keys sorted"""
+
+    NAME = "json"
+    PREFIX = "[\n"
+    SEPARATOR = ",\n"
+    SUFFIX = "]"
+
+    @classmethod
+    def format_record(cls, response_dict, inc):
+        parts = [INDENT]
+        _append_json(parts, response_dict, INDENT)
+        return "".join(parts)
+
+class XMLWriter(RecordWriter):
+    """Write records as <sequence> elements of a <sequence_group> document"""
+
+    NAME = "xml"
+    PREFIX = '<?xml version="1.0" ?>\n<sequence_group>\n'
+    SEPARATOR = "\n"
+    SUFFIX = "</sequence_group>"
+
+    @classmethod
+    def format_record(cls, response_dict, inc):
+        lines = []
+        if not _append_xml(lines, "sequence", response_dict, INDENT):
+            return _format_xml_with_dom(response_dict)
+        return "\n".join(lines)
+
+class YAMLWriter(RecordWriter):
+    """Write records as sequence_<inc> mappings of a sequence_group mapping"""
+
+    NAME = "yaml"
+    PREFIX = "sequence_group:\n"
+    SEPARATOR = "\n\n"
+    SUFFIX = ""
+
+    @classmethod
+    def format_record(cls, response_dict, inc):
+        global _yaml, _yaml_dumper
+        if _yaml is None:
+            import yaml
+            _yaml_dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+            _yaml = yaml
+        # keep yaml.dump's default flow style, which differs between PyYAML
+        # versions, so the output matches yaml.dump(response_dict)
+        response_string = _yaml.dump(response_dict,
+                                     Dumper=_yaml_dumper)[:-1]
+        response_string = "sequence_%s:\n" % (inc) \
+            + indent_lines(response_string)
+        return indent_lines(response_string)
+
+class NDJSONWriter(RecordWriter):
+    """Write records as newline-delimited JSON (JSON Lines)
+
+    Each record is one compact JSON object on its own line, with no
+    enclosing array. The handle is flushed after every record, so a
+    consumer can read the results of a running or interrupted batch line
+    by line.
+    """
+
+    NAME = "ndjson"
+
+    @classmethod
+    def format_record(cls, response_dict, inc):
+        return json.dumps(response_dict, sort_keys=True,
+                          separators=(",", ":"))
+
+    def write_formatted(self, record_string):
+        self.handle.write(record_string + "\n")
+        self.handle.flush()
+        self.count += 1
+
+    def write_suffix(self):
+        pass
+
+class CSVWriter(RecordWriter):
+    """Write records as CSV rows, one column per flattened field
+
+    The header row names the columns. Missing values are written as empty
+    fields, and aliases as a JSON array of alias objects.
+    """
+
+    NAME = "csv"
+    PREFIX = ",".join(COLUMNS) + "\n"
+    SEPARATOR = "\n"
+
+    @classmethod
+    def format_record(cls, response_dict, inc):
+        row = flatten_record(response_dict)
+        aliases = row[-1]
+        row = row[:-1] + (json.dumps(aliases, sort_keys=True,
+                                     separators=(",", ":"))
+                          if aliases is not None else None,)
+        line = io.StringIO()
+        csv.writer(line, lineterminator="").writerow(row)
+        return line.getvalue()
+
+class ParquetWriter(RecordWriter):
+    """Write records to a Parquet file, one typed column per flattened field
+
+    Rows are buffered and written as a row group every ROW_GROUP_SIZE rows,
+    so memory use does not grow with the size of the batch. Requires the
+    optional pyarrow package.
+    """
+
+    NAME = "parquet"
+    BINARY = True
+    ROW_GROUP_SIZE = 10000
+
+    def __init__(self, handle, row_group_size=ROW_GROUP_SIZE):
+        """instantiate the writer
+
+        Args:
+            handle (file): binary file handle the Parquet file is written to
+            row_group_size (int): number of rows in each row group
+
+        Raises:
+            ImportError: if pyarrow is not installed
+        """
+
+        ParquetWriter.check_available()
+        import pyarrow
+        import pyarrow.parquet
+
+        RecordWriter.__init__(self, handle)
+        self.row_group_size = row_group_size
+        self.__pyarrow = pyarrow
+        self.__schema = pyarrow.schema([
+            ("req_seq_id", pyarrow.string()),
+            ("status_code", pyarrow.int32()),
+            ("error", pyarrow.string()),
+            ("id", pyarrow.string()),
+            ("md5", pyarrow.string()),
+            ("trunc512", pyarrow.string()),
+            ("length", pyarrow.int64()),
+            ("aliases", pyarrow.list_(pyarrow.struct([
+                ("alias", pyarrow.string()),
+                ("naming_authority", pyarrow.string())])))
+        ])
+        self.__parquet_writer = pyarrow.parquet.ParquetWriter(
+            handle, self.__schema)
+        self.__rows = []
+
+    @classmethod
+    def check_available(cls):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("parquet output requires pyarrow, install it "
+                              + "with: pip install pyarrow")
+
+    @classmethod
+    def format_record(cls, response_dict, inc):
+        return flatten_record(response_dict)
+
+    def write_prefix(self):
+        pass
+
+    def write_formatted(self, record_string):
+        """buffer a row, writing a row group once enough rows are buffered
+
+        Args:
+            record_string (tuple): row formatted with format_record
+        """
+
+        self.__rows.append(record_string)
+        self.count += 1
+        if len(self.__rows) >= self.row_group_size:
+            self.__write_row_group()
+
+    def write_suffix(self):
+        """write the remaining rows and the Parquet footer"""
+
+        if self.__rows:
+            self.__write_row_group()
+        self.__parquet_writer.close()
+
+    def __write_row_group(self):
+        """write the buffered rows as one row group"""
+
+        columns = [self.__pyarrow.array(list(values), type=field.type)
+                   for values, field in zip(zip(*self.__rows),
+                                            self.__schema)]
+        self.__parquet_writer.write_table(
+            self.__pyarrow.Table.from_arrays(columns, schema=self.__schema))
+        self.__rows = []
+
+class EnabWriter(RecordWriter):
+    """Write records to an enab file, indexed by req_seq_id
+
+    Each record is the response dictionary as one line of compact JSON, keys
+    sorted. The records are followed by an index of their req_seq_id sorted
+    by key, written once the batch completes, so that the EnabReader can
+    find any record with a binary search (see enab.py and digestindex.py).
+    Index entries are spilled to a temporary file in sorted runs rather than
+    held in memory, so memory use stays flat however large the batch.
+    """
+
+    NAME = "enab"
+    BINARY = True
+
+    def __init__(self, handle):
+        """instantiate the writer
+
+        Args:
+            handle (file): binary file handle the enab file is written to
+        """
+
+        # imported here, so that other output formats do not pay for it
+        from enaclient.digestindex import DigestIndexWriter, identifier_key
+        from enaclient.enab import ENAB_MAGIC
+
+        RecordWriter.__init__(self, handle)
+        self.__index_writer = DigestIndexWriter(handle, ENAB_MAGIC)
+        self.__identifier_key = identifier_key
+
+    @classmethod
+    def format_record(cls, response_dict, inc):
+        return (response_dict.get("req_seq_id"),
+                json.dumps(response_dict, sort_keys=True,
+                           separators=(",", ":")).encode("utf-8") + b"\n")
+
+    def write_prefix(self):
+        pass
+
+    def write_formatted(self, record_string):
+        """write a record, and index it by its req_seq_id
+
+        Args:
+            record_string (tuple): req_seq_id and record bytes, formatted
+                with format_record
+        """
+
+        req_seq_id, record = record_string
+        location = self.__index_writer.write_record(record)
+        if req_seq_id is not None:
+            self.__index_writer.add_key(self.__identifier_key(req_seq_id),
+                                        location)
+        self.count += 1
+
+    def write_suffix(self):
+        """write the sorted index and the footer"""
+        self.__index_writer.finish()
+
+def flatten_record(response_dict):
+    """flatten a response dictionary into a row of the columnar formats
+
+    Metadata fields other than those in COLUMNS are dropped. The status code
+    is always an integer (timeouts are reported with the string "408").
+
+    Args:
+        response_dict (dict): API response for a sequence id
+
+    Returns:
+        row (tuple): values in COLUMNS order, None where missing
+    """
+
+    metadata = response_dict.get("metadata") or {}
+    status_code = response_dict.get("status_code")
+    return (response_dict.get("req_seq_id"),
+            int(status_code) if status_code is not None else None,
+            response_dict.get("error")) \
+        + tuple(metadata.get(column) for column in METADATA_COLUMNS)
+
+"JSON formatting"
+
+def _append_json(parts, value, indent):
+    """append the pretty-printed JSON of a value to a list of strings
+
+    Equivalent to json.dumps(value, indent=4, sort_keys=True), with every
+    line after the first indented by "indent".
+
+    Args:
+        parts (list): list of strings to append to
+        value (obj): value to format
+        indent (str): indentation of the line the value starts on
+    """
+
+    if isinstance(value, str):
+        parts.append(encode_basestring_ascii(value))
+    elif value is None:
+        parts.append("null")
+    elif value is True:
+        parts.append("true")
+    elif value is False:
+        parts.append("false")
+    elif isinstance(value, int):
+        parts.append(int.__repr__(value))
+    elif isinstance(value, float):
+        parts.append(_format_json_float(value))
+    elif isinstance(value, dict):
+        if not value:
+            parts.append("{}")
+            return
+        inner = indent + INDENT
+        parts.append("{\n")
+        first = True
+        for key in sorted(value):
+            if not first:
+                parts.append(",\n")
+            first = False
+            parts.append(inner)
+            parts.append(encode_basestring_ascii(key))
+            parts.append(": ")
+            _append_json(parts, value[key], inner)
+        parts.append("\n" + indent + "}")
+    elif isinstance(value, (list, tuple)):
+        if not value:
+            parts.append("[]")
+            return
+        inner = indent + INDENT
+        parts.append("[\n")
+        first = True
+        for item in value:
+            if not first:
+                parts.append(",\n")
+            first = False
+            parts.append(inner)
+            _append_json(parts, item, inner)
+        parts.append("\n" + indent + "]")
+    else:
+        raise TypeError("Object of type %s is not JSON serializable"
+                        % (type(value).__name__))
+
+def _format_json_float(value):
+    """format a float the way the json module does
+
+    Args:
+        value (float): float to format
+
+    Returns:
+        formatted (str): JSON representation of the float
+    """
+
+    if value != value:
+        return "NaN"
+    if value == float("inf"):
+        return "Infinity"
+    if value == -float("inf"):
+        return "-Infinity"
+    return float.__repr__(value)
+
+"XML formatting"
+
+# element names the fast path writes as-is. other keys are rewritten by
+# dicttoxml (eg. keys with spaces, or numeric keys), so records containing
+# them are formatted with dicttoxml and minidom instead
+XML_SIMPLE_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_\-]*$")
+
+def _escape_xml(text):
+    """escape text the way minidom writes text nodes
+
+    Args:
+        text (str): text to escape
+
+    Returns:
+        escaped (str): escaped text
+    """
+
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if '"' in text:
+        text = text.replace('"', "&quot;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+def _append_xml(lines, name, value, indent, in_list=False):
+    """append the pretty-printed XML element of a value to a list of lines
+
+    Follows the element layout of dicttoxml (dict keys as child elements,
+    list items as <item> elements, None as an empty element) and the
+    pretty-printing of minidom. Multi-line strings, which minidom indents,
+    and booleans in lists, which dicttoxml writes capitalized, are left to
+    the DOM fallback.
+
+    Args:
+        lines (list): list of lines to append to
+        name (str): element name
+        value (obj): element value
+        indent (str): indentation of the element
+        in_list (bool): True if the value is an item of a list
+
+    Returns:
+        formatted (bool): False if the value cannot be formatted by the fast
+            path, in which case lines must be discarded
+    """
+
+    if isinstance(value, str):
+        if "\n" in value:
+            return False
+        if value:
+            lines.append("%s<%s>%s</%s>" % (indent, name, _escape_xml(value),
+                                            name))
+        else:
+            lines.append("%s<%s/>" % (indent, name))
+    elif value is None:
+        lines.append("%s<%s/>" % (indent, name))
+    elif isinstance(value, bool):
+        if in_list:
+            return False
+        lines.append("%s<%s>%s</%s>" % (indent, name, str(value).lower(),
+                                        name))
+    elif isinstance(value, (int, float)):
+        lines.append("%s<%s>%s</%s>" % (indent, name, value, name))
+    elif isinstance(value, dict) or isinstance(value, list):
+        if not value:
+            lines.append("%s<%s/>" % (indent, name))
+            return True
+        inner = indent + INDENT
+        lines.append("%s<%s>" % (indent, name))
+        if isinstance(value, dict):
+            items = value.items()
+        else:
+            items = (("item", item) for item in value)
+        for key, item in items:
+            if not isinstance(key, str) or not XML_SIMPLE_NAME.match(key):
+                return False
+            if not _append_xml(lines, key, item, inner,
+                               isinstance(value, list)):
+                return False
+        lines.append("%s</%s>" % (indent, name))
+    else:
+        return False
+    return True
+
+def _format_xml_with_dom(response_dict):
+    """format a response dictionary with dicttoxml and minidom
+
+    Used for records the fast path does not handle.
+
+    Args:
+        response_dict (dict): API response for a sequence id
+
+    Returns:
+        record_string (str): formatted, indented record
+    """
+
+    from dicttoxml import dicttoxml
+    from xml.dom.minidom import parseString
+
+    xml = dicttoxml(response_dict, custom_root="sequence", attr_type=False)
+    response_string = parseString(xml).toprettyxml(indent=INDENT)[:-1]
+    response_string = re.sub("<\\?xml.+?>\n", "", response_string)
+    return indent_lines(response_string)
@@ -1,14 +1,29 @@
 """run-enaclient.py - run the ENAClient
 
-This module can be used to run the ENAClient via the command line
+This module can be used to run the ENAClient via the command line, or one of
+its subcommands (eg. "mirror", "resolve", "serve", "sequence")
 """
 
+import importlib
 import sys
 from enaclient.enaclient import ENAClient
 
+# modules of the subcommands, whose main functions are called with the
+# arguments after the subcommand. modules are only imported when their
+# subcommand is run
+SUBCOMMANDS = {
+    "mirror": "enaclient.mirror",
+    "resolve": "enaclient.aliases",
+    "serve": "enaclient.daemon",
+    "sequence": "enaclient.sequences"
+}
+
 def main():
-    """run the ENAClient"""
-    client = ENAClient()
+    """run the ENAClient, or the subcommand named by the first argument"""
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        subcommand = importlib.import_module(SUBCOMMANDS[sys.argv[1]])
+        sys.exit(subcommand.main(sys.argv[2:]))
+    client = ENAClient(args=sys.argv[1:])
     client.call_and_output_all()
 
 if __name__ == "__main__":
@@ -13,12 +13,11 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/jb-adams/enaclient",
     packages=setuptools.find_packages(),
+    python_requires=">=3.7",
     classifiers=[
         "Programming Language :: Python",
-        "Programming Language :: Python :: 3.4",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
@@ -0,0 +1,43 @@
+"""legacy_format.py - reference formatter for output writer tests
+
+This module contains the formatting previously done in
+ENAClient.call_refget_api (json.dumps, dicttoxml + minidom, yaml.dump with
+regex re-indentation). The output writers must produce identical output.
+"""
+
+import json
+import re
+import yaml
+from dicttoxml import dicttoxml
+from xml.dom.minidom import parseString
+
+def legacy_format_record(response_dict, inc, output_format):
+    """format a response dictionary the way the ENAClient used to
+
+    Args:
+        response_dict (dict): API response for a sequence id
+        inc (int): auto-increment input sequence
+        output_format (str): json, xml, or yaml
+
+    Returns:
+        response_string (str): formatted, indented record
+    """
+
+    if output_format == "json":
+        response_string = json.dumps(response_dict, indent=4, sort_keys=True)
+    elif output_format == "xml":
+        xml = dicttoxml(response_dict, custom_root="sequence",
+                        attr_type=False)
+        dom = parseString(xml)
+        response_string = dom.toprettyxml(indent="    ")[:-1]
+        response_string = re.sub("<\\?xml.+?>\n", "", response_string)
+    elif output_format == "yaml":
+        response_string = yaml.dump(response_dict)[:-1]
+        response_string = re.sub("(.+?\n)", r'    \1', response_string)
+        response_string =  re.sub("\n(.+?$)", r'\n    \1',
+                           response_string)
+        response_string = "sequence_%s:\n" % (inc) + response_string
+
+    response_string = re.sub("(.+?\n)", r'    \1', response_string)
+    response_string = re.sub("\n(.+?$)", r'\n    \1', response_string)
+    return response_string
@@ -0,0 +1,412 @@
+"""stub_server.py - local stub refget server for tests
+
+This module contains the StubRefgetServer, a threaded HTTP server that answers
+refget sequence metadata requests from an in-memory table of sequences, and
+sequence bases requests (with start/end parameters or a Range header) from an
+in-memory table of bases. It can also serve a batch metadata endpoint, taking
+a POST of many sequence ids. For benchmarks, the stub can answer a fraction
+of requests with server errors, and generate metadata (with a chosen number
+of aliases) for any sequence id. Metadata responses carry an ETag, and
+requests whose If-None-Match matches it are answered with a 304. Each
+response can be delayed to simulate the round trip to the ENA refget API
+(counting how many delayed requests are in flight at once), and the server
+can be run over TLS with a self-signed certificate. Faults (error responses,
+throttling, connection resets) can be injected per sequence id, and paths
+under /moved/ are redirected.
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import ssl
+import subprocess
+import threading
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, parse_qs
+
+# metadata for the sequences known to the stub server, keyed by md5. keys are
+# in the same order as the ENA refget API returns them
+KNOWN_SEQUENCES = {
+    "3050107579885e1608e6fe50fae3f8d0": {
+        "id": "3050107579885e1608e6fe50fae3f8d0",
+        "md5": "3050107579885e1608e6fe50fae3f8d0",
+        "trunc512": None,
+        "length": 7156,
+        "aliases": []
+    }
+}
+
+# metadata body returned by the refget API when a sequence is not found
+NOT_FOUND_METADATA = {
+    "id": None,
+    "md5": None,
+    "trunc512": None,
+    "length": None,
+    "aliases": []
+}
+
+class StubRefgetHandler(BaseHTTPRequestHandler):
+    """Answer GET /sequence/<id>/metadata from the server's sequence table,
+    and GET /sequence/<id> from its bases table"""
+
+    # keep connections alive between requests, without waiting on delayed
+    # acks between the header and body writes
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        """respond to a refget metadata request"""
+
+        server = self.server
+        server.record_request(self.path)
+        if server.latency_secs:
+            server.add_in_flight(1)
+            try:
+                time.sleep(server.latency_secs)
+            finally:
+                server.add_in_flight(-1)
+
+        # paths under /moved/ are redirected to the same path without it,
+        # and /loop/ to itself
+        if self.path.startswith("/moved/"):
+            self.__respond(301, {}, {"Location": self.path[len("/moved"):]})
+            return
+        if self.path.startswith("/loop/"):
+            self.__respond(302, {}, {"Location": self.path})
+            return
+
+        # split the path into its components, only the metadata and bases
+        # endpoints are served by the stub
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) >= 2 and parts[-2] == "sequence":
+            self.__respond_bases(parts[-1], parse_qs(url.query))
+        elif len(parts) >= 3 and parts[-1] == "metadata" \
+           and parts[-3] == "sequence":
+            sequence_id = parts[-2]
+            fault = server.next_fault(sequence_id)
+            if fault == "slow":
+                # respond normally, after a delay
+                time.sleep(StubRefgetServer.SLOW_FAULT_SECS)
+                fault = None
+            if fault == "reset":
+                # drop the connection without responding
+                self.close_connection = True
+            elif isinstance(fault, tuple):
+                self.__respond(fault[0], {"error": "injected fault"},
+                               {"Retry-After": str(fault[1])})
+            elif fault is not None:
+                self.__respond(fault, {"error": "injected fault"})
+            elif server.draw_error():
+                self.__respond(503, {"error": "injected error"})
+            elif sequence_id in server.sequences:
+                self.__respond_metadata(200, {"metadata":
+                                              server.sequences[sequence_id]})
+            elif server.aliases is not None:
+                self.__respond_metadata(200, {"metadata":
+                    server.generate_metadata(sequence_id)})
+            else:
+                self.__respond_metadata(404, {"metadata":
+                                              NOT_FOUND_METADATA})
+        else:
+            self.__respond(404, {"error": "not found"})
+
+    def do_POST(self):
+        """respond to a batch metadata request, if the batch endpoint is
+        served"""
+
+        server = self.server
+        server.record_request(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if server.batch_path is None \
+           or self.path.strip("/") != server.batch_path:
+            self.__respond(404, {"error": "not found"})
+            return
+
+        # answer each sequence id with the status and body of the metadata
+        # endpoint
+        response_dict = {}
+        for sequence_id in json.loads(body.decode("utf-8"))["ids"]:
+            if sequence_id in server.sequences:
+                response_dict[sequence_id] = {"status_code": 200,
+                    "metadata": server.sequences[sequence_id]}
+            else:
+                response_dict[sequence_id] = {"status_code": 404,
+                    "metadata": NOT_FOUND_METADATA}
+        self.__respond(200, response_dict)
+
+    def __respond_bases(self, sequence_id, query):
+        """write the bases of a sequence, or a sub-range of them
+
+        Args:
+            sequence_id (str): requested sequence id
+            query (dict): parsed query string, may hold start and end
+        """
+
+        server = self.server
+        fault = server.next_fault(sequence_id)
+        if fault == "reset":
+            self.close_connection = True
+            return
+        if isinstance(fault, tuple):
+            self.__respond(fault[0], {"error": "injected fault"},
+                           {"Retry-After": str(fault[1])})
+            return
+        if fault is not None:
+            self.__respond(fault, {"error": "injected fault"})
+            return
+        bases = server.bases.get(sequence_id)
+        if bases is None:
+            self.__respond(404, {"error": "not found"})
+            return
+
+        # the range is taken from start/end, or from a Range header
+        # (inclusive end), the whole sequence by default
+        status_code = 200
+        start = int(query.get("start", ["0"])[0])
+        end = int(query.get("end", [str(len(bases))])[0])
+        range_match = re.match(r"bytes=(\d+)-(\d*)$",
+                               self.headers.get("Range", ""))
+        if range_match and not server.ignore_ranges:
+            status_code = 206
+            start = int(range_match.group(1))
+            end = int(range_match.group(2)) + 1 if range_match.group(2) \
+                else len(bases)
+            end = min(end, len(bases))
+        if start > end or end > len(bases):
+            self.__respond(416, {"error": "range not satisfiable"})
+            return
+
+        body = bases[start:end]
+        self.send_response(status_code)
+        self.send_header("Content-Type", "text/vnd.ga4gh.refget.v1.0.0+plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __respond_metadata(self, status_code, body_dict):
+        """write a metadata response with an ETag, or a 304 if the request's
+        If-None-Match matches it
+
+        Args:
+            status_code (int): http status code
+            body_dict (dict): response body
+        """
+
+        etag = '"%s"' % (hashlib.md5(json.dumps(body_dict, sort_keys=True)
+                                     .encode("utf-8")).hexdigest())
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.__respond(status_code, body_dict, {"ETag": etag})
+
+    def __respond(self, status_code, body_dict, headers=None):
+        """write a json response
+
+        Args:
+            status_code (int): http status code
+            body_dict (dict): response body
+            headers (dict): additional response headers
+        """
+
+        body = json.dumps(body_dict).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """silence the per-request log lines written to stderr"""
+        pass
+
+class StubRefgetServer(ThreadingMixIn, HTTPServer):
+    """Threaded local refget server, started on a free localhost port
+
+    Use as a context manager; the server runs in a background thread and
+    its base url (suitable for ENAClient.API_BASE_URL) is available as the
+    "url" attribute.
+    """
+
+    daemon_threads = True
+
+    # delay of the "slow" fault
+    SLOW_FAULT_SECS = 1.0
+
+    def __init__(self, sequences=None, latency_secs=0, certfile=None,
+                 faults=None, bases=None, batch_path=None, error_rate=0,
+                 aliases=None, seed=0):
+        """instantiate the stub server
+
+        Args:
+            sequences (dict): sequence metadata keyed by sequence id
+            latency_secs (float): delay added to every response
+            certfile (str): path to a PEM file holding the certificate and
+                private key, the server uses TLS if provided
+            faults (dict): faults injected into successive requests for a
+                sequence id, keyed by sequence id. each fault is an http
+                status code, a (status code, Retry-After) tuple, "reset"
+                to close the connection without responding, or "slow" to
+                respond after SLOW_FAULT_SECS
+            bases (dict): sequence bases (bytes) keyed by sequence id
+            batch_path (str): path of the batch metadata endpoint, None to
+                answer batch requests with 404
+            error_rate (float): fraction of metadata requests answered with
+                a 503, drawn at random
+            aliases (int): number of aliases of the metadata generated for
+                sequence ids missing from the sequence table, None to answer
+                them with 404
+            seed (int): seed of the random error draws
+        """
+
+        HTTPServer.__init__(self, ("127.0.0.1", 0), StubRefgetHandler)
+        self.sequences = dict(KNOWN_SEQUENCES if sequences is None
+                              else sequences)
+        self.latency_secs = latency_secs
+        self.request_paths = []
+        self.connection_count = 0
+        self.open_connections = 0
+        self.max_open_connections = 0
+        # metadata requests being delayed by latency_secs at once
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.bases = dict(bases or {})
+        # answer Range requests with the whole sequence, like a server that
+        # does not support them
+        self.ignore_ranges = False
+        self.batch_path = batch_path
+        self.error_rate = error_rate
+        self.aliases = aliases
+        self.__random = random.Random(seed)
+        self.faults = dict((sequence_id, list(sequence_faults))
+                           for sequence_id, sequence_faults
+                           in (faults or {}).items())
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__scheme = "http"
+
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+            self.__scheme = "https"
+
+    @property
+    def url(self):
+        """base url of the stub server, ending in a slash"""
+        return "%s://%s:%s/" % ((self.__scheme,) + self.server_address[:2])
+
+    def process_request(self, request, client_address):
+        """count each accepted connection before handling it"""
+        with self.__lock:
+            self.connection_count += 1
+            self.open_connections += 1
+            self.max_open_connections = max(self.max_open_connections,
+                                            self.open_connections)
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def shutdown_request(self, request):
+        """count each connection closed, by the client or the server"""
+        with self.__lock:
+            self.open_connections -= 1
+        HTTPServer.shutdown_request(self, request)
+
+    def record_request(self, path):
+        """record a requested path
+
+        Args:
+            path (str): requested url path
+        """
+        with self.__lock:
+            self.request_paths.append(path)
+
+    def add_in_flight(self, count):
+        """count requests starting (or, if negative, ending) their delay
+
+        Args:
+            count (int): change in the number of requests in flight
+        """
+        with self.__lock:
+            self.in_flight += count
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def draw_error(self):
+        """draw whether to answer a request with an injected error
+
+        Returns:
+            error (bool): true for an error, with probability error_rate
+        """
+        if not self.error_rate:
+            return False
+        with self.__lock:
+            return self.__random.random() < self.error_rate
+
+    def generate_metadata(self, sequence_id):
+        """generate metadata for a sequence id missing from the table
+
+        Args:
+            sequence_id (str): requested sequence id
+
+        Returns:
+            metadata (dict): metadata with "aliases" aliases, in the same key
+                order as the ENA refget API
+        """
+        return {
+            "id": sequence_id,
+            "md5": sequence_id if len(sequence_id) == 32 else None,
+            "trunc512": sequence_id if len(sequence_id) == 48 else None,
+            "length": int(sequence_id[:6], 16),
+            "aliases": [{"alias": "%s.%s" % (sequence_id[:12], i),
+                         "naming_authority": "insdc"}
+                        for i in range(self.aliases)]
+        }
+
+    def next_fault(self, sequence_id):
+        """pop the next fault to inject for a sequence id
+
+        Args:
+            sequence_id (str): requested sequence id
+
+        Returns:
+            fault (obj): fault to inject, or None to respond normally
+        """
+        with self.__lock:
+            sequence_faults = self.faults.get(sequence_id)
+            return sequence_faults.pop(0) if sequence_faults else None
+
+    def __enter__(self):
+        self.__thread = threading.Thread(target=self.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+        self.__thread.join()
+
+def make_self_signed_cert(directory):
+    """write a self-signed certificate for 127.0.0.1 using the openssl cli
+
+    Args:
+        directory (str): directory to write the certificate to
+
+    Returns:
+        certfile (str): path to a PEM file holding the certificate and key
+    """
+
+    certfile = os.path.join(directory, "stub.pem")
+    subprocess.check_call(["openssl", "req", "-x509", "-newkey", "rsa:2048",
+        "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+        "-addext", "subjectAltName=IP:127.0.0.1",
+        "-keyout", certfile, "-out", certfile],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certfile
@@ -0,0 +1,198 @@
+"""test_aliases.py - test alias index scenarios
+
+This module contains test scenarios for the AliasIndex, the resolve
+subcommand, and ENAClient lookups by alias.
+"""
+
+import json
+import sqlite3
+from enaclient.aliases import AliasIndex, main
+from enaclient.enaclient import ENAClient
+from tests.stub_server import StubRefgetServer
+
+md5_0 = "3050107579885e1608e6fe50fae3f8d0"
+trunc512_0 = "959cb1883fc1ca9ae1394ceb475a356ead1ecceff5824ae7"
+trunc512_1 = "0123456789abcdef0123456789abcdef0123456789abcdef"
+md5_2 = "%032x" % (2)
+
+metadata_0 = {"id": md5_0, "md5": md5_0, "trunc512": trunc512_0,
+              "length": 7156,
+              "aliases": [{"alias": "CM000663.2", "naming_authority": "insdc"},
+                          {"alias": "chr1", "naming_authority": "ucsc"},
+                          {"alias": "CM000663.1",
+                           "naming_authority": "insdc"}]}
+metadata_1 = {"id": trunc512_1, "md5": None, "trunc512": trunc512_1,
+              "length": 100,
+              "aliases": [{"alias": "CM000664.2",
+                           "naming_authority": "insdc"}]}
+
+def test_alias_index(tmp_path):
+    """test the AliasIndex resolves and translates identifiers"""
+
+    index = AliasIndex(str(tmp_path / "cache"))
+    assert index.add(metadata_0) == 5
+    assert index.add_many([metadata_1, {"md5": None, "trunc512": None}]) == 2
+    assert len(index) == 7
+
+    # assert every identifier resolves to the digests of its sequence, and
+    # digests are resolved whatever their case
+    assert index.resolve("CM000663.2") == (md5_0, trunc512_0)
+    assert index.resolve(trunc512_0.upper()) == (md5_0, trunc512_0)
+    assert index.resolve("CM000664.2") == (None, trunc512_1)
+    assert index.resolve("cm000663.2") is None
+    assert (index.hits, index.misses) == (3, 1)
+    assert index.get_aliases(md5_0) == [("CM000663.1", "insdc"),
+                                        ("CM000663.2", "insdc"),
+                                        ("chr1", "ucsc")]
+    assert index.get_aliases(trunc512_1) == [("CM000664.2", "insdc")]
+
+    # assert identifiers are translated into digest and alias namespaces,
+    # digests missing from the index only into their own
+    identifiers = ["chr1", trunc512_1, md5_0.upper(), md5_2, "unknown"]
+    assert index.translate_many(identifiers, "md5") \
+        == {"chr1": md5_0, md5_0.upper(): md5_0, md5_2: md5_2}
+    assert index.translate_many(identifiers, "trunc512") \
+        == {"chr1": trunc512_0, trunc512_1: trunc512_1,
+            md5_0.upper(): trunc512_0}
+    assert index.translate_many(identifiers, "insdc") \
+        == {"chr1": "CM000663.1", trunc512_1: "CM000664.2",
+            md5_0.upper(): "CM000663.1"}
+    index.close()
+
+    # assert the index persists
+    index = AliasIndex(str(tmp_path / "cache"))
+    assert index.resolve("chr1") == (md5_0, trunc512_0)
+    index.close()
+
+def test_alias_index_shared_alias(tmp_path):
+    """test an alias of several sequences is indexed for each, and resolves
+    to none of them"""
+
+    index = AliasIndex(str(tmp_path / "cache"))
+    index.add_many([
+        dict(metadata_0, aliases=[{"alias": "chrM",
+                                   "naming_authority": "ucsc"}]),
+        dict(metadata_1, aliases=[{"alias": "chrM",
+                                   "naming_authority": "ucsc"}])])
+    assert index.resolve("chrM") is None
+    assert index.get_aliases(md5_0) == [("chrM", "ucsc")]
+    assert index.get_aliases(trunc512_1) == [("chrM", "ucsc")]
+
+    # assert re-indexing a sequence once its md5 is known replaces its rows,
+    # rather than sharing its alias with itself
+    index.add(metadata_1)
+    index.add(dict(metadata_1, md5=md5_2))
+    assert index.resolve("CM000664.2") == (md5_2, trunc512_1)
+
+    # assert duplicated identifiers are counted once
+    index.hits = index.misses = 0
+    assert index.resolve_many(["chrM", "CM000664.2", "CM000664.2",
+                               "unknown", "unknown"]) \
+        == {"CM000664.2": (md5_2, trunc512_1)}
+    assert (index.hits, index.misses) == (1, 2)
+    index.close()
+
+def test_alias_index_rekeyed(tmp_path):
+    """test an index keyed by identifier alone is rekeyed when opened"""
+
+    (tmp_path / "cache").mkdir()
+    connection = sqlite3.connect(
+        str(tmp_path / "cache" / AliasIndex.FILE_NAME))
+    connection.execute(
+        "CREATE TABLE identifiers (identifier TEXT PRIMARY KEY, "
+        + "namespace TEXT NOT NULL, md5 TEXT, trunc512 TEXT)")
+    connection.execute("CREATE INDEX identifiers_md5 ON identifiers (md5)")
+    connection.execute(
+        "INSERT INTO identifiers VALUES ('chrM', 'ucsc', ?, ?)",
+        (md5_0, trunc512_0))
+    connection.commit()
+    connection.close()
+
+    index = AliasIndex(str(tmp_path / "cache"))
+    assert index.resolve("chrM") == (md5_0, trunc512_0)
+    index.add(dict(metadata_1, aliases=[{"alias": "chrM",
+                                         "naming_authority": "ucsc"}]))
+    assert index.resolve("chrM") is None
+    assert len(index) == 3
+    index.close()
+
+def test_get_response_dict_alias(tmp_path):
+    """test aliases of sequences seen before are looked up by md5, without
+    calling the API again"""
+
+    sequences = {md5_0: metadata_0, trunc512_1: metadata_1}
+    with StubRefgetServer(sequences=sequences) as server:
+        client = ENAClient(args=None)
+        client.set_base_urls([server.url])
+        client.set_cache_dir(str(tmp_path / "cache"))
+
+        # assert an alias is invalid until its sequence was looked up
+        assert client.get_response_dict("chr1")["status_code"] == "400"
+        assert client.get_response_dict(md5_0)["status_code"] == 200
+        for sequence_id in ["chr1", "CM000663.2", trunc512_0]:
+            response_dict = client.get_response_dict(sequence_id)
+            assert response_dict["req_seq_id"] == sequence_id
+            assert response_dict["metadata"]["length"] == 7156
+        assert len(server.request_paths) == 1
+        client.close()
+
+        # assert batches resolve aliases with the index of a previous run,
+        # answering them from the on-disk cache. aliases are resolved before
+        # the chunk is requested, so those of sequences requested in the
+        # same chunk are not
+        client = ENAClient(args=None)
+        client.set_base_urls([server.url])
+        client.set_cache_dir(str(tmp_path / "cache"))
+        response_dicts = list(client.iter_metadata_batch(
+            [trunc512_1, "CM000663.2", md5_0, "CM000664.2"]))
+        assert [(response_dict["req_seq_id"], response_dict["status_code"])
+                for response_dict in response_dicts] \
+            == [(trunc512_1, 200), ("CM000663.2", 200), (md5_0, 200),
+                ("CM000664.2", "400")]
+        response_dicts = list(client.iter_metadata_batch(["CM000664.2"]))
+        assert response_dicts[0]["req_seq_id"] == "CM000664.2"
+        assert response_dicts[0]["metadata"]["length"] == 100
+        assert len(server.request_paths) == 2
+        client.close()
+
+def test_resolve(tmp_path, capsys):
+    """test the resolve subcommand translates manifests"""
+
+    cache_dir = str(tmp_path / "cache")
+    output_file = tmp_path / "output.ndjson"
+    output_file.write_text(json.dumps({"req_seq_id": md5_0,
+                                       "status_code": 200,
+                                       "metadata": metadata_0}) + "\n")
+    manifest = tmp_path / "manifest.tsv"
+    manifest.write_text("sample\taccession\n"
+                        + "a\tCM000663.2\n"
+                        + "b\t%s\n" % (trunc512_1)
+                        + "c\tchr9\n")
+    translated = tmp_path / "translated.tsv"
+
+    # assert manifests are translated after importing previous output, and
+    # untranslated identifiers are left as they are
+    assert main(["-i", str(manifest), "-o", str(translated), "--id_column",
+                 "accession", "--import", str(output_file), "--cache_dir",
+                 cache_dir]) == 0
+    assert translated.read_text() == "sample\taccession\n" \
+        + "a\t%s\nb\t%s\nc\tchr9\n" % (md5_0, trunc512_1)
+    err = capsys.readouterr().err
+    assert "5 identifiers imported" in err
+    assert "1 of 3 identifiers translated to md5" in err
+
+    # assert digests missing from the index are looked up with --lookup
+    ids_file = tmp_path / "ids.txt"
+    ids_file.write_text("%s\n%s\nchr9\n" % (md5_0, trunc512_1))
+    with StubRefgetServer(sequences={trunc512_1: metadata_1}) as server:
+        assert main(["-i", str(ids_file), "--to", "insdc", "--lookup",
+                     "--cache_dir", cache_dir, "--base_url", server.url]) == 0
+        assert len(server.request_paths) == 1
+    assert capsys.readouterr().out.split() \
+        == ["CM000663.1", "CM000664.2", "chr9"]
+
+    # assert missing input files and id columns are reported
+    assert main(["--cache_dir", cache_dir]) == 1
+    assert main(["-i", str(tmp_path / "nofile.txt")]) == 1
+    assert main(["-i", str(manifest), "--id_column", "id", "--cache_dir",
+                 cache_dir]) == 1
@@ -3,8 +3,14 @@
 This module contains test scenarios for the ENAClient.
 """
 
+import io
+import os
 import sys
+import json
+import time
 from enaclient.enaclient import ENAClient
+from enaclient.session import SessionPool
+from tests.stub_server import StubRefgetServer
 
 # define arguments that will be passed to the ENAClient through the arg parser
 sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
@@ -18,6 +24,8 @@ args_error_0 = []
 args_error_1 = ["-i", "nofile.txt"]
 args_error_2 = ["-s", sequence_id_0, "-f", "wrongformat"]
 args_error_3 = ["-s", sequence_id_0, "-o", "wrongdir/wrongfile.txt"]
+args_error_4 = ["-i", input_file_0, "-w", "0"]
+args_error_5 = ["-i", input_file_0, "--id_column", "md5"]
 
 # argument sets that are designed to run the ENAClient to completion
 args_success_0 = ["-s", sequence_id_0]
@@ -28,7 +36,7 @@ args_success_4 = ["-i", input_file_0, "-o", output_file_0]
 args_success_5 = ["-s", sequence_id_0, "-o", output_file_1, "-f", "xml"]
 args_success_6 = ["-s", sequence_id_0, "-o", output_file_2, "-f", "yaml"]
 
-def test_parse_args():
+def test_parse_args(tmp_path):
     """test the ENAClient __parse_args method"""
 
     # assert ValueError raised - seq id and input file not specified
@@ -47,6 +55,35 @@ def test_parse_args():
     client = ENAClient(args=args_error_3)
     assert client.get_parser_error().__class__.__name__ == "FileNotFoundError"
 
+    # assert ValueError raised - empty worker pool
+    client = ENAClient(args=args_error_4)
+    assert client.get_parser_error().__class__.__name__ == "ValueError"
+
+    # assert ValueError raised - id column without a manifest
+    client = ENAClient(args=args_error_5)
+    assert client.get_parser_error().__class__.__name__ == "ValueError"
+
+    # assert ValueError raised - id column not in the manifest header
+    manifest_file = str(tmp_path / "manifest.tsv")
+    with open(manifest_file, "w") as handle:
+        handle.write("name\tmd5\nchr1\t%s\n" % (sequence_id_0))
+    client = ENAClient(args=["-i", manifest_file, "--id_column", "sha1"])
+    assert client.get_parser_error().__class__.__name__ == "ValueError"
+    assert "id column not found" in str(client.get_parser_error())
+    client = ENAClient(args=["-i", manifest_file, "--id_column", "md5"])
+    assert client.get_valid_args() == True
+
+    # assert stdin accepted as input file
+    client = ENAClient(args=["-i", "-", "--input_format", "tsv",
+                             "--id_column", "md5"])
+    assert client.get_valid_args() == True
+    assert client.get_input_format() == "tsv"
+    assert client.get_id_column() == "md5"
+
+    # assert number of workers correctly assigned
+    client = ENAClient(args=["-i", input_file_0, "-w", "8"])
+    assert client.get_workers() == 8
+
     # assert sequence id correctly assigned
     client = ENAClient(args=args_success_1)
     assert client.get_args_dict()["sequence_id"] == sequence_id_0
@@ -93,6 +130,316 @@ def test_call_and_output_all():
     client = ENAClient(args=args_success_6)
     client.call_and_output_all()
 
+def test_call_and_output_all_workers(tmp_path, monkeypatch):
+    """test call_and_output_all with a concurrent worker pool"""
+
+    # batch of 40 ids against a stub server that takes 50ms per request,
+    # every 4th id is known to the server
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(
+        sequence_id_0 if i % 4 == 0 else "%032x" % (i) for i in range(40)))
+    output_serial = tmp_path / "serial.json"
+    output_concurrent = tmp_path / "concurrent.json"
+
+    with StubRefgetServer(latency_secs=0.05) as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+
+        # assert a single worker sends one request at a time
+        ENAClient(args=["-i", str(input_file), "-o", str(output_serial),
+                        "--no_cache"]).call_and_output_all()
+        assert server.max_in_flight == 1
+
+        # assert the worker pool sends requests concurrently, never more
+        # than there are workers (wall-clock speedups are measured in
+        # benchmarks/bench_suite.py)
+        server.max_in_flight = 0
+        ENAClient(args=["-i", str(input_file), "-o", str(output_concurrent),
+                        "-w", "10", "--no_cache"]).call_and_output_all()
+        assert 1 < server.max_in_flight <= 10
+
+    # assert output is identical and in input order
+    assert output_concurrent.read_text() == output_serial.read_text()
+
+def wait_for_open_connections(server, count, timeout_secs=0.5):
+    """wait until the stub server has a number of connections open
+
+    Args:
+        server (StubRefgetServer): the stub server
+        count (int): number of open connections waited for
+        timeout_secs (float): seconds to wait at most
+
+    Returns:
+        open_connections (int): number of connections open once waited
+    """
+
+    deadline = time.time() + timeout_secs
+    while server.open_connections != count and time.time() < deadline:
+        time.sleep(0.01)
+    return server.open_connections
+
+def test_call_and_output_all_session(tmp_path, monkeypatch):
+    """test call_and_output_all reuses pooled keep-alive connections"""
+
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join("%032x" % (i) for i in range(20)))
+    output_file = str(tmp_path / "output.json")
+
+    with StubRefgetServer() as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+
+        # assert all requests in a serial batch share one connection
+        ENAClient(args=["-i", str(input_file), "-o", output_file,
+                        "--no_cache"]).call_and_output_all()
+        assert server.connection_count == 1
+
+        # assert a lifetime of 0 opens a new connection for every request,
+        # closing each replaced session once its request is done, with
+        # requests in flight on 4 workers
+        server.max_open_connections = server.open_connections
+        ENAClient(args=["-i", str(input_file), "-o", output_file,
+                        "--no_cache", "--connection_lifetime", "0",
+                        "-w", "4"]) \
+            .call_and_output_all()
+        assert server.connection_count == 1 + 20
+        assert server.max_open_connections <= 4 + 4
+        assert wait_for_open_connections(server, 0) == 0
+
+        # assert a replaced session is kept open while a request is in
+        # flight on it, and closed once it is handed back
+        session_pool = SessionPool(1, connection_lifetime=0)
+        session = session_pool.get_session()
+        session.get(server.url + "sequence/%s/metadata" % (sequence_id_0))
+        assert session_pool.get_session() is not session
+        assert wait_for_open_connections(server, 0) == 1
+        session_pool.release(session)
+        assert wait_for_open_connections(server, 0) == 0
+        session_pool.close()
+
+    # assert pool size set by constructor, overridden by command line,
+    # and defaulting to the number of workers when larger
+    client = ENAClient(args=["-s", sequence_id_0], pool_size=4)
+    assert client.get_pool_size() == 4
+    client = ENAClient(args=["-s", sequence_id_0, "--pool_size", "2"],
+                       pool_size=4)
+    assert client.get_pool_size() == 2
+    client = ENAClient(args=["-s", sequence_id_0, "-w", "32"])
+    assert client.get_pool_size() == 32
+
+def test_get_response_dict_resources(tmp_path):
+    """test lookups read shared resources without the resource lock"""
+
+    class CountingLock:
+        """lock counting how often it is acquired"""
+
+        def __init__(self):
+            self.acquired = 0
+
+        def __enter__(self):
+            self.acquired += 1
+
+        def __exit__(self, *exc_info):
+            pass
+
+    with StubRefgetServer() as server:
+        client = ENAClient(args=None)
+        client.set_base_urls([server.url])
+        client.set_cache_dir(str(tmp_path / "cache"))
+        assert client.get_response_dict(sequence_id_0)["status_code"] == 200
+
+        # assert once created, the session pool, cache, memo, rate limiter,
+        # retry policy and endpoints are read without taking the lock
+        lock = CountingLock()
+        client._ENAClient__resource_lock = lock
+        for i in range(5):
+            client.get_response_dict("%032x" % (i))
+        assert lock.acquired == 0
+        client.close()
+
+def test_call_and_output_all_cache(tmp_path, monkeypatch, capsys):
+    """test call_and_output_all answers repeated runs from the cache"""
+
+    args = ["-i", input_file_0, "-o", str(tmp_path / "output.json"),
+            "--cache_dir", str(tmp_path / "cache"), "--cache_negative_ttl",
+            "3600"]
+
+    with StubRefgetServer() as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+
+        # assert the first run requests every id, and the second none
+        ENAClient(args=args).call_and_output_all()
+        assert len(server.request_paths) == 5
+        first_output = open(args[3], "r").read()
+        ENAClient(args=args).call_and_output_all()
+        assert len(server.request_paths) == 5
+        assert open(args[3], "r").read() == first_output
+        assert "cache hit ratio: 100.0% (5 hits, 0 misses)" \
+            in capsys.readouterr().err
+
+        # assert refresh requests every id again, and no-cache bypasses
+        # the cache entirely
+        ENAClient(args=args + ["--refresh"]).call_and_output_all()
+        assert len(server.request_paths) == 10
+        ENAClient(args=args[:4] + ["--no-cache"]).call_and_output_all()
+        assert len(server.request_paths) == 15
+
+        # assert not found (404) responses are not cached by default, and
+        # no cache is used unless asked for
+        other_args = args[:4] + ["--cache_dir", str(tmp_path / "other")]
+        ENAClient(args=other_args).call_and_output_all()
+        ENAClient(args=other_args).call_and_output_all()
+        assert len(server.request_paths) == 20 + 4
+        ENAClient(args=args[:4]).call_and_output_all()
+        assert len(server.request_paths) == 29
+
+    # assert cached responses are output as if they came from the API
+    assert first_output.rstrip() \
+        == open("testdata/response_3.json", "r").read().rstrip()
+
+def test_call_and_output_all_duplicates(tmp_path, monkeypatch):
+    """test call_and_output_all requests each distinct id once per run"""
+
+    # 60 lines repeating 3 distinct ids, with concurrent workers
+    sequence_ids = [sequence_id_0, "%032x" % (1), "%032x" % (2)] * 20
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(sequence_ids))
+    output_file = tmp_path / "output.json"
+
+    with StubRefgetServer(latency_secs=0.05) as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+        ENAClient(args=["-i", str(input_file), "-o", str(output_file),
+                        "-w", "8", "--no_cache"]).call_and_output_all()
+
+    # assert one request per distinct id, and one record per input line
+    # in input order
+    assert len(server.request_paths) == 3
+    records = json.loads(output_file.read_text())
+    assert [record["req_seq_id"] for record in records] == sequence_ids
+    assert records[0]["metadata"]["length"] == 7156
+
+def test_call_and_output_all_resume(tmp_path, monkeypatch):
+    """test call_and_output_all resumes an interrupted batch"""
+
+    output_file = str(tmp_path / "output.json")
+    journal_file = output_file + ".journal"
+    args = ["-i", input_file_0, "-o", output_file, "--no_cache", "--resume"]
+    get_response_dict = ENAClient.get_response_dict
+    calls = []
+
+    def interrupted_get_response_dict(client, sequence_id):
+        # simulate the batch being killed on the 4th request
+        calls.append(sequence_id)
+        if len(calls) == 4:
+            raise KeyboardInterrupt()
+        return get_response_dict(client, sequence_id)
+
+    with StubRefgetServer() as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+
+        # assert the journal holds the 3 completed responses, after a
+        # partial line is written by the interrupted run
+        monkeypatch.setattr(ENAClient, "get_response_dict",
+                            interrupted_get_response_dict)
+        try:
+            ENAClient(args=args).call_and_output_all()
+        except KeyboardInterrupt:
+            pass
+        open(journal_file, "a").write('{"req_seq_id": "30501')
+        assert len(open(journal_file, "r").readlines()) == 4
+
+        # assert the resumed run only requests the remaining ids, and
+        # rebuilds the complete output
+        monkeypatch.setattr(ENAClient, "get_response_dict",
+                            get_response_dict)
+        ENAClient(args=args).call_and_output_all()
+        assert len(server.request_paths) == 3 + 2
+
+    output = open(output_file, "r").read().rstrip()
+    assert output == open("testdata/response_3.json", "r").read().rstrip()
+    assert not os.path.exists(journal_file)
+
+    # assert resume requires an input and output file
+    client = ENAClient(args=["-i", input_file_0, "--resume"])
+    assert client.get_parser_error().__class__.__name__ == "ValueError"
+
+def test_call_and_output_all_retries(tmp_path, monkeypatch, capsys):
+    """test call_and_output_all retries transient failures"""
+
+    sequence_ids = ["%032x" % (i) for i in range(5)]
+    faults = {
+        sequence_ids[0]: [503, 502],
+        sequence_ids[1]: [(429, 0.2)],
+        sequence_ids[2]: ["reset"],
+        sequence_ids[3]: [500] * 5,
+    }
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(sequence_ids))
+    output_file = tmp_path / "output.json"
+
+    with StubRefgetServer(faults=faults) as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+        start = time.time()
+        ENAClient(args=["-i", str(input_file), "-o", str(output_file),
+                        "--no_cache", "--backoff_base", "0.01"]) \
+            .call_and_output_all()
+        elapsed_secs = time.time() - start
+
+    # assert transient failures were retried until the request succeeded,
+    # and the persistent failure reported once retries ran out
+    records = json.loads(output_file.read_text())
+    assert [record["status_code"] for record in records] \
+        == [404, 404, 404, 500, 404]
+    assert records[3]["error"] == "server error"
+    assert "error" not in records[0]
+
+    # assert the Retry-After header was honoured, and the counters reported
+    assert elapsed_secs >= 0.2
+    assert "retries: 7 (1 requests failed after all retries), throttled: 1" \
+        in capsys.readouterr().err
+
+def test_call_and_output_all_request_error(tmp_path, monkeypatch):
+    """test call_and_output_all reports other request failures, without
+    retrying them or aborting the batch"""
+
+    sequence_ids = ["%032x" % (i) for i in range(3)]
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(sequence_ids))
+    output_file = tmp_path / "output.json"
+
+    # every request is redirected in a loop, until too many redirects
+    with StubRefgetServer() as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url + "loop/")
+        ENAClient(args=["-i", str(input_file), "-o", str(output_file),
+                        "--no_cache", "--backoff_base", "0.01"]) \
+            .call_and_output_all()
+        request_count = len(server.request_paths)
+
+    records = json.loads(output_file.read_text())
+    assert [(record["status_code"], record["error"]) for record in records] \
+        == [("503", "request error")] * 3
+    assert request_count == 3 * (1 + 30)
+
+def test_call_and_output_all_stdin(monkeypatch, capsysbinary):
+    """test call_and_output_all reads a manifest from stdin"""
+
+    manifest = "\n".join(["# contigs", "name\tmd5",
+                          "chr1\t%s" % (sequence_id_0), "",
+                          "chr2\tnot-a-checksum", "chr3\t%032x" % (1)])
+    monkeypatch.setattr(sys, "stdin", io.StringIO(manifest))
+
+    with StubRefgetServer() as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+        ENAClient(args=["-i", "-", "--input_format", "tsv", "--id_column",
+                        "md5", "-f", "ndjson", "--no_cache"]) \
+            .call_and_output_all()
+
+    # assert comment and blank lines were skipped, and the malformed id
+    # reported without a request
+    records = [json.loads(line) for line
+               in capsysbinary.readouterr().out.splitlines()]
+    assert [record["status_code"] for record in records] == [200, "400", 404]
+    assert records[1]["error"] == "invalid sequence id"
+    assert len(server.request_paths) == 2
+
 def test_call_refget_api():
     """test the ENAClient call_refget_api method"""
 
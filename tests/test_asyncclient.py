@@ -0,0 +1,72 @@
+"""test_asyncclient.py - test AsyncENAClient scenarios
+
+This module contains test scenarios for the AsyncENAClient.
+"""
+
+import asyncio
+import time
+from enaclient.enaclient import ENAClient
+from enaclient.asyncclient import AsyncENAClient
+from tests.stub_server import StubRefgetServer
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+sequence_id_1 = "3050107579885e1608e6fe50fae3f8d1"
+
+def test_fetch(monkeypatch):
+    """test the AsyncENAClient fetch method"""
+
+    async def fetch_both(client):
+        return await asyncio.gather(client.fetch(sequence_id_0),
+                                    client.fetch(sequence_id_1))
+
+    with StubRefgetServer() as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+        client = AsyncENAClient()
+        found, not_found = asyncio.run(fetch_both(client))
+
+    # assert response dicts have the same shape as the ENAClient's
+    assert found["req_seq_id"] == sequence_id_0
+    assert found["status_code"] == 200
+    assert found["metadata"]["length"] == 7156
+    assert not_found["status_code"] == 404
+
+    # assert the shared formatter produces the ENAClient's json output
+    correct_output = open("testdata/response_1.json", "r").read().rstrip()
+    assert client.format_response(found, 0) == correct_output
+
+def test_fetch_many(monkeypatch):
+    """test the AsyncENAClient fetch_many method"""
+
+    pulled = []
+
+    def sequence_ids():
+        # never-ending id iterator, records how many ids were pulled
+        i = 0
+        while True:
+            pulled.append(i)
+            yield "%032x" % (i)
+            i += 1
+
+    async def consume(client, limit):
+        response_dicts = []
+        async for response_dict in client.fetch_many(sequence_ids(),
+                                                     concurrency=5):
+            response_dicts.append(response_dict)
+            if len(response_dicts) == limit:
+                break
+        return response_dicts
+
+    with StubRefgetServer(latency_secs=0.05) as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+        start = time.time()
+        response_dicts = asyncio.run(consume(AsyncENAClient(), 20))
+        elapsed_secs = time.time() - start
+
+    # assert responses are yielded in input order
+    assert [r["req_seq_id"] for r in response_dicts] \
+        == ["%032x" % (i) for i in range(20)]
+
+    # assert requests ran concurrently, and that the input was only read
+    # one window ahead of the consumer
+    assert elapsed_secs < 20 * 0.05 / 2
+    assert len(pulled) <= 20 + 5
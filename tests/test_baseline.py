@@ -0,0 +1,133 @@
+"""test_baseline.py - test diff mode scenarios
+
+This module contains test scenarios for the BaselineIndex, and for
+ENAClient batches compared with a previous output (--baseline).
+"""
+
+import gzip
+import json
+import pytest
+from enaclient.baseline import BaselineIndex
+from enaclient.enaclient import ENAClient
+from tests.stub_server import StubRefgetServer
+
+sequence_ids = ["%032x" % (i) for i in range(4)]
+
+def make_metadata(sequence_id, length):
+    """make the metadata of a found sequence
+
+    Args:
+        sequence_id (str): md5 of the sequence
+        length (int): length of the sequence
+
+    Returns:
+        metadata (dict): metadata, as returned by the API
+    """
+    return {"id": sequence_id, "md5": sequence_id, "trunc512": None,
+            "length": length, "aliases": []}
+
+def test_baseline_index(tmp_path):
+    """test the BaselineIndex compares responses with a previous output"""
+
+    found = {"req_seq_id": sequence_ids[0], "status_code": 200,
+             "metadata": make_metadata(sequence_ids[0], 10)}
+    not_found = {"req_seq_id": sequence_ids[1], "status_code": 404,
+                 "metadata": make_metadata(None, None)}
+    failed = {"req_seq_id": sequence_ids[3], "status_code": "503",
+              "error": "connection error"}
+    baseline_file = tmp_path / "baseline.ndjson.gz"
+    baseline_file.write_bytes(gzip.compress("".join(
+        json.dumps(response_dict) + "\n"
+        for response_dict in [found, not_found, failed]).encode("utf-8")))
+    baseline = BaselineIndex(str(baseline_file))
+    assert len(baseline) == 3
+
+    # assert the key order of a record does not matter, and each category
+    # is counted
+    assert baseline.compare(dict(reversed(list(found.items())))) \
+        == BaselineIndex.UNCHANGED
+    assert baseline.compare(dict(not_found)) == BaselineIndex.UNCHANGED
+    assert baseline.compare(dict(found, metadata=make_metadata(
+        sequence_ids[0], 11))) == BaselineIndex.CHANGED
+    assert baseline.compare(dict(not_found, req_seq_id=sequence_ids[0])) \
+        == BaselineIndex.NOT_FOUND
+    assert baseline.compare(dict(not_found, error="moved")) \
+        == BaselineIndex.CHANGED
+    assert baseline.compare({"req_seq_id": sequence_ids[0],
+                             "status_code": "408",
+                             "error": "read timeout"}) \
+        == BaselineIndex.FAILED
+    assert baseline.compare(dict(failed)) == BaselineIndex.FAILED
+    assert baseline.compare(dict(found, req_seq_id=sequence_ids[2])) \
+        == BaselineIndex.ADDED
+    assert baseline.counts == {"added": 1, "changed": 2, "not found": 1,
+                               "failed": 2, "unchanged": 2}
+
+    # assert other files are reported
+    other_file = tmp_path / "other.json"
+    other_file.write_text('[{"id": 1}]')
+    with pytest.raises(ValueError):
+        BaselineIndex(str(other_file))
+
+def test_call_and_output_all_baseline(tmp_path, capsys):
+    """test a batch compared with a previous output only writes changes,
+    revalidating cached responses with conditional requests"""
+
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(sequence_ids[:3]))
+    baseline_file = tmp_path / "baseline.ndjson"
+    output_file = tmp_path / "output.ndjson"
+    sequences = dict((sequence_id, make_metadata(sequence_id, 10))
+                     for sequence_id in sequence_ids[:3])
+
+    with StubRefgetServer(sequences=sequences) as server:
+        args = ["-f", "ndjson", "--base_url", server.url, "--cache_dir",
+                str(tmp_path / "cache")]
+        ENAClient(args=args + ["-i", str(input_file), "-o",
+                               str(baseline_file)]).call_and_output_all()
+
+        # change one sequence, remove another, and add one to the input
+        server.sequences[sequence_ids[1]] = make_metadata(sequence_ids[1], 20)
+        del server.sequences[sequence_ids[2]]
+        input_file.write_text("\n".join(sequence_ids))
+        capsys.readouterr()
+        client = ENAClient(args=args + ["-i", str(input_file), "-o",
+                                        str(output_file), "--baseline",
+                                        str(baseline_file)])
+        client.call_and_output_all()
+
+    # assert only the changed, newly not found and added records are
+    # written, and the unchanged sequence was answered with a 304
+    records = [json.loads(line)
+               for line in output_file.read_text().splitlines()]
+    assert [(record["req_seq_id"], record["status_code"])
+            for record in records] \
+        == [(sequence_ids[1], 200), (sequence_ids[2], 404),
+            (sequence_ids[3], 404)]
+    assert records[0]["metadata"]["length"] == 20
+    assert client.get_not_modified() == 1
+    err = capsys.readouterr().err
+    assert "baseline: 1 added, 1 changed, 1 newly not found, 0 failed, 1 " \
+        + "unchanged" in err
+    assert "revalidated: 1 not modified" in err
+
+def test_parse_args_baseline(tmp_path):
+    """test invalid diff mode args are reported"""
+
+    input_file = tmp_path / "input.txt"
+    input_file.write_text(sequence_ids[0])
+    baseline_file = tmp_path / "baseline.json"
+    baseline_file.write_text("[]")
+    for args in [["-i", str(input_file), "--baseline",
+                  str(tmp_path / "nofile.json")],
+                 ["-i", str(input_file), "-o", str(tmp_path / "o.json"),
+                  "--resume", "--baseline", str(baseline_file)],
+                 ["-i", str(input_file), "--processes", "2", "--baseline",
+                  str(baseline_file)]]:
+        client = ENAClient(args=args)
+        assert client.get_valid_args() is False
+
+    client = ENAClient(args=["-i", str(input_file), "--baseline",
+                             str(baseline_file)])
+    assert client.get_valid_args() is True
+    assert client.get_revalidate() is True
@@ -0,0 +1,79 @@
+"""test_batch.py - test batched metadata lookup scenarios
+
+This module contains test scenarios for the ENAClient fetch_metadata_batch
+and iter_metadata_batch library methods.
+"""
+
+from enaclient.enaclient import ENAClient
+from tests.stub_server import StubRefgetServer
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+batch_path = "sequence/metadata/batch"
+
+def make_client(server, batch_path=None, cache_dir=None):
+    """make a library client using the stub server
+
+    Args:
+        server (StubRefgetServer): the stub server
+        batch_path (str): path of the batch endpoint, None if not used
+        cache_dir (str): directory of the on-disk cache, None if not used
+
+    Returns:
+        client (ENAClient): the client
+    """
+
+    client = ENAClient(args=None)
+    client.set_base_urls([server.url])
+    client.set_batch_path(batch_path)
+    if cache_dir is not None:
+        client.set_cache_dir(cache_dir)
+        client.set_cache_negative_ttl(3600)
+    return client
+
+def test_fetch_metadata_batch(tmp_path):
+    """test metadata is fetched per sequence id without a batch endpoint"""
+
+    sequence_ids = [sequence_id_0, "%032x" % (1), "bad", sequence_id_0] \
+        + ["%032x" % (i) for i in range(2, 12)]
+
+    with StubRefgetServer() as server:
+        client = make_client(server, batch_path, str(tmp_path / "cache"))
+        response_dicts = client.fetch_metadata_batch(sequence_ids,
+                                                     chunk_size=5)
+
+        # assert one response per distinct sequence id, in input order, and
+        # that the batch endpoint was probed once before falling back
+        assert list(response_dicts) == list(dict.fromkeys(sequence_ids))
+        assert response_dicts[sequence_id_0]["metadata"]["length"] == 7156
+        assert response_dicts["%032x" % (1)]["status_code"] == 404
+        assert response_dicts["bad"]["status_code"] == "400"
+        assert [path.endswith(batch_path) for path in server.request_paths] \
+            .count(True) == 1
+        assert len(server.request_paths) == 1 + 12
+
+        # assert a second batch is answered by the on-disk cache
+        request_count = len(server.request_paths)
+        client = make_client(server, cache_dir=str(tmp_path / "cache"))
+        assert client.fetch_metadata_batch(sequence_ids) == response_dicts
+        assert len(server.request_paths) == request_count
+        assert client.get_cache().hits == 12
+
+def test_iter_metadata_batch():
+    """test metadata is fetched in chunks from a batch endpoint"""
+
+    sequence_ids = ["%032x" % (i) for i in range(250)] + [sequence_id_0]
+
+    with StubRefgetServer(batch_path=batch_path) as server:
+        client = make_client(server, batch_path)
+        client.set_cache_dir(None)
+        response_dicts = list(client.iter_metadata_batch(
+            iter(sequence_ids), chunk_size=100))
+
+    # assert one POST per chunk, and responses in input order with the same
+    # shape as responses to single requests
+    assert server.request_paths == ["/" + batch_path] * 3
+    assert [response_dict["req_seq_id"] for response_dict
+            in response_dicts] == sequence_ids
+    assert response_dicts[-1] == {"req_seq_id": sequence_id_0,
+        "status_code": 200, "metadata": server.sequences[sequence_id_0]}
+    assert response_dicts[0]["status_code"] == 404
@@ -0,0 +1,167 @@
+"""test_cache.py - test MetadataCache scenarios
+
+This module contains test scenarios for the MetadataCache.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from enaclient.cache import MetadataCache, LRUCache, SingleFlight
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+sequence_id_1 = "3050107579885e1608e6fe50fae3f8d1"
+
+found_0 = {"req_seq_id": sequence_id_0, "status_code": 200,
+           "metadata": {"id": sequence_id_0, "md5": sequence_id_0,
+                        "trunc512": None, "length": 7156, "aliases": []}}
+not_found_1 = {"req_seq_id": sequence_id_1, "status_code": 404,
+               "metadata": {"id": None, "md5": None, "trunc512": None,
+                            "length": None, "aliases": []}}
+timeout_1 = {"req_seq_id": sequence_id_1, "status_code": "408",
+             "error": "connection timeout"}
+
+def test_get_put(tmp_path):
+    """test the MetadataCache get and put methods"""
+
+    cache = MetadataCache(str(tmp_path), 60, 60, 100)
+
+    # assert responses round trip with the same keys and key order, and
+    # persist across instances once closed
+    cache.put(sequence_id_0, found_0)
+    cache.put(sequence_id_1, not_found_1)
+    cache.close()
+    cache = MetadataCache(str(tmp_path), 60, 60, 100)
+    assert list(cache.get(sequence_id_0).items()) == list(found_0.items())
+    assert cache.get(sequence_id_1) == not_found_1
+
+    # assert timeouts are not cached, and hits/misses are counted
+    cache.put(sequence_id_1, timeout_1)
+    assert cache.get(sequence_id_1) == not_found_1
+    assert cache.get("0" * 32) is None
+    assert (cache.hits, cache.misses) == (3, 1)
+    assert cache.get_hit_ratio() == 0.75
+
+def test_ttl(tmp_path):
+    """test found and not found responses expire separately"""
+
+    cache = MetadataCache(str(tmp_path), 60, 0.05, 100)
+    cache.put(sequence_id_0, found_0)
+    cache.put(sequence_id_1, not_found_1)
+    time.sleep(0.1)
+    assert cache.get(sequence_id_0) == found_0
+    assert cache.get(sequence_id_1) is None
+
+def test_eviction(tmp_path):
+    """test least recently used responses are evicted"""
+
+    cache = MetadataCache(str(tmp_path), 60, 60, 10)
+    sequence_ids = ["%032x" % (i) for i in range(11)]
+    for sequence_id in sequence_ids[:10]:
+        cache.put(sequence_id, dict(found_0, req_seq_id=sequence_id))
+        time.sleep(0.001)
+
+    # touch the oldest entry, so that it is the most recently used
+    assert cache.get(sequence_ids[0]) is not None
+    cache.put(sequence_ids[10], dict(found_0, req_seq_id=sequence_ids[10]))
+
+    # assert evicted down to 90% of the maximum, least recently used first
+    assert cache.get(sequence_ids[0]) is not None
+    assert cache.get(sequence_ids[10]) is not None
+    assert cache.get(sequence_ids[1]) is None
+    assert cache.get(sequence_ids[2]) is None
+    assert cache.get(sequence_ids[3]) is not None
+
+def test_validators(tmp_path):
+    """test ETags are kept as validators, including for expired responses
+    and in caches created before validators were kept"""
+
+    # create a cache with the table of earlier versions, without ETags
+    connection = sqlite3.connect(os.path.join(str(tmp_path),
+                                              MetadataCache.FILE_NAME))
+    connection.execute("CREATE TABLE responses (sequence_id TEXT PRIMARY "
+                       + "KEY, status_code INTEGER NOT NULL, body TEXT NOT "
+                       + "NULL, expires_at REAL NOT NULL, accessed_at REAL "
+                       + "NOT NULL)")
+    connection.execute("INSERT INTO responses VALUES (?, 200, '{}', 0, 0)",
+                       (sequence_id_1,))
+    connection.commit()
+    connection.close()
+
+    cache = MetadataCache(str(tmp_path), 0.05, 60, 100)
+    cache.put(sequence_id_0, found_0, '"etag-0"')
+    cache.put_many([not_found_1], {sequence_id_1: '"etag-1"'})
+    time.sleep(0.1)
+    assert cache.get(sequence_id_0) is None
+    validators = cache.get_validators([sequence_id_0, sequence_id_1,
+                                       "0" * 32])
+    assert validators == {sequence_id_0: (found_0, '"etag-0"'),
+                          sequence_id_1: (not_found_1, '"etag-1"')}
+
+    # assert responses cached without an ETag have no validator
+    cache.put(sequence_id_0, found_0)
+    assert cache.get_validators([sequence_id_0]) == {}
+
+def test_lru_cache():
+    """test the LRUCache evicts the least recently used value"""
+
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+def test_single_flight():
+    """test the SingleFlight collapses concurrent calls for a key"""
+
+    single_flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def slow_call(key):
+        calls.append(key)
+        release.wait()
+        return key.upper()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        single_flight.do("a", slow_call, "a"))) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    while single_flight.collapsed < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    # assert the function ran once, and every caller got its result
+    assert calls == ["a"]
+    assert results == ["A"] * 5
+
+    # assert an interrupt of the running call is raised in waiting callers
+    # too, rather than handing them no result
+    release.clear()
+
+    def interrupted_call(key):
+        release.wait()
+        raise KeyboardInterrupt()
+
+    errors = []
+    def wait_for_call():
+        try:
+            single_flight.do("b", interrupted_call, "b")
+        except BaseException as e:
+            errors.append(type(e))
+    threads = [threading.Thread(target=wait_for_call) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    while single_flight.collapsed < 6:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert errors == [KeyboardInterrupt] * 3
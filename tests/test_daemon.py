@@ -0,0 +1,201 @@
+"""test_daemon.py - test daemon mode scenarios
+
+This module contains test scenarios for the MetadataDaemon, the DaemonClient,
+and command line runs sending their lookups to a running daemon.
+"""
+
+import contextlib
+import json
+import threading
+import pytest
+from enaclient.daemon import MetadataDaemon, main
+from enaclient.enaclient import ENAClient
+from enaclient.lighthttp import DaemonClient, DaemonError
+from tests.stub_server import StubRefgetServer
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+sequence_id_1 = "%032x" % (1)
+
+@contextlib.contextmanager
+def running_daemon(address, base_url):
+    """run a daemon in a thread, looking up sequence ids with a stub server
+
+    Args:
+        address (str): socket path or http://host:port URL of the daemon
+        base_url (str): base URL of the stub server
+
+    Yields:
+        metadata_daemon (MetadataDaemon): the running daemon
+    """
+
+    client = ENAClient(args=None)
+    client.set_base_urls([base_url])
+    client.set_cache_dir(None)
+    metadata_daemon = MetadataDaemon(client, address)
+    thread = threading.Thread(target=metadata_daemon.serve_forever)
+    thread.start()
+    try:
+        yield metadata_daemon
+    finally:
+        metadata_daemon.shutdown()
+        thread.join()
+        metadata_daemon.close()
+
+def test_daemon_lookups(tmp_path):
+    """test the daemon answers lookups over its Unix socket"""
+
+    socket_path = str(tmp_path / "daemon.sock")
+    with StubRefgetServer() as server:
+        with running_daemon(socket_path, server.url) as metadata_daemon:
+            daemon = DaemonClient(socket_path)
+            assert daemon.is_running()
+
+            # assert single and batch lookups are answered in input order,
+            # each sequence id requested from the API once
+            assert daemon.get_response_dict(sequence_id_0)["status_code"] \
+                == 200
+            response_dicts = daemon.get_response_dicts(
+                [sequence_id_1, "not-a-checksum", sequence_id_0])
+            assert [(response_dict["req_seq_id"],
+                     response_dict["status_code"])
+                    for response_dict in response_dicts] \
+                == [(sequence_id_1, 404), ("not-a-checksum", "400"),
+                    (sequence_id_0, 200)]
+            assert len(server.request_paths) == 2
+            assert daemon.get_health()["lookups"] == 4
+
+            # assert a second daemon does not take over the socket
+            with pytest.raises(ValueError):
+                MetadataDaemon(ENAClient(args=None), socket_path)
+            daemon.close()
+
+    # assert the socket is removed once stopped, and a stale socket left
+    # behind is replaced
+    assert not (tmp_path / "daemon.sock").exists()
+    (tmp_path / "daemon.sock").write_text("")
+    assert not DaemonClient(socket_path).is_running()
+    MetadataDaemon(ENAClient(args=None), socket_path).close()
+
+def test_daemon_lookup_error(tmp_path, monkeypatch):
+    """test lookups that fail in the daemon are answered with an error"""
+
+    def fail(sequence_id):
+        raise RuntimeError("lookup of %s failed" % (sequence_id))
+
+    socket_path = str(tmp_path / "daemon.sock")
+    with StubRefgetServer() as server:
+        with running_daemon(socket_path, server.url) as metadata_daemon:
+            monkeypatch.setattr(metadata_daemon.client, "get_response_dict",
+                                fail)
+            daemon = DaemonClient(socket_path)
+
+            # assert both lookups are answered with 500 and the error, on a
+            # connection kept alive
+            with pytest.raises(DaemonError,
+                               match="500 .*lookup of %s failed"
+                               % (sequence_id_0)):
+                daemon.get_response_dict(sequence_id_0)
+            with pytest.raises(DaemonError, match="500 .*lookup of"):
+                daemon.get_response_dicts([sequence_id_0, sequence_id_1])
+            assert daemon.get_health()["lookups"] == 3
+            daemon.close()
+
+def test_daemon_coalesces_lookups():
+    """test concurrent lookups of the same sequence id, over localhost http,
+    are sent to the API once"""
+
+    with StubRefgetServer(latency_secs=0.2) as server:
+        with running_daemon("http://127.0.0.1:0", server.url) \
+                as metadata_daemon:
+            daemon = DaemonClient(metadata_daemon.address)
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(
+                           daemon.get_response_dict(sequence_id_0)))
+                       for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert [response_dict["status_code"]
+                    for response_dict in results] == [200] * 8
+            assert len(server.request_paths) == 1
+            daemon.close()
+
+def test_call_and_output_all_daemon(tmp_path, monkeypatch, capsys):
+    """test command line runs use a daemon only when asked to"""
+
+    monkeypatch.setenv("ENACLIENT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("ENACLIENT_DAEMON", raising=False)
+    (tmp_path / "cache").mkdir()
+    socket_path = ENAClient.default_daemon_address()
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("%s\n%s\n%s\n" % (sequence_id_0, sequence_id_1,
+                                            sequence_id_0))
+    output_file = tmp_path / "output.json"
+
+    with StubRefgetServer() as server:
+        with running_daemon(socket_path, server.url):
+            # assert a daemon on the default socket is not used unless
+            # --daemon or ENACLIENT_DAEMON is given
+            client = ENAClient(args=["-s", sequence_id_0])
+            assert client.get_daemon_address() is None
+
+            # assert single and batch runs are answered by the daemon,
+            # which requests each sequence id once
+            client = ENAClient(args=["-s", sequence_id_0, "--daemon"])
+            assert client.get_daemon_address() == socket_path
+            client.call_and_output_all()
+            assert json.loads(capsys.readouterr().out)[0]["metadata"]["id"] \
+                == sequence_id_0
+            monkeypatch.setenv("ENACLIENT_DAEMON", socket_path)
+            ENAClient(args=["-i", str(input_file), "-o", str(output_file),
+                            "-w", "2"]).call_and_output_all()
+            assert [record["req_seq_id"] for record
+                    in json.loads(output_file.read_text())] \
+                == [sequence_id_0, sequence_id_1, sequence_id_0]
+            assert len(server.request_paths) == 2
+            assert "daemon: lookups sent to" in capsys.readouterr().err
+
+            # assert --no_daemon overrides ENACLIENT_DAEMON, and options
+            # changing how lookups are made can not be combined with it
+            client = ENAClient(args=["-s", sequence_id_0, "--no_daemon"])
+            assert client.get_daemon_address() is None
+            for args in [["--base_url", server.url], ["--refresh"],
+                         ["--no_cache"]]:
+                client = ENAClient(args=["-s", sequence_id_0] + args)
+                assert isinstance(client.get_parser_error(), ValueError)
+                assert "ENACLIENT_DAEMON" in str(client.get_parser_error())
+            monkeypatch.delenv("ENACLIENT_DAEMON")
+
+            # assert options the daemon applies itself are ignored, with a
+            # warning, and others can not be combined with --daemon
+            client = ENAClient(args=["-s", sequence_id_0, "--daemon",
+                                     socket_path, "--max_retries", "0"])
+            assert client.get_daemon_address() == socket_path
+            assert "daemon: --max_retries ignored" in capsys.readouterr().err
+            client = ENAClient(args=["-s", sequence_id_0, "--daemon",
+                                     socket_path, "--base_url", server.url])
+            assert isinstance(client.get_parser_error(), ValueError)
+
+        # assert a daemon that stopped is reported, and lookups are made
+        # directly
+        client = ENAClient(args=["-s", sequence_id_0, "--daemon"])
+        assert isinstance(client.get_parser_error(), FileNotFoundError)
+        stale_path = tmp_path / "stale.sock"
+        stale_path.write_text("")
+        client = ENAClient(args=None)
+        client.set_base_urls([server.url])
+        client.set_daemon_address(str(stale_path))
+        assert client.get_response_dict(sequence_id_1)["status_code"] == 404
+        assert client.get_daemon_address() is None
+        assert "looking up directly" in capsys.readouterr().err
+        client.close()
+
+def test_serve_args(tmp_path):
+    """test invalid serve args are reported"""
+
+    assert main(["--mirror", str(tmp_path / "nofile.sqlite3")]) == 1
+    assert main(["--workers", "0"]) == 1
+    assert main(["--base_url", "ftp://example.org"]) == 1
+    with pytest.raises(DaemonError):
+        DaemonClient(str(tmp_path / "nofile.sock")).get_health()
@@ -0,0 +1,124 @@
+"""test_enab.py - test enab output scenarios
+
+This module contains test scenarios for writing enab output, and looking up
+its records with the EnabReader.
+"""
+
+import pytest
+from enaclient.digestindex import DigestIndexWriter, DigestIndexReader, \
+                                  identifier_key
+from enaclient.enab import EnabReader
+from enaclient.enaclient import ENAClient
+from enaclient.readers import read_output_records
+from enaclient.writers import EnabWriter
+from tests.stub_server import StubRefgetServer
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+trunc512_0 = "959cb1883fc1ca9ae1394ceb475a356ead1ecceff5824ae7"
+
+records = [
+    {"req_seq_id": sequence_id_0, "status_code": 200,
+     "metadata": {"id": sequence_id_0, "md5": sequence_id_0,
+                  "trunc512": trunc512_0, "length": 7156,
+                  "aliases": [{"alias": "chrM", "naming_authority": "insdc"}]}},
+    {"req_seq_id": trunc512_0, "status_code": 404,
+     "metadata": {"id": None, "md5": None, "trunc512": None, "length": None,
+                  "aliases": []}},
+    {"req_seq_id": "chrM\nété", "status_code": "400",
+     "error": "invalid sequence id"},
+    {"req_seq_id": "not an id", "status_code": "408",
+     "error": "connection timeout"},
+    {"req_seq_id": "not an id", "status_code": "408",
+     "error": "read timeout"},
+]
+
+def write_enab(path, response_dicts):
+    """write response dictionaries to an enab file
+
+    Args:
+        path (str): path to the enab file
+        response_dicts (list): records to write
+    """
+
+    with open(path, "wb") as handle:
+        writer = EnabWriter(handle)
+        writer.write_prefix()
+        for inc, response_dict in enumerate(response_dicts):
+            writer.write_record(response_dict, inc)
+        writer.write_suffix()
+
+def test_enab_reader(tmp_path):
+    """test records are found by req_seq_id, and read back in order"""
+
+    path = str(tmp_path / "output.enab")
+    write_enab(path, records)
+
+    with EnabReader(path) as reader:
+        # assert digests are found whatever their case, other identifiers
+        # as written, and the last record of a repeated req_seq_id wins
+        assert reader.get(sequence_id_0) == records[0]
+        assert reader.get(trunc512_0.upper()) == records[1]
+        assert reader.get("chrM\nété") == records[2]
+        assert reader.get("not an id") == records[4]
+        assert reader.get("chrm") is None
+        assert reader.get("%032x" % (1)) is None
+        assert "not an id" in reader
+        assert reader.get_result(sequence_id_0).length == 7156
+        assert len(reader) == 4
+        assert list(reader) == records
+
+    # assert enab output is read back like JSON/NDJSON output, and other
+    # files are rejected
+    assert list(read_output_records(path)) == records
+    (tmp_path / "output.json").write_text("[]")
+    with pytest.raises(ValueError):
+        EnabReader(str(tmp_path / "output.json"))
+
+def test_digest_index_spill(tmp_path):
+    """test index entries spilled to sorted runs are merged, the entry
+    added last winning"""
+
+    path = str(tmp_path / "index.bin")
+    for spill_entries in [1, 3, 1000]:
+        with open(path, "wb") as handle:
+            writer = DigestIndexWriter(handle, b"TESTTEST", spill_entries)
+            for i in range(50):
+                identifier = "id-%s" % (i % 17)
+                location = writer.write_record(
+                    ("%s=%s\n" % (identifier, i)).encode("utf-8"))
+                writer.add_key(identifier_key(identifier), location)
+            assert writer.finish() == 17
+        reader = DigestIndexReader(path, b"TESTTEST")
+        assert [reader.get(identifier_key("id-%s" % (i))) for i in range(17)] \
+            == [("id-%s=%s\n" % (i, i + 34 if i < 16 else i + 17))
+                .encode("utf-8") for i in range(17)]
+        assert len(list(reader.iter_records())) == 50
+        reader.close()
+
+def test_call_and_output_all_enab(tmp_path):
+    """test batches write enab output, sharded or not"""
+
+    sequence_ids = ["%032x" % (i) for i in range(20)] \
+        + [sequence_id_0, "not-a-checksum"]
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(sequence_ids))
+    single_file = tmp_path / "single.enab"
+    sharded_file = tmp_path / "sharded.enab"
+
+    with StubRefgetServer() as server:
+        args = ["-i", str(input_file), "-f", "enab", "--base_url", server.url]
+        ENAClient(args=args + ["-o", str(single_file)]).call_and_output_all()
+        ENAClient(args=args + ["-o", str(sharded_file), "--processes", "2"]) \
+            .call_and_output_all()
+
+    assert sharded_file.read_bytes() == single_file.read_bytes()
+    with EnabReader(str(single_file)) as reader:
+        assert [response_dict["req_seq_id"] for response_dict in reader] \
+            == sequence_ids
+        assert reader.get(sequence_id_0)["metadata"]["length"] == 7156
+        assert reader.get("not-a-checksum")["status_code"] == "400"
+        assert reader.get("%032x" % (3))["status_code"] == 404
+
+    # assert enab output requires an output file
+    client = ENAClient(args=["-s", sequence_id_0, "-f", "enab"])
+    assert isinstance(client.get_parser_error(), ValueError)
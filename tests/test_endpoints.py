@@ -0,0 +1,133 @@
+"""test_endpoints.py - test API endpoint scenarios
+
+This module contains test scenarios for the EndpointPool, and for ENAClient
+failover and hedged requests across endpoints.
+"""
+
+import json
+import time
+from enaclient.enaclient import ENAClient
+from enaclient.endpoints import EndpointPool
+from tests.stub_server import StubRefgetServer
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+
+def test_endpoint_pool(monkeypatch):
+    """test the EndpointPool fails over while an endpoint is down"""
+
+    monkeypatch.setattr(EndpointPool, "COOLDOWN_SECS", 0.2)
+    endpoint_pool = EndpointPool(["http://primary", "http://secondary/"])
+    primary, secondary = endpoint_pool.endpoints
+    assert primary.get_metadata_url(sequence_id_0) \
+        == "http://primary/sequence/%s/metadata" % (sequence_id_0)
+
+    # assert the preferred endpoint is used until it fails repeatedly, and
+    # a retry avoids the endpoint it failed on
+    assert endpoint_pool.choose() is primary
+    assert endpoint_pool.choose(exclude=primary) is secondary
+    for i in range(EndpointPool.FAILURE_THRESHOLD - 1):
+        endpoint_pool.record_failure(primary)
+    assert endpoint_pool.choose() is primary
+    endpoint_pool.record_failure(primary)
+    assert endpoint_pool.choose() is secondary
+    assert endpoint_pool.choose_hedge(secondary) is None
+
+    # assert the endpoint is tried again after its cooldown, a failure
+    # marks it down again for longer, and a success brings it back up
+    time.sleep(0.25)
+    assert endpoint_pool.choose() is primary
+    endpoint_pool.record_failure(primary)
+    assert endpoint_pool.choose() is secondary
+    assert primary.cooldown_secs == 0.4
+    endpoint_pool.record_success(primary)
+    assert endpoint_pool.choose() is primary
+
+    # assert every endpoint down uses the one that comes back first
+    for i in range(EndpointPool.FAILURE_THRESHOLD):
+        endpoint_pool.record_failure(secondary)
+        endpoint_pool.record_failure(primary)
+    assert endpoint_pool.choose() is secondary
+
+def test_endpoint_p95():
+    """test the EndpointPool hedges after enough latencies are recorded"""
+
+    endpoint_pool = EndpointPool(["http://primary"])
+    endpoint = endpoint_pool.endpoints[0]
+
+    # assert no hedging until enough latencies are recorded
+    for latency_secs in range(1, EndpointPool.MIN_LATENCIES):
+        endpoint_pool.record_latency(endpoint, latency_secs / 100.0)
+    assert endpoint_pool.get_hedge_delay(endpoint) is None
+    endpoint_pool.record_latency(endpoint, EndpointPool.MIN_LATENCIES / 100.0)
+    assert endpoint_pool.get_hedge_delay(endpoint) == 0.19
+
+    # assert the p95 is updated periodically
+    for i in range(EndpointPool.P95_UPDATE_EVERY - 1):
+        endpoint_pool.record_latency(endpoint, 1.0)
+    assert endpoint_pool.get_hedge_delay(endpoint) == 0.19
+    endpoint_pool.record_latency(endpoint, 1.0)
+    assert endpoint_pool.get_hedge_delay(endpoint) == 1.0
+
+def test_call_and_output_all_failover(tmp_path, monkeypatch, capsys):
+    """test call_and_output_all fails over to a second endpoint"""
+
+    sequence_ids = ["%032x" % (i) for i in range(10)]
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(sequence_ids))
+    output_file = tmp_path / "output.ndjson"
+
+    # the primary endpoint drops every connection
+    faults = dict((sequence_id, ["reset"] * 10)
+                  for sequence_id in sequence_ids)
+    with StubRefgetServer(faults=faults) as primary, \
+         StubRefgetServer() as secondary:
+        client = ENAClient(args=["-i", str(input_file), "-o",
+            str(output_file), "-f", "ndjson", "--no_cache", "--base_url",
+            primary.url, "--base_url", secondary.url, "--backoff_base",
+            "0.001"])
+        client.call_and_output_all()
+
+    # assert every record was answered by the secondary, and the primary
+    # was avoided once marked down
+    records = [json.loads(line) for line
+               in output_file.read_text().splitlines()]
+    assert [record["status_code"] for record in records] == [404] * 10
+    assert len(primary.request_paths) == EndpointPool.FAILURE_THRESHOLD
+    assert len(secondary.request_paths) == 10
+    assert "failovers: 10" in capsys.readouterr().err
+
+def test_call_and_output_all_hedge(tmp_path, monkeypatch, capsys):
+    """test call_and_output_all hedges a slow request"""
+
+    sequence_ids = ["%032x" % (i) for i in range(40)]
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(sequence_ids))
+    output_file = tmp_path / "output.ndjson"
+
+    # assert hedging requires a second endpoint
+    client = ENAClient(args=["-i", str(input_file), "--hedge"])
+    assert client.get_parser_error().__class__.__name__ == "ValueError"
+    client = ENAClient(args=["-i", str(input_file), "--base_url", "ftp://x"])
+    assert client.get_parser_error().__class__.__name__ == "ValueError"
+
+    # one request is slow on the primary endpoint, once its p95 is known
+    faults = {sequence_ids[30]: ["slow"]}
+    with StubRefgetServer(faults=faults) as primary, \
+         StubRefgetServer() as secondary:
+        start = time.time()
+        ENAClient(args=["-i", str(input_file), "-o", str(output_file),
+            "-f", "ndjson", "--no_cache", "--base_url", primary.url,
+            "--base_url", secondary.url, "--hedge"]).call_and_output_all()
+        elapsed_secs = time.time() - start
+
+    # assert the slow request was answered by the hedge, without waiting
+    # for the primary (requests slower than the p95 by chance may also be
+    # hedged)
+    records = [json.loads(line) for line
+               in output_file.read_text().splitlines()]
+    assert [record["req_seq_id"] for record in records] == sequence_ids
+    assert elapsed_secs < StubRefgetServer.SLOW_FAULT_SECS
+    assert "/sequence/%s/metadata" % (sequence_ids[30]) \
+        in secondary.request_paths
+    assert "hedged: %s" % (len(secondary.request_paths)) \
+        in capsys.readouterr().err
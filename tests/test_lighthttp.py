@@ -0,0 +1,117 @@
+"""test_lighthttp.py - test light http session scenarios
+
+This module contains test scenarios for the LightSession, and for ENAClient
+single lookups made over it.
+"""
+
+import json
+import socket
+import pytest
+from enaclient.enaclient import ENAClient
+from enaclient.lighthttp import LightSession, LightSessionPool, \
+                                ConnectionError, ConnectTimeout, ReadTimeout, \
+                                TooManyRedirects
+from tests.stub_server import StubRefgetServer, make_self_signed_cert
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+sequence_id_1 = "%032x" % (1)
+
+def metadata_url(server, sequence_id):
+    return server.url + "sequence/%s/metadata" % (sequence_id)
+
+def test_light_session():
+    """test the LightSession keeps connections alive between requests"""
+
+    session = LightSession()
+    with StubRefgetServer(faults={sequence_id_1: ["reset"]}) as server:
+        response_obj = session.get(metadata_url(server, sequence_id_0),
+                                   timeout=5)
+        assert response_obj.status_code == 200
+        assert response_obj.json()["metadata"]["length"] == 7156
+        assert response_obj.headers.get("content-type") == "application/json"
+        assert response_obj.elapsed.total_seconds() > 0
+
+        # assert the connection was reused, and a connection the server
+        # dropped is reported once the request was sent again on a new one
+        assert session.get(metadata_url(server, sequence_id_1),
+                           timeout=5).status_code == 404
+        assert server.connection_count == 2
+        session.close()
+
+def test_light_session_redirects(capsys):
+    """test the LightSession follows redirects, as requests does"""
+
+    session = LightSession()
+    with StubRefgetServer() as server:
+        response_obj = session.get(server.url + "moved/moved/sequence/%s/"
+                                   % (sequence_id_0) + "metadata", timeout=5)
+        assert response_obj.status_code == 200
+        assert response_obj.json()["metadata"]["length"] == 7156
+        assert len(server.request_paths) == 3
+
+        # assert a single lookup through a redirect matches batch mode
+        client = ENAClient(args=["-s", sequence_id_0, "--base_url",
+                                 server.url + "moved/", "--no_cache"])
+        client.call_and_output_all()
+        assert isinstance(client.get_session_pool(), LightSessionPool)
+        assert json.loads(capsys.readouterr().out)[0]["status_code"] == 200
+
+        with pytest.raises(TooManyRedirects):
+            session.get(server.url + "loop/", timeout=5)
+    session.close()
+
+def test_light_session_errors():
+    """test the LightSession raises the exceptions requests would"""
+
+    session = LightSession()
+
+    # assert a closed port is a connection error
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    with pytest.raises(ConnectionError):
+        session.get("http://127.0.0.1:%s/" % (port), timeout=1)
+
+    # assert a slow response is a read timeout, but not a connect timeout
+    with StubRefgetServer(faults={sequence_id_0: ["slow"]}) as server:
+        with pytest.raises(ReadTimeout) as exc_info:
+            session.get(metadata_url(server, sequence_id_0), timeout=0.2)
+        assert not isinstance(exc_info.value, ConnectTimeout)
+    session.close()
+
+def test_light_session_tls(tmp_path, monkeypatch):
+    """test the LightSession verifies certificates with the CA bundle
+    requests would use"""
+
+    certfile = make_self_signed_cert(str(tmp_path))
+    monkeypatch.setenv("REQUESTS_CA_BUNDLE", certfile)
+    with StubRefgetServer(certfile=certfile) as server:
+        response_obj = LightSession().get(metadata_url(server, sequence_id_0),
+                                          timeout=5)
+    assert response_obj.status_code == 200
+
+def test_call_and_output_all_single(monkeypatch, capsys):
+    """test call_and_output_all makes single lookups over a LightSession,
+    retrying transient failures"""
+
+    for variable in ["http_proxy", "https_proxy", "all_proxy", "HTTP_PROXY",
+                     "HTTPS_PROXY", "ALL_PROXY"]:
+        monkeypatch.delenv(variable, raising=False)
+    # a reset on a kept-alive connection is sent again at once, on a new
+    # connection, so only the second reset is retried after a backoff
+    faults = {sequence_id_0: [503, "reset", "reset"]}
+    with StubRefgetServer(faults=faults) as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+        client = ENAClient(args=["-s", sequence_id_0, "--no_cache",
+                                 "--backoff_base", "0.01"])
+        client.call_and_output_all()
+
+    assert isinstance(client.get_session_pool(), LightSessionPool)
+    records = json.loads(capsys.readouterr().out)
+    assert records[0]["status_code"] == 200
+    assert client.get_retry_policy().retries == 2
+
+    # assert a configured proxy falls back to requests, which supports it
+    monkeypatch.setenv("HTTPS_PROXY", "http://127.0.0.1:3128")
+    assert not LightSessionPool.is_supported()
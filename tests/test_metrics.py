@@ -0,0 +1,131 @@
+"""test_metrics.py - test request timing scenarios
+
+This module contains test scenarios for the Histogram and RunStats, and for
+ENAClient request traces, the run summary and the Prometheus export.
+"""
+
+import threading
+from enaclient.enaclient import ENAClient
+from enaclient.metrics import Histogram, MetricsObserver, RunStats, \
+                              RequestTrace, STAGE_RATE_LIMIT, STAGE_CONNECT, \
+                              STAGE_SERVER, STAGE_TRANSFER, STAGE_DECODE, \
+                              STAGE_BACKOFF
+from tests.stub_server import StubRefgetServer
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+
+class RecordingObserver(MetricsObserver):
+    """observer keeping every trace and record it is notified of"""
+
+    def __init__(self):
+        self.traces = []
+        self.records = []
+        self.lock = threading.Lock()
+
+    def on_request(self, trace):
+        with self.lock:
+            self.traces.append(trace)
+
+    def on_record(self, response_dict, format_secs, write_secs):
+        with self.lock:
+            self.records.append((response_dict["req_seq_id"], format_secs,
+                                 write_secs))
+
+def test_histogram():
+    """test the Histogram counts observations and estimates quantiles"""
+
+    histogram = Histogram()
+    assert histogram.get_quantile(0.5) == 0.0
+    for secs in [0.0001] * 90 + [0.02] * 9 + [20]:
+        histogram.observe(secs)
+
+    # assert quantiles are the upper bounds of their buckets
+    assert histogram.count == 100
+    assert histogram.get_quantile(0.5) == 0.0005
+    assert histogram.get_quantile(0.95) == 0.025
+    assert histogram.get_quantile(1.0) == float("inf")
+    assert abs(histogram.get_mean() - (0.009 + 0.18 + 20) / 100) < 1e-9
+
+def test_run_stats():
+    """test the RunStats aggregates traces into a summary and metrics"""
+
+    run_stats = RunStats()
+    trace = RequestTrace(sequence_id_0)
+    trace.add_stage(STAGE_SERVER, 0.0, 0.004)
+    trace.add_stage(STAGE_BACKOFF, 0.0, 0.1)
+    trace.add_stage(STAGE_SERVER, 0.0, 0.004)
+    trace.bytes_received = 2048
+    trace.finish(200)
+    run_stats.on_request(trace)
+    run_stats.on_record({"req_seq_id": sequence_id_0, "status_code": 200},
+                        0.0001, 0.0001)
+
+    # assert stages are summed per request, and every counter reported
+    assert run_stats.stage_histograms[STAGE_SERVER].sum == 0.008
+    summary = run_stats.format_summary()
+    assert summary.startswith("stats: 1 records in ")
+    assert "1 API requests, 2.0 KiB received" in summary
+    assert "record status codes: 200: 1" in summary
+    assert "backoff           1   100.00ms" in summary
+
+    metrics = run_stats.to_prometheus()
+    assert 'enaclient_requests_total{status_code="200"} 1' in metrics
+    assert "enaclient_response_bytes_total 2048" in metrics
+    assert 'enaclient_stage_seconds_bucket{stage="server",le="0.01"} 1' \
+        in metrics
+    assert 'enaclient_stage_seconds_count{stage="connect"} 0' in metrics
+
+def test_call_and_output_all_stats(tmp_path, monkeypatch, capsys):
+    """test call_and_output_all traces requests and reports statistics"""
+
+    sequence_ids = ["%032x" % (i) for i in range(20)]
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(sequence_ids + [sequence_ids[0],
+                                                    "not-a-checksum"]))
+    metrics_file = tmp_path / "metrics.prom"
+    observer = RecordingObserver()
+
+    with StubRefgetServer(faults={sequence_ids[1]: [503]},
+                          aliases=1) as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+        client = ENAClient(args=["-i", str(input_file), "-o",
+            str(tmp_path / "output.json"), "-w", "4", "--no_cache",
+            "--backoff_base", "0.01", "--stats", "--metrics_file",
+            str(metrics_file)])
+        client.set_observers(client.get_observers() + [observer])
+        client.call_and_output_all()
+
+    # assert each distinct valid sequence id was traced once, through every
+    # stage of the request, and the retried request backed off once
+    traces = dict((trace.sequence_id, trace) for trace in observer.traces)
+    assert sorted(traces) == sequence_ids
+    stages = [stage for stage, offset, duration
+              in traces[sequence_ids[0]].stages]
+    assert stages == [STAGE_RATE_LIMIT, STAGE_CONNECT, STAGE_SERVER,
+                      STAGE_TRANSFER, STAGE_DECODE]
+    assert traces[sequence_ids[1]].attempts == 2
+    assert STAGE_BACKOFF in traces[sequence_ids[1]].get_stage_secs()
+    assert traces[sequence_ids[0]].bytes_received > 0
+    assert sum(trace.get_stage_secs()[STAGE_CONNECT]
+               for trace in observer.traces) > 0
+
+    # assert every output record was reported, and the summary and metrics
+    # count records and requests separately
+    assert len(observer.records) == 22
+    assert client.get_run_stats().records == 22
+    err = capsys.readouterr().err
+    assert "stats: 22 records in " in err
+    assert "20 API requests" in err
+    assert "record status codes: 200: 21, 400: 1" in err
+    assert "request latency histogram:" in err
+    metrics = metrics_file.read_text()
+    assert 'enaclient_records_total{status_code="400"} 1' in metrics
+    assert "enaclient_request_seconds_count 20" in metrics
+
+def test_parse_args_otel(monkeypatch):
+    """test --otel reports a missing opentelemetry-api as an args error"""
+
+    monkeypatch.setitem(__import__("sys").modules, "opentelemetry", None)
+    client = ENAClient(args=["-s", sequence_id_0, "--otel"])
+    assert client.get_valid_args() is False
+    assert "opentelemetry-api" in str(client.get_parser_error())
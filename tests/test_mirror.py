@@ -0,0 +1,115 @@
+"""test_mirror.py - test local mirror snapshot scenarios
+
+This module contains test scenarios for the MirrorSnapshot, the mirror
+subcommand, and ENAClient lookups from a snapshot.
+"""
+
+import gzip
+import json
+import os
+from enaclient.enaclient import ENAClient
+from enaclient.mirror import MirrorSnapshot, main
+from tests.stub_server import StubRefgetServer
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+sequence_id_1 = "3050107579885e1608e6fe50fae3f8d1"
+md5_2 = "6aef897c3d6ff0c78aff06ac189178dd"
+trunc512_2 = "959cb1883fc1ca9ae1394ceb475a356ead1ecceff5824ae7"
+json_output_file = "testdata/response_3.json"
+
+def make_ndjson_output(path, length):
+    """write NDJSON output holding one found and one not found response
+
+    Args:
+        path (pathlib.Path): path to the gzip compressed output file
+        length (int): length of the found sequence
+    """
+
+    response_dicts = [
+        {"req_seq_id": trunc512_2, "status_code": 200,
+         "metadata": {"aliases": [], "id": trunc512_2, "length": length,
+                      "md5": md5_2, "trunc512": trunc512_2}},
+        {"req_seq_id": "%032x" % (5), "status_code": 404,
+         "metadata": {"aliases": [], "id": None, "length": None,
+                      "md5": None, "trunc512": None}}]
+    path.write_bytes(gzip.compress("".join(
+        json.dumps(response_dict) + "\n" for response_dict in response_dicts)
+        .encode("utf-8")))
+
+def test_mirror_import(tmp_path, capsys):
+    """test the mirror subcommand builds and extends a snapshot"""
+
+    snapshot_path = str(tmp_path / "mirror.enam")
+    ndjson_output_file = tmp_path / "output.ndjson.gz"
+    make_ndjson_output(ndjson_output_file, 100)
+
+    # assert only found responses are imported, from JSON and NDJSON output
+    assert main(["import", snapshot_path, json_output_file]) == 0
+    assert main(["import", snapshot_path, str(ndjson_output_file)]) == 0
+    assert "1 sequences" in capsys.readouterr().out.splitlines()[0]
+
+    snapshot = MirrorSnapshot(snapshot_path)
+    assert len(snapshot) == 3
+
+    # assert lookups by md5 and trunc512, and misses
+    response_dict = snapshot.get(sequence_id_0)
+    assert response_dict["req_seq_id"] == sequence_id_0
+    assert response_dict["status_code"] == 200
+    assert response_dict["metadata"]["length"] == 7156
+    assert snapshot.get(md5_2.upper())["metadata"]["trunc512"] == trunc512_2
+    assert snapshot.get(trunc512_2)["req_seq_id"] == trunc512_2
+    assert snapshot.get(sequence_id_1) is None
+    assert snapshot.get("%032x" % (5)) is None
+    assert (snapshot.hits, snapshot.misses) == (3, 2)
+    snapshot.close()
+
+    # assert a re-imported sequence replaces the one in the snapshot
+    make_ndjson_output(ndjson_output_file, 200)
+    assert main(["import", snapshot_path, str(ndjson_output_file)]) == 0
+    snapshot = MirrorSnapshot(snapshot_path)
+    assert len(snapshot) == 3
+    assert snapshot.get(md5_2)["metadata"]["length"] == 200
+    assert snapshot.get(sequence_id_0)["metadata"]["length"] == 7156
+    assert len(list(snapshot.iter_bodies())) == 2
+    snapshot.close()
+
+    # assert re-importing the same sequences leaves the snapshot as it is,
+    # replaced records being dropped
+    size = os.path.getsize(snapshot_path)
+    for attempt in range(2):
+        assert main(["import", snapshot_path, str(ndjson_output_file)]) == 0
+        assert os.path.getsize(snapshot_path) == size
+    assert capsys.readouterr().out.splitlines()[-1] \
+        == "2 sequences in %s" % (snapshot_path)
+    assert sorted(path.name for path in tmp_path.iterdir()) \
+        == ["mirror.enam", "output.ndjson.gz"]
+
+    # assert missing output files and invalid snapshots are reported
+    assert main(["import", snapshot_path, "nofile.json"]) == 1
+    assert main(["info", json_output_file]) == 1
+
+def test_call_and_output_all_mirror(tmp_path, monkeypatch, capsys):
+    """test call_and_output_all answers from a mirror, falling back to http"""
+
+    snapshot_path = str(tmp_path / "mirror.enam")
+    main(["import", snapshot_path, json_output_file])
+    output_file = tmp_path / "output.json"
+
+    # assert an invalid snapshot is reported
+    client = ENAClient(args=["-s", sequence_id_0, "--mirror", "nofile"])
+    assert client.get_parser_error().__class__.__name__ == "FileNotFoundError"
+
+    with StubRefgetServer() as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+        ENAClient(args=["-i", "testdata/input.txt", "-o", str(output_file),
+                        "--mirror", snapshot_path, "--no_cache"]) \
+            .call_and_output_all()
+
+    # assert only the sequences missing from the mirror were requested,
+    # and the output matches output of the API
+    assert len(server.request_paths) == 4
+    assert sequence_id_0 not in "".join(server.request_paths)
+    assert output_file.read_text().rstrip() \
+        == open(json_output_file, "r").read().rstrip()
+    assert "mirror hit ratio: 20.0% (1 hits, 4 misses)" \
+        in capsys.readouterr().err
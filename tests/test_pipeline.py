@@ -0,0 +1,125 @@
+"""test_pipeline.py - test batch pipeline scenarios
+
+This module contains test scenarios for the stages of the batch pipeline,
+and the memory use of batches of growing size.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import pytest
+from enaclient.enaclient import ENAClient
+from enaclient.pipeline import Stage
+from tests.stub_server import StubRefgetServer
+
+# script run in a subprocess, writing a batch and printing its peak RSS in
+# kilobytes. the peak is read from /proc rather than getrusage, which counts
+# the peak of the parent process the subprocess was forked from
+PEAK_RSS_SCRIPT = """
+import re, sys
+from enaclient.enaclient import ENAClient
+ENAClient(args=sys.argv[1:]).call_and_output_all()
+print(re.search(r"VmHWM:\\s+(\\d+) kB", open("/proc/self/status").read())
+      .group(1))
+"""
+
+def test_stage():
+    """test stages yield in order, raise errors after the items before
+    them, and stop their iterable once closed"""
+
+    assert list(Stage(iter(range(100)), "numbers", batch_size=7)) \
+        == list(range(100))
+
+    def failing():
+        yield 1
+        yield 2
+        raise KeyError("failed")
+    items = []
+    with pytest.raises(KeyError):
+        for item in Stage(failing(), "failing"):
+            items.append(item)
+    assert items == [1, 2]
+
+    # assert an item is handed on while the iterable is blocked on the next
+    # one, rather than waiting for it
+    release = threading.Event()
+    def blocked():
+        yield 1
+        release.wait()
+        yield 2
+    stage = iter(Stage(Stage(blocked(), "blocked"), "copy"))
+    start = time.perf_counter()
+    assert next(stage) == 1
+    assert time.perf_counter() - start < 2
+    release.set()
+    assert list(stage) == [2]
+
+    # assert a consumer stopping early stops the stages before it, with
+    # at most a few queues of items read ahead
+    produced = []
+    closed = []
+    def numbers():
+        try:
+            for i in range(1000000):
+                produced.append(i)
+                yield i
+        finally:
+            closed.append(True)
+    stage = iter(Stage(Stage(numbers(), "read", queue_size=2, batch_size=4),
+                       "copy", queue_size=2, batch_size=4))
+    assert next(stage) == 0
+    stage.close()
+    for attempt in range(50):
+        if closed:
+            break
+        time.sleep(Stage.PUT_TIMEOUT_SECS)
+    assert closed == [True]
+    assert len(produced) < 100
+
+def test_call_and_output_all_flush_every(tmp_path):
+    """test the in-flight window and flush interval leave the output as it
+    is"""
+
+    sequence_ids = ["%032x" % (i) for i in range(30)]
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(sequence_ids))
+    with StubRefgetServer() as server:
+        for args in [[], ["-w", "3", "--in_flight", "4", "--flush_every",
+                          "1"]]:
+            output_file = tmp_path / "output.ndjson"
+            ENAClient(args=["-i", str(input_file), "-o", str(output_file),
+                            "-f", "ndjson", "--no_cache", "--base_url",
+                            server.url] + args).call_and_output_all()
+            assert [json.loads(line)["req_seq_id"] for line
+                    in output_file.read_text().splitlines()] == sequence_ids
+
+    for args in [["--in_flight", "0"], ["--flush_every", "-1"]]:
+        client = ENAClient(args=["-i", str(input_file)] + args)
+        assert isinstance(client.get_parser_error(), ValueError)
+
+def test_call_and_output_all_peak_rss(tmp_path):
+    """test peak memory use stays flat as the batch grows twentyfold, with a
+    formatter (XML) slower than the stages before it"""
+
+    if not os.path.exists("/proc/self/status"):
+        pytest.skip("peak RSS is read from /proc")
+
+    peak_rss_kb = []
+    for count in [5000, 100000]:
+        input_file = tmp_path / ("input-%s.txt" % (count))
+        input_file.write_text("\n".join("sequence-%s" % (i)
+                                        for i in range(count)))
+        output = subprocess.run([sys.executable, "-c", PEAK_RSS_SCRIPT,
+                                 "-i", str(input_file), "-o",
+                                 str(tmp_path / "output.xml"), "-f", "xml",
+                                 "--no_cache"],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, check=True,
+                                env=dict(os.environ, PYTHONPATH=os.getcwd()))
+        peak_rss_kb.append(int(output.stdout.split()[-1]))
+        assert (tmp_path / "output.xml").read_text().count("<req_seq_id") \
+            == count
+    assert peak_rss_kb[1] - peak_rss_kb[0] < 4 * 1024
@@ -0,0 +1,95 @@
+"""test_readers.py - test batch input reading scenarios
+
+This module contains test scenarios for the streaming readers of batch input.
+"""
+
+import bz2
+import gzip
+import io
+import sys
+import pytest
+from enaclient.readers import read_sequence_ids, is_valid_sequence_id, \
+                              guess_input_format, read_manifest_header
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+sequence_id_1 = "3050107579885e1608e6fe50fae3f8d1"
+trunc512_0 = "959cb1883fc1ca9ae1394ceb475a356ead1ecceff5824ae7"
+
+lines_input = "# sequence ids\n%s\n\n  %s  \n#%s\n" \
+    % (sequence_id_0, sequence_id_1, sequence_id_0)
+tsv_input = "# manifest\nname\tmd5\nchr1\t%s\nchr2\t%s\n" \
+    % (sequence_id_0, sequence_id_1)
+
+def test_is_valid_sequence_id():
+    """test md5 and trunc512 sequence ids are accepted, others rejected"""
+
+    assert is_valid_sequence_id(sequence_id_0)
+    assert is_valid_sequence_id(sequence_id_0.upper())
+    assert is_valid_sequence_id(trunc512_0)
+    assert not is_valid_sequence_id("")
+    assert not is_valid_sequence_id(sequence_id_0[:-1])
+    assert not is_valid_sequence_id(sequence_id_0 + "0")
+    assert not is_valid_sequence_id("3050107579885e1608e6fe50fae3f8dz")
+    assert not is_valid_sequence_id("md5,name")
+
+def test_guess_input_format():
+    """test the input format is guessed from the file extension"""
+
+    assert guess_input_format("ids.txt") == "lines"
+    assert guess_input_format("-") == "lines"
+    assert guess_input_format("manifest.TSV") == "tsv"
+    assert guess_input_format("manifest.csv.gz") == "csv"
+    assert guess_input_format("ids.gz") == "lines"
+
+def test_read_sequence_ids(tmp_path, monkeypatch):
+    """test sequence ids are read, skipping blank and comment lines"""
+
+    expected = [sequence_id_0, sequence_id_1]
+
+    # assert plain and compressed inputs give the same sequence ids
+    path = tmp_path / "ids.txt"
+    path.write_text(lines_input)
+    assert list(read_sequence_ids(str(path))) == expected
+    path = tmp_path / "ids.txt.gz"
+    path.write_bytes(gzip.compress(lines_input.encode("utf-8")))
+    assert list(read_sequence_ids(str(path))) == expected
+    path = tmp_path / "ids.txt.bz2"
+    path.write_bytes(bz2.compress(lines_input.encode("utf-8")))
+    assert list(read_sequence_ids(str(path))) == expected
+    zstandard = pytest.importorskip("zstandard")
+    path = tmp_path / "ids.txt.zst"
+    path.write_bytes(zstandard.ZstdCompressor().compress(
+        lines_input.encode("utf-8")))
+    assert list(read_sequence_ids(str(path))) == expected
+
+    # assert stdin is read, and left open
+    monkeypatch.setattr(sys, "stdin", io.StringIO(lines_input))
+    assert list(read_sequence_ids("-")) == expected
+    assert not sys.stdin.closed
+
+def test_read_sequence_ids_manifest(tmp_path):
+    """test sequence ids are read from a column of a TSV/CSV manifest"""
+
+    expected = [sequence_id_0, sequence_id_1]
+    path = tmp_path / "manifest.tsv"
+    path.write_text(tsv_input)
+
+    # assert the id column is selected by name or number
+    assert list(read_sequence_ids(str(path), id_column="md5")) == expected
+    assert list(read_sequence_ids(str(path), id_column="2")) == expected
+    assert list(read_sequence_ids(str(path))) == ["chr1", "chr2"]
+
+    # assert a CSV manifest, and an explicit input format
+    path = tmp_path / "manifest.txt"
+    path.write_text(tsv_input.replace("\t", ","))
+    assert list(read_sequence_ids(str(path), "csv", "md5")) == expected
+
+    # assert a missing id column is reported
+    with pytest.raises(ValueError):
+        list(read_sequence_ids(str(path), "csv", "sha1"))
+
+    # assert a row with an empty first field keeps its columns
+    path = tmp_path / "empty.tsv"
+    path.write_text("id\tname\n\tempty\n %s \tchr1\n" % (sequence_id_0))
+    assert list(read_sequence_ids(str(path))) == ["", sequence_id_0]
+    assert read_manifest_header(str(path), "tsv") == ["id", "name"]
@@ -0,0 +1,72 @@
+"""test_results.py - test structured result scenarios
+
+This module contains test scenarios for the MetadataResult, and for the
+ENAClient library methods returning results.
+"""
+
+from enaclient.enaclient import ENAClient
+from enaclient.results import MetadataResult
+from tests.stub_server import StubRefgetServer
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+sequence_id_1 = "3050107579885e1608e6fe50fae3f8d1"
+
+def test_metadata_result():
+    """test results round trip to response dictionaries"""
+
+    response_dicts = [
+        {"req_seq_id": sequence_id_0, "status_code": 200,
+         "metadata": {"id": sequence_id_0, "md5": sequence_id_0,
+                      "trunc512": None, "length": 7156, "aliases": [
+                          {"alias": "chr1", "naming_authority": "insdc"}]}},
+        {"req_seq_id": sequence_id_1, "status_code": 404,
+         "metadata": {"id": None, "md5": None, "trunc512": None,
+                      "length": None, "aliases": []}},
+        {"req_seq_id": sequence_id_1, "status_code": "408",
+         "error": "read timeout"},
+        {"req_seq_id": sequence_id_0, "status_code": 200,
+         "metadata": {"id": sequence_id_0, "circular": True, "md5": None,
+                      "trunc512": None, "length": 16569, "aliases": None},
+         "etag": "\"v1\""},
+        {"req_seq_id": sequence_id_0, "status_code": 200,
+         "metadata": {"id": sequence_id_0, "length": 3}}]
+
+    for response_dict in response_dicts:
+        result = MetadataResult.from_response_dict(response_dict)
+        assert result.to_response_dict() == response_dict
+        assert list(result.to_response_dict()) == list(response_dict)
+        assert result == MetadataResult.from_response_dict(response_dict)
+
+    result = MetadataResult.from_response_dict(response_dicts[0])
+    assert result.found and result.length == 7156 and result.error is None
+    assert result.aliases[0]["alias"] == "chr1"
+    assert not hasattr(result, "__dict__")
+    assert not MetadataResult.from_response_dict(response_dicts[2]).found
+
+    # assert metadata and response keys the result does not model are kept
+    result = MetadataResult.from_response_dict(response_dicts[3])
+    assert result.extra == {"circular": True}
+    assert result.response_extra == {"etag": "\"v1\""}
+    assert result.aliases is None
+
+def test_lookup(monkeypatch):
+    """test the ENAClient lookup and lookup_many methods"""
+
+    # assert a library client does not parse the command line
+    client = ENAClient(args=None)
+    assert client.get_args_dict() is None
+
+    with StubRefgetServer() as server:
+        client = ENAClient(args=None)
+        client.set_base_urls([server.url])
+        client.set_cache_dir(None)
+        result = client.lookup(sequence_id_0)
+        assert result.found and result.md5 == sequence_id_0
+        assert result.length == 7156
+
+        results = list(client.lookup_many(iter([sequence_id_1, "bad",
+                                                sequence_id_0])))
+        assert [result.status_code for result in results] \
+            == [404, "400", 200]
+        assert results[1].error == "invalid sequence id"
+        assert results[2] == result
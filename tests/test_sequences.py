@@ -0,0 +1,153 @@
+"""test_sequences.py - test sequence bases retrieval scenarios
+
+This module contains test scenarios for the SequenceFetcher, the FastaWriter,
+and the sequence subcommand.
+"""
+
+import hashlib
+import io
+import time
+import pytest
+from enaclient.enaclient import ENAClient
+from enaclient.sequences import SequenceFetcher, FastaWriter, \
+                                ChecksumError, main
+from tests.stub_server import StubRefgetServer
+
+# a pseudo-random sequence of 10,000 bases, keyed by its md5 and trunc512
+bases = bytes(b"ACGT"[(i * 7919 + i // 13) % 4] for i in range(10000))
+md5 = hashlib.md5(bases).hexdigest()
+trunc512 = hashlib.sha512(bases).hexdigest()[:48]
+metadata = {"id": md5, "md5": md5, "trunc512": trunc512,
+            "length": len(bases), "aliases": []}
+
+def make_server(faults=None):
+    """start a stub server holding the test sequence
+
+    Args:
+        faults (dict): faults injected per sequence id
+
+    Returns:
+        server (StubRefgetServer): the stub server, to use as a context
+            manager
+    """
+
+    return StubRefgetServer(sequences={md5: metadata, trunc512: metadata},
+                            bases={md5: bases, trunc512: bases},
+                            faults=faults)
+
+def fasta(name, sequence, line_width=60):
+    """format a FASTA record
+
+    Args:
+        name (str): record name
+        sequence (bytes): record bases
+        line_width (int): bases per line
+
+    Returns:
+        record (bytes): the FASTA record
+    """
+
+    return (">%s\n" % (name)).encode("utf-8") + b"".join(
+        sequence[i:i + line_width] + b"\n"
+        for i in range(0, len(sequence), line_width))
+
+def test_fasta_writer():
+    """test the FastaWriter wraps chunks of any size into lines"""
+
+    handle = io.BytesIO()
+    writer = FastaWriter(handle, line_width=4)
+    writer.write_header("a")
+    for chunk in [b"ACG", b"TACGTA", b"", b"C"]:
+        writer.write_bases(chunk)
+    writer.write_header("b")
+    writer.write_bases(b"ACGT")
+    writer.end_record()
+    assert handle.getvalue() == b">a\nACGT\nACGT\nAC\n>b\nACGT\n"
+
+def test_write_fasta(monkeypatch):
+    """test sequences are streamed serially and in parallel parts"""
+
+    with make_server(faults={md5: ["reset", (429, 0.2)]}) as server:
+        client = ENAClient(args=None)
+        client.set_base_urls([server.url])
+        client.set_cache_dir(None)
+        client.set_backoff_base(0.001)
+
+        # assert the whole sequence is streamed in chunks and verified,
+        # resuming after the dropped connection, and waiting as long as the
+        # throttled request was asked to
+        handle = io.BytesIO()
+        fetcher = SequenceFetcher(client, chunk_size=1000)
+        start = time.time()
+        assert fetcher.write_fasta(FastaWriter(handle), md5,
+                                   verify=True) == len(bases)
+        assert time.time() - start >= 0.2
+        assert handle.getvalue() == fasta(md5, bases)
+        assert client.get_retry_policy().retries == 2
+        assert client.get_rate_limiter().throttled == 1
+
+        # assert parts of several ranges are fetched in parallel, and
+        # written in order
+        handle = io.BytesIO()
+        fetcher = SequenceFetcher(client, workers=4, part_size=700)
+        ranges = [(0, 10), (2500, 6001), (9990, 10000)]
+        fetcher.write_fasta(FastaWriter(handle), md5, ranges)
+        assert handle.getvalue() == b"".join(
+            fasta("%s:%s-%s" % (md5, start, end), bases[start:end])
+            for start, end in ranges)
+
+        # assert the whole sequence, in parallel parts, by trunc512
+        request_count = len(server.request_paths)
+        handle = io.BytesIO()
+        fetcher.write_fasta(FastaWriter(handle), trunc512, verify=True)
+        assert handle.getvalue() == fasta(trunc512, bases)
+        assert len(server.request_paths) - request_count == 1 + 15
+
+        # assert a server ignoring Range headers answers each part with the
+        # whole sequence, of which only the part's bases are kept
+        server.ignore_ranges = True
+        handle = io.BytesIO()
+        fetcher.write_fasta(FastaWriter(handle), md5, ranges)
+        assert handle.getvalue() == b"".join(
+            fasta("%s:%s-%s" % (md5, start, end), bases[start:end])
+            for start, end in ranges)
+        server.ignore_ranges = False
+
+        # assert a checksum mismatch is reported
+        server.bases[md5] = bases[:-1] + b"A"
+        with pytest.raises(ChecksumError):
+            fetcher.write_fasta(FastaWriter(io.BytesIO()), md5, verify=True)
+        with pytest.raises(ValueError):
+            fetcher.write_fasta(FastaWriter(io.BytesIO()), md5, [(5, 1)])
+
+        # assert an empty range is rejected before any request is made
+        request_count = len(server.request_paths)
+        with pytest.raises(ValueError):
+            fetcher.write_fasta(FastaWriter(io.BytesIO()), md5, [(5, 5)])
+        assert len(server.request_paths) == request_count
+
+def test_sequence_subcommand(tmp_path):
+    """test the sequence subcommand writes FASTA files"""
+
+    output_file = tmp_path / "output.fa"
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("%s\n%s\n" % (md5, trunc512))
+
+    with make_server() as server:
+        # assert ranges of one sequence, and every sequence of an input file
+        assert main(["-s", md5, "-r", "0-100", "-r", "200-250", "-o",
+                     str(output_file), "--base_url", server.url,
+                     "--line_width", "80"]) == 0
+        assert output_file.read_bytes() \
+            == fasta("%s:0-100" % (md5), bases[:100], 80) \
+            + fasta("%s:200-250" % (md5), bases[200:250], 80)
+        assert main(["-i", str(input_file), "-o", str(output_file), "-w",
+                     "2", "--verify", "--base_url", server.url]) == 0
+        assert output_file.read_bytes() \
+            == fasta(md5, bases) + fasta(trunc512, bases)
+
+        # assert a missing sequence fails without replacing the output
+        assert main(["-s", "%032x" % (1), "-o", str(output_file),
+                     "--base_url", server.url]) == 1
+        assert output_file.read_bytes().startswith(b">" + md5.encode())
+        assert not (tmp_path / "output.fa.part").exists()
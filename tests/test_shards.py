@@ -0,0 +1,124 @@
+"""test_shards.py - test sharded batch scenarios
+
+This module contains test scenarios for running a batch across worker
+processes, merging their shards or keeping them.
+"""
+
+import json
+import pytest
+from enaclient.enaclient import ENAClient
+from enaclient.shards import split_input, iter_merged, get_shard_path, \
+                             read_shard_input, ShardRecordWriter
+from tests.stub_server import StubRefgetServer
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+
+def test_split_and_merge(tmp_path):
+    """test shards dealt round-robin are merged back in input order"""
+
+    # assert each shard reads back exactly the ids dealt to it, including
+    # ids that would read as blank or comment lines
+    sequence_ids = ["%032x" % (i) for i in range(8)] + ["", "# id", " "]
+    input_paths = [str(tmp_path / ("input-%s.bin" % (i))) for i in range(3)]
+    assert split_input(iter(sequence_ids), input_paths) == 11
+    assert list(read_shard_input(input_paths[1])) == sequence_ids[1::3]
+    assert list(read_shard_input(input_paths[2])) == sequence_ids[2::3]
+
+    # assert framed records of uneven shards merge in input order
+    shard_paths = []
+    for index, input_path in enumerate(input_paths):
+        shard_path = str(tmp_path / ("output-%s.bin" % (index)))
+        with open(shard_path, "wb") as handle:
+            writer = ShardRecordWriter(handle)
+            for sequence_id in read_shard_input(input_path):
+                writer.write_formatted(sequence_id)
+        shard_paths.append(shard_path)
+    assert list(iter_merged(shard_paths)) == sequence_ids
+
+    assert get_shard_path("out/metadata.json", 0, 4) \
+        == "out/metadata.shard-1-of-4.json"
+
+@pytest.mark.parametrize("output_format", ["json", "yaml", "xml", "csv"])
+def test_call_and_output_all_processes(tmp_path, output_format):
+    """test a sharded batch writes the same output as a single process"""
+
+    sequence_ids = ["%032x" % (i) for i in range(40)] \
+        + [sequence_id_0, "not-a-checksum", "%032x" % (3)]
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(sequence_ids))
+    single_file = tmp_path / ("single." + output_format)
+    sharded_file = tmp_path / ("sharded." + output_format)
+
+    with StubRefgetServer() as server:
+        args = ["-i", str(input_file), "-f", output_format, "--base_url",
+                server.url]
+        ENAClient(args=args + ["-o", str(single_file), "--no_cache"]) \
+            .call_and_output_all()
+        ENAClient(args=args + ["-o", str(sharded_file), "--processes", "3"]) \
+            .call_and_output_all()
+
+    # assert the merged output matches, and the temporary shards are gone
+    assert sharded_file.read_text() == single_file.read_text()
+    assert sorted(path.name for path in tmp_path.iterdir()) \
+        == ["input.txt", "sharded." + output_format,
+            "single." + output_format]
+
+def test_call_and_output_all_processes_manifest(tmp_path):
+    """test a sharded batch of a manifest with an empty id cell writes the
+    same records, in the same order, as a single process"""
+
+    input_file = tmp_path / "input.tsv"
+    input_file.write_text("name\tid\na\t%s\nb\t\nc\t%s\nd\t%s\n"
+                          % (sequence_id_0, "%032x" % (1), "%032x" % (2)))
+    single_file = tmp_path / "single.ndjson"
+    sharded_file = tmp_path / "sharded.ndjson"
+
+    with StubRefgetServer() as server:
+        args = ["-i", str(input_file), "--id_column", "id", "-f", "ndjson",
+                "--base_url", server.url, "--no_cache"]
+        ENAClient(args=args + ["-o", str(single_file)]).call_and_output_all()
+        ENAClient(args=args + ["-o", str(sharded_file), "--processes", "2"]) \
+            .call_and_output_all()
+
+    assert [json.loads(line)["req_seq_id"] for line
+            in sharded_file.read_text().splitlines()] \
+        == [sequence_id_0, "", "%032x" % (1), "%032x" % (2)]
+    assert sharded_file.read_text() == single_file.read_text()
+
+def test_call_and_output_all_keep_shards(tmp_path, capfd):
+    """test a sharded batch can leave the output of each worker"""
+
+    sequence_ids = ["%032x" % (i) for i in range(10)]
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(sequence_ids))
+    output_file = tmp_path / "output.json"
+
+    with StubRefgetServer() as server:
+        ENAClient(args=["-i", str(input_file), "-o", str(output_file),
+                        "--base_url", server.url, "--no_cache",
+                        "--processes", "2", "--keep_shards"]) \
+            .call_and_output_all()
+
+    # assert each shard is a complete output, holding every other record
+    assert not output_file.exists()
+    for index in range(2):
+        records = json.loads((tmp_path / ("output.shard-%s-of-2.json"
+                                          % (index + 1))).read_text())
+        assert [record["req_seq_id"] for record in records] \
+            == sequence_ids[index::2]
+    assert "shard 2 of 2: 5 records" in capfd.readouterr().err
+
+def test_parse_args_processes(tmp_path):
+    """test invalid sharded mode args are reported"""
+
+    input_file = tmp_path / "input.txt"
+    input_file.write_text(sequence_id_0)
+    for args in [["-i", str(input_file), "--processes", "0"],
+                 ["-s", sequence_id_0, "--processes", "2"],
+                 ["-i", str(input_file), "-o", str(tmp_path / "o.json"),
+                  "--processes", "2", "--resume"],
+                 ["-i", str(input_file), "--processes", "2",
+                  "--keep_shards"]]:
+        client = ENAClient(args=args)
+        assert client.get_valid_args() is False
+        assert isinstance(client.get_parser_error(), ValueError)
@@ -0,0 +1,67 @@
+"""test_throttle.py - test rate limiting and retry scenarios
+
+This module contains test scenarios for the AdaptiveRateLimiter and the
+RetryPolicy.
+"""
+
+import time
+from email.utils import formatdate
+from enaclient.throttle import AdaptiveRateLimiter, RetryPolicy, \
+                              parse_retry_after
+
+def test_parse_retry_after():
+    """test Retry-After headers in seconds and as http dates"""
+
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert 8 < parse_retry_after(formatdate(time.time() + 10,
+                                            usegmt=True)) <= 10
+
+def test_rate_limiter():
+    """test the AdaptiveRateLimiter spaces out and adapts the request rate"""
+
+    # assert an unlimited limiter never waits
+    rate_limiter = AdaptiveRateLimiter()
+    start = time.time()
+    for i in range(100):
+        rate_limiter.acquire()
+    assert time.time() - start < 0.1
+    assert rate_limiter.rate is None
+
+    # assert a 429 limits the rate to half the measured rate, and that
+    # later 429s within the decrease interval do not lower it again
+    rate_limiter.on_throttled()
+    assert rate_limiter.rate > 100
+    rate = rate_limiter.rate
+    rate_limiter.on_throttled()
+    assert rate_limiter.rate == rate
+    assert rate_limiter.throttled == 2
+
+    # assert requests are spaced out at the configured rate, and successes
+    # raise the rate up to the maximum
+    rate_limiter = AdaptiveRateLimiter(max_rate=20)
+    start = time.time()
+    for i in range(11):
+        rate_limiter.acquire()
+    assert 0.4 < time.time() - start < 0.7
+    rate_limiter.on_success()
+    assert rate_limiter.rate == 20
+
+    # assert Retry-After pauses requests
+    rate_limiter.on_throttled(retry_after=0.3)
+    assert rate_limiter.rate == 10
+    start = time.time()
+    rate_limiter.acquire()
+    assert time.time() - start >= 0.25
+
+def test_retry_policy():
+    """test the RetryPolicy backs off exponentially with jitter"""
+
+    retry_policy = RetryPolicy(3, 1.0, 4.0)
+    delays = [retry_policy.get_delay(attempt) for attempt in range(5)
+              for i in range(100)]
+    assert all(0 <= delay <= 4.0 for delay in delays)
+    assert max(retry_policy.get_delay(0) for i in range(100)) <= 1.0
+    assert len(set(delays)) > 100
+    assert retry_policy.get_delay(0, retry_after=5.0) == 5.0
@@ -0,0 +1,181 @@
+"""test_writers.py - test output writer scenarios
+
+This module contains test scenarios for the streaming output writers.
+"""
+
+import csv
+import io
+import json
+import sys
+import pytest
+from enaclient.enaclient import ENAClient
+from enaclient.writers import JSONWriter, XMLWriter, YAMLWriter, \
+                              NDJSONWriter, CSVWriter, ParquetWriter, COLUMNS
+from tests.legacy_format import legacy_format_record
+from tests.stub_server import StubRefgetServer
+
+sequence_id_0 = "3050107579885e1608e6fe50fae3f8d0"
+
+# records covering found, not found, and timed out responses, aliases,
+# values that need escaping, multi-line strings and booleans in lists
+records = [
+    {"req_seq_id": sequence_id_0, "status_code": 200,
+     "metadata": {"id": sequence_id_0, "md5": sequence_id_0,
+                  "trunc512": "959cb1883fc1ca9ae1394ceb475a356ead1ecceff5824ae7",
+                  "length": 7156,
+                  "aliases": [{"alias": "chrM", "naming_authority": "insdc"},
+                              {"alias": "MT & <mito>", "naming_authority":
+                               "un\"quoted'"}]}},
+    {"req_seq_id": "3050107579885e1608e6fe50fae3f8d1", "status_code": 404,
+     "metadata": {"id": None, "md5": None, "trunc512": None, "length": None,
+                  "aliases": []}},
+    {"req_seq_id": "not an id", "status_code": "408",
+     "error": "connection timeout"},
+    {"req_seq_id": "\u00e9t\u00e9", "status_code": 200,
+     "metadata": {"length": 1.5, "circular": True, "empty": "",
+                  "nested": {}, "values": [1, None, "a"]}},
+    {"req_seq_id": sequence_id_0, "status_code": 200,
+     "metadata": {"description": "first line\nsecond line",
+                  "flags": [True, False], "nested": {"circular": False}}},
+]
+
+writer_classes = [("json", JSONWriter), ("xml", XMLWriter),
+                  ("yaml", YAMLWriter)]
+
+def test_format_record():
+    """test writers format records identically to the legacy formatter"""
+
+    for output_format, writer_class in writer_classes:
+        for inc, record in enumerate(records):
+            assert writer_class.format_record(record, inc) \
+                == legacy_format_record(record, inc, output_format)
+
+def test_write():
+    """test writers frame records as the ENAClient batch output did"""
+
+    for output_format, writer_class in writer_classes:
+        handle = io.StringIO()
+        writer = writer_class(handle)
+        writer.write_prefix()
+        for inc, record in enumerate(records):
+            writer.write_record(record, inc)
+        writer.write_suffix()
+
+        expected = writer_class.PREFIX \
+            + writer_class.SEPARATOR.join(
+                legacy_format_record(record, inc, output_format)
+                for inc, record in enumerate(records)) \
+            + "\n" + writer_class.SUFFIX
+        assert handle.getvalue() == expected
+
+def test_testdata_output(tmp_path, monkeypatch):
+    """test single mode output matches testdata/response_1 for each format"""
+
+    with StubRefgetServer() as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+        for output_format, writer_class in writer_classes:
+            output_file = str(tmp_path / ("output." + output_format))
+            ENAClient(args=["-s", sequence_id_0, "-o", output_file,
+                            "-f", output_format]).call_and_output_all()
+            output = open(output_file, "r").read().rstrip()
+            if output_format == "json":
+                expected_file = "testdata/response_2.json"
+            else:
+                expected_file = "testdata/response_1." + output_format
+            assert output == open(expected_file, "r").read().rstrip()
+
+def test_ndjson_writer(tmp_path, monkeypatch):
+    """test the NDJSONWriter writes one flushed compact object per line"""
+
+    # assert each record is readable from the file as soon as it is
+    # written, before the handle is closed
+    output_file = str(tmp_path / "output.ndjson")
+    handle = open(output_file, "w", buffering=1024 * 1024)
+    writer = NDJSONWriter(handle)
+    writer.write_prefix()
+    for inc, record in enumerate(records):
+        writer.write_record(record, inc)
+        lines = open(output_file, "r").read().split("\n")
+        assert len(lines) == inc + 2 and lines[-1] == ""
+        assert json.loads(lines[inc]) == record
+    writer.write_suffix()
+    handle.close()
+
+    # assert batch output through the ENAClient
+    with StubRefgetServer() as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+        ENAClient(args=["-i", "testdata/input.txt", "-o", output_file,
+                        "-f", "ndjson"]).call_and_output_all()
+    lines = open(output_file, "r").read().split("\n")
+    assert lines[-1] == ""
+    assert [json.loads(line)["status_code"] for line in lines[:-1]] \
+        == [200, 404, 404, 404, 404]
+    assert lines[0] == '{"metadata":{"aliases":[],"id":"%s","length":7156,' \
+        % (sequence_id_0) + '"md5":"%s","trunc512":null},"req_seq_id":"%s",' \
+        % (sequence_id_0, sequence_id_0) + '"status_code":200}'
+
+def test_csv_writer():
+    """test the CSVWriter flattens records into columns"""
+
+    handle = io.StringIO()
+    writer = CSVWriter(handle)
+    writer.write_prefix()
+    for inc, record in enumerate(records[:3]):
+        writer.write_record(record, inc)
+    writer.write_suffix()
+
+    rows = list(csv.DictReader(io.StringIO(handle.getvalue())))
+    assert list(rows[0].keys()) == COLUMNS
+    assert rows[0]["md5"] == sequence_id_0
+    assert rows[0]["length"] == "7156"
+    assert json.loads(rows[0]["aliases"])[1]["alias"] == "MT & <mito>"
+    assert rows[1]["status_code"] == "404" and rows[1]["length"] == ""
+    assert rows[2]["status_code"] == "408"
+    assert rows[2]["error"] == "connection timeout"
+    assert rows[2]["aliases"] == ""
+
+def test_parquet_writer(tmp_path, monkeypatch):
+    """test the ParquetWriter writes typed columns in row groups"""
+
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+
+    # assert rows are written in row groups of the configured size
+    output_file = str(tmp_path / "output.parquet")
+    with open(output_file, "wb") as handle:
+        writer = ParquetWriter(handle, row_group_size=2)
+        writer.write_prefix()
+        for inc, record in enumerate(records[:3]):
+            writer.write_record(record, inc)
+        writer.write_suffix()
+    parquet_file = pyarrow_parquet.ParquetFile(output_file)
+    assert parquet_file.metadata.num_row_groups == 2
+    table = parquet_file.read()
+    assert table.column_names == COLUMNS
+    assert table.column("status_code").to_pylist() == [200, 404, 408]
+    assert table.column("length").to_pylist() == [7156, None, None]
+    assert table.column("aliases").to_pylist()[0][0] \
+        == {"alias": "chrM", "naming_authority": "insdc"}
+
+    # assert batch output through the ENAClient, which requires -o
+    client = ENAClient(args=["-i", "testdata/input.txt", "-f", "parquet"])
+    assert client.get_parser_error().__class__.__name__ == "ValueError"
+    with StubRefgetServer() as server:
+        monkeypatch.setattr(ENAClient, "API_BASE_URL", server.url)
+        ENAClient(args=["-i", "testdata/input.txt", "-o", output_file,
+                        "-f", "parquet"]).call_and_output_all()
+    table = pyarrow_parquet.read_table(output_file)
+    assert table.column("req_seq_id").to_pylist()[0] == sequence_id_0
+    assert table.column("status_code").to_pylist() == [200] + [404] * 4
+
+def test_parquet_writer_missing_pyarrow(tmp_path, monkeypatch):
+    """test parquet output without pyarrow is reported before the output
+    file is opened"""
+
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    output_file = tmp_path / "output.parquet"
+    client = ENAClient(args=["-i", "testdata/input.txt", "-o",
+                             str(output_file), "-f", "parquet"])
+    assert client.get_parser_error().__class__.__name__ == "ValueError"
+    assert "requires pyarrow" in str(client.get_parser_error())
+    client.call_and_output_all()
+    assert not output_file.exists()